@@ -12,7 +12,130 @@ import { Kernel, ServerConnection } from '@jupyterlab/services';
 import { KernelConnection } from '@jupyterlab/services/lib/kernel/default';
 import * as KernelMessage from '@jupyterlab/services/lib/kernel/messages';
 
+// With SOLARA_KERNEL_SEND_BATCHING the server sends the messages of one kernel message handler
+// as one text frame: a JSON text sequence (RFC 7464), each message prefixed by a record
+// separator. A regular message frame starts with '{'.
+const BATCH_RECORD_SEPARATOR = '\x1e';
 
+function unpackBatches(handler: (this: WebSocket, ev: MessageEvent) => any) {
+  return function (this: WebSocket, event: MessageEvent) {
+    const data = event.data;
+    if (typeof data !== 'string' || data[0] !== BATCH_RECORD_SEPARATOR) {
+      return handler.call(this, event);
+    }
+    // the kernel connection handles one message per event: replay the batch in order
+    for (const message of data.split(BATCH_RECORD_SEPARATOR)) {
+      if (message.length > 0) {
+        handler.call(this, new MessageEvent('message', { data: message }));
+      }
+    }
+  };
+}
+
+/**
+ * A WebSocket whose onmessage handler receives the messages of a batch frame one by one.
+ *
+ * Used as the kernel connection's WebSocket constructor; frames that are not a batch pass
+ * through untouched, so this works whether or not the server batches.
+ */
+export function BatchingWebSocket(url: string, protocols?: string | string[]): WebSocket {
+  const ws = new WebSocket(url, protocols);
+  const onmessage = Object.getOwnPropertyDescriptor(WebSocket.prototype, 'onmessage')!;
+  let handler: ((this: WebSocket, ev: MessageEvent) => any) | null = null;
+  Object.defineProperty(ws, 'onmessage', {
+    configurable: true,
+    get: () => handler,
+    set: (value: ((this: WebSocket, ev: MessageEvent) => any) | null) => {
+      handler = value;
+      onmessage.set!.call(ws, value ? unpackBatches(value) : null);
+    },
+  });
+  return ws;
+}
+BatchingWebSocket.CONNECTING = WebSocket.CONNECTING;
+BatchingWebSocket.OPEN = WebSocket.OPEN;
+BatchingWebSocket.CLOSING = WebSocket.CLOSING;
+BatchingWebSocket.CLOSED = WebSocket.CLOSED;
+
+// With SOLARA_KERNEL_BINARY_ARRAYS the server sends numpy arrays in widget state as raw binary
+// buffers, listed in data.solara_buffer_arrays as [buffer index, dtype, shape]. We turn them back
+// into the (nested) arrays the JSON encoding would have given, before the widget manager sees
+// the message, so widgets do not need to know about it.
+const BUFFER_ARRAYS_KEY = 'solara_buffer_arrays';
+const TYPED_ARRAYS: { [dtype: string]: any } = {
+  b: Uint8Array,
+  i1: Int8Array,
+  u1: Uint8Array,
+  i2: Int16Array,
+  u2: Uint16Array,
+  i4: Int32Array,
+  u4: Uint32Array,
+  f4: Float32Array,
+  f8: Float64Array,
+};
+
+function flatArray(buffer: DataView, dtype: string): any[] {
+  if (dtype === 'i8' || dtype === 'u8') {
+    // as plain numbers (no BigInt), which is also what JSON gives: exact up to 2**53
+    const out = new Array(buffer.byteLength / 8);
+    for (let i = 0; i < out.length; i++) {
+      const low = buffer.getUint32(i * 8, true);
+      const high = dtype === 'i8' ? buffer.getInt32(i * 8 + 4, true) : buffer.getUint32(i * 8 + 4, true);
+      out[i] = high * 4294967296 + low;
+    }
+    return out;
+  }
+  const TypedArray = TYPED_ARRAYS[dtype];
+  let bytes = buffer.buffer;
+  let offset = buffer.byteOffset;
+  if (offset % TypedArray.BYTES_PER_ELEMENT !== 0) {
+    // typed arrays need an aligned offset
+    bytes = bytes.slice(offset, offset + buffer.byteLength);
+    offset = 0;
+  }
+  const typed = new TypedArray(bytes, offset, buffer.byteLength / TypedArray.BYTES_PER_ELEMENT);
+  return dtype === 'b' ? Array.from(typed, (v) => v !== 0) : Array.from(typed);
+}
+
+function bufferToArray(buffer: DataView, dtype: string, shape: number[]): any[] {
+  const flat = flatArray(buffer, dtype);
+  const nest = (start: number, dim: number): any[] => {
+    if (dim === shape.length - 1) {
+      return flat.slice(start, start + shape[dim]);
+    }
+    const stride = shape.slice(dim + 1).reduce((a, b) => a * b, 1);
+    const out = new Array(shape[dim]);
+    for (let i = 0; i < shape[dim]; i++) {
+      out[i] = nest(start + i * stride, dim + 1);
+    }
+    return out;
+  };
+  return shape.length === 1 ? flat : nest(0, 0);
+}
+
+export function decodeBufferArrays(msg: any) {
+  const data = msg.content?.data;
+  const arrays: [number, string, number[]][] | undefined = data?.[BUFFER_ARRAYS_KEY];
+  if (!arrays) {
+    return msg;
+  }
+  const root = data.state ?? data.states;
+  const decoded = new Set<number>();
+  for (const [index, dtype, shape] of arrays) {
+    const path = data.buffer_paths[index];
+    let obj = root;
+    for (const key of path.slice(0, -1)) {
+      obj = obj[key];
+    }
+    obj[path[path.length - 1]] = bufferToArray(msg.buffers[index], dtype, shape);
+    decoded.add(index);
+  }
+  // the remaining buffers (bytes, memoryview) are for the widget manager, as usual
+  data.buffer_paths = data.buffer_paths.filter((_: any, i: number) => !decoded.has(i));
+  msg.buffers = msg.buffers.filter((_: any, i: number) => !decoded.has(i));
+  delete data[BUFFER_ARRAYS_KEY];
+  return msg;
+}
 
 export async function connectKernel(
   baseUrl?: string,
@@ -21,7 +144,7 @@ export async function connectKernel(
 ): Promise<Kernel.IKernelConnection | undefined> {
   baseUrl = baseUrl ?? PageConfig.getBaseUrl();
   kernelId = kernelId ?? PageConfig.getOption('kernelId');
-  const serverSettings = ServerConnection.makeSettings({ baseUrl, ...options });
+  const serverSettings = ServerConnection.makeSettings({ baseUrl, WebSocket: BatchingWebSocket as any, ...options });
 
   // const model = await KernelAPI.getKernelModel(kernelId, serverSettings);
   // if (!model) {
@@ -29,6 +152,9 @@ export async function connectKernel(
   // }
   const model = { 'id': kernelId, 'name': 'solara-name' }
   const kernel = new KernelConnection({ model, serverSettings });
+  // every incoming message passes through _handleMessage (private, hence the cast)
+  const handleMessage = (kernel as any)._handleMessage.bind(kernel);
+  (kernel as any)._handleMessage = (msg: any) => handleMessage(decodeBufferArrays(msg));
   return kernel;
 }
 
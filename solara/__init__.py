@@ -8,12 +8,22 @@ git_branch = "master"
 from . import comm  # noqa: F401
 
 
+# once the server is in use it stays in use, so a positive answer is remembered (this is
+# asked on every reactive read)
+_solara_server_used = False
+
+
 def _using_solara_server():
+    global _solara_server_used
+    if _solara_server_used:
+        return True
     import sys
 
     if "solara.server.starlette" in sys.modules or "solara.server.flask" in sys.modules:
+        _solara_server_used = True
         return True
     if sys.argv[0].split("/")[-1] == "solara":
+        _solara_server_used = True
         return True
     return False
 
@@ -172,7 +172,7 @@ if "SOLARA_MODE" in os.environ:
     "--workers",
     default=None,
     type=int,
-    help="Number of worker processes. Defaults to the $WEB_CONCURRENCY environment variable if available, or 1. Not valid with --auto-restart/-a.",
+    help="Number of worker processes. A front process routes every browser session to a fixed worker. Defaults to 1 ($WEB_CONCURRENCY is not used). Not valid with --auto-restart/-a.",
 )
 @click.option(
     "--env-file",
@@ -363,7 +363,7 @@ def run(
         settings.main.mode = "production"
     else:
         settings.main.mode = "development"
-    server = None
+    server: typing.Any = None  # a uvicorn.Server, or a workers.Front with --workers
 
     # TODO: we might want to support this, but it needs to be started from the main thread
     # and then uvicorn needs to be started from a thread
@@ -411,6 +411,9 @@ def run(
     os.environ["SERVER_PORT"] = str(port)
 
     kwargs["app"] = "solara.server.starlette:app"
+    if timing:
+        # the per-message timing lines are logged at info level
+        LOGGING_CONFIG["loggers"]["solara.server.timing"] = {"level": "INFO"}
     kwargs["log_config"] = LOGGING_CONFIG if log_config is None else log_config
     kwargs["loop"] = loop
     settings.main.use_pdb = use_pdb
@@ -427,10 +430,35 @@ def run(
     for item in items:
         del kwargs[item]
 
+    if workers is not None and workers > 1 and reload:
+        raise click.UsageError("--workers cannot be combined with --auto-restart/-a")
+
+    def start_worker(index: int, path: str):
+        from .server import workers as workers_module
+
+        # ssg crawls the front server, from this process
+        worker_config = uvicorn.Config(**{**kwargs, "uds": path, "workers": None})
+        target = run_with_settings(
+            uvicorn.Server(config=worker_config),
+            main=settings.main.dict(),
+            theme=settings.theme.dict(),
+            ssg={**settings.ssg.dict(), "enabled": False},
+            search=settings.search.dict(),
+        )
+        return workers_module.spawn(target, index)
+
     def start_server():
         nonlocal server
         nonlocal failed
         try:
+            if workers is not None and workers > 1:
+                import asyncio
+
+                from .server import workers as workers_module
+
+                server = workers_module.Front(host, port, workers, start_worker)
+                asyncio.run(server.serve())
+                return
             # we manually create the server instead of calling uvicorn.run
             # because we can then access the server variable and check if it is
             # running.
@@ -1,12 +1,12 @@
 from typing import TYPE_CHECKING, Any, Callable, Optional, TypeVar, Union
 
-from solara.toestand import Reactive
+from solara.toestand import Reactive, batch
 import solara.util
 
 if TYPE_CHECKING:
     from solara.state.persist import PersistConfig
 
-__all__ = ["reactive", "Reactive"]
+__all__ = ["reactive", "Reactive", "batch"]
 
 T = TypeVar("T")
 
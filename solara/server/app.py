@@ -23,7 +23,7 @@ import solara
 import solara.lifecycle
 from solara.util import nested_get
 
-from . import kernel_context, patch, reload, settings
+from . import kernel_context, kernel_pool, patch, reload, settings
 from .kernel import Kernel
 from .utils import pdb_guard
 
@@ -425,12 +425,8 @@ def _run_app(
     return container, render_context
 
 
-def load_app_widget(app_state, app_script: AppScript, pathname: str):
-    # load the app, and set it at the child of the context's container
-    app_state_initial = app_state
-    context = kernel_context.get_current_context()
-    container = context.container
-    assert container is not None
+def create_module_widgets():
+    """Create (or update) the ESM module widgets of the current kernel."""
     try:
         import ipyreact
 
@@ -451,6 +447,16 @@ def load_app_widget(app_state, app_script: AppScript, pathname: str):
 
         solara.server.esm_vue.create_modules()
 
+
+def load_app_widget(app_state, app_script: AppScript, pathname: str):
+    # load the app, and set it at the child of the context's container
+    app_state_initial = app_state
+    context = kernel_context.get_current_context()
+    container = context.container
+    assert container is not None
+    kernel_pool.send_prewarmed_frames(context)
+    create_module_widgets()
+
     try:
         render_context = context.app_object
         app_state = app_state_initial
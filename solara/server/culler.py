@@ -0,0 +1,243 @@
+"""One process-wide scheduler for kernel culls.
+
+When the last page of a virtual kernel disconnects, the kernel is culled after the cull timeout
+unless a page (re)connects first. Instead of one sleeping asyncio task per kernel, which a
+flapping mobile client recreates and cancels on every reconnect, the kernels waiting for their
+cull are entries in one heap, served by a single task on the keep-alive event loop. A cancelled
+entry stays in the heap (a cancel is O(1)) and is dropped when it reaches the top, or when the
+cancelled entries make up more than half of the heap.
+
+Expired entries are handled in batches of at most ``SOLARA_KERNEL_CULL_RATE`` entries, with at
+least one second per batch, so a mass disconnect does not close thousands of kernels at once.
+The callbacks (closing the kernel) run without holding the scheduler lock.
+
+``/resourcez`` reports the counters, the culls in the last minute and the close latency in ``culler``.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from . import metrics, settings
+
+logger = logging.getLogger("solara.server.culler")
+
+
+class CullInfo:
+    """Process-wide counters of the cull scheduler, for /resourcez."""
+
+    lock = threading.Lock()
+    scheduled = 0
+    cancelled = 0
+    culled = 0
+    kept = 0
+    errors = 0
+    # time.monotonic() of the culls in the last minute
+    recent: Deque[float] = collections.deque()
+    close_seconds = metrics.Histogram()
+    # how long after its deadline an entry was handled, grows when the rate limit kicks in
+    lag_seconds = metrics.Histogram()
+
+    @classmethod
+    def record(cls, scheduled: int = 0, cancelled: int = 0, kept: int = 0, errors: int = 0) -> None:
+        with cls.lock:
+            cls.scheduled += scheduled
+            cls.cancelled += cancelled
+            cls.kept += kept
+            cls.errors += errors
+
+    @classmethod
+    def record_cull(cls, close_seconds: float, lag_seconds: float) -> None:
+        now = time.monotonic()
+        with cls.lock:
+            cls.culled += 1
+            cls.recent.append(now)
+            cls._expire(now)
+            cls.close_seconds.observe(close_seconds)
+            cls.lag_seconds.observe(lag_seconds)
+
+    @classmethod
+    def _expire(cls, now: float) -> None:
+        while cls.recent and cls.recent[0] < now - 60:
+            cls.recent.popleft()
+
+    @classmethod
+    def as_dict(cls) -> Dict[str, Any]:
+        with cls.lock:
+            cls._expire(time.monotonic())
+            return {
+                "scheduled": cls.scheduled,
+                "cancelled": cls.cancelled,
+                "culled": cls.culled,
+                "kept": cls.kept,
+                "errors": cls.errors,
+                "culls_last_minute": len(cls.recent),
+                "close_seconds": cls.close_seconds.as_dict(),
+                "lag_seconds": cls.lag_seconds.as_dict(),
+            }
+
+    @classmethod
+    def _reset(cls) -> None:
+        with cls.lock:
+            cls.scheduled = cls.cancelled = cls.culled = cls.kept = cls.errors = 0
+            cls.recent.clear()
+            cls.close_seconds = metrics.Histogram()
+            cls.lag_seconds = metrics.Histogram()
+
+
+class CullEntry:
+    """A scheduled cull; ``future`` is done once the callback ran, or cancelled."""
+
+    def __init__(self, deadline: float, callback: Callable[[], bool]) -> None:
+        self.deadline = deadline
+        # returns True when the kernel was closed, False when it was kept
+        self.callback = callback
+        self.cancelled = False
+        self.in_heap = True
+        self.future: "concurrent.futures.Future[None]" = concurrent.futures.Future()
+
+
+class Culler:
+    """A heap of :class:`CullEntry`, served by one task on ``loop``."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[float, int, CullEntry]] = []
+        self._cancelled = 0
+        self._counter = itertools.count()
+        self._started = False
+        self._task: "Optional[concurrent.futures.Future[None]]" = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._heap) - self._cancelled
+
+    def schedule(self, delay: float, callback: Callable[[], bool]) -> CullEntry:
+        entry = CullEntry(time.monotonic() + delay, callback)
+        with self._lock:
+            heapq.heappush(self._heap, (entry.deadline, next(self._counter), entry))
+            # only a new earliest deadline changes how long the task should wait
+            wake = self._heap[0][2] is entry
+            start = not self._started
+            self._started = True
+        CullInfo.record(scheduled=1)
+        if start:
+            self._task = asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+        elif wake:
+            self._loop.call_soon_threadsafe(self._wake)
+        return entry
+
+    def cancel(self, entry: CullEntry) -> None:
+        with self._lock:
+            if entry.cancelled or entry.future.done():
+                return
+            entry.cancelled = True
+            if entry.in_heap:
+                self._cancelled += 1
+            if self._cancelled > len(self._heap) // 2:
+                for item in self._heap:
+                    item[2].in_heap = not item[2].cancelled
+                self._heap = [item for item in self._heap if item[2].in_heap]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+        entry.future.cancel()
+        CullInfo.record(cancelled=1)
+
+    def stop(self) -> None:
+        """Stop the task; pending entries stay, and the next :meth:`schedule` starts it again."""
+        with self._lock:
+            task, self._task = self._task, None
+            self._started = False
+        if task is not None:
+            task.cancel()
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _pop_due(self, now: float, limit: int) -> Tuple[List[CullEntry], Optional[float]]:
+        due: List[CullEntry] = []
+        with self._lock:
+            while self._heap and len(due) < limit:
+                deadline, _, entry = self._heap[0]
+                if entry.cancelled:
+                    heapq.heappop(self._heap)
+                    entry.in_heap = False
+                    self._cancelled -= 1
+                elif deadline <= now:
+                    heapq.heappop(self._heap)
+                    entry.in_heap = False
+                    due.append(entry)
+                else:
+                    break
+            next_deadline = self._heap[0][0] if self._heap else None
+        return due, next_deadline
+
+    def _handle(self, entry: CullEntry) -> None:
+        if not entry.future.set_running_or_notify_cancel():
+            return
+        lag = time.monotonic() - entry.deadline
+        start = time.perf_counter()
+        try:
+            closed = entry.callback()
+        except Exception:
+            logger.exception("error while culling a virtual kernel")
+            CullInfo.record(errors=1)
+            closed = False
+        if closed:
+            CullInfo.record_cull(time.perf_counter() - start, lag)
+        else:
+            CullInfo.record(kept=1)
+        entry.future.set_result(None)
+
+    async def _run(self) -> None:
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            batch_start = time.monotonic()
+            rate = max(1, int(settings.kernel.cull_rate))
+            due, next_deadline = self._pop_due(batch_start, rate)
+            for entry in due:
+                self._handle(entry)
+            if len(due) == rate:
+                # more may be due: the next batch waits for the rest of this second
+                await asyncio.sleep(max(0.0, batch_start + 1 - time.monotonic()))
+                continue
+            timeout = None if next_deadline is None else max(0.0, next_deadline - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+_culler: Optional[Culler] = None
+_culler_lock = threading.Lock()
+
+
+def get_culler() -> Culler:
+    global _culler
+    if _culler is None:
+        with _culler_lock:
+            if _culler is None:
+                from .kernel_context import keep_alive_event_loop
+
+                _culler = Culler(keep_alive_event_loop)
+    return _culler
+
+
+def stop() -> None:
+    if _culler is not None:
+        _culler.stop()
+
+
+def as_dict() -> Dict[str, Any]:
+    return {"pending": _culler.pending if _culler is not None else 0, **CullInfo.as_dict()}
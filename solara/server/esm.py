@@ -68,9 +68,10 @@ def create_modules():
     kernel_id = context.id
     if kernel_id not in _modules_added_per_kernel:
         # widgets close with the kernel; drop our per-kernel bookkeeping too
-        def cleanup(kernel_id=kernel_id):
-            _modules_added_per_kernel.pop(kernel_id, None)
-            _import_map_per_kernel.pop(kernel_id, None)
+        # a pre-warmed kernel gets its id when handed out, see rename_kernel
+        def cleanup(context=context):
+            _modules_added_per_kernel.pop(context.id, None)
+            _import_map_per_kernel.pop(context.id, None)
 
         context.on_close(cleanup)
     _modules_added = _modules_added_per_kernel[kernel_id]
@@ -125,6 +126,14 @@ def create_module(name, module: Union[str, Path], dependencies: List[str]):
     return ipyreact.module.Module(code=_read(module), name=name, dependencies=dependencies)
 
 
+def rename_kernel(old_id: str, new_id: str):
+    with lock:
+        if old_id in _modules_added_per_kernel:
+            _modules_added_per_kernel[new_id] = _modules_added_per_kernel.pop(old_id)
+        if old_id in _import_map_per_kernel:
+            _import_map_per_kernel[new_id] = _import_map_per_kernel.pop(old_id)
+
+
 def create_import_map():
     kernel_id = kernel_context.get_current_context().id
     with lock:
@@ -89,8 +89,9 @@ def create_modules():
     kernel_id = context.id
     if kernel_id not in _modules_added_per_kernel:
         # widgets close with the kernel; drop our per-kernel bookkeeping too
-        def cleanup(kernel_id=kernel_id) -> None:
-            _modules_added_per_kernel.pop(kernel_id, None)
+        # a pre-warmed kernel gets its id when handed out, see rename_kernel
+        def cleanup(context=context) -> None:
+            _modules_added_per_kernel.pop(context.id, None)
 
         context.on_close(cleanup)
     _modules_added = _modules_added_per_kernel[kernel_id]
@@ -125,3 +126,9 @@ def create_modules():
                     widget.dependencies = dependencies
             widgets[name] = widget
     return widgets
+
+
+def rename_kernel(old_id: str, new_id: str) -> None:
+    with lock:
+        if old_id in _modules_added_per_kernel:
+            _modules_added_per_kernel[new_id] = _modules_added_per_kernel.pop(old_id)
@@ -1,13 +1,17 @@
+import contextlib
 import json
 import logging
 import pdb
 import queue
 import re
 import struct
+import sys
+import threading
+import time
 import warnings
 from binascii import b2a_base64
 from datetime import datetime
-from typing import Set, Union
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Set, Tuple, Union
 
 import ipykernel
 import ipykernel.kernelbase
@@ -19,7 +23,7 @@ from zmq.eventloop.zmqstream import ZMQStream
 import solara
 from solara.server.shell import SolaraInteractiveShell
 
-from . import settings, websocket
+from . import metrics, send_queue, settings, websocket
 
 logger = logging.getLogger("solara.server.kernel")
 ipykernel_major = int(ipykernel.__version__.split(".")[0])
@@ -77,7 +81,7 @@ def json_default(obj):
         raise TypeError("%r is not JSON serializable" % obj)
 
 
-def json_dumps(data):
+def _stdlib_json_dumps(data) -> str:
     try:
         return jsonmodule.dumps(data)
     except TypeError:
@@ -90,6 +94,151 @@ def json_dumps(data):
     )
 
 
+def _orjson_default(obj):
+    # orjson serializes C-contiguous numpy arrays of the common dtypes itself; the rest ends up here
+    if type(obj).__module__ == "numpy" and hasattr(obj, "tolist"):
+        return obj.tolist()
+    return json_default(obj)
+
+
+def _make_orjson_serializer():
+    import orjson
+
+    # datetimes pass through to json_default, so they come out exactly as with the stdlib path
+    options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(data) -> bytes:
+        try:
+            return orjson.dumps(data, default=_orjson_default, option=options)
+        except TypeError:  # orjson.JSONEncodeError, e.g. an int beyond 64 bits
+            return _stdlib_json_dumps(data).encode("utf-8")
+
+    return dumps, orjson.loads
+
+
+JsonSerializer = Tuple[Callable[[Any], Union[str, bytes]], Callable[[Union[str, bytes]], Any]]
+
+# name -> factory returning (dumps, loads), selected by SOLARA_KERNEL_JSON_SERIALIZER. dumps may
+# return str or bytes (UTF-8), loads accepts both. Factories run once, on first use, so an
+# optional dependency is only imported when selected.
+json_serializers: Dict[str, Callable[[], JsonSerializer]] = {
+    "json": lambda: (_stdlib_json_dumps, jsonmodule.loads),
+    "orjson": _make_orjson_serializer,
+}
+_json_serializers_resolved: Dict[str, JsonSerializer] = {}
+
+
+def register_json_serializer(name: str, factory: Callable[[], JsonSerializer]) -> None:
+    """Make a wire-message JSON serializer selectable as ``SOLARA_KERNEL_JSON_SERIALIZER=name``."""
+    json_serializers[name] = factory
+    _json_serializers_resolved.pop(name, None)
+    _json_serializers_resolved.pop("auto", None)
+
+
+def get_json_serializer(name: Union[str, None] = None) -> JsonSerializer:
+    """The ``(dumps, loads)`` pair for ``name`` (default: ``settings.kernel.json_serializer``).
+
+    ``"auto"`` is orjson when it is installed, else the standard library. Raises ValueError for an
+    unknown name and ImportError when the selected serializer is not installed.
+    """
+    if name is None:
+        name = settings.kernel.json_serializer
+    resolved = _json_serializers_resolved.get(name)
+    if resolved is not None:
+        return resolved
+    if name == "auto":
+        try:
+            resolved = get_json_serializer("orjson")
+        except ImportError:
+            resolved = get_json_serializer("json")
+    elif name in json_serializers:
+        resolved = json_serializers[name]()
+    else:
+        raise ValueError(f"Unknown SOLARA_KERNEL_JSON_SERIALIZER {name!r}; known: {sorted(json_serializers) + ['auto']}")
+    _json_serializers_resolved[name] = resolved
+    return resolved
+
+
+def json_dumps(data) -> str:
+    dumped = get_json_serializer()[0](data)
+    return dumped.decode("utf-8") if isinstance(dumped, bytes) else dumped
+
+
+def json_loads(data: Union[str, bytes]):
+    return get_json_serializer()[1](data)
+
+
+# dtypes the frontend can view as a JavaScript typed array (see decodeBufferArrays in kernel.ts)
+_BUFFER_ARRAY_DTYPES = {"b", "i1", "u1", "i2", "u2", "i4", "u4", "i8", "u8", "f4", "f8"}
+BUFFER_ARRAYS_KEY = "solara_buffer_arrays"
+
+
+def _separate_arrays(obj, path, buffer_paths, buffers, arrays, numpy, min_bytes):
+    # like ipywidgets' _separate_buffers, but for numpy arrays: copy-on-write, so the widget's own
+    # trait values are never modified; a dict entry is dropped, a list entry becomes None
+    if isinstance(obj, dict):
+        items: Any = obj.items()
+    elif isinstance(obj, (list, tuple)):
+        items = enumerate(obj)
+    else:
+        return obj
+    copied = None
+    for key, value in items:
+        if isinstance(value, numpy.ndarray):
+            kind = "b" if value.dtype.kind == "b" else value.dtype.kind + str(value.dtype.itemsize)
+            # subclasses (masked arrays, matrices) have their own notion of the values: lists
+            if type(value) is not numpy.ndarray or value.ndim == 0 or value.nbytes < min_bytes or kind not in _BUFFER_ARRAY_DTYPES:
+                new_value = value.tolist()
+            else:
+                # the frontend views the buffer in its own (little endian) byte order
+                value = numpy.ascontiguousarray(value, dtype=value.dtype.newbyteorder("<"))
+                buffer_paths.append(path + [key])
+                buffers.append(memoryview(value.reshape(-1).view(numpy.uint8)))
+                arrays.append([len(buffers) - 1, kind, list(value.shape)])
+                new_value = None
+        else:
+            new_value = _separate_arrays(value, path + [key], buffer_paths, buffers, arrays, numpy, min_bytes)
+            if new_value is value:
+                continue
+        if copied is None:
+            copied = dict(obj) if isinstance(obj, dict) else list(obj)
+        if new_value is None and isinstance(copied, dict):
+            del copied[key]
+        else:
+            copied[key] = new_value
+    return obj if copied is None else copied
+
+
+def extract_array_buffers(data, buffers):
+    """Move the numpy arrays in the widget state of a comm message into binary buffers.
+
+    Covers ``data["state"]`` (comm_open, update, echo_update) and ``data["states"]`` (ipywidgets 8
+    ``update_states``). An array goes out as its raw bytes plus a ``[buffer index, dtype, shape]``
+    entry in ``data["solara_buffer_arrays"]``, from which the frontend rebuilds the (nested) list
+    the JSON encoding would have produced. Small, 0-d, and non-numeric arrays become lists.
+    Returns the new ``(data, buffers)``; the arguments are not modified.
+    """
+    numpy = sys.modules.get("numpy")
+    if numpy is None or not isinstance(data, dict):
+        # an array can only be in the state if numpy is already imported
+        return data, buffers
+    root_key = "state" if "state" in data else "states"
+    root = data.get(root_key)
+    if not isinstance(root, dict):
+        return data, buffers
+    buffer_paths = list(data.get("buffer_paths") or [])
+    new_buffers = list(buffers or [])
+    arrays: List[List[Any]] = []
+    new_root = _separate_arrays(root, [], buffer_paths, new_buffers, arrays, numpy, settings.kernel.binary_arrays_min_bytes)
+    if new_root is root:
+        return data, buffers
+    data = {**data, root_key: new_root}
+    if arrays:
+        data["buffer_paths"] = buffer_paths
+        data[BUFFER_ARRAYS_KEY] = arrays
+    return data, new_buffers
+
+
 ipykernel_version = tuple(map(int, re.split(r"\D+", ipykernel.__version__)[:3]))
 if ipykernel_version >= (6, 18, 0):
     import comm.base_comm
@@ -121,7 +270,13 @@ if ipykernel_version >= (6, 18, 0):
                 return
             data = {} if data is None else data
             metadata = {} if metadata is None else metadata
+            if settings.kernel.binary_arrays and msg_type in ("comm_open", "comm_msg"):
+                data, buffers = extract_array_buffers(data, buffers)
             content = dict(data=data, comm_id=self.comm_id, **keys)
+            session = self.kernel.session
+            if msg_type == "comm_msg" and not buffers and isinstance(session, SessionWebsocket):
+                if session.hold_update(self.kernel.iopub_socket, content, metadata, self.kernel.get_parent("shell"), self.topic):
+                    return
             self.kernel.session.send(
                 self.kernel.iopub_socket,
                 msg_type,
@@ -185,7 +340,9 @@ def serialize_binary_message(msg):
     # don't modify msg or buffer list in-place
     msg = msg.copy()
     buffers = list(msg.pop("buffers"))
-    bmsg = json_dumps(msg).encode("utf8")
+    bmsg = get_json_serializer()[0](msg)
+    if isinstance(bmsg, str):
+        bmsg = bmsg.encode("utf8")
     buffers.insert(0, bmsg)
     nbufs = len(buffers)
     offsets = [4 * (nbufs + 1)]
@@ -216,7 +373,7 @@ def deserialize_binary_message(bmsg):
     bufs = []
     for start, stop in zip(offsets[:-1], offsets[1:]):
         bufs.append(bmsg[start:stop])
-    msg = json.loads(bufs[0].decode("utf8"))
+    msg = json_loads(bufs[0])
     msg["buffers"] = bufs[1:]
     return msg
 
@@ -239,10 +396,14 @@ class WebsocketStreamWrapper(ZMQStream):
         pass
 
 
-def send_websockets(websockets: Set[websocket.WebsocketWrapper], binary_msg):
+def send_websockets(websockets: Set[websocket.WebsocketWrapper], binary_msg, coalesce_key: Optional[Hashable] = None):
+    start = time.perf_counter()
     for ws in list(websockets):
         try:
-            ws.send(binary_msg)
+            if coalesce_key is None:
+                ws.send(binary_msg)
+            else:
+                ws.send(binary_msg, coalesce_key)
         except websocket.WebSocketDisconnect:
             # ignore the exception, we tried to send while websocket closed
             # just remove it from the websocket set
@@ -264,12 +425,213 @@ def send_websockets(websockets: Set[websocket.WebsocketWrapper], binary_msg):
                 websockets.remove(ws)
             except KeyError:
                 pass  # already removed
+    metrics.tally.send_seconds += time.perf_counter() - start
+
+
+# A batch frame is a JSON text sequence (RFC 7464): every message is prefixed with an ASCII record
+# separator. JSON escapes all control characters inside strings, so the separator can never occur
+# in a message, and a regular message frame starts with "{".
+BATCH_RECORD_SEPARATOR = "\x1e"
+
+
+class SendBatchInfo:
+    """Process-wide counters of the outbound batching (``SOLARA_KERNEL_SEND_BATCHING``), for /resourcez."""
+
+    lock = threading.Lock()
+    frames = 0  # websocket frames sent while batching is on (a batch is one frame)
+    messages = 0  # kernel messages in those frames
+    bytes = 0
+    batches = 0  # frames carrying more than one message
+    batched_messages = 0
+    batched_bytes = 0
+    max_batch_messages = 0
+    max_batch_bytes = 0
+
+    @classmethod
+    def record(cls, messages: int, nbytes: int) -> None:
+        with cls.lock:
+            cls.frames += 1
+            cls.messages += messages
+            cls.bytes += nbytes
+            if messages > 1:
+                cls.batches += 1
+                cls.batched_messages += messages
+                cls.batched_bytes += nbytes
+                cls.max_batch_messages = max(cls.max_batch_messages, messages)
+                cls.max_batch_bytes = max(cls.max_batch_bytes, nbytes)
+
+    @classmethod
+    def as_dict(cls) -> dict:
+        with cls.lock:
+            return {
+                "enabled": settings.kernel.send_batching,
+                "frames": cls.frames,
+                "messages": cls.messages,
+                "bytes": cls.bytes,
+                "batches": cls.batches,
+                "batch_mean_messages": round(cls.batched_messages / cls.batches, 2) if cls.batches else None,
+                "batch_mean_bytes": cls.batched_bytes // cls.batches if cls.batches else None,
+                "batch_max_messages": cls.max_batch_messages,
+                "batch_max_bytes": cls.max_batch_bytes,
+            }
+
+    @classmethod
+    def _reset(cls) -> None:
+        with cls.lock:
+            cls.frames = cls.messages = cls.bytes = 0
+            cls.batches = cls.batched_messages = cls.batched_bytes = 0
+            cls.max_batch_messages = cls.max_batch_bytes = 0
+
+
+class UpdateCoalesceInfo:
+    """Process-wide counters of the update coalescing (``SOLARA_KERNEL_COALESCE_UPDATES``), for /resourcez."""
+
+    lock = threading.Lock()
+    held = 0  # update messages held back in a batch block
+    dropped = 0  # updates merged into a later update of the same comm, never sent on their own
+    traits_overwritten = 0  # trait values in those that a later update replaced
+
+    @classmethod
+    def record(cls, dropped: int, traits_overwritten: int) -> None:
+        with cls.lock:
+            cls.held += 1
+            cls.dropped += dropped
+            cls.traits_overwritten += traits_overwritten
+
+    @classmethod
+    def as_dict(cls) -> dict:
+        with cls.lock:
+            return {
+                "enabled": settings.kernel.coalesce_updates,
+                "held": cls.held,
+                "dropped": cls.dropped,
+                "traits_overwritten": cls.traits_overwritten,
+            }
+
+    @classmethod
+    def _reset(cls) -> None:
+        with cls.lock:
+            cls.held = cls.dropped = cls.traits_overwritten = 0
 
 
 class SessionWebsocket(session.Session):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.websockets: Set[websocket.WebsocketWrapper] = set()  # map from .. msg id to websocket?
+        # outbound batching (see batch()); sends from every thread go through the lock while
+        # batching is on, so the buffered messages and direct sends keep their order
+        self._batch_lock = threading.RLock()
+        self._batch_depth = 0
+        self._batch: List[str] = []
+        self._batch_bytes = 0
+        self._batch_started = 0.0
+        # widget updates held back in a batch block (see hold_update), by comm id, in send order
+        self._held_updates: Dict[str, Tuple[Any, dict, dict, Any, Any]] = {}
+        self._held_since = 0.0
+        self.updates_dropped = 0
+
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[None]:
+        """Buffer the text messages sent inside this block and send them as one frame at the end.
+
+        A no-op unless ``SOLARA_KERNEL_SEND_BATCHING`` or ``SOLARA_KERNEL_COALESCE_UPDATES`` is
+        on. Nested blocks join the outermost one. Sends from other threads during the block join
+        the batch too, so the order of all messages is kept. A binary message (with buffers)
+        sends the pending batch first, then itself as a frame of its own.
+        """
+        if not (settings.kernel.send_batching or settings.kernel.coalesce_updates):
+            yield
+            return
+        with self._batch_lock:
+            self._batch_depth += 1
+        try:
+            yield
+        finally:
+            with self._batch_lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self._release_updates()
+                    self._flush_batch()
+
+    def hold_update(self, stream, content: dict, metadata: dict, parent, ident) -> bool:
+        """Hold back a widget ``update`` message until the end of the batch block.
+
+        A later update of the same comm replaces it, with the trait values merged (the later
+        ones win), and takes its place at the end of the send order. Any other message sends the
+        held updates first, so they never overtake a message sent after them. Returns False when
+        the message has to be sent right away: coalescing is off, there is no batch block, or it
+        is not a plain update (``echo_update`` and binary updates are never held).
+        """
+        if not settings.kernel.coalesce_updates or not self._batch_depth:
+            return False
+        data = content.get("data")
+        if not isinstance(data, dict) or data.get("method") != "update" or data.get("buffer_paths") or not isinstance(data.get("state"), dict):
+            return False
+        comm_id = content.get("comm_id")
+        if not isinstance(comm_id, str):
+            return False
+        with self._batch_lock:
+            if not self._batch_depth:
+                return False
+            held = self._held_updates.pop(comm_id, None)
+            if held is None:
+                if not self._held_updates:
+                    self._held_since = time.monotonic()
+                UpdateCoalesceInfo.record(0, 0)
+            else:
+                previous = held[1]["data"]["state"]
+                state = data["state"]
+                content = {**content, "data": {**data, "state": {**previous, **state}}}
+                self.updates_dropped += 1
+                UpdateCoalesceInfo.record(1, len(previous.keys() & state.keys()))
+            self._held_updates[comm_id] = (stream, content, metadata, parent, ident)
+            if time.monotonic() - self._held_since >= settings.kernel.send_batch_max_delay:
+                self._release_updates()
+        return True
+
+    def _release_updates(self) -> None:
+        # caller holds self._batch_lock
+        if not self._held_updates:
+            return
+        held, self._held_updates = self._held_updates, {}
+        for stream, content, metadata, parent, ident in held.values():
+            self._send(stream, "comm_msg", content, parent=parent, ident=ident, metadata=metadata)
+
+    def _flush_batch(self) -> None:
+        # caller holds self._batch_lock
+        if not self._batch:
+            return
+        pending, self._batch = self._batch, []
+        nbytes, self._batch_bytes = self._batch_bytes, 0
+        if len(pending) == 1:
+            wire_message = pending[0]
+        else:
+            wire_message = "".join(BATCH_RECORD_SEPARATOR + message for message in pending)
+            nbytes += len(pending)
+        SendBatchInfo.record(len(pending), nbytes)
+        send_websockets(self.websockets, wire_message)
+
+    def _send_wire(self, wire_message: Union[str, bytes], coalesce_key: Optional[Hashable] = None) -> None:
+        if not settings.kernel.send_batching:
+            send_websockets(self.websockets, wire_message, coalesce_key)
+            return
+        with self._batch_lock:
+            if self._batch_depth and isinstance(wire_message, str):
+                if not self._batch:
+                    self._batch_started = time.monotonic()
+                self._batch.append(wire_message)
+                self._batch_bytes += len(wire_message)
+                kernel_settings = settings.kernel
+                if (
+                    len(self._batch) >= kernel_settings.send_batch_max_messages
+                    or self._batch_bytes >= kernel_settings.send_batch_max_bytes
+                    or time.monotonic() - self._batch_started >= kernel_settings.send_batch_max_delay
+                ):
+                    self._flush_batch()
+                return
+            self._flush_batch()
+            SendBatchInfo.record(1, len(wire_message))
+            send_websockets(self.websockets, wire_message, coalesce_key)
 
     def close(self):
         for ws in list(self.websockets):
@@ -289,6 +651,23 @@ class SessionWebsocket(session.Session):
         track=False,
         header=None,
         metadata=None,
+    ):
+        if self._held_updates:
+            # held updates were sent before this message, keep it that way
+            with self._batch_lock:
+                self._release_updates()
+        self._send(stream, msg_or_type, content=content, parent=parent, ident=ident, buffers=buffers, header=header, metadata=metadata)
+
+    def _send(
+        self,
+        stream,
+        msg_or_type,
+        content=None,
+        parent=None,
+        ident=None,
+        buffers=None,
+        header=None,
+        metadata=None,
     ):
         if stream is None:
             return  # can happen when the kernel is closed but someone was still trying to send a message
@@ -305,19 +684,26 @@ class SessionWebsocket(session.Session):
                 )
             _fix_msg(msg)
             msg["channel"] = stream.channel
+            msg_type = msg.get("msg_type")
+            if msg_type == "comm_open":
+                metrics.tally.widgets_opened += 1
+            elif msg_type == "comm_close":
+                metrics.tally.widgets_closed += 1
             # not using pdb guard for performance reasons
             try:
+                coalesce_key = None
                 if buffers:
                     msg["buffers"] = [memoryview(k).cast("b") for k in buffers]
                     wire_message = serialize_binary_message(msg)
                 else:
                     wire_message = json_dumps(msg)
+                    coalesce_key = send_queue.coalesce_key(msg)
             except Exception:
                 logger.exception("Could not serialize message: %r", msg)
                 if settings.main.use_pdb:
                     pdb.post_mortem()
                 raise
-            send_websockets(self.websockets, wire_message)
+            self._send_wire(wire_message, coalesce_key)
         except Exception as e:
             logger.exception("Error sending message: %s", e)
 
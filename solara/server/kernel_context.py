@@ -10,7 +10,7 @@ import concurrent.futures
 import contextlib
 import dataclasses
 import enum
-from collections import defaultdict
+from collections import Counter, defaultdict
 import logging
 import os
 import pickle
@@ -29,7 +29,7 @@ from ipywidgets import DOMWidget, Widget
 import solara.server.settings
 import solara.util
 
-from . import kernel, websocket
+from . import culler, kernel, metrics, websocket
 from .. import lifecycle
 from .kernel import Kernel, WebsocketStreamWrapper
 from .utils import redact_id
@@ -40,6 +40,9 @@ logger = logging.getLogger("solara.server.app")
 
 class Local(threading.local):
     kernel_context_stack: Optional[List[Optional["VirtualKernelContext"]]] = None
+    # (current_context.version, thread name, weakref to the context or None) of the last lookup
+    # on this thread; weak, so a thread that outlives a kernel does not keep it alive
+    context_cache: Optional[Tuple[int, str, Optional["weakref.ReferenceType[VirtualKernelContext]"]]] = None
 
 
 local = Local()
@@ -56,6 +59,43 @@ class PageStatus(enum.Enum):
     CLOSED = "closed"
 
 
+class _PageStatusDict(Dict[str, PageStatus]):
+    """The ``page_status`` of a context, with a count per status.
+
+    The counts answer "does this kernel have a connected page?" without a scan, and keep the
+    process-wide index of :data:`contexts` up to date (see :class:`_Contexts`).
+    """
+
+    def __init__(self, context: "VirtualKernelContext", pages: Dict[str, PageStatus]):
+        super().__init__(pages)
+        self._context = context
+        self.counts: typing.Counter[PageStatus] = Counter(self.values())
+
+    def __setitem__(self, page_id: str, status: PageStatus) -> None:
+        with _index_lock:
+            old = self.get(page_id)
+            super().__setitem__(page_id, status)
+            if old is not status:
+                if old is not None:
+                    self._count(old, -1)
+                self._count(status, 1)
+
+    def __delitem__(self, page_id: str) -> None:
+        with _index_lock:
+            status = self[page_id]
+            super().__delitem__(page_id)
+            self._count(status, -1)
+
+    def _count(self, status: PageStatus, delta: int) -> None:
+        self.counts[status] += delta
+        # only the 0 <-> 1 transitions change the number of kernels having a page in this status
+        if self.counts[status] == (1 if delta > 0 else 0):
+            contexts._status_changed(self._context, status, delta > 0)
+
+    def has(self, status: PageStatus) -> bool:
+        return self.counts[status] > 0
+
+
 class _LifecycleState(enum.Enum):
     OPEN = "open"
     RESTARTING = "restarting"
@@ -116,11 +156,14 @@ class VirtualKernelContext:
     # "evicted" | "unknown". Drives the reason-gated fenced delete (§5.4) and is logged/asserted.
     close_reason: str = "unknown"
     container: Optional[DOMWidget] = None
+    # messages a pre-warmed kernel sent before it had a page, see kernel_pool.py
+    prewarmed_frames: Optional[List[Union[str, bytes]]] = None
+    # timing of the messages this kernel handled, see solara.server.metrics
+    message_metrics: metrics.MessageMetrics = dataclasses.field(default_factory=metrics.MessageMetrics)
     # we track which pages are connected to implement kernel culling
     page_status: Dict[str, PageStatus] = dataclasses.field(default_factory=dict)
-    # only used for testing
-    _last_kernel_cull_task: "Optional[asyncio.Future[None]]" = None
-    _last_kernel_cull_future: "Optional[concurrent.futures.Future[None]]" = None
+    # the pending cull of this kernel, see solara.server.culler
+    _cull_entry: Optional[culler.CullEntry] = None
     closed_event: threading.Event = dataclasses.field(default_factory=threading.Event)
     # guards persistence teardown so concurrent closes (cull vs page-close vs superseded) run it
     # exactly once, WITHOUT waiting on self.lock (teardown does backend I/O that must stay
@@ -133,8 +176,21 @@ class VirtualKernelContext:
     _generation_stores: Dict[int, Tuple["weakref.ReferenceType[Any]", str, Optional[Callable[[Any], None]], bool]] = dataclasses.field(default_factory=dict)
     lock: threading.RLock = dataclasses.field(default_factory=threading.RLock)
     event_loop: asyncio.AbstractEventLoop = dataclasses.field(default_factory=_get_or_create_event_loop)
+    # False for a pre-warmed kernel (see kernel_pool.py): the on_kernel_start callbacks run when
+    # it is handed to a page, since they may depend on the session
+    start: dataclasses.InitVar[bool] = True
+
+    def __post_init__(self, start: bool = True):
+        if not isinstance(self.page_status, _PageStatusDict):
+            self.page_status = _PageStatusDict(self, self.page_status)
+        if start:
+            self._run_start_callbacks()
 
-    def __post_init__(self):
+    @property
+    def _page_status(self) -> _PageStatusDict:
+        return cast(_PageStatusDict, self.page_status)
+
+    def _run_start_callbacks(self):
         with self:
             for f, *_ in lifecycle._on_kernel_start_callbacks:
                 cleanup = f()
@@ -357,12 +413,7 @@ class VirtualKernelContext:
             with self.lock:
                 for key in self.page_status:
                     self.page_status[key] = PageStatus.CLOSED
-                if self._last_kernel_cull_task:
-                    self._last_kernel_cull_task.cancel()
-                    self._last_kernel_cull_task = None
-                if self._last_kernel_cull_future:
-                    self._last_kernel_cull_future.cancel()
-                    self._last_kernel_cull_future = None
+                self._cancel_kernel_cull()
                 had_app = self.app_object is not None
                 app_object = self.app_object
                 kernel_to_close = self.kernel
@@ -458,9 +509,9 @@ class VirtualKernelContext:
             if page_id in self.page_status and self.page_status.get(page_id) == PageStatus.CLOSED:
                 raise RuntimeError("Cannot connect a page that is already closed")
             self.page_status[page_id] = PageStatus.CONNECTED
-            if self._last_kernel_cull_task:
-                logger.info("Cancelling previous kernel cull task for virtual kernel %s", self.id)
-                self._last_kernel_cull_task.cancel()
+            if self._cull_entry is not None:
+                logger.info("Cancelling previous kernel cull for virtual kernel %s", self.id)
+                self._cancel_kernel_cull()
 
     def _cull_timeout_seconds(self) -> float:
         """The cull timeout for this kernel (design §5.4).
@@ -479,43 +530,30 @@ class VirtualKernelContext:
             return solara.util.parse_timedelta(solara.server.settings.state.orphan_cull_timeout)
         return solara.util.parse_timedelta(solara.server.settings.kernel.cull_timeout)
 
-    def _bump_kernel_cull(self):
-        async def kernel_cull():
-            try:
-                cull_timeout_sleep_seconds = self._cull_timeout_seconds()
-                logger.info("Scheduling kernel cull, will wait for max %s before shutting down the virtual kernel %s", cull_timeout_sleep_seconds, self.id)
-                await asyncio.sleep(cull_timeout_sleep_seconds)
-                logger.info("Timeout reached, checking if we should be shutting down virtual kernel %s", self.id)
-                with self.lock:
-                    has_connected_pages = PageStatus.CONNECTED in self.page_status.values()
-                if has_connected_pages:
-                    logger.info("We have (re)connected pages, keeping the virtual kernel %s alive", self.id)
-                else:
-                    logger.info("No connected pages, and timeout reached, shutting down virtual kernel %s", self.id)
-                    # close() OUTSIDE self.lock: its persistence teardown does backend I/O (§5.3)
-                    self.close(reason="cull")
-                if current_event_loop is not None and future is not None:
-                    try:
-                        current_event_loop.call_soon_threadsafe(future.set_result, None)
-                    except RuntimeError:
-                        pass  # event loop already closed, happens during testing
-            except asyncio.CancelledError:
-                if current_event_loop is not None and future is not None:
-                    try:
-                        if sys.version_info >= (3, 9):
-                            current_event_loop.call_soon_threadsafe(future.cancel, "cancelled because a new cull task was scheduled")
-                        else:
-                            current_event_loop.call_soon_threadsafe(future.cancel)
-                    except RuntimeError:
-                        pass  # event loop already closed, happens during testing
-                raise
+    def _cancel_kernel_cull(self):
+        # call with self.lock held
+        if self._cull_entry is not None:
+            culler.get_culler().cancel(self._cull_entry)
+            self._cull_entry = None
 
-        async def create_task():
-            task = asyncio.create_task(kernel_cull())
-            # create a reference to the task so we can cancel it later
-            self._last_kernel_cull_task = task
-            await task
+    def _kernel_cull(self, entry: culler.CullEntry) -> bool:
+        """Called by the culler when the timeout of ``entry`` is reached; returns True when it closed the kernel."""
+        logger.info("Timeout reached, checking if we should be shutting down virtual kernel %s", self.id)
+        with self.lock:
+            if self._cull_entry is not entry:
+                # superseded by a newer cull, or cancelled while the culler got to it
+                return False
+            self._cull_entry = None
+            has_connected_pages = self._page_status.has(PageStatus.CONNECTED)
+        if has_connected_pages:
+            logger.info("We have (re)connected pages, keeping the virtual kernel %s alive", self.id)
+            return False
+        logger.info("No connected pages, and timeout reached, shutting down virtual kernel %s", self.id)
+        # close() OUTSIDE self.lock: its persistence teardown does backend I/O (§5.3)
+        self.close(reason="cull")
+        return True
 
+    def _bump_kernel_cull(self):
         with self.lock:
             future: "Optional[asyncio.Future[None]]" = None
             current_event_loop: Optional[asyncio.AbstractEventLoop] = None
@@ -524,22 +562,36 @@ class VirtualKernelContext:
                 current_event_loop = asyncio.get_event_loop()
             except RuntimeError:
                 pass
-            if self._last_kernel_cull_task:
-                logger.info("Cancelling previous kernel cull tas for virtual kernel %s", self.id)
-                self._last_kernel_cull_task.cancel()
+            if self._cull_entry is not None:
+                logger.info("Cancelling previous kernel cull for virtual kernel %s", self.id)
+                self._cancel_kernel_cull()
 
-            logger.info("Scheduling kernel cull for virtual kernel %s", self.id)
+            cull_timeout_sleep_seconds = self._cull_timeout_seconds()
+            logger.info("Scheduling kernel cull, will wait for max %s before shutting down the virtual kernel %s", cull_timeout_sleep_seconds, self.id)
+            entry = culler.get_culler().schedule(cull_timeout_sleep_seconds, lambda: self._kernel_cull(entry))
+            self._cull_entry = entry
 
-            async def create_task():
-                task = asyncio.create_task(kernel_cull())
-                # create a reference to the task so we can cancel it later
-                self._last_kernel_cull_task = task
-                try:
-                    await task
-                except RuntimeError:
-                    pass  # event loop already closed, happens during testing
+            if current_event_loop is not None and future is not None:
+
+                def set_done():
+                    assert future is not None
+                    if not future.done():
+                        future.set_result(None)
 
-            self._last_kernel_cull_future = asyncio.run_coroutine_threadsafe(create_task(), keep_alive_event_loop)
+                def done(cull_future: "concurrent.futures.Future[None]"):
+                    assert current_event_loop is not None and future is not None
+                    try:
+                        if cull_future.cancelled():
+                            if sys.version_info >= (3, 9):
+                                current_event_loop.call_soon_threadsafe(future.cancel, "cancelled because a new cull task was scheduled")
+                            else:
+                                current_event_loop.call_soon_threadsafe(future.cancel)
+                        else:
+                            current_event_loop.call_soon_threadsafe(set_done)
+                    except RuntimeError:
+                        pass  # event loop already closed, happens during testing
+
+                entry.future.add_done_callback(done)
             return future
 
     def page_disconnect(self, page_id: str) -> "Optional[asyncio.Future[None]]":
@@ -562,7 +614,7 @@ class VirtualKernelContext:
                 return future
             assert self.page_status[page_id] == PageStatus.CONNECTED, "cannot disconnect a page that is in state: %r" % self.page_status[page_id]
             self.page_status[page_id] = PageStatus.DISCONNECTED
-            has_connected_pages = PageStatus.CONNECTED in self.page_status.values()
+            has_connected_pages = self._page_status.has(PageStatus.CONNECTED)
             if not has_connected_pages:
                 # when we have no connected pages, we will schedule a kernel cull
                 future = self._bump_kernel_cull()
@@ -598,8 +650,8 @@ class VirtualKernelContext:
                 return future
             self.page_status[page_id] = PageStatus.CLOSED
             logger.info("Close page %s for kernel %s", page_id, self.id)
-            has_connected_pages = PageStatus.CONNECTED in self.page_status.values()
-            has_disconnected_pages = PageStatus.DISCONNECTED in self.page_status.values()
+            has_connected_pages = self._page_status.has(PageStatus.CONNECTED)
+            has_disconnected_pages = self._page_status.has(PageStatus.DISCONNECTED)
             # if we have disconnected pages, we may have cancelled the kernel cull task
             # if we still have connected pages, it will go to a disconnected state again
             # which will also trigger a new kernel cull
@@ -634,7 +686,93 @@ except RuntimeError:
     # Emscripten/pyodide/lite
     keep_alive_event_loop = asyncio.get_event_loop()
 
-contexts: Dict[str, VirtualKernelContext] = {}
+
+class _Contexts(Dict[str, VirtualKernelContext]):
+    """The live contexts by kernel id, with incrementally maintained indexes.
+
+    Next to the mapping itself, this keeps the kernel ids per session, and the kernel ids having
+    at least one page in each :class:`PageStatus`. ``/resourcez`` and the per-session kernel limit
+    read these instead of scanning all contexts and their pages, which gets expensive with many
+    thousands of kernels. Culling needs no scan: each kernel schedules its own cull (see
+    :mod:`solara.server.culler`).
+    All indexes are guarded by ``_index_lock``, which is never held while taking another lock.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.by_session: Dict[str, Dict[str, None]] = {}
+        self.by_page_status: Dict[PageStatus, Dict[str, None]] = {status: {} for status in PageStatus}
+
+    def __setitem__(self, kernel_id: str, context: VirtualKernelContext) -> None:
+        with _index_lock:
+            if kernel_id in self:
+                self._remove(kernel_id)
+            super().__setitem__(kernel_id, context)
+            self.by_session.setdefault(context.session_id, {})[kernel_id] = None
+            for status in PageStatus:
+                if context._page_status.has(status):
+                    self.by_page_status[status][kernel_id] = None
+
+    def __delitem__(self, kernel_id: str) -> None:
+        with _index_lock:
+            self._remove(kernel_id)
+
+    def pop(self, kernel_id: str, *default):  # type: ignore
+        with _index_lock:
+            if kernel_id not in self:
+                if default:
+                    return default[0]
+                raise KeyError(kernel_id)
+            context = self[kernel_id]
+            self._remove(kernel_id)
+            return context
+
+    def clear(self) -> None:
+        with _index_lock:
+            super().clear()
+            self.by_session.clear()
+            for kernel_ids in self.by_page_status.values():
+                kernel_ids.clear()
+
+    def _remove(self, kernel_id: str) -> None:
+        context = self[kernel_id]
+        super().__delitem__(kernel_id)
+        session = self.by_session.get(context.session_id)
+        if session is not None:
+            session.pop(kernel_id, None)
+            if not session:
+                del self.by_session[context.session_id]
+        for kernel_ids in self.by_page_status.values():
+            kernel_ids.pop(kernel_id, None)
+
+    def _registered(self, context: VirtualKernelContext) -> bool:
+        return self.get(context.id) is context
+
+    def _status_changed(self, context: VirtualKernelContext, status: PageStatus, present: bool) -> None:
+        if self._registered(context):
+            if present:
+                self.by_page_status[status][context.id] = None
+            else:
+                self.by_page_status[status].pop(context.id, None)
+
+    def count_for_session(self, session_id: str) -> int:
+        with _index_lock:
+            return len(self.by_session.get(session_id, ()))
+
+    def counts(self) -> Dict[str, int]:
+        """The number of kernels, sessions, and kernels having a page in each status."""
+        with _index_lock:
+            return {
+                "total": len(self),
+                "sessions": len(self.by_session),
+                "has_connected": len(self.by_page_status[PageStatus.CONNECTED]),
+                "has_disconnected": len(self.by_page_status[PageStatus.DISCONNECTED]),
+                "has_closed": len(self.by_page_status[PageStatus.CLOSED]),
+            }
+
+
+_index_lock = threading.Lock()
+contexts = _Contexts()
 
 # Closed kernel contexts are reference cycles (widgets, reacton render contexts and the
 # IPython shell all reference each other), so plain refcounting cannot free them: they wait
@@ -671,8 +809,36 @@ def _schedule_gc_after_kernel_close():
     thread.start()
 
 
+class _CurrentContexts(Dict[str, Optional[VirtualKernelContext]]):
+    """:data:`current_context`, with a ``version`` that changes on every write.
+
+    A thread remembers its last lookup together with the version, so repeated lookups (every
+    reactive read does one) skip computing the thread key until some context is entered or left.
+    """
+
+    version = 0
+
+    def __setitem__(self, key: str, context: Optional[VirtualKernelContext]) -> None:
+        super().__setitem__(key, context)
+        self.version += 1
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        self.version += 1
+
+    def pop(self, key: str, *args: Any) -> Any:  # type: ignore
+        try:
+            return super().pop(key, *args)
+        finally:
+            self.version += 1
+
+    def clear(self) -> None:
+        super().clear()
+        self.version += 1
+
+
 # maps from thread key to VirtualKernelContext, if VirtualKernelContext is None, it exists, but is not set as current
-current_context: Dict[str, Optional[VirtualKernelContext]] = {}
+current_context = _CurrentContexts()
 
 
 def create_dummy_context():
@@ -737,6 +903,31 @@ def clear_context_for_thread(thread: threading.Thread):
     current_context.pop(key, None)
 
 
+def get_current_context_or_none() -> Optional[VirtualKernelContext]:
+    """The current context, or None, in one lookup.
+
+    In threaded mode, outside of ``async with context``, the result is cached per thread until
+    :data:`current_context` changes.
+    """
+    if solara.server.settings.kernel.threaded and not async_stack.get():
+        name = threading.current_thread()._name  # type: ignore
+        version = current_context.version
+        cache = local.context_cache
+        if cache is not None and cache[0] == version and cache[1] == name:
+            if cache[2] is None:
+                return None
+            context = cache[2]()
+            if context is not None:
+                return context
+        context = current_context.get(get_current_thread_key())
+        local.context_cache = (version, name, weakref.ref(context) if context is not None else None)
+        return context
+    try:
+        return current_context.get(get_current_thread_key())
+    except RuntimeError:
+        return None
+
+
 def has_current_context() -> bool:
     thread_key = get_current_thread_key()
     return (thread_key in current_context) and (current_context[thread_key] is not None)
@@ -806,15 +997,11 @@ def _get_takeover_executor() -> "concurrent.futures.ThreadPoolExecutor":
 
 def _has_connected_page(context: VirtualKernelContext) -> bool:
     # lock-free snapshot read (§5.3): the flush worker calls this off the hot path
-    return PageStatus.CONNECTED in tuple(context.page_status.values())
+    return context._page_status.has(PageStatus.CONNECTED)
 
 
-def _restore_on_connect(context: VirtualKernelContext, backend, session_id: str) -> None:
-    """Run the atomic backend takeover for a fresh context and attach persistence (§5.1/§5.3).
-
-    Never blocks past ``state.connect_timeout`` and never raises: any failure degrades to today's
-    behavior (a fresh, unpersisted kernel). Called OUTSIDE ``_init_lock`` (backend I/O).
-    """
+def _restore_preflight(context: VirtualKernelContext, session_id: str) -> Optional[Tuple[bytes, List[bytes], str]]:
+    """The checks before a connect-time takeover; ``(session_hmac, candidates, schema_tag)``, or None to skip it."""
     import solara.state as solara_state
     from solara.state.stats import log_restore
 
@@ -824,61 +1011,65 @@ def _restore_on_connect(context: VirtualKernelContext, backend, session_id: str)
     # the keyspace; such a kernel simply runs unpersisted (degrade, never fail the connection).
     if not _KERNEL_ID_RE.match(kernel_id):
         logger.warning("state restore skipped for kernel %s: kernel id outside the safe charset", kernel_id)
-        return
-
-    breaker = solara_state.get_breaker()
-    shmac = solara_state.session_hmac(session_id)  # primary: what the manager WRITES on flush (sign-first)
-    shmac_candidates = solara_state.session_hmacs(session_id)  # verify-ANY set for takeover (key rotation)
-    schema_tag = solara_state.effective_schema_tag()
-    stats = solara_state.stats()
+        return None
 
     # breaker gates restores too (§5.3): during a brownout, skip the takeover read instantly
     # instead of paying the deadline on every connect of a deploy herd.
-    if not breaker.allow():
-        stats.incr("restore_attempts")
+    if not solara_state.get_breaker().allow():
+        solara_state.stats().incr("restore_attempts")
         log_restore("timeout", kernel=kernel_id)
         logger.info("state restore skipped for kernel %s (circuit breaker open)", kernel_id)
-        return
+        return None
 
-    timeout = float(solara.server.settings.state.connect_timeout)
-    future = _get_takeover_executor().submit(backend.takeover, kernel_id, shmac_candidates, schema_tag)
-    try:
-        result = future.result(timeout=timeout)
-    except concurrent.futures.TimeoutError:
-        # claim-or-delete (§5.1/§12 zombie fix): we degrade to an unpersisted kernel now, but the
-        # takeover already bumped (or will bump) the generation in the backend. Leaving the hash
-        # readable would let a LATER failover silently roll the user back to this pre-timeout
-        # snapshot after they diverged. So when the late takeover finally completes, use its result
-        # ONLY to fenced-delete the hash (fire-and-forget on the executor thread that completes it).
-        breaker.record_failure()
-        stats.incr("restore_attempts")
-        stats.record_backend_error("takeover timeout")
-        log_restore("timeout", kernel=kernel_id)
+    shmac = solara_state.session_hmac(session_id)  # primary: what the manager WRITES on flush (sign-first)
+    shmac_candidates = solara_state.session_hmacs(session_id)  # verify-ANY set for takeover (key rotation)
+    return shmac, shmac_candidates, solara_state.effective_schema_tag()
 
-        def _claim_or_delete(fut: "concurrent.futures.Future") -> None:
-            try:
-                res = fut.result()
-            except Exception:  # noqa
-                return
-            if res.reason in ("restored", "miss", "schema-reset") and res.generation:
-                try:
-                    backend.delete(kernel_id, generation=res.generation)
-                except Exception:  # noqa
-                    logger.exception("late takeover claim-or-delete failed for kernel %s", kernel_id)
 
-        future.add_done_callback(_claim_or_delete)
-        return
-    except Exception:  # noqa
-        breaker.record_failure()
-        stats.incr("restore_attempts")
-        stats.record_backend_error("takeover raised")
-        log_restore("timeout", kernel=kernel_id)
-        logger.exception("state takeover raised for kernel %s", kernel_id)
-        return
+def _takeover_timed_out(kernel_id: str) -> None:
+    import solara.state as solara_state
+    from solara.state.stats import log_restore
+
+    solara_state.get_breaker().record_failure()
+    stats = solara_state.stats()
+    stats.incr("restore_attempts")
+    stats.record_backend_error("takeover timeout")
+    log_restore("timeout", kernel=kernel_id)
+
+
+def _claim_or_delete(backend, kernel_id: str, result) -> None:
+    # claim-or-delete (§5.1/§12 zombie fix): a takeover that completes after the connect deadline
+    # already bumped the generation in the backend, but we degraded to an unpersisted kernel.
+    # Leaving the hash readable would let a LATER failover silently roll the user back to this
+    # pre-timeout snapshot after they diverged, so its result is used ONLY to fenced-delete it.
+    if result.reason in ("restored", "miss", "schema-reset") and result.generation:
+        try:
+            backend.delete(kernel_id, generation=result.generation)
+        except Exception:  # noqa
+            logger.exception("late takeover claim-or-delete failed for kernel %s", kernel_id)
+
+
+def _takeover_raised(kernel_id: str) -> None:
+    import solara.state as solara_state
+    from solara.state.stats import log_restore
+
+    solara_state.get_breaker().record_failure()
+    stats = solara_state.stats()
+    stats.incr("restore_attempts")
+    stats.record_backend_error("takeover raised")
+    log_restore("timeout", kernel=kernel_id)
+    logger.exception("state takeover raised for kernel %s", kernel_id)
+
 
+def _attach_after_takeover(context: VirtualKernelContext, backend, result, shmac: bytes, schema_tag: str) -> None:
+    """Attach persistence and start the flush worker for a completed takeover (never raises)."""
+    import solara.state as solara_state
+
+    kernel_id = context.id
+    breaker = solara_state.get_breaker()
     breaker.record_success()
     if result.generation == 0:  # identity-mismatch (§5.1) - mirrors the in-memory hijack guard
-        stats.incr("restore_attempts")
+        solara_state.stats().incr("restore_attempts")
         logger.warning("state takeover identity mismatch for kernel %s (session hijack?); serving unpersisted", kernel_id)
         return
 
@@ -907,11 +1098,81 @@ def _restore_on_connect(context: VirtualKernelContext, backend, session_id: str)
         breaker=breaker,
         has_connected_page=lambda: _has_connected_page(context),
         on_superseded=lambda: context.close(reason="superseded"),
+        scheduler=solara_state.get_flush_scheduler(),
     )
     context.state_flush_worker = worker
     worker.start()
 
 
+def _restore_on_connect(context: VirtualKernelContext, backend, session_id: str) -> None:
+    """Run the atomic backend takeover for a fresh context and attach persistence (§5.1/§5.3).
+
+    Never blocks past ``state.connect_timeout`` and never raises: any failure degrades to today's
+    behavior (a fresh, unpersisted kernel). Called OUTSIDE ``_init_lock`` (backend I/O).
+    """
+    preflight = _restore_preflight(context, session_id)
+    if preflight is None:
+        return
+    shmac, shmac_candidates, schema_tag = preflight
+    kernel_id = context.id
+
+    timeout = float(solara.server.settings.state.connect_timeout)
+    future = _get_takeover_executor().submit(backend.takeover, kernel_id, shmac_candidates, schema_tag)
+    try:
+        result = future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        _takeover_timed_out(kernel_id)
+
+        def _late(fut: "concurrent.futures.Future") -> None:
+            # fire-and-forget on the executor thread that completes the takeover
+            try:
+                res = fut.result()
+            except Exception:  # noqa
+                return
+            _claim_or_delete(backend, kernel_id, res)
+
+        future.add_done_callback(_late)
+        return
+    except Exception:  # noqa
+        _takeover_raised(kernel_id)
+        return
+    _attach_after_takeover(context, backend, result, shmac, schema_tag)
+
+
+async def _restore_on_connect_async(context: VirtualKernelContext, backend, session_id: str) -> None:
+    """:func:`_restore_on_connect` for a natively async backend: the takeover is awaited on the
+    connection's event loop instead of occupying a takeover-executor thread. Same deadline,
+    same claim-or-delete of a late result, never raises.
+    """
+    preflight = _restore_preflight(context, session_id)
+    if preflight is None:
+        return
+    shmac, shmac_candidates, schema_tag = preflight
+    kernel_id = context.id
+
+    timeout = float(solara.server.settings.state.connect_timeout)
+    task = asyncio.ensure_future(backend.takeover_async(kernel_id, shmac_candidates, schema_tag))
+    try:
+        # shielded: the deadline abandons the takeover, it does not cancel it (its late result
+        # is needed for claim-or-delete)
+        result = await asyncio.wait_for(asyncio.shield(task), timeout)
+    except asyncio.TimeoutError:
+        _takeover_timed_out(kernel_id)
+
+        def _late(fut: "asyncio.Future") -> None:
+            if fut.cancelled() or fut.exception() is not None:
+                return
+            # the fenced delete is blocking I/O: keep it off this event loop
+            _get_takeover_executor().submit(_claim_or_delete, backend, kernel_id, fut.result())
+
+        task.add_done_callback(_late)
+        return
+    except Exception:  # noqa
+        _takeover_raised(kernel_id)
+        return
+    _attach_after_takeover(context, backend, result, shmac, schema_tag)
+
+
 def _reuse_context_is_stale(context: VirtualKernelContext, backend) -> bool:
     """Whether a reused in-memory context has been superseded in the shared backend (§5.1).
 
@@ -921,13 +1182,7 @@ def _reuse_context_is_stale(context: VirtualKernelContext, backend) -> bool:
     in-memory (the documented TOCTOU closure: the fenced write path catches real mismatches).
     Never raises. Called OUTSIDE ``_init_lock`` (backend I/O).
     """
-    import solara.state as solara_state
-
-    manager = context.state_persistence
-    if manager is None or manager.disabled:
-        return False
-    breaker = solara_state.get_breaker()
-    if not breaker.allow():
+    if not _reuse_check_allowed(context):
         return False
     try:
         # The redis backend builds its client with socket_timeout/socket_connect_timeout set to
@@ -935,12 +1190,45 @@ def _reuse_context_is_stale(context: VirtualKernelContext, backend) -> bool:
         # even on the reuse branch - a hung Redis cannot block the reconnect path. The breaker
         # additionally bounds sustained brownouts.
         stored = backend.peek_generation(context.id)
-        breaker.record_success()
     except Exception:  # noqa
-        breaker.record_failure()
-        logger.exception("peek_generation failed for kernel %s; serving in-memory", context.id)
+        return _reuse_peek_failed(context)
+    return _reuse_peeked(context, stored)
+
+
+async def _reuse_context_is_stale_async(context: VirtualKernelContext, backend) -> bool:
+    """:func:`_reuse_context_is_stale`, awaiting the peek on the connection's event loop."""
+    if not _reuse_check_allowed(context):
+        return False
+    try:
+        stored = await backend.peek_generation_async(context.id)
+    except Exception:  # noqa
+        return _reuse_peek_failed(context)
+    return _reuse_peeked(context, stored)
+
+
+def _reuse_check_allowed(context: VirtualKernelContext) -> bool:
+    import solara.state as solara_state
+
+    manager = context.state_persistence
+    if manager is None or manager.disabled:
         return False
-    if stored is None:
+    return solara_state.get_breaker().allow()
+
+
+def _reuse_peek_failed(context: VirtualKernelContext) -> bool:
+    import solara.state as solara_state
+
+    solara_state.get_breaker().record_failure()
+    logger.exception("peek_generation failed for kernel %s; serving in-memory", context.id)
+    return False
+
+
+def _reuse_peeked(context: VirtualKernelContext, stored: Optional[int]) -> bool:
+    import solara.state as solara_state
+
+    solara_state.get_breaker().record_success()
+    manager = context.state_persistence
+    if stored is None or manager is None:
         return False
     return stored != manager.generation
 
@@ -954,11 +1242,17 @@ def _wire_kernel_streams(context: VirtualKernelContext, websocket: websocket.Web
         context.kernel.session.websockets.add(websocket)
 
 
-def initialize_virtual_kernel(session_id: str, kernel_id: str, websocket: websocket.WebsocketWrapper):
+def register_comm_targets(context: VirtualKernelContext) -> None:
     from solara.server import app as appmodule
-    import solara.state as solara_state
 
-    backend = solara_state.get_backend()
+    with context:
+        widgets.register_comm_target(context.kernel)
+        appmodule.register_solara_comm_target(context.kernel)
+
+
+def _reserve_context(session_id: str, kernel_id: str, websocket: websocket.WebsocketWrapper, backend) -> Tuple[VirtualKernelContext, bool]:
+    """Find or create the context slot for ``kernel_id``; returns ``(context, newly_created)``."""
+    from solara.server import kernel_pool
 
     # Reserve or find the context slot under a small lock (no backend I/O here, §5.1). A brand-new
     # context is created and registered immediately - the slot is "reserved" - so a concurrent
@@ -989,7 +1283,7 @@ def initialize_virtual_kernel(session_id: str, kernel_id: str, websocket: websoc
             # unchanged for deployments that do not opt into persistence.
             max_per_session = solara.server.settings.kernel.max_per_session
             if max_per_session and backend is not None:
-                live_for_session = sum(1 for c in contexts.values() if c.session_id == session_id)
+                live_for_session = contexts.count_for_session(session_id)
                 if live_for_session >= max_per_session:
                     logger.warning(
                         "session %s already has %d live kernels (max_per_session=%d); refusing new kernel %s",
@@ -999,11 +1293,16 @@ def initialize_virtual_kernel(session_id: str, kernel_id: str, websocket: websoc
                         redact_id(kernel_id),
                     )
                     raise RuntimeError("too many live kernels for this session")
-            kernel = Kernel()
-            logger.info("new virtual kernel: %s", kernel_id)
-            context = contexts[kernel_id] = VirtualKernelContext(
-                id=kernel_id, session_id=session_id, kernel=kernel, control_sockets=[], widgets={}, templates={}
-            )
+            context = kernel_pool.take(kernel_id, session_id)
+            if context is None:
+                kernel = Kernel()
+                logger.info("new virtual kernel: %s", kernel_id)
+                context = VirtualKernelContext(id=kernel_id, session_id=session_id, kernel=kernel, control_sockets=[], widgets={}, templates={})
+                warm = False
+            else:
+                logger.info("new virtual kernel from the pool: %s", kernel_id)
+                warm = True
+            contexts[kernel_id] = context
             newly_created = True
 
     if mismatch:
@@ -1021,25 +1320,69 @@ def initialize_virtual_kernel(session_id: str, kernel_id: str, websocket: websoc
         raise ValueError("Session id mismatch")
 
     if newly_created:
-        with context:
-            widgets.register_comm_target(context.kernel)
-            appmodule.register_solara_comm_target(context.kernel)
+        if warm:
+            context._run_start_callbacks()
+        else:
+            register_comm_targets(context)
+    return context, newly_created
+
+
+def _supersede_stale(context: VirtualKernelContext) -> None:
+    logger.info("virtual kernel %s superseded (generation mismatch); recreating with a fresh takeover", context.id)
+    # close the stale context (flush-and-leave; backend I/O, so OUTSIDE _init_lock), which
+    # frees the slot, so the caller can recurse to run the normal atomic takeover + restore.
+    context.close(reason="superseded")
+
+
+def _resume_reused(context: VirtualKernelContext) -> None:
+    logger.info("reusing virtual kernel: %s", context.id)
+    worker = context.state_flush_worker
+    if worker is not None:
+        # a genuine client reconnect starts a new connection epoch: reset the one-re-takeover
+        # budget of the rejection protocol (§5.5)
+        worker.new_epoch()
+
+
+def initialize_virtual_kernel(session_id: str, kernel_id: str, websocket: websocket.WebsocketWrapper):
+    import solara.state as solara_state
+
+    backend = solara_state.get_backend()
+    context, newly_created = _reserve_context(session_id, kernel_id, websocket, backend)
+    if newly_created:
         if backend is not None:
             _restore_on_connect(context, backend, session_id)
     else:
         # reuse branch (§5.1): verify ownership against the shared backend before serving
         if backend is not None and context.state_persistence is not None and _reuse_context_is_stale(context, backend):
-            logger.info("virtual kernel %s superseded (generation mismatch); recreating with a fresh takeover", kernel_id)
-            # close the stale context (flush-and-leave; backend I/O, so OUTSIDE _init_lock), which
-            # frees the slot, then recurse to run the normal atomic takeover + restore.
-            context.close(reason="superseded")
+            _supersede_stale(context)
             return initialize_virtual_kernel(session_id, kernel_id, websocket)
-        logger.info("reusing virtual kernel: %s", kernel_id)
-        worker = context.state_flush_worker
-        if worker is not None:
-            # a genuine client reconnect starts a new connection epoch: reset the one-re-takeover
-            # budget of the rejection protocol (§5.5)
-            worker.new_epoch()
+        _resume_reused(context)
+
+    _wire_kernel_streams(context, websocket)
+    return context
+
+
+async def initialize_virtual_kernel_async(session_id: str, kernel_id: str, websocket: websocket.WebsocketWrapper):
+    """:func:`initialize_virtual_kernel` for the websocket's event loop.
+
+    With a natively async state backend (``StateBackend.native_async``), the connect-time
+    takeover and the reuse-branch peek are awaited instead of blocking the loop (or a
+    takeover-executor thread) for up to ``state.connect_timeout``. Any other backend takes
+    the blocking path unchanged.
+    """
+    import solara.state as solara_state
+
+    backend = solara_state.get_backend()
+    if backend is None or not backend.native_async:
+        return initialize_virtual_kernel(session_id, kernel_id, websocket)
+    context, newly_created = _reserve_context(session_id, kernel_id, websocket, backend)
+    if newly_created:
+        await _restore_on_connect_async(context, backend, session_id)
+    else:
+        if context.state_persistence is not None and await _reuse_context_is_stale_async(context, backend):
+            _supersede_stale(context)
+            return await initialize_virtual_kernel_async(session_id, kernel_id, websocket)
+        _resume_reused(context)
 
     _wire_kernel_streams(context, websocket)
     return context
@@ -0,0 +1,220 @@
+"""Pool of pre-warmed virtual kernels (``SOLARA_KERNEL_POOL_SIZE``).
+
+A new page normally builds its virtual kernel when the websocket connects: the ``Kernel`` with
+its session and comm manager, the ``VirtualKernelContext``, and the registration of the comm
+targets. Loading the app then creates the ESM module widgets (:func:`solara.server.app.create_module_widgets`).
+With a pool, a background thread does this ahead of time for ``SOLARA_KERNEL_POOL_SIZE``
+kernels, and a new page takes one of them. The thread refills the pool after each handout.
+
+A pre-warmed kernel is not connected to a page yet: the messages that open its module widgets
+are kept, and sent when the page loads the app, after the frontend registered its widget
+manager. The ``on_kernel_start`` callbacks run at handout, since they may depend on the session.
+
+``/resourcez`` reports the handouts and the cold starts (new kernels built while the page waits,
+because the pool is off or empty) in ``kernel_pool``.
+"""
+
+import logging
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Union
+
+from . import kernel_context, settings, websocket
+from .kernel import Kernel
+
+logger = logging.getLogger("solara.server.kernel_pool")
+
+
+class KernelPoolInfo:
+    """Process-wide counters of the kernel pool, for /resourcez."""
+
+    lock = threading.Lock()
+    handouts = 0
+    cold_starts = 0
+    warmed = 0
+    warm_seconds = 0.0
+    errors = 0
+
+    @classmethod
+    def record(cls, handouts: int = 0, cold_starts: int = 0, warm_seconds: Optional[float] = None, errors: int = 0) -> None:
+        with cls.lock:
+            cls.handouts += handouts
+            cls.cold_starts += cold_starts
+            if warm_seconds is not None:
+                cls.warmed += 1
+                cls.warm_seconds += warm_seconds
+            cls.errors += errors
+
+    @classmethod
+    def as_dict(cls) -> Dict[str, Any]:
+        with cls.lock:
+            new_kernels = cls.handouts + cls.cold_starts
+            return {
+                "handouts": cls.handouts,
+                "cold_starts": cls.cold_starts,
+                "handout_rate": round(cls.handouts / new_kernels, 3) if new_kernels else None,
+                "warmed": cls.warmed,
+                "warm_seconds_mean": round(cls.warm_seconds / cls.warmed, 6) if cls.warmed else None,
+                "errors": cls.errors,
+            }
+
+    @classmethod
+    def _reset(cls) -> None:
+        with cls.lock:
+            cls.handouts = cls.cold_starts = cls.warmed = cls.errors = 0
+            cls.warm_seconds = 0.0
+
+
+class _Recorder(websocket.WebsocketWrapper):
+    # stands in for the page's websocket while a kernel warms up
+    def __init__(self) -> None:
+        self.frames: List[Union[str, bytes]] = []
+
+    def send_text(self, data: str) -> None:
+        self.frames.append(data)
+
+    def send_bytes(self, data: bytes) -> None:
+        self.frames.append(data)
+
+    def close(self) -> None:
+        pass
+
+    async def receive(self) -> Union[str, bytes]:
+        raise websocket.WebSocketDisconnect()
+
+
+class KernelPool:
+    """Keeps up to ``size`` pre-warmed contexts, refilled by a daemon thread."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._ready: List[kernel_context.VirtualKernelContext] = []
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._loop = kernel_context._get_or_create_event_loop()
+        self._thread = threading.Thread(target=self._fill, name="solara-kernel-pool", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    @property
+    def ready(self) -> int:
+        return len(self._ready)
+
+    def warm(self) -> kernel_context.VirtualKernelContext:
+        """Build one context as a new page would, without a page attached."""
+        from . import app
+
+        start = time.perf_counter()
+        context = kernel_context.VirtualKernelContext(
+            id=f"pool-{uuid.uuid4()}",
+            session_id="",
+            kernel=Kernel(),
+            control_sockets=[],
+            widgets={},
+            templates={},
+            event_loop=self._loop,
+            start=False,
+        )
+        kernel_context.register_comm_targets(context)
+        recorder = _Recorder()
+        session = context.kernel.session
+        session.websockets.add(recorder)
+        try:
+            with context:
+                app.create_module_widgets()
+        finally:
+            session.websockets.discard(recorder)
+        context.prewarmed_frames = recorder.frames
+        KernelPoolInfo.record(warm_seconds=time.perf_counter() - start)
+        return context
+
+    def _fill(self) -> None:
+        while True:
+            with self._condition:
+                while not self._stopped and len(self._ready) >= self.size:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+            try:
+                context = self.warm()
+            except Exception:
+                logger.exception("could not pre-warm a virtual kernel, stopping the kernel pool")
+                KernelPoolInfo.record(errors=1)
+                return
+            with self._condition:
+                if self._stopped:
+                    stale = True
+                else:
+                    self._ready.append(context)
+                    stale = False
+            if stale:
+                context.close(reason="server-shutdown")
+
+    def take(self) -> Optional[kernel_context.VirtualKernelContext]:
+        with self._condition:
+            if not self._ready:
+                return None
+            context = self._ready.pop(0)
+            self._condition.notify()
+        return context
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            ready, self._ready = self._ready, []
+            self._condition.notify()
+        for context in ready:
+            try:
+                context.close(reason="server-shutdown")
+            except Exception:
+                logger.exception("error closing a pre-warmed kernel")
+
+
+pool: Optional[KernelPool] = None
+
+
+def start() -> None:
+    global pool
+    if settings.kernel.pool_size > 0 and pool is None:
+        pool = KernelPool(settings.kernel.pool_size)
+        pool.start()
+
+
+def stop() -> None:
+    global pool
+    if pool is not None:
+        pool.stop()
+        pool = None
+
+
+def take(kernel_id: str, session_id: str) -> Optional[kernel_context.VirtualKernelContext]:
+    """A pre-warmed context, renamed to ``kernel_id``, or None (a cold start)."""
+    context = pool.take() if pool is not None else None
+    if context is None:
+        KernelPoolInfo.record(cold_starts=1)
+        return None
+    pool_id = context.id
+    context.id = kernel_id
+    context.session_id = session_id
+    # the loop of the thread serving the page, as for a context created here
+    context.event_loop = kernel_context._get_or_create_event_loop()
+    for name in ["solara.server.esm", "solara.server.esm_vue"]:
+        module = sys.modules.get(name)
+        if module is not None:
+            module.rename_kernel(pool_id, kernel_id)
+    KernelPoolInfo.record(handouts=1)
+    return context
+
+
+def send_prewarmed_frames(context: kernel_context.VirtualKernelContext) -> None:
+    """Send the messages a pre-warmed kernel produced before it had a page."""
+    frames, context.prewarmed_frames = context.prewarmed_frames, None
+    for frame in frames or []:
+        context.kernel.session._send_wire(frame)
+
+
+def as_dict() -> Dict[str, Any]:
+    return {"size": pool.size if pool is not None else 0, "ready": pool.ready if pool is not None else 0, **KernelPoolInfo.as_dict()}
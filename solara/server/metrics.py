@@ -0,0 +1,220 @@
+"""Per-message timing of the kernel websocket, for /resourcez and /metricsz.
+
+For each incoming message, ``app_loop`` records how long it spent in each phase:
+
+- ``receive``: waiting for and reading the message; mostly the time the user did nothing.
+- ``deserialize``: turning the frame into a message dict.
+- ``lock_wait``: waiting for ``context.lock``, held by another connection or a thread of the
+  same kernel.
+- ``handler``: running the message (event handlers, renders), excluding ``send``.
+- ``send``: handing outgoing frames to the websocket(s), or to the send queue.
+
+Each phase goes into a histogram with fixed buckets, per message type (``comm_msg/update``,
+``comm_msg/custom``, ``kernel_info_request``, ...). Recording a message is a handful of
+``bisect`` calls under one lock, so this is on by default (``SOLARA_SERVER_MESSAGE_METRICS``).
+Every kernel keeps its own histograms (``context.message_metrics``), and the process keeps the
+totals, including kernels that are gone. ``/metricsz`` serves the totals in the Prometheus text
+format, and is only routed with ``SOLARA_SERVER_METRICSZ=true``.
+"""
+
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+PHASES = ("receive", "deserialize", "lock_wait", "handler", "send")
+
+# upper bounds in seconds, like the Prometheus client defaults but starting lower
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# the client picks the message type, so labels are limited to known values (bounded cardinality)
+_MSG_TYPES = {
+    "comm_msg",
+    "comm_open",
+    "comm_close",
+    "comm_info_request",
+    "kernel_info_request",
+    "execute_request",
+    "complete_request",
+    "inspect_request",
+    "history_request",
+    "is_complete_request",
+    "interrupt_request",
+    "shutdown_request",
+}
+_COMM_METHODS = {"update", "request_state", "request_states", "custom", "echo_update"}
+
+
+def message_type(msg: Dict[str, Any]) -> str:
+    """The label a message is recorded under, e.g. ``comm_msg/update``."""
+    header = msg.get("header")
+    msg_type = header.get("msg_type") if isinstance(header, dict) else None
+    if msg_type not in _MSG_TYPES:
+        return "other"
+    if msg_type == "comm_msg":
+        content = msg.get("content")
+        data = content.get("data") if isinstance(content, dict) else None
+        method = data.get("method") if isinstance(data, dict) else None
+        return "comm_msg/" + (method if method in _COMM_METHODS else "other")
+    return msg_type
+
+
+class Histogram:
+    """Counts of observations per bucket of :data:`BUCKETS`, plus one for everything above."""
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        # bucket upper bounds are inclusive (Prometheus ``le``)
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram") -> None:
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket the q-quantile falls in (the maximum, above the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": round(self.max, 6),
+        }
+
+
+class MessageMetrics:
+    """Histograms per (phase, message type) and counters, of one kernel or of the whole process."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.messages = 0
+        self.renders = 0
+        self.widgets_opened = 0
+        self.widgets_closed = 0
+
+    def record(self, msg_type: str, timings: Dict[str, float], renders: int = 0, widgets_opened: int = 0, widgets_closed: int = 0) -> None:
+        with self.lock:
+            self.messages += 1
+            self.renders += renders
+            self.widgets_opened += widgets_opened
+            self.widgets_closed += widgets_closed
+            for phase, seconds in timings.items():
+                histogram = self.histograms.get((phase, msg_type))
+                if histogram is None:
+                    histogram = self.histograms[(phase, msg_type)] = Histogram()
+                histogram.observe(seconds)
+
+    def snapshot(self) -> Tuple[Dict[str, int], Dict[Tuple[str, str], Histogram]]:
+        """Consistent copies of the counters and histograms."""
+        with self.lock:
+            counters = {
+                "messages": self.messages,
+                "renders": self.renders,
+                "widgets_opened": self.widgets_opened,
+                "widgets_closed": self.widgets_closed,
+            }
+            histograms = {}
+            for key, histogram in self.histograms.items():
+                copy = histograms[key] = Histogram()
+                copy.merge(histogram)
+        return counters, histograms
+
+    def as_dict(self, by_type: bool = True) -> Dict[str, Any]:
+        counters, histograms = self.snapshot()
+        phases: Dict[str, Histogram] = {}
+        for (phase, _), histogram in histograms.items():
+            phases.setdefault(phase, Histogram()).merge(histogram)
+        data: Dict[str, Any] = {**counters, "phases": {phase: phases[phase].as_dict() for phase in PHASES if phase in phases}}
+        if by_type:
+            types: Dict[str, Dict[str, Any]] = {}
+            for (phase, msg_type), histogram in sorted(histograms.items()):
+                types.setdefault(msg_type, {})[phase] = histogram.as_dict()
+            data["by_type"] = types
+        return data
+
+
+totals = MessageMetrics()
+
+
+def record(
+    metrics: Optional[MessageMetrics], msg_type: str, timings: Dict[str, float], renders: int = 0, widgets_opened: int = 0, widgets_closed: int = 0
+) -> None:
+    """Record one handled message in the kernel's metrics (if given) and in the process totals."""
+    if metrics is not None:
+        metrics.record(msg_type, timings, renders, widgets_opened, widgets_closed)
+    totals.record(msg_type, timings, renders, widgets_opened, widgets_closed)
+
+
+class _Tally(threading.local):
+    # what the kernel sent from this thread; app_loop takes the difference across a handler
+    send_seconds = 0.0
+    widgets_opened = 0
+    widgets_closed = 0
+
+
+tally = _Tally()
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(metrics: Optional[MessageMetrics] = None, prefix: str = "solara") -> str:
+    """The metrics (by default the process totals) in the Prometheus text exposition format."""
+    counters, histograms = (metrics or totals).snapshot()
+    lines: List[str] = []
+    help_texts = {
+        "messages": "Incoming kernel messages handled.",
+        "renders": "Render passes run while handling kernel messages.",
+        "widgets_opened": "Widgets opened on the frontend while handling kernel messages.",
+        "widgets_closed": "Widgets closed on the frontend while handling kernel messages.",
+    }
+    for name, value in counters.items():
+        lines.append(f"# HELP {prefix}_{name}_total {help_texts[name]}")
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total {value}")
+    name = f"{prefix}_message_phase_seconds"
+    lines.append(f"# HELP {name} Time spent per incoming kernel message, by phase and message type.")
+    lines.append(f"# TYPE {name} histogram")
+    for (phase, msg_type), histogram in sorted(histograms.items()):
+        labels = f'phase="{_label(phase)}",msg_type="{_label(msg_type)}"'
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum!r}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+def _reset() -> None:
+    global totals
+    totals = MessageMetrics()
@@ -0,0 +1,269 @@
+"""Bounded per-connection send queue for the kernel websocket.
+
+By default, each message a kernel thread sends goes through ``portal.call`` to the event loop.
+The render thread waits for one loop round trip per message, and for the write itself when the
+client is slow. ``SOLARA_SERVER_SEND_QUEUE=true`` (or ``SOLARA_EXPERIMENTAL_PERFORMANCE``)
+hands the frames to a per-connection queue instead:
+
+- the sending thread appends to the queue and returns; one event loop task per connection
+  drains it, woken up when the queue goes from empty to non-empty (no polling);
+- ``update`` messages for the same comm and the same set of traits supersede each other:
+  while an older one is still queued, it is dropped and the new one is appended at the end.
+  Only the latest state of a trait matters to the frontend, and it never refers to widgets
+  opened after it.
+- the queue has a high-water mark (``SOLARA_SERVER_SEND_QUEUE_MAX_MESSAGES`` messages or
+  ``SOLARA_SERVER_SEND_QUEUE_MAX_BYTES`` bytes). What happens above it is the policy
+  (``SOLARA_SERVER_SEND_QUEUE_POLICY``):
+
+  - ``block`` (default): the sending thread waits until the client catches up below the mark,
+    so a render runs at the pace of the client. A client that does not catch up within
+    ``SOLARA_SERVER_SEND_QUEUE_BLOCK_TIMEOUT`` seconds is disconnected.
+  - ``drop-coalesce``: never wait, only rely on dropping superseded updates. A client that
+    falls behind to twice the mark is disconnected.
+  - ``disconnect``: disconnect a client as soon as it falls behind the mark.
+
+  A disconnected page reconnects to its kernel and fetches the current widget state, which is
+  cheaper than streaming every intermediate update to it. Sends from the event loop thread
+  itself never wait (that would deadlock); they only count toward the mark.
+
+Queue depth, coalesced messages and time spent blocked are reported per kernel in
+``/resourcez`` (``send_queues``).
+"""
+
+import asyncio
+import collections
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, Union
+
+from . import websocket
+
+logger = logging.getLogger("solara.server.send_queue")
+
+POLICIES = ("block", "drop-coalesce", "disconnect")
+
+
+def check_policy(policy: str) -> None:
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown SOLARA_SERVER_SEND_QUEUE_POLICY {policy!r}, expected one of {', '.join(POLICIES)}")
+
+
+def coalesce_key(msg: Dict[str, Any]) -> Optional[Hashable]:
+    """The key under which a later message supersedes ``msg``, or None.
+
+    Only plain ipywidgets ``update`` messages qualify. ``echo_update`` is excluded because the
+    frontend matches echoes against its own pending changes.
+    """
+    content = msg.get("content")
+    if msg.get("msg_type") != "comm_msg" or not isinstance(content, dict):
+        return None
+    data = content.get("data")
+    if not isinstance(data, dict) or data.get("method") != "update" or data.get("buffer_paths") or not isinstance(data.get("state"), dict):
+        return None
+    return (content.get("comm_id"), tuple(sorted(data["state"])))
+
+
+class SendQueueInfo:
+    """Process-wide totals, including connections that are gone (see /resourcez)."""
+
+    lock = threading.Lock()
+    coalesced = 0
+    blocked = 0
+    blocked_seconds = 0.0
+    disconnects = 0
+
+    @classmethod
+    def record(cls, coalesced: int = 0, blocked_seconds: Optional[float] = None, disconnects: int = 0) -> None:
+        with cls.lock:
+            cls.coalesced += coalesced
+            if blocked_seconds is not None:
+                cls.blocked += 1
+                cls.blocked_seconds += blocked_seconds
+            cls.disconnects += disconnects
+
+    @classmethod
+    def as_dict(cls) -> Dict[str, Any]:
+        with cls.lock:
+            return {
+                "coalesced": cls.coalesced,
+                "blocked": cls.blocked,
+                "blocked_seconds": round(cls.blocked_seconds, 3),
+                "disconnects": cls.disconnects,
+            }
+
+    @classmethod
+    def _reset(cls) -> None:
+        with cls.lock:
+            cls.coalesced = cls.blocked = cls.disconnects = 0
+            cls.blocked_seconds = 0.0
+
+
+class SendQueue:
+    """The outgoing frames of one websocket connection, drained by :meth:`run` on the event loop.
+
+    :param send: coroutine function that writes one frame; raises
+        ``websocket.WebSocketDisconnect`` once the connection is gone.
+    :param loop: the event loop that runs :meth:`run`.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Union[str, bytes]], Awaitable[None]],
+        loop: asyncio.AbstractEventLoop,
+        *,
+        max_messages: int,
+        max_bytes: int,
+        policy: str = "block",
+        block_timeout: float = 30.0,
+    ) -> None:
+        check_policy(policy)
+        self._send = send
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        # seq -> (frame, key): an ordered dict so a superseded frame is removed in O(1)
+        self._frames: "collections.OrderedDict[int, Tuple[Union[str, bytes], Optional[Hashable]]]" = collections.OrderedDict()
+        self._by_key: Dict[Hashable, int] = {}
+        self._seq = 0
+        self._bytes = 0
+        self._wakeup = asyncio.Event()
+        self._idle = True
+        self._closed = False
+        # per-connection stats
+        self.max_depth = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.blocked = 0
+        self.blocked_seconds = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._frames)
+
+    def _over(self, factor: int = 1) -> bool:
+        return len(self._frames) >= self.max_messages * factor or self._bytes >= self.max_bytes * factor
+
+    def put(self, data: Union[str, bytes], key: Optional[Hashable] = None) -> None:
+        """Queue a frame; raises ``websocket.WebSocketDisconnect`` when the client is (or gets) dropped."""
+        with self._lock:
+            if self._closed:
+                raise websocket.WebSocketDisconnect()
+            if key is not None:
+                superseded = self._by_key.pop(key, None)
+                if superseded is not None:
+                    self._bytes -= len(self._frames.pop(superseded)[0])
+                    self.coalesced += 1
+                    SendQueueInfo.record(coalesced=1)
+            if self._over():
+                if self.policy == "block" and threading.get_ident() != self._loop_thread_id:
+                    self._wait_not_full()
+                elif self.policy == "disconnect" or (self.policy == "drop-coalesce" and self._over(2)):
+                    self._drop_client()
+            self._seq += 1
+            self._frames[self._seq] = (data, key)
+            if key is not None:
+                self._by_key[key] = self._seq
+            self._bytes += len(data)
+            self.max_depth = max(self.max_depth, len(self._frames))
+            wake = self._idle
+            self._idle = False
+        if wake:
+            if threading.get_ident() == self._loop_thread_id:
+                self._wakeup.set()
+            else:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _wait_not_full(self) -> None:
+        # called with the lock held
+        start = time.monotonic()
+        deadline = start + self.block_timeout
+        while self._over() and not self._closed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._not_full.wait(remaining)
+        elapsed = time.monotonic() - start
+        self.blocked += 1
+        self.blocked_seconds += elapsed
+        SendQueueInfo.record(blocked_seconds=elapsed)
+        if self._closed:
+            raise websocket.WebSocketDisconnect()
+        if self._over():
+            self._drop_client()
+
+    def _drop_client(self) -> None:
+        # called with the lock held
+        logger.warning("disconnecting a client that fell behind: %d messages, %d bytes queued (policy %s)", len(self._frames), self._bytes, self.policy)
+        SendQueueInfo.record(disconnects=1)
+        self._close_locked()
+        raise websocket.WebSocketDisconnect()
+
+    def _close_locked(self) -> None:
+        self._closed = True
+        self._frames.clear()
+        self._by_key.clear()
+        self._bytes = 0
+        self._not_full.notify_all()
+        if threading.get_ident() == self._loop_thread_id:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def close(self) -> None:
+        """Stop accepting frames and release blocked senders; :meth:`run` returns."""
+        with self._lock:
+            if not self._closed:
+                self._close_locked()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def _pop(self) -> Optional[Union[str, bytes]]:
+        with self._lock:
+            if not self._frames:
+                self._idle = True
+                self._wakeup.clear()
+                return None
+            _, (data, key) = self._frames.popitem(last=False)
+            if key is not None:
+                del self._by_key[key]
+            self._bytes -= len(data)
+            if not self._over():
+                self._not_full.notify_all()
+            return data
+
+    async def run(self) -> None:
+        """Write the queued frames in order until the queue is closed or the client disconnects."""
+        while not self._closed:
+            data = self._pop()
+            if data is None:
+                await self._wakeup.wait()
+                continue
+            try:
+                await self._send(data)
+            except websocket.WebSocketDisconnect:
+                self.close()
+                return
+            except Exception:
+                logger.exception("error sending a websocket message, closing the send queue")
+                self.close()
+                return
+            self.sent += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "depth": len(self._frames),
+            "bytes": self._bytes,
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "blocked": self.blocked,
+            "blocked_seconds": round(self.blocked_seconds, 3),
+        }
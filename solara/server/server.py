@@ -1,6 +1,5 @@
 import contextlib
 import hashlib
-import json
 import logging
 import os
 import sys
@@ -17,12 +16,13 @@ import solara
 import solara.routing
 import solara.settings
 import solara.server.settings
+import solara.toestand as toestand
 from solara.lab import cookies as solara_cookies
 from solara.lab import headers as solara_headers
 
-from . import app, jupytertools, patch, settings, websocket
-from .kernel import Kernel, deserialize_binary_message
-from .kernel_context import initialize_virtual_kernel
+from . import app, jupytertools, kernel_context, metrics, settings, websocket
+from .kernel import Kernel, deserialize_binary_message, json_loads
+from .kernel_context import initialize_virtual_kernel_async
 
 COOKIE_KEY_SESSION_ID = "solara-session-id"
 
@@ -53,6 +53,8 @@ def get_jinja_env(app_name: str) -> jinja2.Environment:
 
 
 logger = logging.getLogger("solara.server.server")
+# per-message timing lines, enabled by `solara run --timing`
+timing_logger = logging.getLogger("solara.server.timing")
 nbextensions_ignorelist = [
     "jupytext/index",
     "nbextensions_configurator/config_menu/main",
@@ -125,7 +127,7 @@ async def app_loop(
     page_id: str,
     user: dict = None,
 ):
-    context = initialize_virtual_kernel(session_id, kernel_id, ws)
+    context = await initialize_virtual_kernel_async(session_id, kernel_id, ws)
     if context is None:
         logging.warning("invalid kernel id: %r", kernel_id)
         # to avoid very fast reconnects (we are in a thread anyway)
@@ -154,8 +156,8 @@ async def app_loop(
             solara_headers.set(headers)  # type: ignore
 
             while True:
-                if settings.main.timing:
-                    widgets_ids = set(patch.widgets)
+                track = settings.server.message_metrics or settings.main.timing
+                t_wait = time.perf_counter()
                 try:
                     message = await ws.receive()
                 except websocket.WebSocketDisconnect:
@@ -166,38 +168,80 @@ async def app_loop(
                         pass
                     logger.debug("Disconnected")
                     break
-                t0 = time.time()
+                t0 = time.perf_counter()
                 if isinstance(message, str):
-                    msg = json.loads(message)
+                    msg = json_loads(message)
                 else:
                     msg = deserialize_binary_message(message)
-                t1 = time.time()
+                t1 = time.perf_counter()
+                if track:
+                    render_context = context.app_object
+                    renders_before = getattr(render_context, "render_count", 0)
+                    tally = metrics.tally
+                    send_before, opened_before, closed_before = tally.send_seconds, tally.widgets_opened, tally.widgets_closed
                 # we don't want to have the kernel closed while we are processing a message
                 # therefore we use this mutex that is also used in the context.close method
                 shutdown = False
                 with context.lock:
+                    t2 = time.perf_counter()
                     if context.closed_event.is_set():
                         return
-                    if not process_kernel_messages(kernel, msg):
-                        shutdown = True
+                    # with SOLARA_KERNEL_SEND_BATCHING, everything this message triggers goes
+                    # out as one websocket frame; the reactive variables the event handlers set
+                    # notify once, at the end (see solara.batch)
+                    with kernel.session.batch(), toestand._auto_batch():
+                        if not process_kernel_messages(kernel, msg):
+                            shutdown = True
+                t3 = time.perf_counter()
                 if shutdown:
                     # if we shut down the kernel, we do not keep the page session alive. close()
                     # OUTSIDE context.lock: its persistence teardown does backend I/O (§5.3)
                     context.close()
                     return
-                t2 = time.time()
-                if settings.main.timing:
-                    widgets_ids_after = set(patch.widgets)
-                    created_widgets_count = len(widgets_ids_after - widgets_ids)
-                    close_widgets_count = len(widgets_ids - widgets_ids_after)
-                    print(  # noqa: T201
-                        f"timing: total={t2 - t0:.3f}s, deserialize={t1 - t0:.3f}s, kernel={t2 - t1:.3f}s"
-                        f" widget: created: {created_widgets_count} closed: {close_widgets_count}"
-                    )
+                if track:
+                    _record_message(context, msg, render_context, renders_before, send_before, opened_before, closed_before, t_wait, t0, t1, t2, t3)
     finally:
         context.page_disconnect(page_id)
 
 
+def _record_message(
+    context: kernel_context.VirtualKernelContext,
+    msg: Dict,
+    render_context,
+    renders_before: int,
+    send_before: float,
+    opened_before: int,
+    closed_before: int,
+    t_wait: float,
+    t0: float,
+    t1: float,
+    t2: float,
+    t3: float,
+):
+    tally = metrics.tally
+    send = tally.send_seconds - send_before
+    opened = tally.widgets_opened - opened_before
+    closed = tally.widgets_closed - closed_before
+    # the first message of a page creates the render context
+    renders = getattr(context.app_object, "render_count", 0) - (renders_before if context.app_object is render_context else 0)
+    msg_type = metrics.message_type(msg)
+    timings = {"receive": t0 - t_wait, "deserialize": t1 - t0, "lock_wait": t2 - t1, "handler": max(t3 - t2 - send, 0.0), "send": send}
+    metrics.record(context.message_metrics, msg_type, timings, renders=renders, widgets_opened=opened, widgets_closed=closed)
+    if settings.main.timing:
+        timing_logger.info(
+            "%s: total=%.3fs deserialize=%.3fs lock_wait=%.3fs handler=%.3fs send=%.3fs renders=%d widgets opened=%d closed=%d",
+            msg_type,
+            t3 - t0,
+            t1 - t0,
+            t2 - t1,
+            timings["handler"],
+            send,
+            renders,
+            opened,
+            closed,
+        )
+
+
 def process_kernel_messages(kernel: Kernel, msg: Dict) -> bool:
     session = kernel.session
     assert session is not None
@@ -120,6 +120,29 @@ class Kernel(BaseSettings):
     # threads and (with persistence) Redis keys. The default is far above any legitimate multi-tab
     # use; 0 disables the cap. Reconnects reuse an existing kernel and do not count against it.
     max_per_session: int = 100
+    # at most this many kernels are culled per second; the rest of a mass disconnect waits its turn
+    cull_rate: int = 20
+    # Opt-in outbound batching: the messages a kernel sends while it handles one incoming message
+    # (a render pass easily sends hundreds of tiny comm_msg frames) go out as one websocket frame,
+    # which the frontend unpacks in order. A batch is sent early once it holds send_batch_max_messages
+    # messages or send_batch_max_bytes bytes, or at the next send after send_batch_max_delay seconds.
+    send_batching: bool = False
+    send_batch_max_messages: int = 1000
+    send_batch_max_bytes: int = 4_000_000
+    send_batch_max_delay: float = 0.05
+    # JSON serializer for kernel wire messages: "json" (standard library), "orjson" (needs the orjson
+    # package; numpy scalars/arrays, datetime and bytes in one pass), "auto" (orjson when installed),
+    # or a name registered with solara.server.kernel.register_json_serializer
+    json_serializer: str = "json"
+    # send numpy arrays in widget state as binary buffers instead of JSON lists; arrays smaller
+    # than binary_arrays_min_bytes are sent as lists
+    binary_arrays: bool = False
+    binary_arrays_min_bytes: int = 1024
+    # while handling one incoming message, merge the widget updates of the same comm into one
+    # update (by trait, latest value wins) instead of sending every intermediate state
+    coalesce_updates: bool = False
+    # number of virtual kernels to keep pre-warmed for new pages (see solara.server.kernel_pool), 0 = off
+    pool_size: int = 0
 
     class Config:
         env_prefix = "solara_kernel_"
@@ -136,14 +159,30 @@ class State(BaseSettings):
     ``Session.secret_key``, and ``test_eviction`` gates on ``main.mode``.
     """
 
-    backend: str = ""  # "" = disabled; a name in solara.state.state_backend_map ("redis", "memory", ...)
-    url: str = ""  # backend DSN, e.g. "redis://localhost:6379/0"
+    backend: str = ""  # "" = disabled; a name in solara.state.state_backend_map ("redis", "redis-async", "sqlite", "memory", ...)
+    url: str = ""  # backend DSN, e.g. "redis://localhost:6379/0" or "sqlite:///solara-state.db"
     secret_keys: str = ""  # comma-separated HMAC keys; verify-any, sign-first (rotation). REQUIRED when enabled
     allow_pickle: bool = False  # deployer gate; the "pickle" codec raises without it
     ttl: Optional[str] = None  # default: kernel.cull_timeout
     orphan_cull_timeout: str = "5m"  # applies only with a shared backend
     prefix: str = "solara:state:"  # key prefix / table name, backend-interpreted
+    # redis topology: "standalone" (one endpoint), "cluster" (Redis Cluster; url is any seed node and
+    # keys are hash-tagged on the kernel id), or "sharded" (client-side consistent hashing over the
+    # comma-separated standalone urls in url; every replica must list the same nodes)
+    redis_mode: str = "standalone"
     flush_debounce: str = "300ms"
+    # flush pacing: consecutive flushes of a kernel start at least flush_min_interval apart (a slow
+    # backend stretches this adaptively), each key is written at most once per flush_key_min_interval,
+    # and none of it delays a change by more than flush_max_delay ("0s" disables either interval)
+    flush_min_interval: str = "0s"
+    flush_max_delay: str = "5s"
+    flush_key_min_interval: str = "0s"
+    # opt-in process-wide flush scheduler: instead of one daemon thread + one backend round trip per
+    # kernel, due kernels are coalesced into pipelined backend batches (still fenced per kernel) and
+    # written by a bounded pool. Worth it with thousands of persisted kernels per process.
+    flush_batching: bool = False
+    flush_batch_max: int = 256  # max kernels per backend batch
+    flush_pool_size: int = 4  # flush pool threads (batches in flight)
     connect_timeout: float = 0.3  # hard cap on takeover/flush blocking
     breaker_failures: int = 3  # circuit breaker: consecutive failures to open
     breaker_window: str = "30s"  # open duration before a half-open probe
@@ -156,6 +195,16 @@ class State(BaseSettings):
     # not large objects/DataFrames.
     warn_value_bytes: int = 1_000_000  # ~1 MB: log a warning, still persist
     max_value_bytes: int = 5_000_000  # ~5 MB: skip this key (persist the rest); 0 disables the cap
+    # flush snapshots: values without a fast path (immutable, shallow, register_snapshot hook) are
+    # deep-copied under the reactive's lock. "auto" serializes under the lock instead when that was
+    # measured cheaper for the key; "copy" always deep-copies; "encode" always serializes under the lock.
+    snapshot_mode: str = "auto"
+    # envelope compression above compress_min_bytes: "" (off), "zlib", or "zstd" (needs the zstandard
+    # package). Writes envelope format v2, which older servers cannot read: enable it only once every
+    # replica runs a version that can (format v1 envelopes keep decoding either way).
+    compression: str = ""
+    compress_min_bytes: int = 4096
+    delta_chunk_items: int = 512  # PersistConfig(delta=True): list/dict items (DataFrame rows) per chunk
     test_eviction: bool = False  # dev/test-only kernel-eviction route gate (§6.4); refused in production
 
     def secret_key_list(self):
@@ -226,6 +275,19 @@ class Server(BaseSettings):
     # Requires uvicorn's websockets implementation; falls back to the default
     # path (with a log message) when unavailable. See starlette.py.
     sync_ws_write: bool = False
+    # hand websocket frames to a bounded per-connection queue drained by an event loop task
+    # (SOLARA_SERVER_SEND_QUEUE), with superseded widget updates coalesced. Above the high-water
+    # mark (messages or bytes) the policy applies: "block" the sending thread (at most
+    # send_queue_block_timeout seconds), "drop-coalesce" or "disconnect". See send_queue.py.
+    send_queue: bool = False
+    send_queue_max_messages: int = 10_000
+    send_queue_max_bytes: int = 32_000_000
+    send_queue_policy: str = "block"
+    send_queue_block_timeout: float = 30.0
+    # per-message timing histograms (see solara.server.metrics), reported in /resourcez
+    message_metrics: bool = True
+    # also serve the process totals in the Prometheus text format on /metricsz
+    metricsz: bool = False
 
     class Config:
         env_prefix = "solara_server_"
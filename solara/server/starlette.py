@@ -14,7 +14,7 @@ import sys
 import threading
 import time
 import typing
-from typing import Any, Dict, List, Optional, Set, Union, cast
+from typing import Any, Dict, Hashable, List, Optional, Set, Union, cast
 from uuid import uuid4
 import warnings
 
@@ -61,11 +61,13 @@ from starlette.types import Receive, Scope, Send
 
 import solara
 import solara.settings
+import solara.toestand
 from solara.server.threaded import ServerBase
 
 from . import app as appmod
-from . import kernel_context, server, settings, telemetry, websocket
+from . import culler, kernel_context, kernel_pool, metrics, send_queue, server, settings, telemetry, websocket
 from .cdn_helper import cdn_url_path, get_path
+from .kernel import SendBatchInfo, UpdateCoalesceInfo, get_json_serializer
 
 os.environ["SERVER_SOFTWARE"] = "solara/" + str(solara.__version__)
 limiter: Optional[anyio.CapacityLimiter] = None
@@ -124,24 +126,49 @@ class WebsocketWrapper(websocket.WebsocketWrapper):
             # frames are written synchronously from the sending thread; falls
             # back to the default path (None) when unsupported, see the module
             self.sync_writer = sync_ws_write.SyncFrameWriter.try_create(ws)
-        self.to_send: List[Union[str, bytes]] = []
         # following https://docs.python.org/3/library/asyncio-task.html#asyncio.create_task
         # we store a strong reference
         self.tasks: Set[asyncio.Task] = set()
         self.event_loop = asyncio.get_event_loop()
         self._thread_id = threading.get_ident()
-        if settings.main.experimental_performance:
-            self.task = asyncio.ensure_future(self.process_messages_task())
-
-    async def process_messages_task(self):
-        while True:
-            await asyncio.sleep(0.05)
-            while len(self.to_send) > 0:
-                first = self.to_send.pop(0)
-                if isinstance(first, bytes):
-                    await self._send_bytes_exc(first)
-                else:
-                    await self._send_text_exc(first)
+        self.send_queue: Optional[send_queue.SendQueue] = None
+        if self.sync_writer is None and (settings.server.send_queue or settings.main.experimental_performance):
+            self.send_queue = send_queue.SendQueue(
+                self._send_exc,
+                self.event_loop,
+                max_messages=settings.server.send_queue_max_messages,
+                max_bytes=settings.server.send_queue_max_bytes,
+                policy=settings.server.send_queue_policy,
+                block_timeout=settings.server.send_queue_block_timeout,
+            )
+            self.task = asyncio.ensure_future(self._run_send_queue())
+
+    async def _run_send_queue(self):
+        assert self.send_queue is not None
+        await self.send_queue.run()
+        # the queue only stops by itself when the client is gone
+        await self._close_quietly()
+
+    async def _close_quietly(self):
+        try:
+            await self.ws.close()
+        except:  # noqa
+            pass
+
+    def _drop(self):
+        # the send queue dropped this client for falling behind: abort the write in progress
+        # (possibly stuck on the slow client) and close, the page will reconnect
+        def drop():
+            self.task.cancel()
+            asyncio.ensure_future(self._close_quietly())
+
+        self.event_loop.call_soon_threadsafe(drop)
+
+    async def _send_exc(self, data: Union[str, bytes]):
+        if isinstance(data, bytes):
+            await self._send_bytes_exc(data)
+        else:
+            await self._send_text_exc(data)
 
     async def _send_bytes_exc(self, data: bytes):
         # make sures we catch the starlette/websockets specific exception
@@ -189,6 +216,22 @@ class WebsocketWrapper(websocket.WebsocketWrapper):
         else:
             self.portal.call(_close_exc)
 
+    def _put(self, data: Union[str, bytes], coalesce_key: Optional[Hashable] = None) -> None:
+        assert self.send_queue is not None
+        closed = self.send_queue.closed
+        try:
+            self.send_queue.put(data, coalesce_key)
+        except websocket.WebSocketDisconnect:
+            if not closed:
+                self._drop()
+            raise
+
+    def send(self, data: Union[str, bytes], coalesce_key: Optional[Hashable] = None) -> None:
+        if self.send_queue is not None:
+            self._put(data, coalesce_key)
+        else:
+            super().send(data)
+
     def send_text(self, data: str) -> None:
         if self.sync_writer is not None:
             try:
@@ -196,27 +239,26 @@ class WebsocketWrapper(websocket.WebsocketWrapper):
             except OSError as e:
                 raise websocket.WebSocketDisconnect() from e
             return
-        if self.portal is None:
+        if self.send_queue is not None:
+            self._put(data)
+        elif self.portal is None:
             task = self.event_loop.create_task(self._send_text_exc(data))
             self.tasks.add(task)
             task.add_done_callback(self.tasks.discard)
         else:
-            if settings.main.experimental_performance:
-                self.to_send.append(data)
-            else:
-                if self._thread_id == threading.get_ident():
-                    warnings.warn("""You are triggering a websocket send from the event loop thread.
+            if self._thread_id == threading.get_ident():
+                warnings.warn("""You are triggering a websocket send from the event loop thread.
 Support for this is experimental, and to avoid this message, make sure you trigger updates
 that trigger this from a different thread, e.g.:
 
 from anyio import to_thread
 await to_thread.run_sync(my_update)
 """)
-                    task = self.event_loop.create_task(self._send_text_exc(data))
-                    self.tasks.add(task)
-                    task.add_done_callback(self.tasks.discard)
-                else:
-                    self.portal.call(self._send_text_exc, data)
+                task = self.event_loop.create_task(self._send_text_exc(data))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            else:
+                self.portal.call(self._send_text_exc, data)
 
     def send_bytes(self, data: bytes) -> None:
         if self.sync_writer is not None:
@@ -225,27 +267,26 @@ await to_thread.run_sync(my_update)
             except OSError as e:
                 raise websocket.WebSocketDisconnect() from e
             return
-        if self.portal is None:
+        if self.send_queue is not None:
+            self._put(data)
+        elif self.portal is None:
             task = self.event_loop.create_task(self._send_bytes_exc(data))
             self.tasks.add(task)
             task.add_done_callback(self.tasks.discard)
         else:
-            if settings.main.experimental_performance:
-                self.to_send.append(data)
-            else:
-                if self._thread_id == threading.get_ident():
-                    warnings.warn("""You are triggering a websocket send from the event loop thread.
+            if self._thread_id == threading.get_ident():
+                warnings.warn("""You are triggering a websocket send from the event loop thread.
 Support for this is experimental, and to avoid this message, make sure you trigger updates
 that trigger this from a different thread, e.g.:
 
 from anyio import to_thread
 await to_thread.run_sync(my_update)
 """)
-                    task = self.event_loop.create_task(self._send_bytes_exc(data))
-                    self.tasks.add(task)
-                    task.add_done_callback(self.tasks.discard)
+                task = self.event_loop.create_task(self._send_bytes_exc(data))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
 
-                self.portal.call(self._send_bytes_exc, data)
+            self.portal.call(self._send_bytes_exc, data)
 
     async def receive(self):
         if self.portal is None:
@@ -401,8 +442,9 @@ async def _kernel_connection(ws: starlette.websockets.WebSocket):
             ws_wrapper = WebsocketWrapper(ws, None)
             await run(ws_wrapper)
     finally:
-        if settings.main.experimental_performance:
+        if ws_wrapper.send_queue is not None:
             try:
+                ws_wrapper.send_queue.close()
                 ws_wrapper.task.cancel()
             except:  # noqa
                 logger.exception("error cancelling websocket task")
@@ -735,9 +777,13 @@ def on_startup():
     except Exception:
         logger.exception("invalid state-persistence configuration")
         raise
+    # an unknown or uninstalled wire-message serializer would otherwise fail every message
+    get_json_serializer()
+    send_queue.check_policy(settings.server.send_queue_policy)
     # the dev/test-only kernel-eviction route must never be live in production (§6.4, fail-closed)
     if settings.state.test_eviction and settings.main.mode == "production":
         logger.error("SOLARA_STATE_TEST_EVICTION is enabled but mode is 'production': the kernel-eviction route stays DISABLED. Never enable it in production.")
+    kernel_pool.start()
     # TODO: configure and set max number of threads
     # see https://github.com/encode/starlette/issues/1724
     telemetry.server_start()
@@ -791,12 +837,14 @@ def on_shutdown():
         _drain_state_workers()
     except Exception:  # noqa
         logger.exception("error draining state workers on shutdown")
+    kernel_pool.stop()
     # shutdown all kernels
     for context in list(kernel_context.contexts.values()):
         try:
             context.close(reason="server-shutdown")
         except:  # noqa
             logger.exception("error closing kernel on shutdown")
+    culler.stop()
     telemetry.server_stop()
 
 
@@ -864,6 +912,33 @@ def _redact_sync_labels(state_stats: Dict[str, Any]) -> Dict[str, Any]:
     return redacted
 
 
+def _send_queue_info(contexts: List[kernel_context.VirtualKernelContext], full_detail: bool) -> Dict[str, Any]:
+    kernels: Dict[str, Dict[str, Any]] = {}
+    for context in contexts:
+        queues = [ws.send_queue.as_dict() for ws in list(context.kernel.session.websockets) if isinstance(ws, WebsocketWrapper) and ws.send_queue is not None]
+        if not queues:
+            continue
+        totals: Dict[str, Any] = {"connections": len(queues)}
+        for name in ["depth", "bytes", "sent", "coalesced", "blocked", "blocked_seconds"]:
+            totals[name] = sum(queue[name] for queue in queues)
+        totals["max_depth"] = max(queue["max_depth"] for queue in queues)
+        kernels[context.id if full_detail else redact_id(context.id)] = totals
+    return {
+        "enabled": settings.server.send_queue or settings.main.experimental_performance,
+        "policy": settings.server.send_queue_policy,
+        **send_queue.SendQueueInfo.as_dict(),
+        "kernels": kernels,
+    }
+
+
+def _message_metrics_info(contexts: List[kernel_context.VirtualKernelContext], full_detail: bool, verbose: bool) -> Dict[str, Any]:
+    kernels = {}
+    for context in contexts:
+        if context.message_metrics.messages:
+            kernels[context.id if full_detail else redact_id(context.id)] = context.message_metrics.as_dict(by_type=verbose)
+    return {"enabled": settings.server.message_metrics, **metrics.totals.as_dict(), "kernels": kernels}
+
+
 async def resourcez(request: Request):
     _ensure_limiter()
     assert limiter is not None
@@ -885,10 +960,7 @@ async def resourcez(request: Request):
     }
     contexts = list(kernel_context.contexts.values())
     data["kernels"] = {
-        "total": len(contexts),
-        "has_connected": len([k for k in contexts if kernel_context.PageStatus.CONNECTED in k.page_status.values()]),
-        "has_disconnected": len([k for k in contexts if kernel_context.PageStatus.DISCONNECTED in k.page_status.values()]),
-        "has_closed": len([k for k in contexts if kernel_context.PageStatus.CLOSED in k.page_status.values()]),
+        **kernel_context.contexts.counts(),
         "limiter": {
             "total_tokens": _sanitize_for_json(limiter.total_tokens),
             "borrowed_tokens": _sanitize_for_json(limiter.borrowed_tokens),
@@ -901,6 +973,14 @@ async def resourcez(request: Request):
         "borrowed_tokens": _sanitize_for_json(default_limiter.borrowed_tokens),
         "available_tokens": _sanitize_for_json(default_limiter.available_tokens),
     }
+    data["send_batching"] = SendBatchInfo.as_dict()
+    data["update_coalescing"] = UpdateCoalesceInfo.as_dict()
+    data["reactive_batching"] = solara.toestand.BatchInfo.as_dict()
+    data["reactive_listeners"] = solara.toestand.listener_stats()
+    data["send_queues"] = _send_queue_info(contexts, full_detail=_resourcez_full_detail_allowed(request))
+    data["kernel_pool"] = kernel_pool.as_dict()
+    data["culler"] = culler.as_dict()
+    data["message_metrics"] = _message_metrics_info(contexts, full_detail=_resourcez_full_detail_allowed(request), verbose=verbose)
     # state-persistence health (§7a): cheap, no backend I/O - "is the feature on right now?"
     import solara.state as solara_state
 
@@ -959,6 +1039,11 @@ async def resourcez(request: Request):
     return Response(content=json_string, media_type="application/json")
 
 
+async def metricsz(request: Request):
+    # process totals only: no kernel ids, and a bounded set of labels
+    return Response(content=metrics.prometheus_text(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 middleware = [
     # SOLARA_SERVER_HTTP_GZIP=false to disable, e.g. when a fronting proxy
     # (nginx/caddy) does the compressing
@@ -988,6 +1073,7 @@ if has_auth_support:
 routes = [
     Route("/readyz", endpoint=readyz),
     Route("/resourcez", endpoint=resourcez),
+    *([Route("/metricsz", endpoint=metricsz)] if settings.server.metricsz else []),
     *routes_auth,
     Route("/jupyter/api/kernels/{id}", endpoint=kernels),
     WebSocketRoute("/jupyter/api/kernels/{kernel_id}/{name}", endpoint=kernel_connection),
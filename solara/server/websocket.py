@@ -5,7 +5,7 @@ Async implementation have to come up with a way how to do this sync (see e.g. th
 
 import abc
 import json
-from typing import Union
+from typing import Hashable, Optional, Union
 
 
 class WebSocketDisconnect(Exception):
@@ -21,7 +21,9 @@ class WebsocketWrapper(abc.ABC):
     def send_bytes(self, data: bytes) -> None:
         pass
 
-    def send(self, data: Union[str, bytes]) -> None:
+    def send(self, data: Union[str, bytes], coalesce_key: Optional[Hashable] = None) -> None:
+        # coalesce_key: a later frame with the same key supersedes this one (see send_queue.py);
+        # implementations without a send queue ignore it
         if isinstance(data, str):
             self.send_text(data)
         elif isinstance(data, bytes):
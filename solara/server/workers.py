@@ -0,0 +1,346 @@
+"""``solara run --workers N``: one front process routing to N worker processes.
+
+A Solara server keeps its virtual kernels in memory, and they all render in one interpreter
+(one GIL). In this mode the front process only routes: it accepts the connections on the
+server's host and port, and hands each one to one of N worker processes that run the regular
+Solara server on a unix socket. A connection goes to a fixed worker:
+
+- with a ``solara-session-id`` cookie, by the session id. All pages, kernels, websockets and
+  ``/_solara/api/close`` requests of one browser end up on the same worker, also over a
+  kept-alive connection;
+- without the cookie, by the kernel id in the path (``/jupyter/api/kernels/{id}``,
+  ``/_solara/api/close/{id}``), or otherwise round robin. Such a connection is closed after the
+  response (``Connection: close``), so a follow-up request with the cookie is routed again.
+
+The front answers ``/readyz``, ``/resourcez`` and ``/metricsz`` itself by asking every worker.
+
+A worker that exits is started again on the same socket, and keeps getting the same sessions.
+Its kernels are gone: the pages reconnect, and with state persistence enabled
+(``SOLARA_STATE_BACKEND``) the new kernel restores the persisted state through the regular
+takeover, which fences off the lost process by generation.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import signal
+import tempfile
+import time
+import types
+from http.cookies import CookieError, SimpleCookie
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("solara.server.workers")
+
+COOKIE_KEY_SESSION_ID = "solara-session-id"  # same as solara.server.server, without importing it
+KERNEL_PATH = re.compile(r"/(?:jupyter/api/kernels|_solara/api/close|_solara/api/evict)/([^/?#]+)")
+AGGREGATED_PATHS = ("/readyz", "/resourcez", "/metricsz")
+MAX_HEAD_BYTES = 65536
+CONNECT_TIMEOUT = 10.0  # seconds to wait for a (re)starting worker
+
+
+def worker_index(key: str, workers: int) -> int:
+    """The worker for a routing key; stable across processes and restarts (unlike hash())."""
+    digest = hashlib.blake2b(key.encode("utf8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % workers
+
+
+class RequestHead:
+    """The request line and headers of an HTTP/1.x request, as read from the client."""
+
+    def __init__(self, raw: bytes) -> None:
+        lines = raw.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ")
+        if len(parts) != 3:
+            raise ValueError(f"invalid request line: {lines[0]!r}")
+        self.method, self.target, self.version = parts
+        self.headers: List[Tuple[str, str]] = []
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise ValueError(f"invalid header line: {line!r}")
+            self.headers.append((name.strip(), value.strip()))
+
+    @property
+    def path(self) -> str:
+        return self.target.split("?", 1)[0]
+
+    def header(self, name: str) -> Optional[str]:
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return None
+
+    def cookie(self, name: str) -> Optional[str]:
+        header = self.header("cookie")
+        if not header:
+            return None
+        cookies: SimpleCookie = SimpleCookie()
+        try:
+            cookies.load(header)
+        except CookieError:
+            return None
+        morsel = cookies.get(name)
+        return morsel.value if morsel is not None else None
+
+    @property
+    def is_upgrade(self) -> bool:
+        return self.header("upgrade") is not None
+
+    def encode(self, connection_close: bool = False) -> bytes:
+        headers = self.headers
+        if connection_close:
+            headers = [(key, value) for key, value in headers if key.lower() != "connection"] + [("Connection", "close")]
+        lines = [f"{self.method} {self.target} {self.version}"] + [f"{key}: {value}" for key, value in headers]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def route(head: RequestHead, workers: int, round_robin: Callable[[], int]) -> Tuple[int, bool]:
+    """Returns the worker index for a request, and whether the connection may stay pinned to it."""
+    session_id = head.cookie(COOKIE_KEY_SESSION_ID)
+    if session_id:
+        return worker_index("session:" + session_id, workers), True
+    match = KERNEL_PATH.search(head.path)
+    if match:
+        return worker_index("kernel:" + match.group(1), workers), head.is_upgrade
+    return round_robin(), head.is_upgrade
+
+
+def _response(status: str, body: bytes, content_type: str = "application/json") -> bytes:
+    head = f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+    return head.encode("latin-1") + body
+
+
+def aggregate_resourcez(responses: Dict[int, Any]) -> Dict[str, Any]:
+    """Merge the /resourcez of the workers: totals for the main counters, and each worker's own."""
+    totals: Dict[str, Dict[str, int]] = {"kernels": {}, "websockets": {}}
+    for data in responses.values():
+        if not isinstance(data, dict):
+            continue
+        for section in totals:
+            for key, value in (data.get(section) or {}).items():
+                if isinstance(value, int) and not isinstance(value, bool):
+                    totals[section][key] = totals[section].get(key, 0) + value
+    return {
+        **totals,
+        "workers": {str(index): data for index, data in sorted(responses.items())},
+    }
+
+
+def label_metrics(text: str, worker: int) -> str:
+    """Add a ``worker`` label to each sample of a Prometheus text exposition."""
+    lines = []
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, sep, rest = line.partition("{")
+            if sep:
+                line = f'{name}{{worker="{worker}",{rest}'
+            else:
+                name, _, value = line.partition(" ")
+                line = f'{name}{{worker="{worker}"}} {value}'
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+class Worker:
+    def __init__(self, index: int, path: str) -> None:
+        self.index = index
+        self.path = path
+        self.process: Any = None
+        self.restarts = 0
+
+
+class Front:
+    """Accepts the connections, routes them to the workers, and restarts workers that exit.
+
+    :param start_worker: starts worker ``index`` listening on unix socket ``path``, returns a
+        process-like object (``is_alive()``, ``terminate()``, ``join(timeout)``).
+    """
+
+    def __init__(self, host: str, port: int, workers: int, start_worker: Callable[[int, str], Any], socket_dir: Optional[str] = None) -> None:
+        self.host = host
+        self.port = port
+        # looks like a uvicorn.Server to the helpers in solara.__main__ that wait for it
+        self.config = types.SimpleNamespace(host=host, port=port)
+        self.started = False
+        self._own_socket_dir = socket_dir is None
+        self.socket_dir = socket_dir or tempfile.mkdtemp(prefix="solara-workers-")
+        self.workers = [Worker(index, os.path.join(self.socket_dir, f"worker-{index}.sock")) for index in range(workers)]
+        self._start_worker = start_worker
+        self._round_robin = itertools.cycle(range(workers))
+        self._stopping = False
+        self._server: Optional[asyncio.Server] = None
+
+    def _start(self, worker: Worker) -> None:
+        worker.process = self._start_worker(worker.index, worker.path)
+
+    async def _watch(self) -> None:
+        while not self._stopping:
+            for worker in self.workers:
+                if not self._stopping and worker.process is not None and not worker.process.is_alive():
+                    worker.restarts += 1
+                    logger.error("worker %d exited (exit code %s), starting it again", worker.index, getattr(worker.process, "exitcode", None))
+                    self._start(worker)
+            await asyncio.sleep(0.5)
+
+    async def _open(self, worker: Worker) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while True:
+            try:
+                return await asyncio.open_unix_connection(worker.path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                # the worker is still starting (or restarting)
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.05)
+
+    async def _fetch(self, worker: Worker, head: RequestHead) -> Tuple[int, bytes]:
+        reader, writer = await self._open(worker)
+        try:
+            lines = [f"GET {head.target} HTTP/1.0", "Host: localhost"]
+            authorization = head.header("authorization")
+            if authorization:
+                lines.append(f"Authorization: {authorization}")
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            await writer.drain()
+            data = await reader.read()
+        finally:
+            writer.close()
+        response_head, _, body = data.partition(b"\r\n\r\n")
+        return int(response_head.split(b" ", 2)[1]), body
+
+    async def _aggregate(self, head: RequestHead) -> bytes:
+        results = await asyncio.gather(*[self._fetch(worker, head) for worker in self.workers], return_exceptions=True)
+        path = head.path
+        if path == "/metricsz":
+            parts = [
+                label_metrics(result[1].decode("utf8"), index)
+                for index, result in enumerate(results)
+                if not isinstance(result, BaseException) and result[0] == 200
+            ]
+            return _response("200 OK", "".join(parts).encode("utf8"), "text/plain; version=0.0.4; charset=utf-8")
+        per_worker: Dict[int, Any] = {}
+        ready = True
+        for index, result in enumerate(results):
+            if isinstance(result, BaseException):
+                per_worker[index] = {"error": repr(result)}
+                ready = False
+                continue
+            status, body = result
+            ready = ready and status == 200
+            try:
+                per_worker[index] = json.loads(body)
+            except ValueError:
+                per_worker[index] = {"status": status}
+        if path == "/readyz":
+            data: Dict[str, Any] = {"status": "ok" if ready else "error", "workers": {str(index): value for index, value in per_worker.items()}}
+            return _response("200 OK" if ready else "503 Service Unavailable", json.dumps(data).encode("utf8"))
+        data = aggregate_resourcez(per_worker)
+        data["front"] = {
+            "workers": len(self.workers),
+            "alive": sum(1 for worker in self.workers if worker.process is not None and worker.process.is_alive()),
+            "restarts": {str(worker.index): worker.restarts for worker in self.workers},
+        }
+        return _response("200 OK", json.dumps(data, indent=2).encode("utf8"))
+
+    async def _handle(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                head = RequestHead((await client_reader.readuntil(b"\r\n\r\n"))[:-4])
+            except asyncio.LimitOverrunError:
+                client_writer.write(_response("431 Request Header Fields Too Large", b""))
+                return
+            except asyncio.IncompleteReadError:
+                return
+            except ValueError:
+                client_writer.write(_response("400 Bad Request", b""))
+                return
+            if head.path in AGGREGATED_PATHS:
+                client_writer.write(await self._aggregate(head))
+                return
+            index, pinned = route(head, len(self.workers), lambda: next(self._round_robin))
+            try:
+                worker_reader, worker_writer = await self._open(self.workers[index])
+            except OSError:
+                logger.error("worker %d is not available", index)
+                client_writer.write(_response("502 Bad Gateway", b""))
+                return
+            worker_writer.write(head.encode(connection_close=not pinned))
+            try:
+                await asyncio.gather(_pipe(client_reader, worker_writer), _pipe(worker_reader, client_writer))
+            finally:
+                worker_writer.close()
+        except ConnectionError:
+            pass
+        finally:
+            client_writer.close()
+
+    async def serve(self) -> None:
+        for worker in self.workers:
+            self._start(worker)
+        loop = asyncio.get_running_loop()
+        stopped = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stopped.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # not in the main thread
+        watch = asyncio.ensure_future(self._watch())
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_HEAD_BYTES)
+        self.started = True
+        logger.info("routing %s:%s to %d workers", self.host, self.port, len(self.workers))
+        try:
+            await stopped.wait()
+        finally:
+            await self.stop()
+            watch.cancel()
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._server is not None:
+            self._server.close()
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                await asyncio.get_running_loop().run_in_executor(None, worker.process.join, 10)
+        if self._own_socket_dir:
+            shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        try:
+            if writer.can_write_eof():
+                writer.write_eof()
+            else:
+                writer.close()
+        except OSError:
+            pass
+
+
+def spawn(target: Callable[[], Any], index: int) -> Any:
+    """Start ``target`` in a fresh interpreter (not a fork of the front process)."""
+    os.environ["SOLARA_WORKER_INDEX"] = str(index)
+    process = multiprocessing.get_context("spawn").Process(target=target, name=f"solara-worker-{index}")
+    process.start()
+    return process
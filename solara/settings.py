@@ -76,6 +76,10 @@ class Storage(BaseSettings):
         60.0,
         title="Minimum seconds between repeated initialization-lock timeout warnings for the same reactive variable",
     )
+    batch_updates: bool = Field(
+        True,
+        title="Defer reactive variable notifications until the end of an event handler or task result delivery (see solara.batch)",
+    )
 
     def get_factory(self):
         return solara.util.import_item(self.factory)
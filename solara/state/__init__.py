@@ -14,18 +14,22 @@ import solara.util
 
 logger = logging.getLogger("solara.state")
 
-from .backend import StateBackend, TakeoverResult
+from .backend import FlushRequest, StateBackend, TakeoverResult
 from .memory import MemoryStateBackend
 from .breaker import CircuitBreaker
 from .persist import FlushOutcome, KernelStatePersistence, PersistConfig, attach
 from .stats import Stats, stats
-from .worker import KernelFlushWorker
+from .worker import KernelFlushWorker, parse_duration
+from .scheduler import FlushScheduler
+from .snapshot import register_snapshot
+from . import binary  # noqa: F401  (registers the built-in "binary" codec)
 from .envelope import (
     CodecError,
     EnvelopeError,
     HmacError,
     SerializeError,
     allow_decode_types,
+    check_compression,
     decode,
     encode,
     register_codec,
@@ -41,6 +45,7 @@ except ImportError:
 __all__ = [
     "StateBackend",
     "TakeoverResult",
+    "FlushRequest",
     "MemoryStateBackend",
     "state_backend_map",
     "get_backend",
@@ -49,6 +54,7 @@ __all__ = [
     "encode",
     "decode",
     "register_codec",
+    "register_snapshot",
     "allow_decode_types",
     "session_hmac",
     "session_hmacs",
@@ -62,6 +68,10 @@ __all__ = [
     "Stats",
     "stats",
     "KernelFlushWorker",
+    "parse_duration",
+    "FlushScheduler",
+    "get_flush_scheduler",
+    "reset_flush_scheduler",
     "FlushOutcome",
     "KernelStatePersistence",
     "PersistConfig",
@@ -75,6 +85,8 @@ __all__ = [
 state_backend_map: Dict[str, str] = {
     "memory": "solara.state.memory.MemoryStateBackend",
     "redis": "solara.state.redis.RedisStateBackend",
+    "redis-async": "solara.state.redis.AsyncRedisStateBackend",
+    "sqlite": "solara.state.sqlite.SQLiteStateBackend",
 }
 
 _backend: Optional[StateBackend] = None
@@ -131,6 +143,36 @@ def reset_breaker() -> None:
         _breaker = None
 
 
+# --- batched flush scheduler singleton ----------------------------------------------------
+#
+# Opt-in (SOLARA_STATE_FLUSH_BATCHING): one process-wide scheduler replaces the per-kernel flush
+# threads; None when batching is off, so callers keep the per-kernel worker thread.
+
+_flush_scheduler: Optional[FlushScheduler] = None
+_flush_scheduler_lock = threading.Lock()
+
+
+def get_flush_scheduler() -> Optional[FlushScheduler]:
+    """Return the process-wide batched flush scheduler, or None when ``flush_batching`` is off."""
+    global _flush_scheduler
+    if not solara.settings.state.flush_batching:
+        return None
+    if _flush_scheduler is None:
+        with _flush_scheduler_lock:
+            if _flush_scheduler is None:
+                _flush_scheduler = FlushScheduler()
+    return _flush_scheduler
+
+
+def reset_flush_scheduler() -> None:
+    """Stop and drop the cached scheduler singleton (test hook / re-read settings)."""
+    global _flush_scheduler
+    with _flush_scheduler_lock:
+        scheduler, _flush_scheduler = _flush_scheduler, None
+    if scheduler is not None:
+        scheduler.close()
+
+
 def state_generation() -> Optional[int]:
     """The current kernel's remembered fencing generation, or ``None`` (design §5.5b).
 
@@ -173,14 +215,30 @@ def validate_state_settings() -> None:
     """Validate state settings at server start. Raises ValueError on a misconfiguration.
 
     - pickle codec enabled with empty/default secrets is refused (even without a backend).
+    - the envelope compression must be known (and zstd importable when selected).
+    - the flush pacing durations must parse; a ``flush_max_delay`` below the debounce only warns
+      (the worker raises it to the debounce).
     - when a backend is configured, secret keys must be non-empty and not the placeholder,
-      and the backend name must be known.
+      and the backend name (and redis mode) must be known.
     """
     st = solara.settings.state
     keys = st.secret_key_list()
     default_or_empty = (not keys) or any(key == "change me" for key in keys)
     if st.allow_pickle and default_or_empty:
         raise ValueError("SOLARA_STATE_ALLOW_PICKLE=true requires real, non-default SOLARA_STATE_SECRET_KEYS to be set")
+    check_compression(st.compression)
+    pacing = {}
+    for name in ("flush_debounce", "flush_min_interval", "flush_max_delay", "flush_key_min_interval"):
+        try:
+            pacing[name] = parse_duration(getattr(st, name))
+        except ValueError as exc:
+            raise ValueError(f"SOLARA_STATE_{name.upper()}={getattr(st, name)!r} is not a duration (e.g. 300ms, 5s): {exc}") from exc
+    if pacing["flush_max_delay"] < pacing["flush_debounce"]:
+        logger.warning(
+            "SOLARA_STATE_FLUSH_MAX_DELAY=%s is less than SOLARA_STATE_FLUSH_DEBOUNCE=%s, the debounce is used as the max delay",
+            st.flush_max_delay,
+            st.flush_debounce,
+        )
     if not st.backend:
         return
     if not keys:
@@ -189,6 +247,8 @@ def validate_state_settings() -> None:
         raise ValueError("SOLARA_STATE_SECRET_KEYS must not contain the placeholder value 'change me'")
     if st.backend not in state_backend_map:
         raise ValueError(f"Unknown state backend {st.backend!r}; known: {sorted(state_backend_map)}")
+    if st.redis_mode not in ("standalone", "cluster", "sharded"):
+        raise ValueError(f"Unknown SOLARA_STATE_REDIS_MODE {st.redis_mode!r}; known: cluster, sharded, standalone")
     # design §5.6: with persistence on, the session cookie is a durable cross-instance state-theft
     # credential, so any XSS that reads it now also steals persisted state. http_only makes it
     # unreadable to JS - free hardening. Warn (don't force) so existing deploys aren't broken.
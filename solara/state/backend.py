@@ -5,11 +5,19 @@ writes, so the contract is exactly the four verbs the persistence feature needs,
 atomicity requirements stated here rather than delegated to a particular store's features.
 The Redis backend (Lua hash-per-kernel) and the in-process memory backend both satisfy
 this identical contract, so serialization and fencing logic are exercised in dev too.
+
+Every verb also has an awaitable twin (``takeover_async``, ``flush_async``, ...) with the same
+semantics. By default these run the blocking verb on the event loop's executor, so any backend
+can be awaited; a backend with a native asyncio client (``AsyncRedisStateBackend``) overrides
+them and sets ``native_async``, and the server then awaits the connect-time takeover on the
+websocket's event loop instead of parking a thread on it.
 """
 
 import abc
+import asyncio
 import dataclasses
-from typing import Dict, Optional, Sequence, Union
+import functools
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
 
 
 @dataclasses.dataclass
@@ -27,6 +35,18 @@ class TakeoverResult:
     fields: Dict[str, bytes]
 
 
+@dataclasses.dataclass
+class FlushRequest:
+    """The arguments of one :meth:`StateBackend.flush` call, for :meth:`StateBackend.flush_many`."""
+
+    kernel_id: str
+    generation: int
+    fields: Dict[str, bytes]
+    ttl: float
+    session_hmac: bytes
+    schema_tag: str
+
+
 class StateBackend(abc.ABC):
     """Abstract base for state backends (ABC, not a Protocol, so shared logic can live here)."""
 
@@ -35,6 +55,8 @@ class StateBackend(abc.ABC):
     # state outlives the kernel in a shared store. Defaults True; single-process backends
     # override to False.
     shared: bool = True
+    # whether the *_async verbs are native coroutines; False means they hop to an executor thread
+    native_async: bool = False
 
     @abc.abstractmethod
     def takeover(self, kernel_id: str, session_hmacs: "Union[bytes, Sequence[bytes]]", schema_tag: str) -> TakeoverResult:
@@ -87,6 +109,23 @@ class StateBackend(abc.ABC):
         - Key exists and stored generation != `generation`: return False, write nothing.
         """
 
+    def flush_many(self, requests: Sequence[FlushRequest]) -> List[Union[bool, Exception]]:
+        """Run several independent fenced flushes, one result per request, in order.
+
+        Each request keeps the exact :meth:`flush` semantics (fenced per kernel - one kernel's
+        rejection or failure never affects another's write); a request that raised is reported
+        as the exception instance instead of propagating, so the caller can route every kernel's
+        outcome separately. The default runs :meth:`flush` in a loop; backends with a cheaper
+        multi-key path (the Redis pipeline) override it.
+        """
+        results: List[Union[bool, Exception]] = []
+        for request in requests:
+            try:
+                results.append(self.flush(request.kernel_id, request.generation, request.fields, request.ttl, request.session_hmac, request.schema_tag))
+            except Exception as exc:  # noqa - reported per request
+                results.append(exc)
+        return results
+
     @abc.abstractmethod
     def peek_generation(self, kernel_id: str) -> Optional[int]:
         """Return the stored generation, or None if the key is absent/expired (cheap, no bump)."""
@@ -97,3 +136,37 @@ class StateBackend(abc.ABC):
 
         Returns True if a key was deleted, False otherwise.
         """
+
+    # --- awaitable verbs (same semantics as the blocking ones) ----------------------------
+
+    async def takeover_async(self, kernel_id: str, session_hmacs: "Union[bytes, Sequence[bytes]]", schema_tag: str) -> TakeoverResult:
+        """Awaitable :meth:`takeover`."""
+        return await _run_blocking(self.takeover, kernel_id, session_hmacs, schema_tag)
+
+    async def flush_async(
+        self,
+        kernel_id: str,
+        generation: int,
+        fields: Dict[str, bytes],
+        ttl: float,
+        session_hmac: bytes,
+        schema_tag: str,
+    ) -> bool:
+        """Awaitable :meth:`flush`."""
+        return await _run_blocking(self.flush, kernel_id, generation, fields, ttl, session_hmac, schema_tag)
+
+    async def flush_many_async(self, requests: Sequence[FlushRequest]) -> List[Union[bool, Exception]]:
+        """Awaitable :meth:`flush_many`."""
+        return await _run_blocking(self.flush_many, requests)
+
+    async def peek_generation_async(self, kernel_id: str) -> Optional[int]:
+        """Awaitable :meth:`peek_generation`."""
+        return await _run_blocking(self.peek_generation, kernel_id)
+
+    async def delete_async(self, kernel_id: str, generation: Optional[int] = None) -> bool:
+        """Awaitable :meth:`delete`."""
+        return await _run_blocking(self.delete, kernel_id, generation)
+
+
+async def _run_blocking(fn: Callable[..., Any], *args: Any) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args))
@@ -0,0 +1,422 @@
+"""The built-in ``"binary"`` codec: compact MessagePack-format payloads.
+
+Numeric-heavy state is where the json codec hurts: every float becomes up to ~20 characters
+of text and a numpy array has no JSON form at all. This codec writes the same values in the
+MessagePack wire format (numbers as fixed-width binary, ``bytes`` natively instead of base64)
+and needs no third-party package.
+
+Type fidelity and the decode rules are the json codec's: ``None``/``bool``/``int``/``float``/
+``str``, lists, str-keyed dicts, sets, ``datetime``/``date``/``time``, ``UUID``, ``Decimal``,
+``bytes``, enums, pydantic models and dataclasses round-trip; tuples come back as lists and
+numpy scalars as python numbers. Tagged types travel as MessagePack *ext* values and are
+reconstructed through the same constructors as the json codec, so the kind gates and
+:func:`~solara.state.envelope.allow_decode_types` apply unchanged. On top of that, numpy
+arrays (non-object, non-structured dtypes) are stored as their raw buffer plus dtype and shape.
+"""
+
+import dataclasses
+import datetime
+import decimal
+import enum
+import struct
+import uuid
+from typing import Any, Dict, List, Tuple
+
+from .envelope import (
+    CodecError,
+    EnvelopeError,
+    SerializeError,
+    _class_tag,
+    _construct_dataclass,
+    _construct_enum,
+    _construct_pydantic,
+    _get_numpy,
+    _get_pydantic_base_model,
+    _model_dump,
+    register_codec,
+)
+
+__all__: List[str] = []
+
+# ext type codes (application-defined, 0..127 in MessagePack)
+_EXT_SET = 1
+_EXT_FROZENSET = 2
+_EXT_DATETIME = 3
+_EXT_DATE = 4
+_EXT_TIME = 5
+_EXT_UUID = 6
+_EXT_DECIMAL = 7
+_EXT_ENUM = 8
+_EXT_PYDANTIC = 9
+_EXT_DATACLASS = 10
+_EXT_NDARRAY = 11
+_EXT_BIGINT = 12  # ints outside the 64-bit range, as decimal text
+
+_F64 = struct.Struct(">d")
+_U8 = struct.Struct(">B")
+_U16 = struct.Struct(">H")
+_U32 = struct.Struct(">I")
+_U64 = struct.Struct(">Q")
+_I8 = struct.Struct(">b")
+_I16 = struct.Struct(">h")
+_I32 = struct.Struct(">i")
+_I64 = struct.Struct(">q")
+_F32 = struct.Struct(">f")
+_INT_FORMATS = (_U8, _U16, _U32, _U64, _I8, _I16, _I32, _I64)  # type bytes 0xcc..0xd3
+_LEN_FORMATS = (_U8, _U16, _U32)  # 8/16/32-bit length prefixes
+
+
+# --- encode -------------------------------------------------------------------------------
+
+
+def _write_int(out: bytearray, value: int) -> None:
+    if 0 <= value < 0x80:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value & 0xFF)
+    elif value >= 0:
+        if value <= 0xFF:
+            out.append(0xCC)
+            out += _U8.pack(value)
+        elif value <= 0xFFFF:
+            out.append(0xCD)
+            out += _U16.pack(value)
+        elif value <= 0xFFFFFFFF:
+            out.append(0xCE)
+            out += _U32.pack(value)
+        elif value <= 0xFFFFFFFFFFFFFFFF:
+            out.append(0xCF)
+            out += _U64.pack(value)
+        else:
+            _write_ext(out, _EXT_BIGINT, str(value).encode("ascii"))
+    elif value >= -0x80:
+        out.append(0xD0)
+        out += _I8.pack(value)
+    elif value >= -0x8000:
+        out.append(0xD1)
+        out += _I16.pack(value)
+    elif value >= -0x80000000:
+        out.append(0xD2)
+        out += _I32.pack(value)
+    elif value >= -0x8000000000000000:
+        out.append(0xD3)
+        out += _I64.pack(value)
+    else:
+        _write_ext(out, _EXT_BIGINT, str(value).encode("ascii"))
+
+
+def _write_header(out: bytearray, n: int, fix: int, fix_max: int, code16: int, code32: int, code8: int = 0) -> None:
+    if n <= fix_max:
+        out.append(fix | n)
+    elif code8 and n <= 0xFF:
+        out.append(code8)
+        out += _U8.pack(n)
+    elif n <= 0xFFFF:
+        out.append(code16)
+        out += _U16.pack(n)
+    else:
+        out.append(code32)
+        out += _U32.pack(n)
+
+
+def _write_str(out: bytearray, value: str) -> None:
+    data = value.encode("utf-8")
+    _write_header(out, len(data), 0xA0, 31, 0xDA, 0xDB, code8=0xD9)
+    out += data
+
+
+def _write_bin(out: bytearray, data: bytes) -> None:
+    n = len(data)
+    if n <= 0xFF:
+        out.append(0xC4)
+        out += _U8.pack(n)
+    elif n <= 0xFFFF:
+        out.append(0xC5)
+        out += _U16.pack(n)
+    else:
+        out.append(0xC6)
+        out += _U32.pack(n)
+    out += data
+
+
+def _write_ext(out: bytearray, code: int, data: bytes) -> None:
+    n = len(data)
+    if n <= 0xFF:
+        out.append(0xC7)
+        out += _U8.pack(n)
+    elif n <= 0xFFFF:
+        out.append(0xC8)
+        out += _U16.pack(n)
+    else:
+        out.append(0xC9)
+        out += _U32.pack(n)
+    out.append(code)
+    out += data
+
+
+def _write_tagged(out: bytearray, code: int, value: Any) -> None:
+    inner = bytearray()
+    _write(inner, value)
+    _write_ext(out, code, bytes(inner))
+
+
+def _write_ndarray(out: bytearray, value: Any) -> None:
+    numpy = _get_numpy()
+    assert numpy is not None
+    dtype = value.dtype
+    if dtype.hasobject or dtype.fields is not None:
+        raise SerializeError(f"cannot serialize numpy array of dtype {dtype} with the binary codec (object/structured dtype)")
+    data = numpy.ascontiguousarray(value).tobytes()
+    _write_tagged(out, _EXT_NDARRAY, [dtype.str, list(value.shape), data])
+
+
+def _write(out: bytearray, value: Any) -> None:
+    cls = type(value)
+    # exact-type fast paths for the bulk of numeric/text state
+    if cls is float:
+        out.append(0xCB)
+        out += _F64.pack(value)
+        return
+    if cls is int:
+        _write_int(out, value)
+        return
+    if cls is str:
+        _write_str(out, value)
+        return
+    # enum first: IntEnum/StrEnum members are also int/str instances
+    if isinstance(value, enum.Enum):
+        _write_tagged(out, _EXT_ENUM, [_class_tag(value), value.value])
+        return
+    if value is None:
+        out.append(0xC0)
+    elif value is True:
+        out.append(0xC3)
+    elif value is False:
+        out.append(0xC2)
+    elif isinstance(value, int):
+        _write_int(out, int(value))
+    elif isinstance(value, float):
+        out.append(0xCB)
+        out += _F64.pack(value)
+    elif isinstance(value, str):
+        _write_str(out, str(value))
+    elif isinstance(value, dict):
+        # the json codec's rule, so a value that persists under one codec persists under both
+        for key in value:
+            if not isinstance(key, str):
+                raise SerializeError(f"dict keys must be str for the binary codec (found {type(key).__name__} key {key!r})")
+        _write_header(out, len(value), 0x80, 15, 0xDE, 0xDF)
+        for key, item in value.items():
+            _write_str(out, key)
+            _write(out, item)
+    elif isinstance(value, (list, tuple)):
+        # tuple -> list, like the json codec
+        _write_header(out, len(value), 0x90, 15, 0xDC, 0xDD)
+        for item in value:
+            _write(out, item)
+    elif isinstance(value, (set, frozenset)):
+        _write_tagged(out, _EXT_FROZENSET if isinstance(value, frozenset) else _EXT_SET, list(value))
+    # datetime before date: datetime is a subclass of date
+    elif isinstance(value, datetime.datetime):
+        _write_ext(out, _EXT_DATETIME, value.isoformat().encode("ascii"))
+    elif isinstance(value, datetime.date):
+        _write_ext(out, _EXT_DATE, value.isoformat().encode("ascii"))
+    elif isinstance(value, datetime.time):
+        _write_ext(out, _EXT_TIME, value.isoformat().encode("ascii"))
+    elif isinstance(value, uuid.UUID):
+        _write_ext(out, _EXT_UUID, value.bytes)
+    elif isinstance(value, decimal.Decimal):
+        _write_ext(out, _EXT_DECIMAL, str(value).encode("ascii"))
+    elif isinstance(value, (bytes, bytearray)):
+        _write_bin(out, bytes(value))
+    else:
+        base_model = _get_pydantic_base_model()
+        if base_model is not None and isinstance(value, base_model):
+            _write_tagged(out, _EXT_PYDANTIC, [_class_tag(value), _model_dump(value)])
+            return
+        if dataclasses.is_dataclass(value) and not isinstance(value, type):
+            # init=False fields are derived state, recomputed on construction (as in the json codec)
+            fields = {f.name: getattr(value, f.name) for f in dataclasses.fields(value) if f.init}
+            _write_tagged(out, _EXT_DATACLASS, [_class_tag(value), fields])
+            return
+        numpy = _get_numpy()
+        if numpy is not None:
+            if isinstance(value, numpy.ndarray):
+                _write_ndarray(out, value)
+                return
+            if isinstance(value, numpy.integer):
+                _write_int(out, int(value))
+                return
+            if isinstance(value, numpy.floating):
+                out.append(0xCB)
+                out += _F64.pack(float(value))
+                return
+        raise SerializeError(f"cannot serialize object of type {cls.__module__}.{cls.__qualname__} with the binary codec")
+
+
+def _binary_dumps(value: Any) -> bytes:
+    out = bytearray()
+    try:
+        _write(out, value)
+    except RecursionError as exc:
+        raise SerializeError("binary encoding failed: value is nested too deeply") from exc
+    return bytes(out)
+
+
+# --- decode -------------------------------------------------------------------------------
+
+
+class _Reader:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.pos = 0
+
+    def take(self, n: int) -> bytes:
+        end = self.pos + n
+        if end > len(self.data):
+            raise CodecError("truncated binary payload")
+        chunk = self.data[self.pos : end]
+        self.pos = end
+        return chunk
+
+    def unpack(self, fmt: struct.Struct) -> Any:
+        value = fmt.unpack_from(self.data, self.pos)[0]
+        self.pos += fmt.size
+        return value
+
+    def read(self) -> Any:
+        data = self.data
+        pos = self.pos
+        code = data[pos]
+        self.pos = pos + 1
+        # the common codes first, inline
+        if code <= 0x7F:
+            return code
+        if code == 0xCB:
+            value = _F64.unpack_from(data, pos + 1)[0]
+            self.pos = pos + 9
+            return value
+        if 0xA0 <= code <= 0xBF:
+            end = pos + 1 + (code & 0x1F)
+            if end > len(data):
+                raise CodecError("truncated binary payload")
+            self.pos = end
+            return data[pos + 1 : end].decode("utf-8")
+        if 0x80 <= code <= 0x8F:
+            return self.read_map(code & 0x0F)
+        if 0x90 <= code <= 0x9F:
+            return self.read_array(code & 0x0F)
+        if code >= 0xE0:
+            return code - 0x100
+        if code == 0xC0:
+            return None
+        if code == 0xC2:
+            return False
+        if code == 0xC3:
+            return True
+        if 0xCC <= code <= 0xD3:
+            return self.unpack(_INT_FORMATS[code - 0xCC])
+        if code == 0xCA:
+            return self.unpack(_F32)
+        if 0xD9 <= code <= 0xDB:
+            return self.take(self.unpack(_LEN_FORMATS[code - 0xD9])).decode("utf-8")
+        if 0xC4 <= code <= 0xC6:
+            return self.take(self.unpack(_LEN_FORMATS[code - 0xC4]))
+        if code == 0xDC or code == 0xDD:
+            return self.read_array(self.unpack(_U16 if code == 0xDC else _U32))
+        if code == 0xDE or code == 0xDF:
+            return self.read_map(self.unpack(_U16 if code == 0xDE else _U32))
+        if 0xC7 <= code <= 0xC9:
+            n = self.unpack(_LEN_FORMATS[code - 0xC7])
+            ext = self.take(1)[0]
+            return _read_ext(ext, self.take(n))
+        raise CodecError(f"unsupported binary type byte 0x{code:02x}")
+
+    def read_array(self, n: int) -> List[Any]:
+        read = self.read
+        return [read() for _ in range(n)]
+
+    def read_map(self, n: int) -> Dict[str, Any]:
+        read = self.read
+        out = {}
+        for _ in range(n):
+            key = read()
+            if type(key) is not str:
+                raise CodecError(f"binary map key must be str, not {type(key).__name__}")
+            out[key] = read()
+        return out
+
+
+def _read_exact(data: bytes) -> Any:
+    reader = _Reader(data)
+    value = reader.read()
+    if reader.pos != len(data):
+        raise CodecError("trailing bytes in binary payload")
+    return value
+
+
+def _read_pair(data: bytes) -> Tuple[str, Any]:
+    pair = _read_exact(data)
+    if not (isinstance(pair, list) and len(pair) == 2 and isinstance(pair[0], str)):
+        raise CodecError("malformed tagged value in binary payload")
+    return pair[0], pair[1]
+
+
+def _read_ndarray(data: bytes) -> Any:
+    numpy = _get_numpy()
+    if numpy is None:
+        raise CodecError("decoding a numpy array requires numpy")
+    spec = _read_exact(data)
+    if not (isinstance(spec, list) and len(spec) == 3 and isinstance(spec[0], str) and isinstance(spec[2], bytes)):
+        raise CodecError("malformed numpy array in binary payload")
+    dtype_str, shape, buffer = spec
+    dtype = numpy.dtype(dtype_str)
+    # the buffer is raw memory: never let a payload name an object dtype (pointers)
+    if dtype.hasobject or dtype.fields is not None:
+        raise CodecError(f"refusing to decode numpy array of dtype {dtype}")
+    # copy: frombuffer views the (immutable) payload bytes, a restored array must be writable
+    return numpy.frombuffer(buffer, dtype=dtype).reshape(shape).copy()
+
+
+def _read_ext(code: int, data: bytes) -> Any:
+    if code == _EXT_SET or code == _EXT_FROZENSET:
+        items = _read_exact(data)
+        if not isinstance(items, list):
+            raise CodecError("malformed set in binary payload")
+        return frozenset(items) if code == _EXT_FROZENSET else set(items)
+    if code == _EXT_DATETIME:
+        return datetime.datetime.fromisoformat(data.decode("ascii"))
+    if code == _EXT_DATE:
+        return datetime.date.fromisoformat(data.decode("ascii"))
+    if code == _EXT_TIME:
+        return datetime.time.fromisoformat(data.decode("ascii"))
+    if code == _EXT_UUID:
+        return uuid.UUID(bytes=data)
+    if code == _EXT_DECIMAL:
+        return decimal.Decimal(data.decode("ascii"))
+    if code == _EXT_BIGINT:
+        return int(data.decode("ascii"))
+    if code == _EXT_ENUM:
+        return _construct_enum(*_read_pair(data))
+    if code == _EXT_PYDANTIC:
+        return _construct_pydantic(*_read_pair(data))
+    if code == _EXT_DATACLASS:
+        tag, fields = _read_pair(data)
+        if not isinstance(fields, dict):
+            raise CodecError("malformed dataclass in binary payload")
+        return _construct_dataclass(tag, fields)
+    if code == _EXT_NDARRAY:
+        return _read_ndarray(data)
+    raise CodecError(f"unknown ext type {code} in binary payload")
+
+
+def _binary_loads(blob: bytes) -> Any:
+    try:
+        return _read_exact(bytes(blob))
+    except EnvelopeError:
+        raise
+    except Exception as exc:
+        raise CodecError(f"binary decoding failed: {exc}") from exc
+
+
+register_codec("binary", _binary_dumps, _binary_loads)
@@ -0,0 +1,206 @@
+"""Chunked ("delta") storage for large container values (``PersistConfig(delta=True)``).
+
+By default a persisted reactive is one envelope, so every flush re-serializes, re-signs and
+rewrites the whole value: appending one element to a large list rewrites all of it. With
+``delta=True`` a ``list``, ``dict`` or pandas ``DataFrame`` value is split into chunks of
+``SOLARA_STATE_DELTA_CHUNK_ITEMS`` items (rows), each stored as its own signed envelope under
+``reactive-chunk:<key>#<index>``, and the reactive's regular ``reactive:<key>`` field holds a
+signed :class:`ChunkManifest` listing the SHA-256 of every chunk payload. A flush still
+serializes every chunk (digesting the codec output is what detects a change without trusting
+``==``, which cannot tell ``1`` from ``True``), but it only signs and writes the chunks whose
+digest differs from the last ACKed write, plus the small manifest.
+
+The signed-envelope guarantees are unchanged: every chunk envelope is bound to its kernel and
+its own field name, and restore checks each chunk payload against the digest in the (signed)
+manifest, so chunks of different writes can never be mixed into one value. A missing or
+mismatching chunk is an :class:`~solara.state.envelope.EnvelopeError`, i.e. the usual
+all-or-nothing bail-out. Chunk fields sit outside the ``reactive:`` namespace, so a server
+without this module ignores them (and bails out on the unknown manifest codec).
+"""
+
+import dataclasses
+import hashlib
+import json
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from .envelope import CodecError, EnvelopeError, SerializeError, _dumps, _loads, _open, _seal, register_codec
+
+__all__ = ["ChunkManifest", "ChunkState", "CHUNK_FIELD_PREFIX", "MANIFEST_CODEC", "split", "encode_chunks", "verify_chunks", "load_chunks", "decode_chunks"]
+
+CHUNK_FIELD_PREFIX = "reactive-chunk:"
+MANIFEST_CODEC = "solara-chunks"
+
+
+@dataclasses.dataclass
+class ChunkManifest:
+    """What the reactive's own field holds in delta mode: the container kind and the chunk digests."""
+
+    kind: str  # "list", "dict" or "dataframe"
+    digests: List[str]  # hex SHA-256 of each chunk's codec payload, in order
+
+
+@dataclasses.dataclass
+class ChunkState:
+    """The chunk digests (and envelope sizes) of a key as last written at ``generation``."""
+
+    generation: int
+    digests: List[str]
+    sizes: List[int]
+
+
+def _manifest_dumps(value: Any) -> bytes:
+    if not isinstance(value, ChunkManifest):
+        raise SerializeError(f"the {MANIFEST_CODEC!r} codec only encodes chunk manifests, not {type(value).__name__}")
+    return json.dumps({"kind": value.kind, "digests": value.digests}, separators=(",", ":")).encode("utf-8")
+
+
+def _manifest_loads(blob: bytes) -> ChunkManifest:
+    try:
+        tree = json.loads(blob.decode("utf-8"))
+        kind, digests = tree["kind"], tree["digests"]
+    except (ValueError, TypeError, KeyError) as exc:
+        raise CodecError(f"malformed chunk manifest: {exc}") from exc
+    if kind not in ("list", "dict", "dataframe") or not isinstance(digests, list) or not all(isinstance(d, str) for d in digests):
+        raise CodecError("malformed chunk manifest")
+    return ChunkManifest(kind=kind, digests=digests)
+
+
+register_codec(MANIFEST_CODEC, _manifest_dumps, _manifest_loads)
+
+
+def chunk_field(storage_key: str, index: int) -> str:
+    return f"{CHUNK_FIELD_PREFIX}{storage_key}#{index}"
+
+
+def _get_dataframe_type() -> Optional[type]:
+    # pandas stays optional: a value can only BE a DataFrame if pandas is already imported
+    pandas = sys.modules.get("pandas")
+    return None if pandas is None else pandas.DataFrame
+
+
+def split(value: Any, chunk_items: int) -> Optional[Tuple[str, List[Any]]]:
+    """Split a container into ``(kind, chunks)``, or None for a value that is stored whole.
+
+    Exact types only: a subclass (``OrderedDict``, ``defaultdict``, a list subclass) would come
+    back as the base type, so it keeps the regular single-envelope storage.
+    """
+    n = max(1, chunk_items)
+    if type(value) is list:
+        return "list", [value[start : start + n] for start in range(0, len(value), n)]
+    if type(value) is dict:
+        items = list(value.items())
+        return "dict", [dict(items[start : start + n]) for start in range(0, len(items), n)]
+    dataframe = _get_dataframe_type()
+    if dataframe is not None and type(value) is dataframe:
+        # the type check narrows to `object`, the frame is used untyped
+        frame: Any = value
+        # an empty frame still needs one chunk to carry its columns and dtypes
+        return "dataframe", [frame.iloc[start : start + n] for start in range(0, max(len(frame), 1), n)]
+    return None
+
+
+def _join(kind: str, chunks: List[Any]) -> Any:
+    if kind == "list":
+        out: List[Any] = []
+        for chunk in chunks:
+            if not isinstance(chunk, list):
+                raise CodecError(f"list chunk decoded to {type(chunk).__name__}")
+            out.extend(chunk)
+        return out
+    if kind == "dict":
+        joined: Dict[Any, Any] = {}
+        for chunk in chunks:
+            if not isinstance(chunk, dict):
+                raise CodecError(f"dict chunk decoded to {type(chunk).__name__}")
+            joined.update(chunk)
+        return joined
+    import pandas
+
+    return pandas.concat(chunks) if chunks else pandas.DataFrame()
+
+
+def encode_chunks(
+    *,
+    kind: str,
+    chunks: List[Any],
+    codec: str,
+    kernel_id: str,
+    field_name: str,
+    storage_key: str,
+    previous: Optional[ChunkState],
+    generation: int,
+) -> Tuple[Dict[str, bytes], ChunkState, int]:
+    """Encode a split container as ``(fields to write, new ChunkState, total stored bytes)``.
+
+    ``fields`` holds the manifest plus every chunk whose payload digest differs from
+    ``previous`` (all of them without a usable ``previous``), and an empty tombstone for each
+    chunk index the value shrank away from. The total counts unchanged chunks too, so the
+    size guard sees the whole value.
+    """
+    fields: Dict[str, bytes] = {}
+    digests: List[str] = []
+    sizes: List[int] = []
+    for index, chunk in enumerate(chunks):
+        chunk_name = chunk_field(storage_key, index)
+        payload = _dumps(chunk, codec=codec, field_name=chunk_name)
+        digest = hashlib.sha256(payload).hexdigest()
+        if previous is not None and index < len(previous.digests) and previous.digests[index] == digest:
+            sizes.append(previous.sizes[index])
+        else:
+            blob = _seal(payload, codec=codec, kernel_id=kernel_id, field_name=chunk_name)
+            fields[chunk_name] = blob
+            sizes.append(len(blob))
+        digests.append(digest)
+    if previous is not None:
+        # flush merges fields and has no delete: blank the chunks we no longer reference
+        for index in range(len(chunks), len(previous.digests)):
+            fields[chunk_field(storage_key, index)] = b""
+    manifest = _seal(_manifest_dumps(ChunkManifest(kind=kind, digests=digests)), codec=MANIFEST_CODEC, kernel_id=kernel_id, field_name=field_name)
+    fields[field_name] = manifest
+    return fields, ChunkState(generation=generation, digests=digests, sizes=sizes), len(manifest) + sum(sizes)
+
+
+def verify_chunks(
+    manifest: ChunkManifest,
+    *,
+    envelopes: Dict[str, bytes],
+    kernel_id: str,
+    storage_key: str,
+    generation: int,
+) -> Tuple[List[Tuple[str, bytes]], ChunkState]:
+    """Verify and digest-check every chunk of ``manifest``; returns the ``(codec, payload)`` parts.
+
+    Decoding is left to :func:`load_chunks`, so restore can verify eagerly and decode on first read.
+    """
+    parts: List[Tuple[str, bytes]] = []
+    sizes: List[int] = []
+    for index, expected in enumerate(manifest.digests):
+        chunk_name = chunk_field(storage_key, index)
+        blob = envelopes.get(chunk_name)
+        if not blob:
+            raise EnvelopeError(f"chunk {chunk_name!r} listed in the manifest is missing")
+        codec, payload = _open(blob, kernel_id=kernel_id, field_name=chunk_name)
+        if hashlib.sha256(payload).hexdigest() != expected:
+            raise EnvelopeError(f"chunk {chunk_name!r} does not match its manifest digest")
+        parts.append((codec, payload))
+        sizes.append(len(blob))
+    return parts, ChunkState(generation=generation, digests=list(manifest.digests), sizes=sizes)
+
+
+def load_chunks(kind: str, parts: List[Tuple[str, bytes]]) -> Any:
+    """Decode verified chunk payloads (see :func:`verify_chunks`) and reassemble the value."""
+    return _join(kind, [_loads(payload, codec=codec) for codec, payload in parts])
+
+
+def decode_chunks(
+    manifest: ChunkManifest,
+    *,
+    envelopes: Dict[str, bytes],
+    kernel_id: str,
+    storage_key: str,
+    generation: int,
+) -> Tuple[Any, ChunkState]:
+    """Verify, digest-check and decode every chunk of ``manifest``, and reassemble the value."""
+    parts, state = verify_chunks(manifest, envelopes=envelopes, kernel_id=kernel_id, storage_key=storage_key, generation=generation)
+    return load_chunks(manifest.kind, parts), state
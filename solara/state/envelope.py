@@ -19,16 +19,21 @@ import hmac
 import json
 import pickle
 import sys
+import time
 import uuid
+import zlib
 from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import solara.settings
 
+from .stats import stats
+
 __all__ = [
     "encode",
     "decode",
     "register_codec",
     "session_hmac",
+    "check_compression",
     "EnvelopeError",
     "HmacError",
     "CodecError",
@@ -37,7 +42,14 @@ __all__ = [
 
 # binary layout (all lengths are 4-byte big-endian):
 #   version(1) | len(key_id) key_id | len(codec) codec | len(payload) payload | hmac(32)
+# format version 2 adds a compression stage, recorded in the signed header:
+#   version(2) | len(key_id) key_id | len(codec) codec | len(compression) compression
+#              | raw_len(8) | len(payload) payload | hmac(32)
+# where payload is the (possibly) compressed codec output and raw_len its uncompressed size.
+# Version 1 is still what we write while SOLARA_STATE_COMPRESSION is off, so replicas that
+# predate version 2 keep reading every envelope during a rolling deploy; both always decode.
 _FORMAT_VERSION = 1
+_FORMAT_VERSION_2 = 2
 _HMAC_SIZE = 32
 _KEY_ID_SIZE = 8  # short hash of the secret key; position-independent so rotation works
 
@@ -167,9 +179,8 @@ def _to_jsonable(value: Any) -> Any:
     base_model = _get_pydantic_base_model()
     if base_model is not None and isinstance(value, base_model):
         # model_dump() (python mode) keeps nested exotic types (datetime, Enum, nested
-        # models become dicts pydantic re-validates) for our recursive tagging; v1: dict()
-        dump = value.model_dump() if hasattr(value, "model_dump") else value.dict()  # type: ignore[attr-defined]
-        return {_MARKER: "pydantic", "type": _class_tag(value), "value": _to_jsonable(dump)}
+        # models become dicts pydantic re-validates) for our recursive tagging
+        return {_MARKER: "pydantic", "type": _class_tag(value), "value": _to_jsonable(_model_dump(value))}
     if dataclasses.is_dataclass(value) and not isinstance(value, type):
         # recursive tagging is self-describing at every level, so reconstruction is
         # cls(**fields) with already-decoded children - no type-hint introspection.
@@ -183,6 +194,11 @@ def _to_jsonable(value: Any) -> Any:
     raise SerializeError(f"cannot serialize object of type {tp.__module__}.{tp.__qualname__} with the json codec")
 
 
+def _model_dump(value: Any) -> Dict[str, Any]:
+    # pydantic v2 model_dump() (python mode), v1: dict()
+    return value.model_dump() if hasattr(value, "model_dump") else value.dict()
+
+
 def _resolve(dotted: str) -> Any:
     # Resolve a "module:qualname" tag to the object it names. The tag comes from an envelope
     # that HMAC verification has already accepted - but a *forged* tag can be HMAC-valid too, if
@@ -240,6 +256,44 @@ def _check_decode_allowed(tag: str) -> None:
         raise CodecError(f"type {tag!r} is not in the state decode allow-list (set via solara.state.allow_decode_types)")
 
 
+# The constructors below are shared by every built-in codec that carries self-describing type
+# tags (json and binary), so the allow-list and the per-kind gates are enforced in one place.
+
+
+def _construct_enum(tag: str, value: Any) -> Any:
+    _check_decode_allowed(tag)
+    enum_cls = _resolve(tag)
+    # gate like the pydantic/dataclass constructors below: a forged (but HMAC-valid) tag must
+    # not turn into an arbitrary call. Without this, type="os:system" would resolve os.system
+    # and call it with the attacker's "value" - RCE on the default codec for anyone who holds
+    # the secret. Only ever call an Enum subclass.
+    if not (isinstance(enum_cls, type) and issubclass(enum_cls, enum.Enum)):
+        raise CodecError(f"refusing to decode enum tag: {tag!r} is not an enum.Enum subclass")
+    return enum_cls(value)
+
+
+def _construct_pydantic(tag: str, fields: Any) -> Any:
+    _check_decode_allowed(tag)
+    cls = _resolve(tag)
+    import pydantic  # decoding a pydantic tag on an instance without pydantic -> ImportError -> CodecError
+
+    # strict gate: only ever instantiate BaseModel subclasses - a forged (but HMAC-valid) tag
+    # must not become an arbitrary-constructor call
+    if not (isinstance(cls, type) and issubclass(cls, pydantic.BaseModel)):
+        raise CodecError(f"refusing to decode pydantic tag: {tag!r} is not a pydantic.BaseModel subclass")
+    if hasattr(cls, "model_validate"):
+        return cls.model_validate(fields)
+    return cls.parse_obj(fields)  # type: ignore[attr-defined]  # pydantic v1
+
+
+def _construct_dataclass(tag: str, fields: Dict[str, Any]) -> Any:
+    _check_decode_allowed(tag)
+    cls = _resolve(tag)
+    if not (isinstance(cls, type) and dataclasses.is_dataclass(cls)):
+        raise CodecError(f"refusing to decode dataclass tag: {tag!r} is not a dataclass")
+    return cls(**fields)
+
+
 def _from_jsonable(value: Any) -> Any:
     if isinstance(value, dict):
         marker = value.get(_MARKER)
@@ -263,35 +317,11 @@ def _from_jsonable(value: Any) -> Any:
             if marker == "bytes":
                 return base64.b64decode(value["value"])
             if marker == "enum":
-                _check_decode_allowed(value["type"])
-                enum_cls = _resolve(value["type"])
-                # gate like the pydantic/dataclass branches below: a forged (but HMAC-valid)
-                # tag must not turn into an arbitrary call. Without this, type="os:system"
-                # would resolve os.system and call it with the attacker's "value" - RCE on the
-                # default codec for anyone who holds the secret. Only ever call an Enum subclass.
-                if not (isinstance(enum_cls, type) and issubclass(enum_cls, enum.Enum)):
-                    raise CodecError(f"refusing to decode enum tag: {value['type']!r} is not an enum.Enum subclass")
-                return enum_cls(_from_jsonable(value["value"]))
+                return _construct_enum(value["type"], _from_jsonable(value["value"]))
             if marker == "pydantic":
-                _check_decode_allowed(value["type"])
-                cls = _resolve(value["type"])
-                import pydantic  # decoding a pydantic tag on an instance without pydantic -> ImportError -> CodecError
-
-                # strict gate: only ever instantiate BaseModel subclasses - a forged (but
-                # HMAC-valid) tag must not become an arbitrary-constructor call
-                if not (isinstance(cls, type) and issubclass(cls, pydantic.BaseModel)):
-                    raise CodecError(f"refusing to decode pydantic tag: {value['type']!r} is not a pydantic.BaseModel subclass")
-                fields = _from_jsonable(value["value"])
-                if hasattr(cls, "model_validate"):
-                    return cls.model_validate(fields)
-                return cls.parse_obj(fields)  # type: ignore[attr-defined]  # pydantic v1
+                return _construct_pydantic(value["type"], _from_jsonable(value["value"]))
             if marker == "dataclass":
-                _check_decode_allowed(value["type"])
-                cls = _resolve(value["type"])
-                if not (isinstance(cls, type) and dataclasses.is_dataclass(cls)):
-                    raise CodecError(f"refusing to decode dataclass tag: {value['type']!r} is not a dataclass")
-                fields = {key: _from_jsonable(item) for key, item in value["value"].items()}
-                return cls(**fields)
+                return _construct_dataclass(value["type"], {key: _from_jsonable(item) for key, item in value["value"].items()})
         except EnvelopeError:
             raise
         except Exception as exc:
@@ -350,6 +380,63 @@ register_codec("json", _json_dumps, _json_loads)
 register_codec("pickle", _pickle_dumps, _pickle_loads)
 
 
+# --- compression (format version 2) ---------------------------------------
+
+Compress = Callable[[bytes], bytes]
+Decompress = Callable[[bytes, int], bytes]  # (data, raw_len) -> exactly raw_len bytes
+
+
+def _zlib_decompress(data: bytes, raw_len: int) -> bytes:
+    # bounded: never inflate past the (signed) recorded size
+    inflater = zlib.decompressobj()
+    out = inflater.decompress(data, raw_len + 1)
+    if len(out) != raw_len or not inflater.eof:
+        raise CodecError("zlib payload does not match its recorded size")
+    return out
+
+
+def _get_zstandard():
+    # zstd stays an optional dependency (the zstandard package)
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    zstandard = _get_zstandard()
+    if zstandard is None:
+        raise SerializeError("SOLARA_STATE_COMPRESSION=zstd requires the zstandard package")
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def _zstd_decompress(data: bytes, raw_len: int) -> bytes:
+    zstandard = _get_zstandard()
+    if zstandard is None:
+        raise CodecError("decoding a zstd-compressed envelope requires the zstandard package")
+    out = zstandard.ZstdDecompressor().decompress(data, max_output_size=raw_len)
+    if len(out) != raw_len:
+        raise CodecError("zstd payload does not match its recorded size")
+    return out
+
+
+_COMPRESSORS: Dict[str, Tuple[Compress, Decompress]] = {
+    "zlib": (lambda data: zlib.compress(data, 6), _zlib_decompress),
+    "zstd": (_zstd_compress, _zstd_decompress),
+}
+
+
+def check_compression(name: str) -> None:
+    """Raise ValueError unless ``name`` is a usable ``SOLARA_STATE_COMPRESSION`` value."""
+    if not name:
+        return
+    if name not in _COMPRESSORS:
+        raise ValueError(f"Unknown SOLARA_STATE_COMPRESSION {name!r}; known: {sorted(_COMPRESSORS)} (or empty to disable)")
+    if name == "zstd" and _get_zstandard() is None:
+        raise ValueError("SOLARA_STATE_COMPRESSION=zstd requires the zstandard package (pip install zstandard)")
+
+
 # --- secret keys and signing ----------------------------------------------
 
 
@@ -387,6 +474,25 @@ def _canonical(key_id: bytes, kernel_id: str, field_name: str, codec: str, paylo
     return bytes(out)
 
 
+def _canonical_v2(key_id: bytes, kernel_id: str, field_name: str, codec: str, compression: str, raw_len: int, payload: bytes) -> bytes:
+    # the version is signed too, so a version-2 MAC can never verify as (or be downgraded to) v1
+    parts = [
+        bytes([_FORMAT_VERSION_2]),
+        key_id,
+        kernel_id.encode("utf-8"),
+        field_name.encode("utf-8"),
+        codec.encode("utf-8"),
+        compression.encode("utf-8"),
+        raw_len.to_bytes(8, "big"),
+        payload,
+    ]
+    out = bytearray()
+    for part in parts:
+        out += len(part).to_bytes(4, "big")
+        out += part
+    return bytes(out)
+
+
 def _sign(key: str, canonical: bytes) -> bytes:
     return hmac.new(key.encode("utf-8"), canonical, hashlib.sha256).digest()
 
@@ -405,6 +511,19 @@ def _pack(key_id: bytes, codec: str, payload: bytes, mac: bytes) -> bytes:
     return bytes(out)
 
 
+def _pack_v2(key_id: bytes, codec: str, compression: str, raw_len: int, payload: bytes, mac: bytes) -> bytes:
+    out = bytearray()
+    out.append(_FORMAT_VERSION_2)
+    for part in (key_id, codec.encode("utf-8"), compression.encode("utf-8")):
+        out += len(part).to_bytes(4, "big")
+        out += part
+    out += raw_len.to_bytes(8, "big")
+    out += len(payload).to_bytes(4, "big")
+    out += payload
+    out += mac
+    return bytes(out)
+
+
 def _read_lp(blob: memoryview, offset: int) -> Tuple[bytes, int]:
     if offset + 4 > len(blob):
         raise ValueError("truncated length prefix")
@@ -430,41 +549,125 @@ def _unpack(blob: bytes) -> Tuple[int, bytes, str, bytes, bytes]:
     return version, key_id, codec_bytes.decode("utf-8"), payload, mac
 
 
+def _unpack_v2(blob: bytes) -> Tuple[bytes, str, str, int, bytes, bytes]:
+    view = memoryview(blob)
+    offset = 1
+    key_id, offset = _read_lp(view, offset)
+    codec_bytes, offset = _read_lp(view, offset)
+    compression_bytes, offset = _read_lp(view, offset)
+    if offset + 8 > len(view):
+        raise ValueError("truncated raw length")
+    raw_len = int.from_bytes(view[offset : offset + 8], "big")
+    payload, offset = _read_lp(view, offset + 8)
+    mac = bytes(view[offset:])
+    if len(mac) != _HMAC_SIZE:
+        raise ValueError("truncated or trailing bytes after payload")
+    return key_id, codec_bytes.decode("utf-8"), compression_bytes.decode("utf-8"), raw_len, payload, mac
+
+
 # --- public API -----------------------------------------------------------
 
 
-def encode(value: Any, *, codec: str = "json", kernel_id: str, field_name: str) -> bytes:
-    """Serialize `value` with `codec` and wrap it in a signed envelope bound to `kernel_id`/`field_name`."""
+def _dumps(value: Any, *, codec: str, field_name: str) -> bytes:
+    # the codec half of encode(): serialize only (chunked storage digests payloads before signing)
     dumps, _ = _get_codec(codec)
-    keys = _secret_keys()
-    primary = keys[0]
-    key_id = _key_id(primary)
+    started = time.perf_counter()
     try:
         payload = dumps(value)
     except SerializeError as exc:
         raise SerializeError(f"{exc} (field {field_name!r})") from exc
-    canonical = _canonical(key_id, kernel_id, field_name, codec, payload)
-    mac = _sign(primary, canonical)
-    return _pack(key_id, codec, payload, mac)
+    stats().record_codec(codec, "encode", len(payload), time.perf_counter() - started)
+    return payload
 
 
-def decode(blob: bytes, *, kernel_id: str, field_name: str) -> Any:
-    """Verify the envelope (HMAC first) then decode its payload, checking `kernel_id`/`field_name` binding."""
+def _loads(payload: bytes, *, codec: str) -> Any:
+    # the codec half of decode(): only ever called on a payload _open() verified
+    _, loads = _get_codec(codec)
+    started = time.perf_counter()
+    value = loads(payload)
+    stats().record_codec(codec, "decode", len(payload), time.perf_counter() - started)
+    return value
+
+
+def _seal(payload: bytes, *, codec: str, kernel_id: str, field_name: str) -> bytes:
+    # the signing half of encode(): wrap an already-serialized payload (compressing it first
+    # when SOLARA_STATE_COMPRESSION is on and the payload reaches compress_min_bytes)
+    primary = _secret_keys()[0]
+    key_id = _key_id(primary)
+    settings_state = solara.settings.state
+    compression = settings_state.compression
+    if not compression:
+        mac = _sign(primary, _canonical(key_id, kernel_id, field_name, codec, payload))
+        return _pack(key_id, codec, payload, mac)
+    raw_len = len(payload)
+    used, stored = "none", payload
+    if raw_len >= settings_state.compress_min_bytes:
+        try:
+            compress, _ = _COMPRESSORS[compression]
+        except KeyError:
+            raise SerializeError(f"unknown SOLARA_STATE_COMPRESSION {compression!r}")
+        compressed = compress(payload)
+        # incompressible data (already-compressed bytes, random buffers) is stored as is
+        if len(compressed) < raw_len:
+            used, stored = compression, compressed
+        stats().record_compression(raw_len, len(stored))
+    mac = _sign(primary, _canonical_v2(key_id, kernel_id, field_name, codec, used, raw_len, stored))
+    return _pack_v2(key_id, codec, used, raw_len, stored, mac)
+
+
+def _open(blob: bytes, *, kernel_id: str, field_name: str) -> Tuple[str, bytes]:
+    # the verifying half of decode(): returns (codec, payload) only after the HMAC checked out;
+    # a compressed payload is inflated only after that, so unsigned input is never decompressed
+    compression, raw_len = "none", 0
     try:
-        version, key_id, codec, payload, mac = _unpack(blob)
+        version = blob[0] if blob else None
+        if version == _FORMAT_VERSION_2:
+            key_id, codec, compression, raw_len, payload, mac = _unpack_v2(blob)
+        else:
+            version, key_id, codec, payload, mac = _unpack(blob)
     except (ValueError, IndexError) as exc:
         raise EnvelopeError(f"malformed envelope for field {field_name!r}: {exc}") from exc
-    if version != _FORMAT_VERSION:
+    if version not in (_FORMAT_VERSION, _FORMAT_VERSION_2):
         raise EnvelopeError(f"unsupported envelope format version {version} for field {field_name!r}")
     keys = _secret_keys()
     key = _find_key(keys, key_id)
     if key is None:
         raise HmacError(f"no configured secret key matches the envelope for field {field_name!r}")
-    expected = _sign(key, _canonical(key_id, kernel_id, field_name, codec, payload))
-    if not hmac.compare_digest(expected, mac):
+    if version == _FORMAT_VERSION_2:
+        canonical = _canonical_v2(key_id, kernel_id, field_name, codec, compression, raw_len, payload)
+    else:
+        canonical = _canonical(key_id, kernel_id, field_name, codec, payload)
+    if not hmac.compare_digest(_sign(key, canonical), mac):
         raise HmacError(f"HMAC verification failed for field {field_name!r} (tampered, wrong key, or replayed across kernel/field)")
-    _, loads = _get_codec(codec)
-    return loads(payload)
+    if compression != "none":
+        try:
+            _, decompress = _COMPRESSORS[compression]
+        except KeyError:
+            raise CodecError(f"unknown compression {compression!r} for field {field_name!r}")
+        try:
+            payload = decompress(payload, raw_len)
+        except EnvelopeError:
+            raise
+        except Exception as exc:
+            raise CodecError(f"decompressing field {field_name!r} failed: {exc}") from exc
+    elif version == _FORMAT_VERSION_2 and raw_len != len(payload):
+        raise CodecError(f"payload of field {field_name!r} does not match its recorded size")
+    return codec, payload
+
+
+def encode(value: Any, *, codec: str = "json", kernel_id: str, field_name: str) -> bytes:
+    """Serialize `value` with `codec` and wrap it in a signed envelope bound to `kernel_id`/`field_name`."""
+    # same failure order as ever: unknown codec, then missing keys, then the value itself
+    _get_codec(codec)
+    _secret_keys()
+    payload = _dumps(value, codec=codec, field_name=field_name)
+    return _seal(payload, codec=codec, kernel_id=kernel_id, field_name=field_name)
+
+
+def decode(blob: bytes, *, kernel_id: str, field_name: str) -> Any:
+    """Verify the envelope (HMAC first) then decode its payload, checking `kernel_id`/`field_name` binding."""
+    codec, payload = _open(blob, kernel_id=kernel_id, field_name=field_name)
+    return _loads(payload, codec=codec)
 
 
 def session_hmac(session_id: str) -> bytes:
@@ -3,14 +3,14 @@ registry, and the per-kernel persistence manager.
 
 Three pieces live here (design ``docs/design-redis-state-persistence.md`` §4):
 
-- :class:`PersistConfig` — the two-field per-variable configuration
+- :class:`PersistConfig` — the per-variable configuration
   (``solara.reactive(..., persist=PersistConfig(key=..., serializer=...))``).
 - The process-global persist registry, mapping ``storage_key -> (PersistConfig,
   weakref-to-public-Reactive)`` (§4.4: flush must ``peek()`` the *public* store so
   values are unwrapped from the mutation-detection ``StoreValue`` wrapper).
 - :class:`KernelStatePersistence` — one per :class:`VirtualKernelContext`, created by
-  :func:`attach` after a backend ``takeover``. It eagerly verifies and decodes all
-  restored envelopes (all-or-nothing bail-out, §4.3), lazily installs them at the
+  :func:`attach` after a backend ``takeover``. It eagerly verifies all restored
+  envelopes (all-or-nothing bail-out, §4.3), lazily decodes and installs them at the
   ``KernelStore.get()`` init seam (:meth:`KernelStatePersistence.pop_restored`),
   dirty-marks via ``subscribe_change`` (§4.4, no I/O in listeners), and writes fenced
   batches through :meth:`KernelStatePersistence.flush_now` (§5.3; keys stay dirty until
@@ -23,16 +23,19 @@ import dataclasses
 import enum
 import logging
 import threading
+import time
 import weakref
-from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple, Union
 
 import solara.settings
 import solara.toestand
 import solara.util
 
 from . import derive
-from .backend import StateBackend
-from .envelope import EnvelopeError, HmacError, decode, encode
+from .backend import FlushRequest, StateBackend
+from .delta import CHUNK_FIELD_PREFIX, MANIFEST_CODEC, ChunkState, chunk_field, encode_chunks, load_chunks, split, verify_chunks
+from .envelope import EnvelopeError, HmacError, _get_codec, _loads, _open, encode
+from .snapshot import CostModel, fast_snapshot
 from .stats import log_flush, log_restore, stats
 
 if TYPE_CHECKING:
@@ -68,26 +71,59 @@ class FlushOutcome(str, enum.Enum):
     DISABLED = "disabled"  # a serialize failure disabled persistence for this kernel (§4.3)
 
 
+@dataclasses.dataclass
+class PreparedFlush:
+    """A drained, serialized flush awaiting its backend write (see :meth:`KernelStatePersistence.prepare_flush`)."""
+
+    drained: Set[str]  # the storage keys this write covers; re-marked dirty unless it is ACKed
+    request: FlushRequest
+    # delta-mode bookkeeping committed on ACK: storage_key -> chunk digests written (None: stored whole)
+    chunks: Dict[str, Optional[ChunkState]] = dataclasses.field(default_factory=dict)
+
+
+@dataclasses.dataclass
+class _Verified:
+    """A restored value whose envelope(s) passed verification, not decoded yet (see :meth:`KernelStatePersistence.pop_restored`)."""
+
+    parts: List[Tuple[str, bytes]]  # (codec, payload) per envelope: one, or one per chunk in delta mode
+    kind: Optional[str] = None  # the delta container kind, None for a value stored whole
+
+    def load(self) -> Any:
+        if self.kind is None:
+            codec, payload = self.parts[0]
+            return _loads(payload, codec=codec)
+        return load_chunks(self.kind, self.parts)
+
+
 # backend hash fields for reactives are namespaced (user_dicts is shared with solara.scope,
 # and future namespaces - e.g. session storage - must not collide with reactive keys)
 FIELD_PREFIX = "reactive:"
 
 
+def _storage_key_of_field(field_name: str) -> Optional[str]:
+    if field_name.startswith(FIELD_PREFIX):
+        return field_name[len(FIELD_PREFIX) :]
+    if field_name.startswith(CHUNK_FIELD_PREFIX):
+        return field_name[len(CHUNK_FIELD_PREFIX) :].rpartition("#")[0]
+    return None
+
+
 @dataclasses.dataclass
 class PersistConfig:
     """Per-variable persistence configuration for `solara.reactive(..., persist=...)`.
 
-    Deliberately two fields in v1:
-
     - `key`: the stable cross-process persistence key. When None, the key is derived
       from the definition site (module-level single-name assignment or class attribute);
       anything ambiguous raises, demanding an explicit key.
     - `serializer`: the envelope codec name, `"json"` (default, strict with type
       coercion) or `"pickle"` (requires the deployer-side SOLARA_STATE_ALLOW_PICKLE gate).
+    - `delta`: store a `list`/`dict`/`DataFrame` value as signed chunks and only rewrite the
+      chunks that changed (see :mod:`solara.state.delta`). Other values are stored whole.
     """
 
     key: Optional[str] = None
     serializer: str = "json"
+    delta: bool = False
 
 
 # --- process-global persist registry ------------------------------------------------------
@@ -189,9 +225,9 @@ class KernelStatePersistence:
     """Per-kernel-context persistence manager (one per VirtualKernelContext).
 
     Created via :func:`attach` after a backend ``takeover``. Restored envelopes are
-    verified and decoded eagerly (all-or-nothing: any failure discards everything,
-    deletes the poisoned hash, and sets ``recovery_failed``); the decoded raw values are
-    installed lazily by ``KernelStore.get()`` through :meth:`pop_restored`. Writes are
+    verified eagerly (all-or-nothing: any failure discards everything, deletes the
+    poisoned hash, and sets ``recovery_failed``); each payload is decoded and installed
+    lazily, on its key's first ``KernelStore.get()``, through :meth:`pop_restored`. Writes are
     dirty-marked via ``subscribe_change`` (scoped to this kernel context) and flushed as
     one fenced batch by :meth:`flush_now`.
     """
@@ -224,56 +260,100 @@ class KernelStatePersistence:
         # the TakeoverResult.reason the server observed ("restored"/"miss"/"schema-reset"); set by
         # attach(). Drives the client-facing last_restore status (§6.4). None until attach runs.
         self.restore_reason: Optional[str] = None
-        # number of reactive envelopes decoded at takeover; stable even after pop_restored consumes
+        # number of reactive envelopes verified at takeover; stable even after pop_restored consumes
         # self.restored, so last_restore.nFields stays meaningful once first-render installs values.
         self.n_restored = 0
-        # storage_key -> raw (unwrapped) python value, consumed by pop_restored
+        # storage_key -> verified, not yet decoded value (_Verified), consumed by pop_restored
         self.restored: Dict[str, Any] = {}
+        # time spent decoding restored keys so far; logged once the last one is read
+        self._decode_seconds = 0.0
         self._dirty_lock = threading.Lock()
         self._dirty: Set[str] = set()
+        # changes to an already-dirty key: absorbed into its pending write (counted at drain)
+        self._coalesced = 0
+        # per-key rate limit (set_key_rate_limit): when each dirty key was first marked, and
+        # when each key was last drained into a write (monotonic seconds)
+        self._key_min_interval = 0.0
+        self._key_max_delay = 0.0
+        self._dirty_since: Dict[str, float] = {}
+        self._key_written: Dict[str, float] = {}
+        # when the earliest key held back by the rate limit may be written; None: none held back
+        self.next_key_due: Optional[float] = None
         self._unsubscribers: List[Callable[[], None]] = []
         # storage keys already subscribed, so watch_all + late-registration cannot double-watch
         self._watched: Set[str] = set()
-        # set by the flush worker (commit 2); called once when the dirty set goes clean->dirty
-        # so a write from any source (task/thread/callback) schedules a debounced flush (§5.3)
+        # set by the flush worker (commit 2); called when a key goes clean->dirty so a write
+        # from any source (task/thread/callback) schedules a debounced flush (§5.3)
         self._flush_scheduler: Optional[Callable[[], None]] = None
+        # delta mode: storage_key -> the chunks the backend holds for it, as of a generation.
+        # Only touched by restore and by the (per-kernel serialized) prepare/complete flush.
+        self._chunks: Dict[str, ChunkState] = {}
+        # learns, per key, whether serializing under the reactive's lock beats deep-copying it
+        self._snapshot_costs = CostModel()
         self._decode_envelopes(envelopes)
 
     def _decode_envelopes(self, envelopes: Dict[str, bytes]) -> None:
-        # Eager-decode, lazy-install (§12): verify + decode ALL envelopes now, so a bad
-        # envelope is detected before any value is handed out - never a partial restore.
-        restored: Dict[str, Any] = {}
+        # Eager-verify, lazy-decode (§12): check the HMAC (and chunk digests) of ALL envelopes
+        # now, so a tampered or replayed envelope is detected before any value is handed out:
+        # an envelope that fails verification restores nothing. Payloads are only decoded by
+        # pop_restored, on first read: with many (or large) persisted reactives, decoding is what
+        # dominates reconnect time. The price is that a payload that verifies but fails to decode
+        # is found late, and then the restore is partial: the keys already read keep their values
+        # and the rest fall back to their defaults (see pop_restored).
+        restored: Dict[str, _Verified] = {}
+        started = time.perf_counter()
         for field_name, blob in envelopes.items():
             if not field_name.startswith(FIELD_PREFIX):
                 # not a reactive field (a future namespace); ignore, do not bail out
                 continue
             storage_key = field_name[len(FIELD_PREFIX) :]
             try:
-                restored[storage_key] = decode(blob, kernel_id=self.kernel_id, field_name=field_name)
+                codec, payload = _open(blob, kernel_id=self.kernel_id, field_name=field_name)
+                if codec == MANIFEST_CODEC:
+                    # the manifest is tiny and names the chunks to verify: decode it now
+                    manifest = _loads(payload, codec=codec)
+                    parts, self._chunks[storage_key] = verify_chunks(
+                        manifest, envelopes=envelopes, kernel_id=self.kernel_id, storage_key=storage_key, generation=self.generation
+                    )
+                    restored[storage_key] = _Verified(parts, kind=manifest.kind)
+                else:
+                    # an unknown codec can never decode: fail now rather than on first read
+                    _get_codec(codec)
+                    restored[storage_key] = _Verified([(codec, payload)])
             except EnvelopeError as exc:
-                cause = "hmac" if isinstance(exc, HmacError) else "codec"
-                self.recovery_failed = True
-                self.failed_key = storage_key
-                self.cause = cause
-                stats().incr("restore_bailout")
+                self._bail_out(storage_key, exc)
                 stats().record_restore_attempt(bailed_out=True)
-                log_restore("bailout", kernel=self.kernel_id, key=storage_key, cause=cause)
-                logger.debug("bail-out envelope error for kernel %s key %s: %s", self.kernel_id, storage_key, exc)
-                # poisoned-hash deletion (§4.3): otherwise every reconnect re-reads the same
-                # poisoned envelope and loops in permanent bail-out until TTL
-                try:
-                    self.backend.delete(self.kernel_id)
-                except Exception:  # noqa
-                    logger.exception("failed to delete poisoned state for kernel %s", self.kernel_id)
+                self._delete_poisoned()
                 return
+        verify_seconds = time.perf_counter() - started
         self.restored = restored
         self.n_restored = len(restored)
-        # feed the storm window a non-bailout outcome (this decode reached the end without failing)
+        # feed the storm window a non-bailout outcome (this verify reached the end without failing)
         stats().record_restore_attempt(bailed_out=False)
         if restored:
             stats().incr("restore_success")
-            stats().record_restore_bytes(sum(len(blob) for field_name, blob in envelopes.items() if field_name.startswith(FIELD_PREFIX)))
-            log_restore("success", kernel=self.kernel_id)
+            stats().record_restore_bytes(sum(len(blob) for field_name, blob in envelopes.items() if _storage_key_of_field(field_name) is not None))
+            stats().record_restore_verify(verify_seconds)
+            log_restore("success", kernel=self.kernel_id, verify_ms=verify_seconds * 1000)
+
+    def _bail_out(self, storage_key: str, exc: EnvelopeError) -> None:
+        cause = "hmac" if isinstance(exc, HmacError) else "codec"
+        self.recovery_failed = True
+        self.failed_key = storage_key
+        self.cause = cause
+        self.restored = {}
+        self._chunks = {}
+        stats().incr("restore_bailout")
+        log_restore("bailout", kernel=self.kernel_id, key=storage_key, cause=cause)
+        logger.debug("bail-out envelope error for kernel %s key %s: %s", self.kernel_id, storage_key, exc)
+
+    def _delete_poisoned(self) -> None:
+        # poisoned-hash deletion (§4.3): otherwise every reconnect re-reads the same
+        # poisoned envelope and loops in permanent bail-out until TTL
+        try:
+            self.backend.delete(self.kernel_id)
+        except Exception:  # noqa
+            logger.exception("failed to delete poisoned state for kernel %s", self.kernel_id)
 
     @property
     def last_restore(self) -> Dict[str, Any]:
@@ -305,13 +385,35 @@ class KernelStatePersistence:
         reactive - else ``(False, None)``. The entry is consumed (popped), so a later
         ``clear()`` lazy-inits from the default again. Must not do I/O, fire listeners, or
         mark dirty (same contract as ``initial_value`` - it runs under init locks).
+
+        The payload was verified at takeover and is decoded here. A payload that verified
+        but fails to decode is a late bail-out: this and every not yet read key fall back to
+        their defaults, persistence is disabled for the kernel, and the poisoned hash is
+        deleted from a background thread (no I/O under the init lock).
         """
         if not self.restored:
             return False, None
         try:
-            raw = self.restored.pop(storage_key)
+            verified = self.restored.pop(storage_key)
         except KeyError:
             return False, None
+        started = time.perf_counter()
+        try:
+            raw = verified.load()
+        except EnvelopeError as exc:
+            self._bail_out(storage_key, exc)
+            # keys already handed out keep their values, so nothing may be written back
+            self.disabled = True
+            thread = threading.Thread(target=self._delete_poisoned, daemon=True, name="solara-state-delete-poisoned")
+            # the patched Thread captures the current kernel context; a backend delete needs none
+            thread.current_context = None  # type: ignore
+            thread.start()
+            return False, None
+        seconds = time.perf_counter() - started
+        stats().record_restore_decode(seconds)
+        self._decode_seconds += seconds
+        if not self.restored:
+            log_restore("decoded", kernel=self.kernel_id, decode_ms=self._decode_seconds * 1000)
         from solara._stores import StoreValue, _PublicValueNotSet, _SetValueNotSet
 
         if isinstance(getattr(store, "default_value", None), StoreValue):
@@ -375,11 +477,15 @@ class KernelStatePersistence:
             if isinstance(new, StoreValue) and reactive.equals(_unwrap(new), _unwrap(old)):
                 return
             with self._dirty_lock:
-                was_clean = not self._dirty
-                self._dirty.add(storage_key)
-            # schedule the debounced flush on the clean->dirty edge, outside the dirty lock
-            # (the worker takes its own lock); no I/O here, just an alarm-arm.
-            if was_clean:
+                newly_dirty = storage_key not in self._dirty
+                if newly_dirty:
+                    self._dirty.add(storage_key)
+                    self._dirty_since.setdefault(storage_key, time.monotonic())
+                else:
+                    self._coalesced += 1
+            # schedule the debounced flush on the key's clean->dirty edge, outside the dirty lock
+            # (the worker takes its own lock; an already armed flush absorbs it); no I/O here.
+            if newly_dirty:
                 scheduler = self._flush_scheduler
                 if scheduler is not None:
                     scheduler()
@@ -393,16 +499,66 @@ class KernelStatePersistence:
                 self._unsubscribers.append(inner.subscribe_change(_mark_dirty))
 
     def set_flush_scheduler(self, scheduler: Optional[Callable[[], None]]) -> None:
-        """Install (or clear) the callback the write-behind worker arms on the clean->dirty edge."""
+        """Install (or clear) the callback the write-behind worker arms on a key's clean->dirty edge."""
         self._flush_scheduler = scheduler
 
+    def set_key_rate_limit(self, min_interval: float, max_delay: float) -> None:
+        """Write each key at most once per ``min_interval`` seconds (0 disables the limit).
+
+        A key changed again sooner stays dirty and is left out of the flush, so one chatty
+        reactive cannot take every write; it is written once ``min_interval`` has passed, or
+        at the latest ``max_delay`` after its first unwritten change. The worker re-arms
+        itself for :attr:`next_key_due`.
+        """
+        with self._dirty_lock:
+            self._key_min_interval = min_interval
+            self._key_max_delay = max_delay
+
     def mark_all_dirty(self) -> None:
         """Mark every registered persisted key dirty (the rejection-protocol re-flush, §5.5)."""
         keys = set(persisted_reactives().keys())
         if not keys:
             return
+        now = time.monotonic()
+        with self._dirty_lock:
+            self._dirty |= keys
+            for storage_key in keys:
+                self._dirty_since.setdefault(storage_key, now)
+
+    def _remark_dirty(self, keys: Set[str]) -> None:
+        # an unacknowledged write: its keys are dirty again (and due at once, as before the drain)
+        now = time.monotonic()
         with self._dirty_lock:
             self._dirty |= keys
+            for storage_key in keys:
+                self._dirty_since.setdefault(storage_key, now - self._key_max_delay)
+
+    def _take_due(self, now: float) -> Set[str]:
+        # caller holds self._dirty_lock: drain the dirty keys the per-key rate limit lets through
+        interval = self._key_min_interval
+        if interval <= 0:
+            drained = set(self._dirty)
+            self.next_key_due = None
+        else:
+            drained = set()
+            next_due: Optional[float] = None
+            for storage_key in self._dirty:
+                written = self._key_written.get(storage_key)
+                due = now if written is None else min(written + interval, self._dirty_since.get(storage_key, now) + self._key_max_delay)
+                if due <= now:
+                    drained.add(storage_key)
+                elif next_due is None or due < next_due:
+                    next_due = due
+            self.next_key_due = next_due
+            deferred = len(self._dirty) - len(drained)
+            if deferred:
+                stats().incr("flush_key_deferrals", deferred)
+            for storage_key in drained:
+                self._key_written[storage_key] = now
+        self._dirty -= drained
+        for storage_key in drained:
+            self._dirty_since.pop(storage_key, None)
+        return drained
 
     @property
     def dirty_keys(self) -> Set[str]:
@@ -415,9 +571,12 @@ class KernelStatePersistence:
     def flush_now(self) -> FlushOutcome:
         """Drain the dirty set and write one fenced batch to the backend.
 
-        Snapshot (deepcopy) under the reactive's lock inside the kernel context; serialize
-        and write outside all locks. On a fenced rejection or backend error the drained keys
-        are re-marked dirty (keys stay dirty until the write is ACKed, §4.4). A serialize
+        Each value is taken under the reactive's lock inside the kernel context, in one of two
+        ways (see :mod:`solara.state.snapshot` and ``SOLARA_STATE_SNAPSHOT_MODE``): a snapshot
+        (without a deep copy where allowed) that is serialized after the lock is released, or,
+        when the cost model finds it cheaper, serializing the value under the lock. The backend
+        write is always outside all locks. On a fenced rejection or backend error the drained
+        keys are re-marked dirty (keys stay dirty until the write is ACKed, §4.4). A serialize
         failure follows §4.3: log once, delete the kernel's hash, and disable persistence for
         this kernel.
 
@@ -426,16 +585,43 @@ class KernelStatePersistence:
         breaker-agnostic - the caller checks ``breaker.allow()`` before invoking it. It enters
         the kernel context itself for the snapshot phase (the ONE owner of that step); it never
         holds ``context.lock`` and does the backend I/O outside every lock.
+
+        The two halves are also usable separately (:meth:`prepare_flush` /
+        :meth:`complete_flush`): the batched flush scheduler prepares many kernels, writes them
+        in one :meth:`~solara.state.backend.StateBackend.flush_many` round trip, and completes
+        each kernel with its own result.
+        """
+        prepared = self.prepare_flush()
+        if isinstance(prepared, FlushOutcome):
+            return prepared
+        request = prepared.request
+        try:
+            ok = self.backend.flush(request.kernel_id, request.generation, request.fields, request.ttl, request.session_hmac, request.schema_tag)
+        except Exception as exc:  # noqa
+            return self.complete_flush(prepared, exc)
+        return self.complete_flush(prepared, ok)
+
+    def prepare_flush(self) -> "Union[FlushOutcome, PreparedFlush]":
+        """Drain the dirty set, snapshot and serialize it: everything of a flush but the backend write.
+
+        Returns a :class:`PreparedFlush` to hand to the backend and then to :meth:`complete_flush`,
+        or a final :class:`FlushOutcome` (``NOTHING``/``DISABLED``) when there is nothing to write.
         """
         if self.disabled:
             return FlushOutcome.DISABLED
         with self._dirty_lock:
-            drained = set(self._dirty)
-            self._dirty.clear()
+            drained = self._take_due(time.monotonic())
+            coalesced, self._coalesced = self._coalesced, 0
+        if coalesced:
+            stats().incr("flush_coalesced", coalesced)
         if not drained:
             return FlushOutcome.NOTHING
         registry = persisted_reactives()
-        snapshots: Dict[str, Tuple[PersistConfig, Any]] = {}
+        settings_state = solara.settings.state
+        mode = settings_state.snapshot_mode
+        # storage_key -> (config, snapshot, strategy, lock seconds); or, for a key serialized
+        # under the lock, (config, encoded result or its EnvelopeError, "encode", lock seconds)
+        snapshots: Dict[str, Tuple[PersistConfig, Any, str, float]] = {}
         # enter the kernel context: a context-less thread would resolve reactives to the
         # global scope and snapshot defaults (§5.3)
         with self.context:
@@ -447,20 +633,45 @@ class KernelStatePersistence:
                 reactive = ref()
                 if reactive is None:
                     continue
-                # peek() the PUBLIC reactive (unwraps StoreValue); deepcopy under its lock so
-                # a concurrent task cannot hand us a torn snapshot; serialize off-lock below
+                # peek() the PUBLIC reactive (unwraps StoreValue) and snapshot it under its lock
+                # so a concurrent task cannot hand us a torn value; serialize off-lock below
+                # unless encoding under the lock is the cheaper snapshot (see snapshot.py)
                 try:
                     lock: Optional[Any] = reactive.lock
                 except NotImplementedError:
                     lock = None
                 with lock if lock is not None else solara.util.nullcontext():
-                    snapshots[storage_key] = (config, copy.deepcopy(reactive.peek()))
-        settings_state = solara.settings.state
+                    started = time.perf_counter()
+                    value = reactive.peek()
+                    fast = fast_snapshot(value)
+                    if fast is not None:
+                        strategy, snap = fast
+                    elif mode == "encode" or (mode == "auto" and self._snapshot_costs.encode_under_lock(storage_key)):
+                        strategy = "encode"
+                        try:
+                            snap = self._encode_value(storage_key, config, value)
+                        except EnvelopeError as exc:
+                            snap = exc
+                    else:
+                        strategy, snap = "copy", copy.deepcopy(value)
+                    held = time.perf_counter() - started
+                snapshots[storage_key] = (config, snap, strategy, held)
+                stats().record_snapshot(strategy, held)
+                if strategy == "encode":
+                    self._snapshot_costs.record_encode(storage_key, held)
         fields: Dict[str, bytes] = {}
-        for storage_key, (config, value) in snapshots.items():
-            field_name = FIELD_PREFIX + storage_key
+        chunk_states: Dict[str, Optional[ChunkState]] = {}
+        for storage_key, (config, snap, strategy, held) in snapshots.items():
             try:
-                blob = encode(value, codec=config.serializer, kernel_id=self.kernel_id, field_name=field_name)
+                if strategy == "encode":
+                    if isinstance(snap, EnvelopeError):
+                        raise snap
+                    key_fields, chunk_state, nbytes = snap
+                else:
+                    started = time.perf_counter()
+                    key_fields, chunk_state, nbytes = self._encode_value(storage_key, config, snap)
+                    if strategy == "copy":
+                        self._snapshot_costs.record_copy(storage_key, held, time.perf_counter() - started)
             except EnvelopeError as exc:
                 # §4.3 serialize failure: no false confidence - delete the hash and stop
                 # persisting for this kernel; a reconnect then restores nothing (fresh state)
@@ -481,7 +692,7 @@ class KernelStatePersistence:
             # §4.3 size guard: a single oversize value is SKIPPED (not flushed) rather than
             # disabling the whole kernel - the rest of its state still persists, and one huge
             # reactive cannot fill Redis or spike memory. A warn threshold flags growth earlier.
-            nbytes = len(blob)
+            # In delta mode nbytes is the whole stored value, not just the chunks rewritten now.
             if settings_state.max_value_bytes and nbytes > settings_state.max_value_bytes:
                 stats().incr("sync_oversize_dropped")
                 logger.warning(
@@ -501,24 +712,61 @@ class KernelStatePersistence:
                     nbytes,
                     settings_state.warn_value_bytes,
                 )
-            fields[field_name] = blob
-        try:
-            ok = self.backend.flush(self.kernel_id, self.generation, fields, self.ttl, self.session_hmac, self.schema_tag)
-        except Exception:  # noqa
+            fields.update(key_fields)
+            chunk_states[storage_key] = chunk_state
+        request = FlushRequest(self.kernel_id, self.generation, fields, self.ttl, self.session_hmac, self.schema_tag)
+        return PreparedFlush(drained=drained, request=request, chunks=chunk_states)
+
+    def _encode_value(self, storage_key: str, config: PersistConfig, value: Any) -> Tuple[Dict[str, bytes], Optional[ChunkState], int]:
+        # -> (fields to write, delta chunk state or None, total stored bytes of the value)
+        field_name = FIELD_PREFIX + storage_key
+        previous = self._chunks.get(storage_key)
+        if previous is not None and previous.generation != self.generation:
+            # written under another generation: the hash may hold someone else's chunks
+            previous = None
+        parts = split(value, solara.settings.state.delta_chunk_items) if config.delta else None
+        if parts is not None:
+            kind, chunks = parts
+            return encode_chunks(
+                kind=kind,
+                chunks=chunks,
+                codec=config.serializer,
+                kernel_id=self.kernel_id,
+                field_name=field_name,
+                storage_key=storage_key,
+                previous=previous,
+                generation=self.generation,
+            )
+        blob = encode(value, codec=config.serializer, kernel_id=self.kernel_id, field_name=field_name)
+        key_fields = {field_name: blob}
+        if previous is not None:
+            # the value used to be chunked: blank its chunks
+            key_fields.update({chunk_field(storage_key, index): b"" for index in range(len(previous.digests))})
+        return key_fields, None, len(blob)
+
+    def complete_flush(self, prepared: "PreparedFlush", result: "Union[bool, Exception]") -> FlushOutcome:
+        """Account for the backend's answer to a :meth:`prepare_flush` write.
+
+        ``result`` is the backend's ``flush`` return value, or the exception it raised. Keys stay
+        dirty until ACK: a rejection or an error re-marks the drained keys (§4.4).
+        """
+        fields = prepared.request.fields
+        if isinstance(result, Exception):
             # a backend error (not a fence rejection): re-mark dirty and report ERROR so the
             # caller can feed the circuit breaker
-            with self._dirty_lock:
-                self._dirty |= drained
+            self._remark_dirty(prepared.drained)
+            # the write may or may not have landed: forget the chunk digests, rewrite in full
+            self._forget_chunks(prepared)
             log_flush("error", kernel=self.kernel_id, n_fields=len(fields))
-            logger.exception("backend flush raised for kernel %s", self.kernel_id)
+            logger.error("backend flush raised for kernel %s", self.kernel_id, exc_info=result)
             stats().incr("flush_failures")
             stats().record_backend_error("flush raised")
             return FlushOutcome.ERROR
-        if not ok:
+        if not result:
             # fenced out: another instance owns the generation. Keys stay dirty until ACK
             # (§4.4); this is NOT a backend-health signal, so it does not feed the breaker.
-            with self._dirty_lock:
-                self._dirty |= drained
+            self._remark_dirty(prepared.drained)
+            self._forget_chunks(prepared)
             log_flush("rejected", kernel=self.kernel_id, n_fields=len(fields))
             stats().incr("flush_rejected")
             stats().record_backend_ok()
@@ -526,11 +774,25 @@ class KernelStatePersistence:
         log_flush("ok", kernel=self.kernel_id, n_fields=len(fields))
         stats().incr("flush_ok")
         stats().record_backend_ok()
+        for storage_key, chunk_state in prepared.chunks.items():
+            if chunk_state is None:
+                self._chunks.pop(storage_key, None)
+            else:
+                self._chunks[storage_key] = chunk_state
         # sync-volume accounting, only on ACK: rejected/errored flushes re-mark their keys
         # dirty and would double-count on retry (per persist key + per kernel, §7a)
-        stats().record_sync(self.kernel_id, {field_name[len(FIELD_PREFIX) :]: len(blob) for field_name, blob in fields.items()})
+        synced: Dict[str, int] = {}
+        for field_name, blob in fields.items():
+            synced_key = _storage_key_of_field(field_name)
+            if synced_key is not None:
+                synced[synced_key] = synced.get(synced_key, 0) + len(blob)
+        stats().record_sync(self.kernel_id, synced)
         return FlushOutcome.OK
 
+    def _forget_chunks(self, prepared: "PreparedFlush") -> None:
+        for storage_key in prepared.chunks:
+            self._chunks.pop(storage_key, None)
+
     def close(self) -> None:
         """Best-effort final flush, then unsubscribe and drop references.
 
@@ -5,7 +5,10 @@ This is the v1 production backend for opt-in reactive state persistence (design
 contract as the in-process memory backend, so serialization and fencing logic proven in dev
 against the memory backend behave identically here. Every kernel is one Redis hash at
 ``{prefix}{kernel_id}`` with meta fields (``__generation__``, ``__session_id__``,
-``__version__``) alongside the ``reactive:``-prefixed signed envelopes.
+``__version__``) alongside the ``reactive:``-prefixed signed envelopes. With
+``SOLARA_STATE_REDIS_MODE=cluster`` the key is ``{prefix}{{kernel_id}}`` (hash-tagged, so the
+single-key scripts always run on the kernel's slot); with ``sharded`` the hashes are spread over
+several standalone nodes by a client-side consistent-hash ring.
 
 Atomicity is delegated to Redis, not to the design: ``takeover`` (verify -> bump -> read) and
 ``flush`` (fenced compare-then-write) are each a single Lua script registered once per client,
@@ -15,14 +18,27 @@ by the persistence manager. Redis/network errors propagate to callers (the worke
 paths already count and handle them); only the missing-``redis``-package import is wrapped.
 
 Transparently covers Valkey/KeyDB/Dragonfly (Redis-protocol compatible via redis-py).
+
+:class:`AsyncRedisStateBackend` (``SOLARA_STATE_BACKEND=redis-async``) runs the same scripts
+through ``redis.asyncio`` for the awaitable verbs, so the connect-time takeover is awaited on
+the websocket's event loop rather than parked on a thread.
 """
 
+import asyncio
+import bisect
+import contextlib
+import dataclasses
+import hashlib
 import logging
-from typing import Any, Dict, List, Optional, Sequence, Union
+import threading
+import time
+import urllib.parse
+from typing import Any, Awaitable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 import solara.settings
 
-from .backend import StateBackend, TakeoverResult
+from .backend import FlushRequest, StateBackend, TakeoverResult
+from .stats import stats
 
 logger = logging.getLogger("solara.state.redis")
 
@@ -148,37 +164,123 @@ return 1
 """
 
 
+@dataclasses.dataclass
+class _Shard:
+    """One Redis endpoint: its client and the scripts registered on it."""
+
+    name: str  # stable identity (host:port/db, no credentials): the hash-ring point and the stats label
+    client: Any
+    takeover: Any
+    flush: Any
+    delete: Any
+
+
+def _bind(name: str, client: Any) -> _Shard:
+    # register the atomic scripts once; each Script is bound to its client (EVALSHA + fallback)
+    return _Shard(
+        name=name,
+        client=client,
+        takeover=client.register_script(_LUA_TAKEOVER),
+        flush=client.register_script(_LUA_FLUSH),
+        delete=client.register_script(_LUA_DELETE),
+    )
+
+
+class _HashRing:
+    """Consistent hashing of kernel ids over shard names.
+
+    Each shard owns ``replicas`` points on a 64-bit ring and a kernel belongs to the first point
+    at or after its own hash, so adding or removing one of N shards moves only ~1/N of the
+    kernels (a moved kernel restores as a miss, it is never mixed up with another's state).
+    The ring depends on the names only, not on their order.
+    """
+
+    def __init__(self, names: Sequence[str], replicas: int = 128) -> None:
+        points = sorted((_ring_hash(f"{name}#{index}"), name) for name in names for index in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    def node(self, key: str) -> str:
+        index = bisect.bisect(self._hashes, _ring_hash(key))
+        return self._names[index % len(self._names)]
+
+
+def _ring_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _node_name(url: str) -> str:
+    # host:port/db of a redis DSN; credentials never end up in a stats label or the ring
+    parsed = urllib.parse.urlsplit(url)
+    return f"{parsed.hostname or 'localhost'}:{parsed.port or 6379}{parsed.path or '/0'}"
+
+
+@contextlib.contextmanager
+def _timed(shard: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stats().record_shard(shard, time.perf_counter() - started, error=True)
+        raise
+    stats().record_shard(shard, time.perf_counter() - started, error=False)
+
+
 class RedisStateBackend(StateBackend):
     """Redis-backed state backend (design §5.2/§5.5/§5.7).
 
     Constructed with no arguments by ``get_backend()``: it reads ``solara.settings.state.url``
-    (the redis DSN) and ``prefix``, and builds a sync ``redis.Redis`` client whose socket
+    (the redis DSN), ``prefix`` and ``redis_mode``, and builds sync ``redis`` clients whose socket
     timeouts bound *every* operation (the connect deadline in commit 2 relies on this). The
-    ``client`` kwarg and the :meth:`_make_client` factory are the test-injection seam.
+    ``client`` / ``shards`` kwargs and the :meth:`_make_client` factory are the test-injection seam.
+
+    ``redis_mode`` picks the topology:
+
+    - ``standalone``: one endpoint, one ``{prefix}{kernel_id}`` hash per kernel.
+    - ``cluster``: a ``RedisCluster`` client; keys become ``{prefix}{{kernel_id}}``, so every key
+      of a kernel hash-tags to the kernel's slot and the scripts stay single-slot.
+    - ``sharded``: several standalone endpoints, each kernel placed by a consistent-hash ring
+      (:class:`_HashRing`); a kernel's hash lives on exactly one node, so fencing is unchanged.
+
+    Latency and errors per node are recorded in :func:`solara.state.stats` (``shards``).
     """
 
     # a genuinely shared, cross-process store: the server may shorten the orphan cull (§5.4).
     shared = True
 
-    def __init__(self, client: Optional[Any] = None) -> None:
-        self._prefix = solara.settings.state.prefix
-        # the client is the injection seam: tests pass a fakeredis client (optionally sharing one
+    def __init__(self, client: Optional[Any] = None, *, shards: Optional[Dict[str, Any]] = None, cluster: Optional[bool] = None) -> None:
+        st = solara.settings.state
+        self._prefix = st.prefix
+        self._cluster = (st.redis_mode == "cluster") if cluster is None else cluster
+        # the clients are the injection seam: tests pass fakeredis clients (optionally sharing one
         # FakeServer across two backend instances to model the two-instances-one-redis topology);
-        # in production _make_client() builds a real client from settings.
-        self.client = client if client is not None else self._make_client()
-        # register the atomic scripts once; each Script is bound to this client (EVALSHA + fallback)
-        self._takeover_script = self.client.register_script(_LUA_TAKEOVER)
-        self._flush_script = self.client.register_script(_LUA_FLUSH)
-        self._delete_script = self.client.register_script(_LUA_DELETE)
-        self._check_maxmemory_policy()
-
-    def _check_maxmemory_policy(self) -> None:
+        # in production _make_client() builds real clients from settings.
+        if shards is not None:
+            self._shards = [_bind(name, shard_client) for name, shard_client in shards.items()]
+        elif client is not None:
+            self._shards = [_bind("default", client)]
+        elif st.redis_mode == "sharded":
+            self._shards = [_bind(_node_name(url), self._make_client(url)) for url in _split_urls(st.url)]
+        else:
+            self._shards = [_bind(_node_name(st.url), self._make_client(st.url))]
+        if not self._shards:
+            raise ValueError("SOLARA_STATE_URL must list at least one redis DSN")
+        self._by_name = {shard.name: shard for shard in self._shards}
+        if len(self._by_name) != len(self._shards):
+            raise ValueError("SOLARA_STATE_URL lists the same redis node twice")
+        self._ring = _HashRing(list(self._by_name)) if len(self._shards) > 1 else None
+        # the single-endpoint client (standalone/cluster); with shards, the first node
+        self.client = self._shards[0].client
+        for shard in self._shards:
+            self._check_maxmemory_policy(shard.client)
+
+    def _check_maxmemory_policy(self, client: Any) -> None:
         # design §7: surface a dangerous eviction policy at connect time. `noeviction` refuses
         # writes rather than dropping live sessions; an lru/lfu policy silently evicts persisted
         # state under memory pressure (the "invisible worst case"). Best-effort: a CONFIG-disabled
         # or managed Redis that hides CONFIG must never block startup.
         try:
-            raw = self.client.config_get("maxmemory-policy")  # type: ignore[attr-defined]
+            raw = client.config_get("maxmemory-policy")  # type: ignore[attr-defined]
             policy = raw.get("maxmemory-policy") if isinstance(raw, dict) else raw
             if isinstance(policy, bytes):
                 policy = policy.decode("utf-8", "replace")
@@ -196,7 +298,7 @@ class RedisStateBackend(StateBackend):
         except Exception as exc:  # noqa - never let an observability check break startup
             logger.debug("could not read Redis maxmemory-policy: %s", exc)
 
-    def _make_client(self) -> Any:
+    def _make_client(self, url: str) -> Any:
         # LAZY import: redis is an optional dependency, required only when this backend is selected.
         try:
             import redis
@@ -205,20 +307,38 @@ class RedisStateBackend(StateBackend):
                 "the redis state backend requires the 'redis' package. Install it with `pip install solara[redis]` (or `pip install redis`)."
             ) from exc
         st = solara.settings.state
-        if not st.url:
+        if not url:
             raise ValueError("SOLARA_STATE_URL must be set to a redis DSN (e.g. redis://localhost:6379/0) for the redis state backend")
         # socket_timeout bounds every op incl. peek_generation; socket_connect_timeout bounds connect.
         # decode_responses stays False: envelopes are raw bytes and must round-trip byte-for-byte.
-        return redis.Redis.from_url(
-            st.url,
+        factory = redis.RedisCluster if self._cluster else redis.Redis
+        return factory.from_url(
+            url,
             socket_timeout=st.connect_timeout,
             socket_connect_timeout=st.connect_timeout,
             decode_responses=False,
         )
 
     def _key(self, kernel_id: str) -> str:
+        if self._cluster:
+            # hash tag: the slot is computed from the kernel id alone, whatever the prefix holds
+            return f"{self._prefix}{{{kernel_id}}}"
         return self._prefix + kernel_id
 
+    def _shard(self, kernel_id: str) -> _Shard:
+        if self._ring is None:
+            return self._shards[0]
+        return self._by_name[self._ring.node(kernel_id)]
+
+    def _label(self, shard: _Shard, key: str) -> str:
+        if self._cluster:
+            # report the cluster node that owns the key's slot
+            try:
+                return self.client.get_node_from_key(key).name
+            except Exception:  # noqa - topology refresh in progress; fall back to the seed label
+                pass
+        return shard.name
+
     def _takeover_ttl_seconds(self) -> int:
         # takeover has no ttl argument, but the design refreshes the TTL on connect (§5.2); use the
         # same kernel-scoped TTL the flush path uses so connect and write agree.
@@ -226,20 +346,18 @@ class RedisStateBackend(StateBackend):
 
         return _ttl_to_seconds(_default_ttl())
 
-    def takeover(self, kernel_id: str, session_hmacs: "Union[bytes, Sequence[bytes]]", schema_tag: str) -> TakeoverResult:
+    def _takeover_args(self, session_hmacs: "Union[bytes, Sequence[bytes]]", schema_tag: str) -> List[Any]:
         # bytes IS a Sequence[int]: a bare-bytes arg would spread to ints and silently never match.
         if isinstance(session_hmacs, (bytes, bytearray)):
             session_hmacs = (bytes(session_hmacs),)
         # ARGV = [schema_tag, ttl, *candidate session hmacs] (verify-ANY for key rotation)
-        args = [schema_tag, self._takeover_ttl_seconds(), *session_hmacs]
-        raw = self._takeover_script(keys=[self._key(kernel_id)], args=args)
-        reason = _as_text(raw[0])
-        generation = int(raw[1])
-        fields: Dict[str, bytes] = {}
-        rest = raw[2:]
-        for i in range(0, len(rest), 2):
-            fields[_as_text(rest[i])] = _as_bytes(rest[i + 1])
-        return TakeoverResult(reason=reason, generation=generation, fields=fields)
+        return [schema_tag, self._takeover_ttl_seconds(), *session_hmacs]
+
+    def takeover(self, kernel_id: str, session_hmacs: "Union[bytes, Sequence[bytes]]", schema_tag: str) -> TakeoverResult:
+        shard, key = self._shard(kernel_id), self._key(kernel_id)
+        with _timed(self._label(shard, key)):
+            raw = shard.takeover(keys=[key], args=self._takeover_args(session_hmacs, schema_tag))
+        return _takeover_result(raw)
 
     def flush(
         self,
@@ -250,20 +368,224 @@ class RedisStateBackend(StateBackend):
         session_hmac: bytes,
         schema_tag: str,
     ) -> bool:
-        args: List[Any] = [generation, _ttl_to_seconds(ttl), session_hmac, schema_tag]
-        for field_name, value in fields.items():
-            args.append(field_name)
-            args.append(value)
-        return bool(self._flush_script(keys=[self._key(kernel_id)], args=args))
+        shard, key = self._shard(kernel_id), self._key(kernel_id)
+        with _timed(self._label(shard, key)):
+            return bool(shard.flush(keys=[key], args=_flush_args(generation, ttl, session_hmac, schema_tag, fields)))
+
+    def flush_many(self, requests: Sequence[FlushRequest]) -> List[Union[bool, Exception]]:
+        # one network round trip per node for the whole batch: every request is still its own
+        # EVALSHA of the fenced flush script (the fence stays per kernel), only the transport is
+        # shared. A non-transactional pipeline is enough - the scripts are individually atomic and
+        # independent. Redis Cluster pipelines do not carry scripts, so cluster mode flushes one
+        # request at a time (each routed to its slot's node).
+        if not requests:
+            return []
+        if self._cluster:
+            return super().flush_many(requests)
+        results: List[Union[bool, Exception]] = [False] * len(requests)
+        for shard, indices in self._group(requests).items():
+            for index, result in zip(indices, self._flush_pipeline(shard, [requests[i] for i in indices])):
+                results[index] = result
+        return results
+
+    def _group(self, requests: Sequence[FlushRequest]) -> Dict[str, List[int]]:
+        groups: Dict[str, List[int]] = {}
+        for index, request in enumerate(requests):
+            groups.setdefault(self._shard(request.kernel_id).name, []).append(index)
+        return groups
+
+    def _flush_pipeline(self, name: str, requests: Sequence[FlushRequest]) -> List[Union[bool, Exception]]:
+        shard = self._by_name[name]
+        pipe = shard.client.pipeline(transaction=False)
+        for request in requests:
+            args = _flush_args(request.generation, request.ttl, request.session_hmac, request.schema_tag, request.fields)
+            shard.flush(keys=[self._key(request.kernel_id)], args=args, client=pipe)
+        try:
+            with _timed(name):
+                raw = pipe.execute(raise_on_error=False)
+        except Exception as exc:  # noqa - a transport failure fails every request sent to this node
+            return [exc for _ in requests]
+        return [result if isinstance(result, Exception) else bool(result) for result in raw]
 
     def peek_generation(self, kernel_id: str) -> Optional[int]:
-        raw = self.client.hget(self._key(kernel_id), "__generation__")
+        shard, key = self._shard(kernel_id), self._key(kernel_id)
+        with _timed(self._label(shard, key)):
+            raw = shard.client.hget(key, "__generation__")
         return None if raw is None else int(raw)
 
     def delete(self, kernel_id: str, generation: Optional[int] = None) -> bool:
+        shard, key = self._shard(kernel_id), self._key(kernel_id)
+        with _timed(self._label(shard, key)):
+            if generation is None:
+                return bool(shard.client.delete(key))
+            return bool(shard.delete(keys=[key], args=[generation]))
+
+
+class AsyncRedisStateBackend(RedisStateBackend):
+    """Redis backend with native ``redis.asyncio`` awaitable verbs (``SOLARA_STATE_BACKEND=redis-async``).
+
+    The blocking verbs are inherited unchanged: the flush workers and ``close()`` run on threads
+    and keep using the sync clients. The ``*_async`` verbs run the same Lua scripts through
+    ``redis.asyncio`` clients (one per node) that live on a dedicated I/O event loop thread. A
+    redis.asyncio connection belongs to the loop that opened it, while solara runs one loop per
+    websocket thread (``SOLARA_KERNEL_THREADED``); routing every awaitable call through the I/O
+    loop lets all kernels share one connection pool per node, and lets an in-flight takeover
+    finish even when the loop that awaited it has already moved on (the connect deadline's
+    claim-or-delete relies on the late result). ``async_client`` / ``async_shards`` are the
+    test-injection seam, like ``client`` / ``shards``.
+    """
+
+    native_async = True
+
+    def __init__(
+        self,
+        client: Optional[Any] = None,
+        async_client: Optional[Any] = None,
+        *,
+        shards: Optional[Dict[str, Any]] = None,
+        async_shards: Optional[Dict[str, Any]] = None,
+        cluster: Optional[bool] = None,
+    ) -> None:
+        super().__init__(client, shards=shards, cluster=cluster)
+        st = solara.settings.state
+        if async_shards is not None:
+            async_clients = async_shards
+        elif async_client is not None:
+            async_clients = {self._shards[0].name: async_client}
+        elif st.redis_mode == "sharded" and shards is None and client is None:
+            async_clients = {_node_name(url): self._make_async_client(url) for url in _split_urls(st.url)}
+        else:
+            async_clients = {self._shards[0].name: self._make_async_client(st.url)}
+        if set(async_clients) != set(self._by_name):
+            raise ValueError("the async clients must cover the same redis nodes as the sync clients")
+        self._async_by_name = {name: _bind(name, async_clients[name]) for name in self._by_name}
+        self.async_client = self._async_by_name[self._shards[0].name].client
+        self._io_lock = threading.Lock()
+        self._io_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _make_async_client(self, url: str) -> Any:
+        try:
+            import redis.asyncio
+        except ImportError as exc:  # pragma: no cover - redis < 4.2
+            raise ImportError("the redis-async state backend requires redis>=4.2 (`pip install -U redis`).") from exc
+        st = solara.settings.state
+        # same bounds as the sync client: every awaitable op is limited by connect_timeout too
+        factory = redis.asyncio.RedisCluster if self._cluster else redis.asyncio.Redis
+        return factory.from_url(
+            url,
+            socket_timeout=st.connect_timeout,
+            socket_connect_timeout=st.connect_timeout,
+            decode_responses=False,
+        )
+
+    def _get_io_loop(self) -> asyncio.AbstractEventLoop:
+        with self._io_lock:
+            if self._io_loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="solara-state-redis-io", daemon=True)
+                # the patched Thread captures the current kernel context at creation; the I/O loop
+                # serves every kernel and must not pin whichever one happened to start it
+                thread.current_context = None  # type: ignore
+                thread.start()
+                self._io_loop = loop
+            return self._io_loop
+
+    async def _on_io_loop(self, label: str, coro: Awaitable[Any]) -> Any:
+        async def timed() -> Any:
+            with _timed(label):
+                return await coro
+
+        future = asyncio.run_coroutine_threadsafe(timed(), self._get_io_loop())
+        return await asyncio.wrap_future(future)
+
+    def _async_shard(self, kernel_id: str) -> Tuple[_Shard, str, str]:
+        shard, key = self._shard(kernel_id), self._key(kernel_id)
+        return self._async_by_name[shard.name], key, self._label(shard, key)
+
+    def close(self) -> None:
+        """Stop the I/O loop thread (tests / shutdown); the backend stays usable for the sync verbs."""
+        with self._io_lock:
+            loop, self._io_loop = self._io_loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+
+    async def takeover_async(self, kernel_id: str, session_hmacs: "Union[bytes, Sequence[bytes]]", schema_tag: str) -> TakeoverResult:
+        shard, key, label = self._async_shard(kernel_id)
+        args = self._takeover_args(session_hmacs, schema_tag)
+        return _takeover_result(await self._on_io_loop(label, shard.takeover(keys=[key], args=args)))
+
+    async def flush_async(
+        self,
+        kernel_id: str,
+        generation: int,
+        fields: Dict[str, bytes],
+        ttl: float,
+        session_hmac: bytes,
+        schema_tag: str,
+    ) -> bool:
+        shard, key, label = self._async_shard(kernel_id)
+        args = _flush_args(generation, ttl, session_hmac, schema_tag, fields)
+        return bool(await self._on_io_loop(label, shard.flush(keys=[key], args=args)))
+
+    async def flush_many_async(self, requests: Sequence[FlushRequest]) -> List[Union[bool, Exception]]:
+        if not requests:
+            return []
+        if self._cluster:
+            return await super().flush_many_async(requests)
+        results: List[Union[bool, Exception]] = [False] * len(requests)
+        for name, indices in self._group(requests).items():
+            batch = await self._on_io_loop(name, self._async_flush_pipeline(name, [requests[i] for i in indices]))
+            for index, result in zip(indices, batch):
+                results[index] = result
+        return results
+
+    async def _async_flush_pipeline(self, name: str, requests: Sequence[FlushRequest]) -> List[Union[bool, Exception]]:
+        # the awaitable twin of _flush_pipeline: one pipelined round trip, fenced per request
+        shard = self._async_by_name[name]
+        pipe = shard.client.pipeline(transaction=False)
+        for request in requests:
+            args = _flush_args(request.generation, request.ttl, request.session_hmac, request.schema_tag, request.fields)
+            await shard.flush(keys=[self._key(request.kernel_id)], args=args, client=pipe)
+        try:
+            raw = await pipe.execute(raise_on_error=False)
+        except Exception as exc:  # noqa - a transport failure fails every request sent to this node
+            return [exc for _ in requests]
+        return [result if isinstance(result, Exception) else bool(result) for result in raw]
+
+    async def peek_generation_async(self, kernel_id: str) -> Optional[int]:
+        shard, key, label = self._async_shard(kernel_id)
+        raw = await self._on_io_loop(label, shard.client.hget(key, "__generation__"))
+        return None if raw is None else int(raw)
+
+    async def delete_async(self, kernel_id: str, generation: Optional[int] = None) -> bool:
+        shard, key, label = self._async_shard(kernel_id)
         if generation is None:
-            return bool(self.client.delete(self._key(kernel_id)))
-        return bool(self._delete_script(keys=[self._key(kernel_id)], args=[generation]))
+            return bool(await self._on_io_loop(label, shard.client.delete(key)))
+        return bool(await self._on_io_loop(label, shard.delete(keys=[key], args=[generation])))
+
+
+def _split_urls(text: str) -> List[str]:
+    return [url.strip() for url in text.split(",") if url.strip()]
+
+
+def _takeover_result(raw: List[Any]) -> TakeoverResult:
+    # _LUA_TAKEOVER returns a flat array: {reason, generation [, field, value]...}
+    reason = _as_text(raw[0])
+    generation = int(raw[1])
+    fields: Dict[str, bytes] = {}
+    rest = raw[2:]
+    for i in range(0, len(rest), 2):
+        fields[_as_text(rest[i])] = _as_bytes(rest[i + 1])
+    return TakeoverResult(reason=reason, generation=generation, fields=fields)
+
+
+def _flush_args(generation: int, ttl: Optional[float], session_hmac: bytes, schema_tag: str, fields: Dict[str, bytes]) -> List[Any]:
+    # ARGV layout of _LUA_FLUSH
+    args: List[Any] = [generation, _ttl_to_seconds(ttl), session_hmac, schema_tag]
+    for field_name, value in fields.items():
+        args.append(field_name)
+        args.append(value)
+    return args
 
 
 def _ttl_to_seconds(ttl: Optional[float]) -> int:
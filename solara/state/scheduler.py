@@ -0,0 +1,241 @@
+"""Opt-in process-wide batched flush scheduler (``SOLARA_STATE_FLUSH_BATCHING``).
+
+The default write-behind model (worker.py) is one daemon thread per kernel, each doing its own
+fenced ``flush`` round trip. That is the simplest correct thing at ordinary kernel counts, but
+with thousands of connected kernels per process it means thousands of threads and thousands of
+tiny backend calls per debounce window. With batching on, every :class:`KernelFlushWorker`
+hands its debounce deadline to this one scheduler instead:
+
+- a single dispatcher thread keeps a heap of per-kernel deadlines and, when kernels fall due,
+  coalesces them into batches of at most ``flush_batch_max`` kernels;
+- a bounded pool (``flush_pool_size`` threads) prepares every kernel of a batch
+  (:meth:`KernelStatePersistence.prepare_flush`), writes them in one
+  :meth:`StateBackend.flush_many` round trip (a Redis pipeline of the fenced flush script - still
+  fenced per kernel), and completes and routes each kernel's :class:`FlushOutcome` exactly like
+  the per-kernel thread does (breaker, rejection protocol, re-arm).
+
+A kernel is never in two batches at once: a kernel that falls due again while its previous
+batch is still in flight is deferred until that batch completes. Batch size and latency are
+recorded in :func:`solara.state.stats`.
+"""
+
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Set, Tuple
+
+import solara.settings
+
+from .persist import PreparedFlush
+from .stats import stats
+
+if TYPE_CHECKING:
+    from .worker import KernelFlushWorker
+
+logger = logging.getLogger("solara.state")
+
+__all__ = ["FlushScheduler"]
+
+
+class FlushScheduler:
+    """Coalesces due kernels of many :class:`KernelFlushWorker` s into pipelined backend batches.
+
+    :param batch_max: max kernels per backend batch; ``None`` reads ``state.flush_batch_max``.
+    :param pool_size: flush pool threads; ``None`` reads ``state.flush_pool_size``.
+    :param slack: kernels due within this many seconds of the first due kernel join its batch
+        (flushing them a few ms early is harmless next to the debounce, and it is what turns
+        many staggered deadlines into few round trips).
+    :param clock: monotonic clock (injectable for tests).
+    """
+
+    def __init__(
+        self,
+        batch_max: Optional[int] = None,
+        pool_size: Optional[int] = None,
+        slack: float = 0.05,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        st = solara.settings.state
+        self._batch_max = max(1, st.flush_batch_max if batch_max is None else batch_max)
+        self._pool_size = max(1, st.flush_pool_size if pool_size is None else pool_size)
+        self._slack = slack
+        self._clock = clock
+        self._cond = threading.Condition()
+        # (deadline, seq, worker); stale entries (cancelled / re-armed) are skipped lazily
+        self._heap: List[Tuple[float, int, "KernelFlushWorker"]] = []
+        self._seq = itertools.count()
+        # worker -> (seq, deadline) of its live heap entry (armed); absent = not armed
+        self._armed: Dict["KernelFlushWorker", Tuple[int, float]] = {}
+        self._in_flight: Set["KernelFlushWorker"] = set()
+        # fell due while in flight: re-armed (due now) when the running batch completes
+        self._deferred: Set["KernelFlushWorker"] = set()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        # the batch the current pool thread is flushing (see wait_idle)
+        self._local = threading.local()
+
+    # --- worker-facing API ----------------------------------------------------------------
+
+    def schedule(self, worker: "KernelFlushWorker", delay: float) -> None:
+        """Arm ``worker`` to flush in ``delay`` seconds (a no-op while armed for that time or earlier)."""
+        with self._cond:
+            if self._stop:
+                return
+            deadline = self._clock() + delay
+            armed = self._armed.get(worker)
+            if armed is not None and armed[1] <= deadline:
+                return
+            self._push(worker, deadline)
+            self._ensure_started()
+
+    def cancel(self, worker: "KernelFlushWorker") -> None:
+        """Forget ``worker``'s pending deadline (an in-flight batch still completes)."""
+        with self._cond:
+            self._armed.pop(worker, None)
+            self._deferred.discard(worker)
+
+    def wait_idle(self, worker: "KernelFlushWorker", timeout: float) -> bool:
+        """Block until ``worker`` has no batch in flight. Returns False on timeout."""
+        if worker in getattr(self._local, "batch", ()):
+            # called from the batch itself (the orphan path: a rejection closes the context,
+            # which closes the worker) - waiting would only wait for ourselves
+            return True
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while worker in self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self) -> None:
+        """Stop the dispatcher and the pool (pending deadlines are dropped; test hook / shutdown)."""
+        with self._cond:
+            self._stop = True
+            self._heap = []
+            self._armed.clear()
+            self._deferred.clear()
+            self._cond.notify_all()
+        pool = self._pool
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    # --- dispatcher -----------------------------------------------------------------------
+
+    def _push(self, worker: "KernelFlushWorker", deadline: float) -> None:
+        # caller holds self._cond
+        seq = next(self._seq)
+        self._armed[worker] = (seq, deadline)
+        heapq.heappush(self._heap, (deadline, seq, worker))
+        self._cond.notify_all()
+
+    def _ensure_started(self) -> None:
+        # caller holds self._cond
+        if self._thread is not None:
+            return
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self._pool_size, thread_name_prefix="solara-state-flush")
+        thread = threading.Thread(target=self._run, name="solara-state-flush-scheduler", daemon=True)
+        # the patched Thread captures the current kernel context at creation; the dispatcher
+        # serves every kernel and must not pin (or run inside) whichever one happened to start it
+        thread.current_context = None  # type: ignore
+        self._thread = thread
+        thread.start()
+
+    def _pop_due(self) -> List["KernelFlushWorker"]:
+        # caller holds self._cond; waits until at least one kernel is due (or stop)
+        while not self._stop:
+            now = self._clock()
+            due: List["KernelFlushWorker"] = []
+            horizon = now + self._slack if self._heap and self._heap[0][0] <= now else now
+            while self._heap and self._heap[0][0] <= horizon:
+                _deadline, seq, worker = heapq.heappop(self._heap)
+                armed = self._armed.get(worker)
+                if armed is None or armed[0] != seq:
+                    continue  # cancelled or superseded entry
+                del self._armed[worker]
+                if worker in self._in_flight:
+                    self._deferred.add(worker)
+                    continue
+                due.append(worker)
+            if due:
+                return due
+            if self._heap:
+                self._cond.wait(max(0.0, self._heap[0][0] - now))
+            else:
+                self._cond.wait()
+        return []
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                due = self._pop_due()
+                if not due:
+                    return
+                self._in_flight.update(due)
+                pool = self._pool
+            assert pool is not None
+            for start in range(0, len(due), self._batch_max):
+                batch = due[start : start + self._batch_max]
+                try:
+                    pool.submit(self._flush_batch, batch)
+                except RuntimeError:  # pool shut down (close() raced us)
+                    self._done(batch)
+                    return
+
+    def _done(self, workers: List["KernelFlushWorker"]) -> None:
+        with self._cond:
+            for worker in workers:
+                self._in_flight.discard(worker)
+                if worker in self._deferred:
+                    self._deferred.discard(worker)
+                    if not self._stop and worker not in self._armed:
+                        self._push(worker, self._clock())
+            self._cond.notify_all()
+
+    # --- one batch ------------------------------------------------------------------------
+
+    def _flush_batch(self, workers: List["KernelFlushWorker"]) -> None:
+        started = time.monotonic()
+        self._local.batch = workers
+        try:
+            # prepare every kernel (snapshot + serialize, each inside its own kernel context);
+            # kernels with nothing to write, a disabled manager or an open breaker drop out here
+            prepared: List[Tuple["KernelFlushWorker", PreparedFlush]] = []
+            for worker in workers:
+                try:
+                    item = worker._prepare_batched()
+                except Exception:  # noqa - one kernel must never break the batch
+                    logger.exception("state flush prepare failed for kernel %s", worker.manager.kernel_id)
+                    continue
+                if item is not None:
+                    prepared.append((worker, item))
+            # group per backend (in practice there is one process-wide backend)
+            groups: Dict[int, List[Tuple["KernelFlushWorker", PreparedFlush]]] = {}
+            for worker, item in prepared:
+                groups.setdefault(id(worker.manager.backend), []).append((worker, item))
+            for group in groups.values():
+                backend = group[0][0].manager.backend
+                written = time.monotonic()
+                try:
+                    results = backend.flush_many([item.request for _worker, item in group])
+                except Exception as exc:  # noqa - a backend without per-request errors failed as a whole
+                    results = [exc for _ in group]
+                written = time.monotonic() - written
+                for (worker, item), result in zip(group, results):
+                    try:
+                        worker._observe_latency(written)
+                        worker._route(worker.manager.complete_flush(item, result))
+                    except Exception:  # noqa
+                        logger.exception("state flush completion failed for kernel %s", worker.manager.kernel_id)
+            if prepared:
+                stats().record_flush_batch(len(prepared), time.monotonic() - started)
+        finally:
+            self._local.batch = ()
+            for worker in workers:
+                worker._attempt_done()
+            self._done(workers)
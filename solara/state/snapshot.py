@@ -0,0 +1,137 @@
+"""Flush snapshots that avoid ``copy.deepcopy`` under the reactive's lock where they can.
+
+A flush must serialize a value that no concurrent task is halfway through replacing, so it
+snapshots under the reactive's lock and serializes off-lock. ``copy.deepcopy`` is the general
+snapshot, but for big nested values it is the most expensive step of a flush, and render
+threads that want the same lock wait for it. :meth:`KernelStatePersistence.prepare_flush`
+therefore tries, in order:
+
+1. a per-type hook registered with :func:`register_snapshot` (``"hook"``);
+2. no copy at all for immutable values - scalars, enums, dates, and tuples/frozensets/frozen
+   dataclasses made of them (``"immutable"``);
+3. a shallow copy for a plain list/dict/set of immutable items (``"shallow"``);
+4. serializing directly under the lock, when that has been measured to be cheaper than
+   deep-copying this key (``"encode"``, see :class:`CostModel` and ``SOLARA_STATE_SNAPSHOT_MODE``);
+5. ``copy.deepcopy`` (``"copy"``).
+
+Lock hold time per strategy is recorded in :func:`solara.state.stats`.
+"""
+
+import dataclasses
+import datetime
+import decimal
+import enum
+import threading
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+__all__ = ["register_snapshot", "fast_snapshot", "CostModel"]
+
+_hooks_lock = threading.Lock()
+_hooks: Dict[type, Callable[[Any], Any]] = {}
+
+# exact types only: a subclass can carry mutable attributes that deepcopy would have copied
+_IMMUTABLE_TYPES = frozenset(
+    [
+        type(None),
+        bool,
+        int,
+        float,
+        complex,
+        str,
+        bytes,
+        decimal.Decimal,
+        datetime.date,
+        datetime.datetime,
+        datetime.time,
+        datetime.timedelta,
+        datetime.timezone,
+        uuid.UUID,
+        range,
+    ]
+)
+_MAX_DEPTH = 32
+
+
+def register_snapshot(cls: type, snapshot: Callable[[Any], Any]) -> None:
+    """Register a fast flush snapshot for values of type ``cls`` (and its subclasses).
+
+    ``snapshot(value)`` runs under the reactive's lock and must return a value that no later
+    in-place change of ``value`` can affect, and that the reactive's codec can encode - e.g.
+    ``register_snapshot(pandas.DataFrame, lambda df: df.copy(deep=True))``. The most specific
+    registered class in the MRO wins.
+    """
+    with _hooks_lock:
+        _hooks[cls] = snapshot
+
+
+def _find_hook(cls: type) -> Optional[Callable[[Any], Any]]:
+    if not _hooks:
+        return None
+    for base in cls.__mro__:
+        hook = _hooks.get(base)
+        if hook is not None:
+            return hook
+    return None
+
+
+def _is_immutable(value: Any, depth: int = 0) -> bool:
+    cls = type(value)
+    if cls in _IMMUTABLE_TYPES or isinstance(value, enum.Enum):
+        return True
+    if depth >= _MAX_DEPTH:
+        return False
+    if cls is tuple or cls is frozenset:
+        return all(_is_immutable(item, depth + 1) for item in value)
+    params = getattr(cls, "__dataclass_params__", None)
+    if params is not None and params.frozen and dataclasses.is_dataclass(value):
+        return all(_is_immutable(getattr(value, field.name), depth + 1) for field in dataclasses.fields(value))
+    return False
+
+
+def fast_snapshot(value: Any) -> Optional[Tuple[str, Any]]:
+    """``(strategy, snapshot)`` for a value that needs no deep copy, else None."""
+    hook = _find_hook(type(value))
+    if hook is not None:
+        return "hook", hook(value)
+    if _is_immutable(value):
+        return "immutable", value
+    cls = type(value)
+    if cls is list or cls is set:
+        if all(_is_immutable(item, 1) for item in value):
+            return "shallow", cls(value)
+    elif cls is dict:
+        if all(_is_immutable(key, 1) and _is_immutable(item, 1) for key, item in value.items()):
+            return "shallow", dict(value)
+    return None
+
+
+class CostModel:
+    """Per-key choice between deep-copy-then-encode and encoding under the lock.
+
+    Both end with the same bytes; what differs is how long the reactive's lock is held. The
+    model learns from the copy path (which times both the deepcopy and the off-lock encode)
+    and encodes under the lock while that measured encode is the cheaper of the two. Every
+    ``reprobe``-th flush of a key in encode mode takes the copy path again, so a value whose
+    shape changed is re-measured.
+    """
+
+    def __init__(self, reprobe: int = 32) -> None:
+        self._reprobe = reprobe
+        # storage_key -> [copy_seconds, encode_seconds, flushes since the last copy]
+        self._costs: Dict[str, list] = {}
+
+    def encode_under_lock(self, storage_key: str) -> bool:
+        entry = self._costs.get(storage_key)
+        if entry is None or entry[2] >= self._reprobe:
+            return False
+        return entry[1] <= entry[0]
+
+    def record_copy(self, storage_key: str, copy_seconds: float, encode_seconds: float) -> None:
+        self._costs[storage_key] = [copy_seconds, encode_seconds, 0]
+
+    def record_encode(self, storage_key: str, encode_seconds: float) -> None:
+        entry = self._costs.get(storage_key)
+        if entry is not None:
+            entry[1] = encode_seconds
+            entry[2] += 1
@@ -0,0 +1,254 @@
+"""SQLite state backend: durable single-node persistence without running Redis.
+
+``SOLARA_STATE_BACKEND=sqlite`` with ``SOLARA_STATE_URL=sqlite:///path/to/state.db`` (or a bare
+path) stores the same signed envelope bytes as Redis in a local database file, so state
+survives a server restart or a rolling deploy on one box. It implements the same four-verb
+contract as the other backends (claim-on-miss, fenced generations, TTL expiry):
+
+- each verb is one ``BEGIN IMMEDIATE`` transaction, which takes SQLite's write lock up front,
+  so verify-then-bump-then-read and compare-then-write are atomic even across several server
+  processes sharing the file;
+- the database runs in WAL mode with ``synchronous=NORMAL``: a commit appends to the log
+  without an fsync, which is what makes thousands of flushes per second possible (a power
+  loss can lose the last commits, never corrupt the file - fine for a recovery cache);
+- :meth:`SQLiteStateBackend.flush_many` writes a whole scheduler batch in one transaction,
+  still fenced per kernel.
+
+Deadlines are wall-clock (``time.time``), not monotonic, because they must survive a restart.
+Expired kernels read as absent and are purged in bulk from time to time by the write path.
+"""
+
+import contextlib
+import hmac
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import solara.settings
+
+from .backend import FlushRequest, StateBackend, TakeoverResult
+
+logger = logging.getLogger("solara.state")
+
+__all__ = ["SQLiteStateBackend"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS solara_state_kernels (
+    key TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL,
+    session_hmac BLOB NOT NULL,
+    schema_tag TEXT NOT NULL,
+    deadline REAL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS solara_state_fields (
+    key TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (key, field)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS solara_state_kernels_deadline ON solara_state_kernels (deadline);
+"""
+
+# purge expired kernels at most this often (seconds), from whichever write comes first
+_PURGE_INTERVAL = 60.0
+
+
+def _path_from_url(url: str) -> str:
+    if url.startswith("sqlite:///"):
+        return url[len("sqlite:///") :]
+    if url.startswith("sqlite://"):
+        raise ValueError(f"SOLARA_STATE_URL {url!r} has no path; use sqlite:///relative.db or sqlite:////absolute/path.db")
+    return url
+
+
+class SQLiteStateBackend(StateBackend):
+    """Durable local backend on one SQLite file (WAL mode).
+
+    :param path: the database file; ``None`` reads ``SOLARA_STATE_URL``.
+    :param clock: wall-clock time source for TTL deadlines (tests override it).
+    """
+
+    # the file outlives the process and may be shared by several server processes on the box,
+    # so state does survive a kernel's process: the shortened orphan cull (§5.4) applies.
+    shared = True
+
+    def __init__(self, path: Optional[str] = None, clock: Callable[[], float] = time.time) -> None:
+        if path is None:
+            url = solara.settings.state.url
+            if not url:
+                raise ValueError("SOLARA_STATE_URL must be set to a database file (e.g. sqlite:///solara-state.db) for the sqlite state backend")
+            path = _path_from_url(url)
+        self.path = str(path)
+        self._prefix = solara.settings.state.prefix
+        self._clock = clock
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # one connection for all threads: SQLite serializes writers anyway, and a process-local
+        # lock is cheaper than the file lock contention of a connection per thread
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=max(1.0, solara.settings.state.connect_timeout))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._next_purge = 0.0
+
+    def _key(self, kernel_id: str) -> str:
+        return self._prefix + kernel_id
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[None]:
+        # the process-local lock plus one BEGIN IMMEDIATE transaction (the cross-process write lock)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _live_row(self, key: str, now: float) -> Optional[Tuple[Any, ...]]:
+        # callers hold a transaction: an expired kernel is deleted on the way
+        row = self._conn.execute("SELECT generation, session_hmac, schema_tag, deadline FROM solara_state_kernels WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[3] is not None and now >= row[3]:
+            self._delete_key(key)
+            return None
+        return row
+
+    def _delete_key(self, key: str) -> None:
+        self._conn.execute("DELETE FROM solara_state_kernels WHERE key = ?", (key,))
+        self._conn.execute("DELETE FROM solara_state_fields WHERE key = ?", (key,))
+
+    def _claim(self, key: str, session_hmacs: Sequence[bytes], schema_tag: str, now: float) -> None:
+        # claim-on-miss, as in the memory backend: generation 1, the first candidate (the current
+        # signing key) as identity, and the takeover TTL; no candidates -> no claim
+        first = bytes(session_hmacs[0]) if session_hmacs else b""
+        if not first:
+            return
+        from .persist import _default_ttl
+
+        self._conn.execute(
+            "INSERT INTO solara_state_kernels (key, generation, session_hmac, schema_tag, deadline) VALUES (?, 1, ?, ?, ?)",
+            (key, first, schema_tag, now + _default_ttl()),
+        )
+
+    def _maybe_purge(self, now: float) -> None:
+        if now < self._next_purge:
+            return
+        self._next_purge = now + _PURGE_INTERVAL
+        expired = "SELECT key FROM solara_state_kernels WHERE deadline IS NOT NULL AND deadline <= ?"
+        self._conn.execute(f"DELETE FROM solara_state_fields WHERE key IN ({expired})", (now,))
+        self._conn.execute("DELETE FROM solara_state_kernels WHERE deadline IS NOT NULL AND deadline <= ?", (now,))
+
+    def takeover(self, kernel_id: str, session_hmacs: "Union[bytes, Sequence[bytes]]", schema_tag: str) -> TakeoverResult:
+        # bytes IS a Sequence[int]: a bare-bytes arg would iterate to ints and silently never match.
+        if isinstance(session_hmacs, (bytes, bytearray)):
+            session_hmacs = (bytes(session_hmacs),)
+        key = self._key(kernel_id)
+        with self._transaction():
+            now = self._clock()
+            row = self._live_row(key, now)
+            if row is None:
+                self._claim(key, session_hmacs, schema_tag, now)
+                return TakeoverResult(reason="miss", generation=1, fields={})
+            generation, stored_hmac, stored_tag, _ = row
+            if not stored_hmac or not any(hmac.compare_digest(bytes(stored_hmac), candidate) for candidate in session_hmacs):
+                return TakeoverResult(reason="identity-mismatch", generation=0, fields={})
+            if stored_tag != schema_tag:
+                self._delete_key(key)
+                self._claim(key, session_hmacs, schema_tag, now)
+                return TakeoverResult(reason="schema-reset", generation=1, fields={})
+            from .persist import _default_ttl
+
+            generation += 1
+            self._conn.execute("UPDATE solara_state_kernels SET generation = ?, deadline = ? WHERE key = ?", (generation, now + _default_ttl(), key))
+            fields = {field: bytes(value) for field, value in self._conn.execute("SELECT field, value FROM solara_state_fields WHERE key = ?", (key,))}
+            return TakeoverResult(reason="restored", generation=generation, fields=fields)
+
+    def _flush_locked(self, request: FlushRequest, now: float) -> bool:
+        if request.generation == 0:
+            return False
+        key = self._key(request.kernel_id)
+        row = self._live_row(key, now)
+        deadline = None if request.ttl is None else now + request.ttl
+        if row is None:
+            # create-on-missing only from the fresh-start generation (see redis _LUA_FLUSH)
+            if request.generation != 1:
+                return False
+            self._conn.execute(
+                "INSERT INTO solara_state_kernels (key, generation, session_hmac, schema_tag, deadline) VALUES (?, ?, ?, ?, ?)",
+                (key, request.generation, request.session_hmac, request.schema_tag, deadline),
+            )
+        elif row[0] != request.generation:
+            return False
+        else:
+            self._conn.execute(
+                "UPDATE solara_state_kernels SET session_hmac = ?, schema_tag = ?, deadline = ? WHERE key = ?",
+                (request.session_hmac, request.schema_tag, deadline, key),
+            )
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO solara_state_fields (key, field, value) VALUES (?, ?, ?)",
+            [(key, field, value) for field, value in request.fields.items()],
+        )
+        return True
+
+    def flush(
+        self,
+        kernel_id: str,
+        generation: int,
+        fields: Dict[str, bytes],
+        ttl: float,
+        session_hmac: bytes,
+        schema_tag: str,
+    ) -> bool:
+        if generation == 0:
+            return False
+        request = FlushRequest(kernel_id, generation, fields, ttl, session_hmac, schema_tag)
+        with self._transaction():
+            now = self._clock()
+            self._maybe_purge(now)
+            return self._flush_locked(request, now)
+
+    def flush_many(self, requests: Sequence[FlushRequest]) -> List[Union[bool, Exception]]:
+        # the whole batch in one transaction (one WAL commit); each request is still fenced on
+        # its own kernel's generation, so one rejection never affects another's write
+        if not requests:
+            return []
+        results: List[Union[bool, Exception]] = []
+        try:
+            with self._transaction():
+                now = self._clock()
+                self._maybe_purge(now)
+                for request in requests:
+                    results.append(self._flush_locked(request, now))
+        except Exception as exc:  # noqa - a failed commit fails every request of the batch
+            return [exc for _ in requests]
+        return results
+
+    def peek_generation(self, kernel_id: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute("SELECT generation, deadline FROM solara_state_kernels WHERE key = ?", (self._key(kernel_id),)).fetchone()
+        if row is None or (row[1] is not None and self._clock() >= row[1]):
+            return None
+        return row[0]
+
+    def delete(self, kernel_id: str, generation: Optional[int] = None) -> bool:
+        key = self._key(kernel_id)
+        with self._transaction():
+            row = self._live_row(key, self._clock())
+            if row is None:
+                return False
+            if generation is not None and row[0] != generation:
+                return False
+            self._delete_key(key)
+            return True
+
+    def close(self) -> None:
+        """Close the database connection (tests / shutdown)."""
+        with self._lock:
+            self._conn.close()
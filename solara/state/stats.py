@@ -32,6 +32,8 @@ _STORM_MIN_SAMPLES = 10
 # "(other)" bucket and bumps the corresponding *_dropped counter.
 SYNC_TABLE_CAP = 500
 _OTHER = "(other)"
+# the per-node table is bounded too: a cluster reshard can name new nodes, but not without limit
+_MAX_SHARDS = 64
 
 __all__ = [
     "Stats",
@@ -58,6 +60,12 @@ class Stats:
         self.flush_ok = 0
         self.flush_rejected = 0
         self.flush_failures = 0
+        # flush pacing: changes to an already-dirty key, absorbed into its pending write (the
+        # actual key writes are sync_count below); dirty keys held back by the per-key rate
+        # limit (per flush); flushes pushed back by the adaptive backoff of a slow backend
+        self.flush_coalesced = 0
+        self.flush_key_deferrals = 0
+        self.flush_backoffs = 0
         # circuit breaker + supersession detectors (§7a #1, #5)
         self.breaker_transitions = 0
         self.superseded_closes = 0
@@ -72,11 +80,39 @@ class Stats:
         self.sync_count = 0
         self.sync_bytes_total = 0
         self.restore_bytes_total = 0
+        # restore cost: HMAC verification runs at takeover for every envelope, payload decoding
+        # on each key's first read (pop_restored), so a key that is never read is never decoded
+        self.restore_verify_seconds_total = 0.0
+        self.restore_decodes = 0
+        self.restore_decode_seconds_total = 0.0
         self.sync_keys_dropped = 0
         self.sync_kernels_dropped = 0
         self.sync_oversize_dropped = 0  # §4.3 size guard: values skipped for exceeding max_value_bytes
         self._sync_by_key: Dict[str, List[int]] = {}
         self._sync_by_kernel: Dict[str, List[int]] = {}
+        # batched flush scheduler (opt-in flush_batching): kernels written per backend batch and
+        # the wall time of a batch (prepare + pipelined write + completion)
+        self.flush_batches = 0
+        self.flush_batch_kernels = 0
+        self.flush_batch_max_kernels = 0
+        self.flush_batch_seconds_total = 0.0
+        self.flush_batch_last_seconds: Optional[float] = None
+        # flush snapshots: how long the flush held reactive locks, and by which strategy
+        # ("hook"/"immutable"/"shallow"/"encode"/"copy", see solara.state.snapshot)
+        self.snapshot_count = 0
+        self.snapshot_lock_seconds_total = 0.0
+        self.snapshot_lock_max_seconds = 0.0
+        self._snapshot_strategies: Dict[str, int] = {}
+        # per codec: [encodes, encoded payload bytes, encode seconds, decodes, decoded bytes, decode seconds]
+        self._codecs: Dict[str, List[float]] = {}
+        # envelope compression (format v2): payloads that reached compress_min_bytes, and their
+        # size before and after compression (an incompressible payload counts as stored raw)
+        self.compression_envelopes = 0
+        self.compression_bytes_uncompressed = 0
+        self.compression_bytes_compressed = 0
+        # per backend node (redis: host:port/db, or the cluster node owning the slot):
+        # [ops, errors, seconds, max seconds]
+        self._shards: Dict[str, List[float]] = {}
         # bail-out storm valve (§4.3): the last _STORM_WINDOW restore-attempt outcomes (True =
         # bailed out). A systemic cause - a forgotten schema_tag bump, non-uniform secret_keys
         # across replicas after a bad deploy - bails out EVERY reconnecting session at once; the
@@ -141,11 +177,100 @@ class Stats:
                 self._bump_sync_table(self._sync_by_key, key, nbytes, "sync_keys_dropped")
                 self._bump_sync_table(self._sync_by_kernel, kernel_id, nbytes, "sync_kernels_dropped")
 
+    def record_flush_batch(self, n_kernels: int, seconds: float) -> None:
+        """Record one batched-scheduler backend batch of ``n_kernels`` kernels taking ``seconds``."""
+        with self._lock:
+            self.flush_batches += 1
+            self.flush_batch_kernels += n_kernels
+            self.flush_batch_max_kernels = max(self.flush_batch_max_kernels, n_kernels)
+            self.flush_batch_seconds_total += seconds
+            self.flush_batch_last_seconds = seconds
+
+    def record_snapshot(self, strategy: str, seconds: float) -> None:
+        """Record one flush snapshot taken with ``strategy`` that held the reactive's lock ``seconds``."""
+        with self._lock:
+            self.snapshot_count += 1
+            self.snapshot_lock_seconds_total += seconds
+            self.snapshot_lock_max_seconds = max(self.snapshot_lock_max_seconds, seconds)
+            self._snapshot_strategies[strategy] = self._snapshot_strategies.get(strategy, 0) + 1
+
+    def record_codec(self, codec: str, op: str, nbytes: int, seconds: float) -> None:
+        """Record one ``op`` (``"encode"``/``"decode"``) of a ``nbytes`` payload by ``codec``."""
+        offset = 0 if op == "encode" else 3
+        with self._lock:
+            entry = self._codecs.get(codec)
+            if entry is None:
+                entry = self._codecs[codec] = [0, 0, 0.0, 0, 0, 0.0]
+            entry[offset] += 1
+            entry[offset + 1] += nbytes
+            entry[offset + 2] += seconds
+
+    def record_compression(self, uncompressed: int, compressed: int) -> None:
+        """Record one envelope payload of ``uncompressed`` bytes stored as ``compressed`` bytes."""
+        with self._lock:
+            self.compression_envelopes += 1
+            self.compression_bytes_uncompressed += uncompressed
+            self.compression_bytes_compressed += compressed
+
+    def record_shard(self, shard: str, seconds: float, error: bool) -> None:
+        """Record one backend call to node ``shard`` taking ``seconds`` (``error``: it raised)."""
+        with self._lock:
+            entry = self._shards.get(shard)
+            if entry is None:
+                if len(self._shards) >= _MAX_SHARDS:
+                    shard = _OTHER
+                    entry = self._shards.get(shard)
+                if entry is None:
+                    entry = self._shards[shard] = [0, 0, 0.0, 0.0]
+            entry[0] += 1
+            if error:
+                entry[1] += 1
+            entry[2] += seconds
+            entry[3] = max(entry[3], seconds)
+
+    @staticmethod
+    def _shard_rows(table: Dict[str, List[float]]) -> Dict[str, Dict[str, Any]]:
+        return {
+            shard: {
+                "ops": ops,
+                "errors": errors,
+                "mean_ms": round(seconds * 1000 / ops, 3) if ops else None,
+                "max_ms": round(max_seconds * 1000, 3),
+            }
+            for shard, (ops, errors, seconds, max_seconds) in sorted(table.items())
+        }
+
+    @staticmethod
+    def _codec_rows(table: Dict[str, List[float]]) -> Dict[str, Dict[str, Any]]:
+        rows = {}
+        for codec, (encodes, encode_bytes, encode_seconds, decodes, decode_bytes, decode_seconds) in sorted(table.items()):
+            rows[codec] = {
+                "encodes": encodes,
+                "encode_bytes": encode_bytes,
+                "encode_seconds": round(encode_seconds, 6),
+                "encode_mean_bytes": encode_bytes // encodes if encodes else None,
+                "decodes": decodes,
+                "decode_bytes": decode_bytes,
+                "decode_seconds": round(decode_seconds, 6),
+            }
+        return rows
+
     def record_restore_bytes(self, nbytes: int) -> None:
         """Record the envelope bytes read by a successful restore."""
         with self._lock:
             self.restore_bytes_total += nbytes
 
+    def record_restore_verify(self, seconds: float) -> None:
+        """Record the time a takeover spent verifying its envelopes."""
+        with self._lock:
+            self.restore_verify_seconds_total += seconds
+
+    def record_restore_decode(self, seconds: float) -> None:
+        """Record one restored key decoded on first read, taking ``seconds``."""
+        with self._lock:
+            self.restore_decodes += 1
+            self.restore_decode_seconds_total += seconds
+
     @staticmethod
     def _top_syncers(table: Dict[str, List[int]], label: str, limit: int, truncate: int = 0) -> List[Dict[str, Any]]:
         rows = sorted(table.items(), key=lambda kv: kv[1][1], reverse=True)[:limit]
@@ -180,6 +305,12 @@ class Stats:
                 "flush_ok": self.flush_ok,
                 "flush_rejected": self.flush_rejected,
                 "flush_failures": self.flush_failures,
+                "flush_coalesced": self.flush_coalesced,
+                "flush_coalesced_ratio": (
+                    round(self.flush_coalesced / (self.flush_coalesced + self.sync_count), 3) if self.flush_coalesced + self.sync_count else None
+                ),
+                "flush_key_deferrals": self.flush_key_deferrals,
+                "flush_backoffs": self.flush_backoffs,
                 "breaker_transitions": self.breaker_transitions,
                 "superseded_closes": self.superseded_closes,
                 "superseded_while_connected": self.superseded_while_connected,
@@ -189,9 +320,31 @@ class Stats:
                 "sync_bytes_total": self.sync_bytes_total,
                 "sync_mb_total": round(self.sync_bytes_total / 1e6, 3),
                 "restore_bytes_total": self.restore_bytes_total,
+                "restore_verify_seconds_total": round(self.restore_verify_seconds_total, 6),
+                "restore_decodes": self.restore_decodes,
+                "restore_decode_seconds_total": round(self.restore_decode_seconds_total, 6),
                 "sync_keys_dropped": self.sync_keys_dropped,
                 "sync_kernels_dropped": self.sync_kernels_dropped,
                 "sync_oversize_dropped": self.sync_oversize_dropped,
+                "flush_batches": self.flush_batches,
+                "flush_batch_kernels": self.flush_batch_kernels,
+                "flush_batch_max_kernels": self.flush_batch_max_kernels,
+                "flush_batch_mean_kernels": round(self.flush_batch_kernels / self.flush_batches, 2) if self.flush_batches else None,
+                "flush_batch_mean_seconds": round(self.flush_batch_seconds_total / self.flush_batches, 6) if self.flush_batches else None,
+                "flush_batch_last_seconds": self.flush_batch_last_seconds,
+                "snapshot_count": self.snapshot_count,
+                "snapshot_lock_seconds_total": round(self.snapshot_lock_seconds_total, 6),
+                "snapshot_lock_mean_seconds": round(self.snapshot_lock_seconds_total / self.snapshot_count, 6) if self.snapshot_count else None,
+                "snapshot_lock_max_seconds": round(self.snapshot_lock_max_seconds, 6),
+                "snapshot_strategies": dict(self._snapshot_strategies),
+                "codecs": self._codec_rows(self._codecs),
+                "compression_envelopes": self.compression_envelopes,
+                "compression_bytes_uncompressed": self.compression_bytes_uncompressed,
+                "compression_bytes_compressed": self.compression_bytes_compressed,
+                "compression_ratio": (
+                    round(self.compression_bytes_compressed / self.compression_bytes_uncompressed, 3) if self.compression_bytes_uncompressed else None
+                ),
+                "shards": self._shard_rows(self._shards),
                 "sync_by_key": self._top_syncers(self._sync_by_key, "key", limit),
                 "sync_by_kernel": self._top_syncers(self._sync_by_kernel, "kernel", limit, truncate=8),
             }
@@ -207,6 +360,9 @@ class Stats:
             self.flush_ok = 0
             self.flush_rejected = 0
             self.flush_failures = 0
+            self.flush_coalesced = 0
+            self.flush_key_deferrals = 0
+            self.flush_backoffs = 0
             self.breaker_transitions = 0
             self.superseded_closes = 0
             self.superseded_while_connected = 0
@@ -215,11 +371,28 @@ class Stats:
             self.sync_count = 0
             self.sync_bytes_total = 0
             self.restore_bytes_total = 0
+            self.restore_verify_seconds_total = 0.0
+            self.restore_decodes = 0
+            self.restore_decode_seconds_total = 0.0
             self.sync_keys_dropped = 0
             self.sync_kernels_dropped = 0
             self.sync_oversize_dropped = 0
             self._sync_by_key = {}
             self._sync_by_kernel = {}
+            self.flush_batches = 0
+            self.flush_batch_kernels = 0
+            self.flush_batch_max_kernels = 0
+            self.flush_batch_seconds_total = 0.0
+            self.flush_batch_last_seconds = None
+            self.snapshot_count = 0
+            self.snapshot_lock_seconds_total = 0.0
+            self.snapshot_lock_max_seconds = 0.0
+            self._snapshot_strategies = {}
+            self._codecs = {}
+            self.compression_envelopes = 0
+            self.compression_bytes_uncompressed = 0
+            self.compression_bytes_compressed = 0
+            self._shards = {}
             self._restore_window.clear()
 
 
@@ -238,6 +411,7 @@ def stats() -> Stats:
 
 _RESTORE_LEVEL = {
     "success": logging.INFO,
+    "decoded": logging.DEBUG,
     "miss": logging.DEBUG,
     "fresh-schema": logging.INFO,
     "timeout": logging.WARNING,
@@ -245,13 +419,29 @@ _RESTORE_LEVEL = {
 }
 
 
-def log_restore(result: str, *, kernel: str, key: Optional[str] = None, cause: Optional[str] = None) -> None:
-    """Emit ``restore result=… kernel=… [key=…] [cause=…]`` (key/cause only when relevant)."""
+def log_restore(
+    result: str,
+    *,
+    kernel: str,
+    key: Optional[str] = None,
+    cause: Optional[str] = None,
+    verify_ms: Optional[float] = None,
+    decode_ms: Optional[float] = None,
+) -> None:
+    """Emit ``restore result=… kernel=… [key=…] [cause=…] [verify_ms=…] [decode_ms=…]`` (optional parts only when relevant).
+
+    ``success`` carries the takeover's verify time; ``decoded`` (once every restored key has
+    been read and decoded) carries the total decode time.
+    """
     parts = [f"restore result={result}", f"kernel={kernel}"]
     if key is not None:
         parts.append(f"key={key}")
     if cause is not None:
         parts.append(f"cause={cause}")
+    if verify_ms is not None:
+        parts.append(f"verify_ms={verify_ms:.2f}")
+    if decode_ms is not None:
+        parts.append(f"decode_ms={decode_ms:.2f}")
     logger.log(_RESTORE_LEVEL.get(result, logging.INFO), " ".join(parts))
 
 
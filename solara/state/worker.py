@@ -7,11 +7,24 @@ arms this worker, which coalesces rapid marks into one flush ~``flush_debounce``
 snapshots + serializes off the hot path (inside :meth:`KernelStatePersistence.flush_now`),
 and writes through the fenced backend guarded by the circuit breaker.
 
+Pacing: consecutive flushes of one kernel start at least ``flush_min_interval`` apart, and a
+slow backend stretches that interval adaptively (a kernel's writes may take at most
+1/``_BACKOFF_FACTOR`` of the wall time), so a continuously changing reactive (a dragged
+slider, a timer) is written at a bounded rate instead of once per debounce window. None of
+this delays a change by more than ``flush_max_delay`` - the latency guarantee - short of
+backend failures, which the breaker and the re-arm handle. ``flush_key_min_interval`` limits
+each key on its own (see :meth:`KernelStatePersistence.set_key_rate_limit`).
+
 Threading model: **one background daemon thread per kernel** - the simplest correct thing
 (a kernel already owns per-kernel objects; a shared timer thread would need a heap of
 deadlines and careful cancellation for no real gain at solara's kernel counts). The thread
 sleeps on a ``Condition`` until a deadline, so it costs nothing while idle.
 
+With ``SOLARA_STATE_FLUSH_BATCHING`` on, the worker starts no thread of its own: it hands its
+deadlines to the process-wide :class:`~solara.state.scheduler.FlushScheduler`, which writes due
+kernels in pipelined batches from a bounded pool and routes each kernel's outcome back through
+this worker (:meth:`_route`), so the breaker and rejection-protocol behavior is identical.
+
 The worker never raises out of its thread: every failure path logs and counts. It routes
 :class:`FlushOutcome` per the design - a backend ERROR feeds the breaker, a fenced REJECT
 feeds the bounded rejection protocol (§5.5), a serialize failure already disabled
@@ -22,22 +35,25 @@ timer while keys remain, so the first flush after the breaker closes drains them
 import logging
 import threading
 import time
-from typing import Callable, Optional
+from typing import TYPE_CHECKING, Callable, Optional
 
 import solara.settings
 import solara.util
 
 from .breaker import CircuitBreaker
-from .persist import FlushOutcome, KernelStatePersistence
+from .persist import FlushOutcome, KernelStatePersistence, PreparedFlush
 from .stats import stats
 
+if TYPE_CHECKING:
+    from .scheduler import FlushScheduler
+
 logger = logging.getLogger("solara.state")
 
-__all__ = ["KernelFlushWorker", "FlushOutcome"]
+__all__ = ["KernelFlushWorker", "FlushOutcome", "parse_duration"]
 
 
-def _parse_debounce(text: str) -> float:
-    """Parse ``flush_debounce`` (e.g. ``"300ms"``, ``"1s"``) to seconds.
+def parse_duration(text: str) -> float:
+    """Parse a flush pacing duration (e.g. ``"300ms"``, ``"1s"``) to seconds.
 
     ``solara.util.parse_timedelta`` supports d/h/m/s and bare seconds but NOT milliseconds
     (``"300ms"`` would misparse via its ``s`` branch), so ``ms`` is handled here first; a
@@ -50,7 +66,13 @@ def _parse_debounce(text: str) -> float:
 
 
 def _default_debounce() -> float:
-    return _parse_debounce(solara.settings.state.flush_debounce)
+    return parse_duration(solara.settings.state.flush_debounce)
+
+
+# adaptive backoff: the interval between a kernel's flushes is at least this many times its
+# (smoothed) flush latency, i.e. a slow backend gets at most 1/_BACKOFF_FACTOR of the wall time
+_BACKOFF_FACTOR = 4.0
+_LATENCY_SMOOTHING = 0.3  # EWMA weight of the newest flush latency
 
 
 class KernelFlushWorker:
@@ -63,6 +85,14 @@ class KernelFlushWorker:
     :param on_superseded: called when this kernel is legitimately superseded (orphan): the
         server wires it to close the context with ``close_reason="superseded"``.
     :param debounce: coalescing window in seconds; ``None`` reads ``state.flush_debounce``.
+    :param min_interval: minimum seconds between the starts of two flushes of this kernel;
+        ``None`` reads ``state.flush_min_interval``.
+    :param max_delay: the latest a change is flushed after it was made, whatever the pacing;
+        ``None`` reads ``state.flush_max_delay``.
+    :param key_min_interval: minimum seconds between two writes of one key; ``None`` reads
+        ``state.flush_key_min_interval``.
+    :param scheduler: the process-wide batched :class:`~solara.state.scheduler.FlushScheduler`
+        (``solara.state.get_flush_scheduler()``); ``None`` runs the per-kernel thread.
     """
 
     def __init__(
@@ -73,12 +103,28 @@ class KernelFlushWorker:
         has_connected_page: Callable[[], bool],
         on_superseded: Callable[[], None],
         debounce: Optional[float] = None,
+        min_interval: Optional[float] = None,
+        max_delay: Optional[float] = None,
+        key_min_interval: Optional[float] = None,
+        scheduler: "Optional[FlushScheduler]" = None,
     ) -> None:
         self.manager = manager
         self.breaker = breaker
         self._has_connected_page = has_connected_page
         self._on_superseded = on_superseded
+        st = solara.settings.state
         self._debounce = _default_debounce() if debounce is None else debounce
+        self._min_interval = parse_duration(st.flush_min_interval) if min_interval is None else min_interval
+        self._max_delay = max(self._debounce, parse_duration(st.flush_max_delay) if max_delay is None else max_delay)
+        self._key_min_interval = parse_duration(st.flush_key_min_interval) if key_min_interval is None else key_min_interval
+        self._scheduler = scheduler
+        # pacing state: when the last flush started, and the smoothed flush latency behind the
+        # adaptive backoff (only the flushing thread writes them)
+        self._last_flush = float("-inf")
+        self._latency: Optional[float] = None
+        self._backoff = 0.0
+        # whether the pending flush was already counted as pushed back by the backoff
+        self._backoff_counted = False
 
         self._cond = threading.Condition()
         self._deadline: Optional[float] = None
@@ -101,6 +147,12 @@ class KernelFlushWorker:
     def start(self) -> None:
         """Wire the manager's flush scheduler and start the background thread."""
         self.manager.set_flush_scheduler(self.schedule)
+        self.manager.set_key_rate_limit(self._key_min_interval, self._max_delay)
+        if self._scheduler is not None:
+            # batched mode: the process-wide scheduler owns the timing, no thread of our own
+            if self.manager.dirty_keys:
+                self.schedule()
+            return
         self._thread = threading.Thread(
             target=self._run,
             name=f"solara-state-flush-{self.manager.kernel_id}",
@@ -113,11 +165,40 @@ class KernelFlushWorker:
 
     def schedule(self) -> None:
         """Arm a debounced flush (leading-edge: coalesces marks within the window into one)."""
+        self._arm(self._delay())
+
+    def _delay(self) -> float:
+        # the debounce, stretched to min_interval (or the adaptive backoff) after the previous
+        # flush's start, but never past max_delay
+        interval = max(self._min_interval, self._backoff)
+        paced = self._last_flush + interval - time.monotonic()
+        if paced > self._debounce and self._backoff > self._min_interval and not self._backoff_counted:
+            # once per delayed flush, not for every mark while it is pending
+            self._backoff_counted = True
+            stats().incr("flush_backoffs")
+        return min(max(self._debounce, paced), self._max_delay)
+
+    def _arm(self, delay: float) -> None:
+        # arm the timer ``delay`` from now; an armed timer is only ever moved earlier, so repeat
+        # marks coalesce into the pending flush
+        if self._scheduler is not None:
+            if not self._stop:
+                self._scheduler.schedule(self, delay)
+            return
         with self._cond:
-            if self._deadline is None and not self._stop:
-                self._deadline = time.monotonic() + self._debounce
+            if self._stop:
+                return
+            deadline = time.monotonic() + delay
+            if self._deadline is None or deadline < self._deadline:
+                self._deadline = deadline
                 self._cond.notify_all()
 
+    def _observe_latency(self, seconds: float) -> None:
+        """Feed one flush's duration (``seconds``) to the adaptive backoff."""
+        latency = seconds if self._latency is None else self._latency + _LATENCY_SMOOTHING * (seconds - self._latency)
+        self._latency = latency
+        self._backoff = latency * _BACKOFF_FACTOR
+
     def new_epoch(self) -> None:
         """Reset the re-takeover budget; the server calls this on each websocket connect (§5.5)."""
         with self._epoch_lock:
@@ -133,6 +214,8 @@ class KernelFlushWorker:
         with self._cond:
             self._stop = True
             self._cond.notify_all()
+        if self._scheduler is not None:
+            self._scheduler.cancel(self)
 
     def close(self, timeout: float = 5.0) -> None:
         """Stop the worker and do a bounded, best-effort final flush, then detach the manager.
@@ -152,6 +235,9 @@ class KernelFlushWorker:
         # close -> on_close -> close())
         if thread is not None and thread is not threading.current_thread():
             thread.join(timeout=timeout)
+        elif self._scheduler is not None:
+            # batched mode: let an in-flight batch holding this kernel finish first (same bound)
+            self._scheduler.wait_idle(self, timeout=timeout)
         self.manager.set_flush_scheduler(None)
 
         manager = self.manager
@@ -203,18 +289,18 @@ class KernelFlushWorker:
         except Exception:  # noqa - the worker must never raise out of its thread
             logger.exception("state flush worker error for kernel %s", self.manager.kernel_id)
         finally:
-            self.flush_completed.set()
-            with self._flush_cond:
-                self.flush_attempts += 1
-                self._flush_cond.notify_all()
+            self._attempt_done()
+
+    def _attempt_done(self) -> None:
+        self.flush_completed.set()
+        with self._flush_cond:
+            self.flush_attempts += 1
+            self._flush_cond.notify_all()
 
     def _rearm(self) -> None:
         # retry later: re-arm the debounce timer so a breaker-open (or errored) flush is not
         # stranded - dirty keys drain on the next attempt once the backend recovers.
-        with self._cond:
-            if not self._stop:
-                self._deadline = time.monotonic() + self._debounce
-                self._cond.notify_all()
+        self._arm(self._debounce)
 
     def _flush_once(self) -> None:
         manager = self.manager
@@ -226,7 +312,37 @@ class KernelFlushWorker:
             # breaker open: leave keys dirty, retry when the window may let a probe through
             self._rearm()
             return
-        self._route(manager.flush_now())
+        started = self._start_flush()
+        outcome = manager.flush_now()
+        if outcome in (FlushOutcome.OK, FlushOutcome.REJECTED, FlushOutcome.ERROR):
+            self._observe_latency(time.monotonic() - started)
+        self._route(outcome)
+
+    def _start_flush(self) -> float:
+        self._last_flush = time.monotonic()
+        self._backoff_counted = False
+        return self._last_flush
+
+    def _prepare_batched(self) -> Optional[PreparedFlush]:
+        """The batched-mode counterpart of :meth:`_flush_once` up to the backend write.
+
+        Called by the scheduler's pool; returns the prepared write, or None when this kernel has
+        nothing to write this round (the same gates as :meth:`_flush_once`).
+        """
+        manager = self.manager
+        if manager.disabled or self._stop:
+            return None
+        if not manager.dirty_keys:
+            return None
+        if not self.breaker.allow():
+            self._rearm()
+            return None
+        self._start_flush()
+        prepared = manager.prepare_flush()
+        if isinstance(prepared, FlushOutcome):
+            self._route(prepared)
+            return None
+        return prepared
 
     def _route(self, outcome: FlushOutcome) -> None:
         if outcome == FlushOutcome.OK:
@@ -244,6 +360,10 @@ class KernelFlushWorker:
             # health signal, but allow() above may have consumed a half-open probe - resolve it so
             # the breaker cannot wedge HALF_OPEN (a genuinely down backend re-opens on next flush).
             self.breaker.resolve_probe()
+        # keys held back by the per-key rate limit stay dirty with no new mark to arm the timer
+        due = self.manager.next_key_due
+        if due is not None and not self._stop:
+            self._arm(max(0.0, due - time.monotonic()))
 
     # --- rejection protocol (§5.5, bounded) -----------------------------------------------
 
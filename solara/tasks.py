@@ -28,7 +28,7 @@ import typing_extensions
 
 import solara
 import solara.util
-from solara.toestand import Singleton
+from solara.toestand import Singleton, _auto_batch
 from solara import _using_solara_server
 
 from .toestand import Ref as ref
@@ -451,7 +451,8 @@ class TaskAsyncio(Task[P, R]):
                     self._result.value = TaskResult[R](latest=self._last_value, _state=TaskState.RUNNING)
                 self._last_value = value = await self.function(*args, **kwargs)
                 if self.is_current() and not task_for_this_call.cancelled():  # type: ignore
-                    self._result.value = TaskResult[R](value=value, latest=value, _state=TaskState.FINISHED, progress=self._last_progress)
+                    with _auto_batch():
+                        self._result.value = TaskResult[R](value=value, latest=value, _state=TaskState.FINISHED, progress=self._last_progress)
                 logger.info("setting result to %r", value)
                 self._finish_future_threadsafe(call_event_loop, future, lambda f: f.set_result(value), "result")
             except Exception as e:
@@ -593,11 +594,13 @@ class TaskThreaded(Task[P, R]):
                             except StopIteration:
                                 break
                         if self.is_current():
-                            self._result.value = TaskResult[R](latest=self._last_value, _state=TaskState.FINISHED, progress=self._last_progress)
+                            with _auto_batch():
+                                self._result.value = TaskResult[R](latest=self._last_value, _state=TaskState.FINISHED, progress=self._last_progress)
                     else:
                         self._last_value = value
                         if self.is_current():
-                            self._result.value = TaskResult[R](latest=value, value=value, _state=TaskState.FINISHED, progress=self._last_progress)
+                            with _auto_batch():
+                                self._result.value = TaskResult[R](latest=value, value=value, _state=TaskState.FINISHED, progress=self._last_progress)
                 except Exception as e:
                     if self.is_current():
                         logger.exception(e)
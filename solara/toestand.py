@@ -1,6 +1,8 @@
 import contextlib
 import dataclasses
+import heapq
 import inspect
+import itertools
 import logging
 import os
 import sys
@@ -57,6 +59,19 @@ class ThreadLocal(threading.local):
     # True while solara-internal machinery subscribes: those owners guarantee cleanup,
     # so the subscription-leak warning must not fire for them
     managed_subscribe: bool = False
+    # lazy Computed bookkeeping, see _invalidate_lazy: the computeds being evaluated, how deep we
+    # are in fire() calls, and the pending invalidation pass
+    computed_stack: Optional[List["Computed"]] = None
+    fire_depth: int = 0
+    invalidated: Optional[List[Tuple[int, int, "Computed", Any]]] = None
+    invalidation_running: bool = False
+    # solara.batch() bookkeeping: the nesting depth, the deferred notifications (per store and
+    # scope, the value before the batch and the latest value), and the auto-subscribe managers
+    # notified in the current round of a flush
+    batch_depth: int = 0
+    batch_pending: Optional[Dict[Tuple[int, Any], List[Any]]] = None
+    batch_flushing: bool = False
+    batch_notified: Optional[Set["AutoSubscribeContextManagerBase"]] = None
 
 
 thread_local = ThreadLocal()
@@ -94,6 +109,10 @@ class _ListenerEntry(Generic[T]):
 _pending_subscription_checks: Dict[str, list] = {}
 _pending_subscription_callbacks: Dict[str, Callable[[], None]] = {}
 _warned_sites: Set[str] = set()
+# the stores that currently have listeners, by id, for listener_stats() (weak: a store can be
+# garbage collected while subscribed)
+_stores_with_listeners: "weakref.WeakValueDictionary[int, ValueBase]" = weakref.WeakValueDictionary()
+_stores_with_listeners_lock = threading.Lock()
 _internal_packages_paths = None
 
 
@@ -190,6 +209,10 @@ class ValueBase(Generic[T]):
         self.equals = equals
         self.listeners: Dict[str, Set[_ListenerEntry[T]]] = defaultdict(set)
         self.listeners2: Dict[str, Set[_ListenerEntry[T]]] = defaultdict(set)
+        # the same entries, per scope id grouped by their Context, so fire() enters each context
+        # once and calls its listeners without matching every listener against every context:
+        # {scope_id: {context: ({entry: None}, {entry: None})}} for listeners and listeners2
+        self._dispatch: Dict[str, Dict["Context", Tuple[Dict[_ListenerEntry[T], None], Dict[_ListenerEntry[T], None]]]] = {}
         self._listeners_lock = threading.Lock()
 
     # make sure all boolean operations give type errors
@@ -255,6 +278,36 @@ class ValueBase(Generic[T]):
     def _get_scope_key(self):
         raise NotImplementedError
 
+    def _dispatch_add(self, scope_id: str, entry: _ListenerEntry[T], kind: int) -> None:
+        # called with _listeners_lock held; kind 0 is a listener, 1 a change listener
+        groups = self._dispatch.setdefault(scope_id, {})
+        group = groups.get(entry.context)
+        if group is None:
+            group = groups[entry.context] = ({}, {})
+        group[kind][entry] = None
+        with _stores_with_listeners_lock:
+            _stores_with_listeners[id(self)] = self
+
+    def _dispatch_remove(self, scope_id: str, entry: _ListenerEntry[T], kind: int) -> None:
+        # called with _listeners_lock held
+        groups = self._dispatch.get(scope_id)
+        group = groups.get(entry.context) if groups is not None else None
+        if groups is None or group is None:
+            return
+        group[kind].pop(entry, None)
+        if not group[0] and not group[1]:
+            del groups[entry.context]
+            if not groups:
+                del self._dispatch[scope_id]
+                if not self._dispatch:
+                    with _stores_with_listeners_lock:
+                        _stores_with_listeners.pop(id(self), None)
+
+    def listener_counts(self) -> Dict[str, int]:
+        """The number of listeners per scope (kernel id, or "global"), to diagnose subscription leaks."""
+        with self._listeners_lock:
+            return {scope_id: sum(len(group[0]) + len(group[1]) for group in groups.values()) for scope_id, groups in self._dispatch.items()}
+
     def subscribe(self, listener: Callable[[T], None], scope: Optional[ContextManager] = None):
         if scope is not None:
             warnings.warn("scope argument should not be used, it was only for internal use")
@@ -264,7 +317,7 @@ class ValueBase(Generic[T]):
         if _using_solara_server():
             import solara.server.kernel_context
 
-            kernel = solara.server.kernel_context.get_current_context() if solara.server.kernel_context.has_current_context() else nullcontext()
+            kernel = solara.server.kernel_context.get_current_context_or_none() or nullcontext()
         else:
             kernel = nullcontext()
         context = Context(rc, kernel)
@@ -272,12 +325,14 @@ class ValueBase(Generic[T]):
         entry: _ListenerEntry[T] = _ListenerEntry(listener, context)
         with self._listeners_lock:
             self.listeners[scope_id].add(entry)
+            self._dispatch_add(scope_id, entry, 0)
         leak_check = self._track_subscription()
 
         def cleanup():
             if leak_check is not None:
                 _resolve_subscription(leak_check)
             with self._listeners_lock:
+                self._dispatch_remove(scope_id, entry, 0)
                 entries = self.listeners.get(scope_id)
                 if entries is not None:
                     entries.discard(entry)
@@ -295,19 +350,21 @@ class ValueBase(Generic[T]):
         if _using_solara_server():
             import solara.server.kernel_context
 
-            kernel = solara.server.kernel_context.get_current_context() if solara.server.kernel_context.has_current_context() else nullcontext()
+            kernel = solara.server.kernel_context.get_current_context_or_none() or nullcontext()
         else:
             kernel = nullcontext()
         context = Context(rc, kernel)
         entry: _ListenerEntry[T] = _ListenerEntry(listener, context)
         with self._listeners_lock:
             self.listeners2[scope_id].add(entry)
+            self._dispatch_add(scope_id, entry, 1)
         leak_check = self._track_subscription()
 
         def cleanup():
             if leak_check is not None:
                 _resolve_subscription(leak_check)
             with self._listeners_lock:
+                self._dispatch_remove(scope_id, entry, 1)
                 entries = self.listeners2.get(scope_id)
                 if entries is not None:
                     entries.discard(entry)
@@ -372,25 +429,36 @@ class ValueBase(Generic[T]):
         return leak_check
 
     def fire(self, new: T, old: T):
-        logger.info("value change from %s to %s, will fire events", old, new)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("value change from %s to %s, will fire events", old, new)
+        if thread_local.batch_depth:
+            _defer_fire(self, new, old)
+            return
+        self._fire(new, old)
+
+    def _fire(self, new: T, old: T):
         scope_id = self._get_scope_key()
-        # .get instead of indexing: these are defaultdicts, and indexing would
-        # permanently materialize an empty set for every kernel that ever fires,
-        # growing the dicts by one entry per kernel for the process lifetime
+        # snapshot the listeners grouped by context; they run without the lock, and may
+        # (un)subscribe while we iterate
         with self._listeners_lock:
-            listeners = tuple(self.listeners.get(scope_id, ()))
-            listeners2 = tuple(self.listeners2.get(scope_id, ()))
-        contexts = {entry.context for entry in listeners}
-        contexts.update(entry.context for entry in listeners2)
-        if contexts:
-            for context in contexts:
-                with context or nullcontext():
-                    for entry in listeners:
-                        if context == entry.context:
+            groups = self._dispatch.get(scope_id)
+            if groups is None:
+                return
+            dispatch = [(context, tuple(group[0]), tuple(group[1])) for context, group in groups.items()]
+        if dispatch:
+            thread_local.fire_depth += 1
+            try:
+                for context, listeners, listeners2 in dispatch:
+                    with context or nullcontext():
+                        for entry in listeners:
                             entry.listener(new)
-                    for entry in listeners2:
-                        if context == entry.context:
+                        for entry in listeners2:
                             entry.listener(new, old)
+            finally:
+                thread_local.fire_depth -= 1
+            # the lazy computeds invalidated by this change are updated once all listeners ran
+            if not thread_local.fire_depth and thread_local.invalidated and not thread_local.invalidation_running:
+                _run_invalidation_pass()
 
     def update(self, _f=None, **kwargs):
         if _f is not None:
@@ -474,23 +542,16 @@ class KernelStore(ValueBase[S], ABC):
         # use for locking) when inside a kernel, else the per-instance global dict. Returning the
         # context here -- rather than re-resolving it for the lock -- keeps get()'s dict and lock
         # from ever disagreeing.
-        scope_dict = self._global_dict
-        scope_id = "global"
-        context = None
-        if _using_solara_server():
-            import solara.server.kernel_context
-
-            try:
-                context = solara.server.kernel_context.get_current_context()
-            except RuntimeError:  # noqa
-                context = None  # no current kernel context -> global scope
-            else:
-                scope_dict = cast(Dict[str, S], context.user_dicts)
-                scope_id = context.id
-                # Persistent module stores can share an explicit key with a transient
-                # store; track them so the transient owner cannot clear their value.
-                context.track_generation_store(self, owned=False)
-        return cast(Dict[str, S], scope_dict), scope_id, context
+        # This runs on every read, so the context lookup is the cached one (see
+        # kernel_context.get_current_context_or_none), and a store is tracked once per kernel.
+        context = _current_kernel_context()
+        if context is None:  # no current kernel context -> global scope
+            return self._global_dict, "global", None
+        # Persistent module stores can share an explicit key with a transient
+        # store; track them so the transient owner cannot clear their value.
+        if id(self) not in context._generation_stores:
+            context.track_generation_store(self, owned=False)
+        return context.user_dicts, context.id, context
 
     def peek(self):
         return self.get()
@@ -960,7 +1021,7 @@ class Singleton(Reactive[S]):
 class Computed(Reactive[S]):
     _storage: KernelStore[S]
 
-    def __init__(self, f: Callable[[], S], key=None):
+    def __init__(self, f: Callable[[], S], key=None, lazy: bool = False):
         if reacton.core.get_render_context(required=False) is not None:
             site = _app_call_site()
             if site is not None:
@@ -971,27 +1032,35 @@ class Computed(Reactive[S]):
                     "use_memo for values derived inside a component.",
                 )
         self.f = f
+        self.lazy = lazy
+        # 1 + the highest rank of the computeds it read, the order of an invalidation pass
+        self._rank = 0
 
         self_ref = weakref.ref(self)
 
         def on_change(*ignore):
             computed = self_ref()
             if computed is not None:
-                with computed._auto_subscriber.value:
-                    computed.set(f())
+                if computed.lazy:
+                    _invalidate_lazy(computed)
+                else:
+                    computed.set(computed._evaluate())
 
         import functools
 
+        def create_auto_subscriber():
+            manager = AutoSubscribeContextManager(on_change)
+            manager._lazy_dependent = lazy
+            return manager
+
         self._auto_subscriber = Singleton(
-            functools.wraps(AutoSubscribeContextManager)(lambda: AutoSubscribeContextManager(on_change)),
+            functools.wraps(AutoSubscribeContextManager)(create_auto_subscriber),
             _cleanup_value=lambda manager: manager.unsubscribe_all(),
         )
 
         @functools.wraps(f)
         def factory():
-            v = self._auto_subscriber.value
-            with v:
-                return f()
+            return self._evaluate()
 
         super().__init__(KernelStoreFactory(factory, key=key))
 
@@ -1011,12 +1080,280 @@ class Computed(Reactive[S]):
         value = super().__repr__()
         return "<Computed" + value[len("<Reactive") : -1]
 
+    def get(self, add_watch=None) -> S:
+        if thread_local.batch_pending and not thread_local.batch_flushing:
+            # inside a batch: read the value that includes the changes made so far
+            _flush_batch()
+        value = super().get(add_watch)
+        stack = thread_local.computed_stack
+        if stack:
+            reader = stack[-1]
+            reader._rank = max(reader._rank, self._rank + 1)
+        return value
+
+    def _evaluate(self) -> S:
+        stack = thread_local.computed_stack
+        if stack is None:
+            stack = thread_local.computed_stack = []
+        stack.append(self)
+        try:
+            with self._auto_subscriber.value:
+                return self.f()
+        finally:
+            stack.pop()
+
+    def _is_dirty(self) -> bool:
+        scope_dict, scope_id, context = self._storage._get_dict()
+        return self._storage.storage_key not in scope_dict
+
+    def _listener_entries(self) -> List["_ListenerEntry"]:
+        storage = self._storage
+        scope_id = storage._get_scope_key()
+        with storage._listeners_lock:
+            return [*storage.listeners.get(scope_id, ()), *storage.listeners2.get(scope_id, ())]
+
+    def _refresh(self) -> None:
+        """Bring a dirty lazy computed up to date, as part of an invalidation pass."""
+        if self._is_dirty():
+            # dropped earlier, and its readers were invalidated then: the next get() evaluates it
+            return
+        entries = self._listener_entries()
+        lazy_dependents = [entry for entry in entries if _is_lazy_dependent(entry.listener)]
+        if len(lazy_dependents) < len(entries):
+            # read by a component, a non-lazy computed or a listener: evaluate now, which
+            # notifies the readers (including lazy computeds) only when the value changed
+            self.set(self._evaluate())
+        else:
+            # nobody needs the value now: drop it, and invalidate the lazy computeds reading it
+            self._storage.clear()
+            for entry in lazy_dependents:
+                with entry.context or nullcontext():
+                    entry.listener()
+
+
+def listener_stats(limit: int = 10) -> Dict[str, Any]:
+    """Listener counts of the reactive variables, for /resourcez.
+
+    ``top`` lists the stores with the most listeners, with the most listeners in one scope
+    (kernel): a count that keeps growing points at code that subscribes without unsubscribing.
+    """
+    with _stores_with_listeners_lock:
+        stores = list(_stores_with_listeners.values())
+    rows = []
+    for store in stores:
+        counts = store.listener_counts()
+        if counts:
+            rows.append((sum(counts.values()), len(counts), max(counts.values()), getattr(store, "storage_key", type(store).__name__)))
+    rows.sort(key=lambda row: row[0], reverse=True)
+    return {
+        "stores": len(rows),
+        "listeners": sum(row[0] for row in rows),
+        "top": [
+            {"key": key, "listeners": listeners, "scopes": scopes, "max_per_scope": max_per_scope} for listeners, scopes, max_per_scope, key in rows[:limit]
+        ],
+    }
+
+
+class BatchInfo:
+    """Process-wide counters of solara.batch(), for /resourcez."""
+
+    lock = threading.Lock()
+    batches = 0
+    # changes made inside a batch, and the notifications sent for them at the end
+    deferred = 0
+    fired = 0
+    # auto-subscribe listeners (components, computeds) not called again in the same round
+    listener_calls_saved = 0
+
+    @classmethod
+    def record(cls, batches: int = 0, deferred: int = 0, fired: int = 0, listener_calls_saved: int = 0) -> None:
+        with cls.lock:
+            cls.batches += batches
+            cls.deferred += deferred
+            cls.fired += fired
+            cls.listener_calls_saved += listener_calls_saved
+
+    @classmethod
+    def as_dict(cls) -> Dict[str, int]:
+        with cls.lock:
+            return {"batches": cls.batches, "deferred": cls.deferred, "fired": cls.fired, "listener_calls_saved": cls.listener_calls_saved}
+
+    @classmethod
+    def _reset(cls) -> None:
+        with cls.lock:
+            cls.batches = cls.deferred = cls.fired = cls.listener_calls_saved = 0
+
+
+@contextlib.contextmanager
+def batch():
+    """Defer the notifications of reactive variable changes until the end of the block.
+
+    Setting a reactive variable normally notifies its listeners (components, computed values)
+    right away. Inside `with solara.batch():` the new values are stored, but the notifications
+    wait until the end of the block. Then each changed variable notifies its listeners once,
+    with the value from before the block and the final value, and a component or computed
+    depending on several of the changed variables runs once. A variable set back to its
+    original value does not notify at all.
+
+    ```python
+    def reset():
+        with solara.batch():
+            x.value = 0
+            y.value = 0
+            z.value = 0
+    ```
+
+    Solara batches automatically while it handles a message from the browser (e.g. event
+    handlers such as `on_click`) and while it delivers the result of a task. Set
+    `SOLARA_STORAGE_BATCH_UPDATES=False` to turn this off.
+
+    Reading a computed value inside a batch first sends the pending notifications, so that it
+    reflects the new values. Batches can be nested; the outermost one sends the notifications.
+    """
+    thread_local.batch_depth += 1
+    if thread_local.batch_depth == 1:
+        BatchInfo.record(batches=1)
+    try:
+        yield
+    finally:
+        thread_local.batch_depth -= 1
+        if not thread_local.batch_depth and thread_local.batch_pending:
+            _flush_batch()
+
+
+def _auto_batch():
+    """The batch solara applies around event handlers and task results, unless turned off."""
+    return batch() if solara.settings.storage.batch_updates else nullcontext()
+
+
+def _defer_fire(store: ValueBase, new, old) -> None:
+    pending = thread_local.batch_pending
+    if pending is None:
+        pending = thread_local.batch_pending = {}
+    scope_id = store._get_scope_key()
+    key = (id(store), scope_id)
+    item = pending.get(key)
+    if item is None:
+        # the kernel context to notify in, as fire() would have
+        pending[key] = [store, old, new, _current_kernel_context()]
+    else:
+        item[2] = new
+    BatchInfo.record(deferred=1)
+
+
+def _flush_batch() -> None:
+    """Send the notifications deferred by batch(), in rounds.
+
+    The changes the listeners make are deferred to the next round, so each round notifies every
+    changed store once, and calls every auto-subscribe listener (a component or computed) once.
+
+    A listener that raises does not stop the other stores from being notified (their values are
+    already set); the first error is raised once all notifications are sent.
+    """
+    if thread_local.batch_flushing:
+        return
+    thread_local.batch_flushing = True
+    error: Optional[BaseException] = None
+    try:
+        while thread_local.batch_pending:
+            pending, thread_local.batch_pending = thread_local.batch_pending, None
+            thread_local.batch_depth += 1
+            thread_local.batch_notified = set()
+            thread_local.fire_depth += 1
+            try:
+                for store, old, new, context in pending.values():
+                    if store.equals(old, new):
+                        continue
+                    BatchInfo.record(fired=1)
+                    try:
+                        with context or nullcontext():
+                            store._fire(new, old)
+                    except Exception as e:
+                        if error is None:
+                            error = e
+                        else:
+                            logger.exception("error in a listener while sending batched notifications")
+            finally:
+                thread_local.fire_depth -= 1
+                thread_local.batch_notified = None
+                thread_local.batch_depth -= 1
+            # lazy computeds invalidated in this round: once, after all its notifications
+            if not thread_local.fire_depth and thread_local.invalidated and not thread_local.invalidation_running:
+                thread_local.batch_depth += 1
+                try:
+                    _run_invalidation_pass()
+                finally:
+                    thread_local.batch_depth -= 1
+    finally:
+        thread_local.batch_flushing = False
+    if error is not None:
+        raise error
+
+
+def _is_lazy_dependent(listener: Callable) -> bool:
+    manager = getattr(listener, "__self__", None)
+    return isinstance(manager, AutoSubscribeContextManagerBase) and manager._lazy_dependent
+
+
+# solara.server.kernel_context, imported on first use (an import statement on every reactive
+# read is measurable)
+_kernel_context_module: Any = None
+
+
+def _current_kernel_context():
+    global _kernel_context_module
+    if _using_solara_server():
+        if _kernel_context_module is None:
+            import solara.server.kernel_context
+
+            _kernel_context_module = solara.server.kernel_context
+        return _kernel_context_module.get_current_context_or_none()
+    return None
+
+
+_invalidation_counter = itertools.count()
+
+
+def _invalidate_lazy(computed: "Computed") -> None:
+    """Queue a lazy computed whose dependencies changed.
+
+    The queue is processed when the outermost fire() returns, so that all the direct readers of a
+    change are queued before any of them is evaluated. The pass handles the computeds in order of
+    their rank (a computed comes after the computeds it reads), and each at most once.
+    """
+    queue = thread_local.invalidated
+    if queue is None:
+        queue = thread_local.invalidated = []
+    heapq.heappush(queue, (computed._rank, next(_invalidation_counter), computed, _current_kernel_context()))
+    if not thread_local.fire_depth and not thread_local.invalidation_running:
+        _run_invalidation_pass()
+
+
+def _run_invalidation_pass() -> None:
+    queue = thread_local.invalidated
+    assert queue is not None
+    thread_local.invalidation_running = True
+    done: Set[Tuple[int, int]] = set()
+    try:
+        while queue:
+            _, _, computed, context = heapq.heappop(queue)
+            key = (id(computed), id(context))
+            if key in done:
+                continue
+            done.add(key)
+            with context or nullcontext():
+                computed._refresh()
+    finally:
+        thread_local.invalidation_running = False
+        queue.clear()
+
 
 @overload
 def computed(
     f: None,
     *,
     key: Optional[str] = ...,
+    lazy: bool = ...,
 ) -> Callable[[Callable[[], T]], Reactive[T]]: ...
 
 
@@ -1025,6 +1362,7 @@ def computed(
     f: Callable[[], T],
     *,
     key: Optional[str] = ...,
+    lazy: bool = ...,
 ) -> Reactive[T]: ...
 
 
@@ -1032,6 +1370,7 @@ def computed(
     f: Union[None, Callable[[], T]],
     *,
     key: Optional[str] = None,
+    lazy: bool = False,
 ) -> Union[Callable[[Callable[[], T]], Reactive[T]], Reactive[T]]:
     """Creates a reactive variable that is set to the return value of the function.
 
@@ -1065,10 +1404,27 @@ def computed(
         solara.Button("reset", on_click=reset)
     ```
 
+    ## Lazy evaluation
+
+    By default, a computed is evaluated again as soon as one of the reactive variables it uses
+    changes, even when nothing reads it. With `lazy=True`, a change only marks it as out of date:
+
+     * When a component, a (non-lazy) computed or a listener depends on it, it is evaluated once all
+       listeners of the change ran, and computeds that depend on other computeds come after those.
+       A computed that depends on several changed values is therefore evaluated once, and never
+       sees a mix of old and new values.
+     * Otherwise, it is evaluated on the next read of `.value`.
+
+    ```python
+    @solara.lab.computed(lazy=True)
+    def report():
+        return expensive_summary(data.value)
+    ```
+
     """
 
     def wrapper(f: Callable[[], T]):
-        return Computed(f, key=key)
+        return Computed(f, key=key, lazy=lazy)
 
     if f is None:
         return wrapper
@@ -1265,6 +1621,8 @@ class AutoSubscribeContextManagerBase:
     subscribed: Dict[ValueBase, Callable]
     reactive_used: Optional[Set[ValueBase]]
     on_change: Callable[[], None]
+    # set for the manager of a lazy Computed: its on_change only invalidates
+    _lazy_dependent = False
 
     def __init__(self):
         self.subscribed = {}
@@ -1278,6 +1636,8 @@ class AutoSubscribeContextManagerBase:
     @staticmethod
     def _cleanup(unsubscribes):
         fatal = None
+        # a subscription kept over several runs can be listed more than once
+        unsubscribes = list({id(unsubscribe): unsubscribe for unsubscribe in unsubscribes}.values())
         for unsubscribe in unsubscribes:
             try:
                 unsubscribe()
@@ -1321,8 +1681,13 @@ class AutoSubscribeContextManagerBase:
         with self._subscription_lock:
             if self._closed or run not in self._active_runs:
                 return
+            # the previous run subscribed to it already: keep that subscription
+            unsubscribe = self.subscribed.get(relevant_reactive)
+            if unsubscribe is not None:
+                run.subscriptions[relevant_reactive] = unsubscribe
+                return
         with _managed_subscription():
-            unsubscribe = relevant_reactive.subscribe_change(lambda *args: self.on_change())
+            unsubscribe = relevant_reactive.subscribe_change(self._on_change_listener)
         with self._subscription_lock:
             if self._closed or run not in self._active_runs:
                 keep = False
@@ -1332,6 +1697,16 @@ class AutoSubscribeContextManagerBase:
         if not keep:
             self._cleanup([unsubscribe])
 
+    def _on_change_listener(self, *ignore):
+        notified = thread_local.batch_notified
+        if notified is not None:
+            # flushing a batch: once per round, even when several of our dependencies changed
+            if self in notified:
+                BatchInfo.record(listener_calls_saved=1)
+                return
+            notified.add(self)
+        self.on_change()
+
     def __enter__(self):
         self._bind_to_current_kernel()
         run = _AutoSubscribeRun({}, set(), thread_local.reactive_used, thread_local.reactive_watch)
@@ -1353,13 +1728,19 @@ class AutoSubscribeContextManagerBase:
         with self._subscription_lock:
             if run in self._active_runs:
                 self._active_runs.remove(run)
+            # Only the difference with the previous run is (un)subscribed: a reactive read again
+            # keeps its subscription (see add). A subscription can be shared by the committed
+            # set and the runs still active, so it ends once none of them holds it anymore.
+            candidates = [*self.subscribed.values(), *run.subscriptions.values()]
             if self._closed or exc_type is not None:
-                unsubscribes = list(run.subscriptions.values())
                 run.subscriptions = {}
             else:
-                unsubscribes = list(self.subscribed.values())
                 self.subscribed = run.subscriptions
                 self.reactive_used = run.reactive_used
+            live = {id(unsubscribe) for unsubscribe in self.subscribed.values()}
+            for other in self._active_runs:
+                live.update(id(unsubscribe) for unsubscribe in other.subscriptions.values())
+            unsubscribes = [unsubscribe for unsubscribe in candidates if id(unsubscribe) not in live]
         self._cleanup(unsubscribes)
 
     def _bind_to_current_kernel(self):
@@ -0,0 +1,49 @@
+"""Micro-benchmark of the kernel wire JSON serializers: ``python -m tests.benchmarks.kernel_json_bench [rounds]``."""
+
+import sys
+import time
+
+import pytest
+
+import solara.server.app  # noqa: F401 - sets up the widget comms, as the server does
+import solara.server.kernel as kernel
+import solara.server.kernel_context
+from solara.server import settings
+
+from ..unit.kernel_json_test import _record_traffic
+
+
+def bench(fn, items, rounds: int) -> float:
+    """Seconds per pass of calling ``fn`` on every item."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for item in items:
+            fn(item)
+    return (time.perf_counter() - start) / rounds
+
+
+def main(rounds=200):
+    k = kernel.Kernel()
+    context = solara.server.kernel_context.VirtualKernelContext(id="bench", kernel=k, session_id="bench")
+    monkeypatch = pytest.MonkeyPatch()
+    try:
+        with context:
+            messages, frames = _record_traffic(context, monkeypatch)
+    finally:
+        monkeypatch.undo()
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else rounds
+    nbytes = sum(len(frame) for frame in frames)
+    print(f"recorded {len(messages)} messages, {len(frames)} frames, {nbytes} bytes; {rounds} rounds")  # noqa
+    previous = settings.kernel.json_serializer
+    try:
+        for name in ["json", "orjson"]:
+            settings.kernel.json_serializer = name
+            dumps = bench(kernel.json_dumps, messages, rounds)
+            loads = bench(kernel.json_loads, frames, rounds)
+            print(f"{name:>8}: dumps {dumps * 1e3:7.3f} ms/pass  loads {loads * 1e3:7.3f} ms/pass")  # noqa
+    finally:
+        settings.kernel.json_serializer = previous
+
+
+if __name__ == "__main__":
+    main()
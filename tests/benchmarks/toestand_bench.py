@@ -0,0 +1,52 @@
+"""Micro-benchmarks of reactive variables: ``python -m tests.benchmarks.toestand_bench [rounds]``."""
+
+import sys
+import time
+import unittest.mock
+
+import solara.server.app  # noqa: F401 - sets up the widget comms, as the server does
+import solara.server.kernel as kernel
+import solara.toestand as toestand
+from solara.server import kernel_context
+from solara.toestand import Reactive
+
+
+def bench_auto_subscribe(reads: int, rounds: int) -> float:
+    """Seconds per render that reads the same ``reads`` reactives under auto-subscription."""
+    reactives = [Reactive(i) for i in range(reads)]
+    manager = toestand.AutoSubscribeContextManager(lambda: None)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        with manager:
+            for reactive in reactives:
+                reactive.value
+    manager.unsubscribe_all()
+    return (time.perf_counter() - start) / rounds
+
+
+def bench_kernel_reads(reads: int, rounds: int) -> float:
+    """Seconds per pass of reading ``reads`` reactives inside a kernel context."""
+    context = kernel_context.VirtualKernelContext(id="bench-reads", kernel=kernel.Kernel(), session_id="session")
+    reactives = [Reactive(i) for i in range(reads)]
+    with unittest.mock.patch.object(toestand, "_using_solara_server", lambda: True), context:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for reactive in reactives:
+                reactive.value
+        seconds = (time.perf_counter() - start) / rounds
+    context.close()
+    return seconds
+
+
+def main(rounds=2000):
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else rounds
+    for reads in [1, 10, 50, 200]:
+        seconds = bench_auto_subscribe(reads, rounds)
+        print(f"{reads:>4} reads: {seconds * 1e6:9.2f} us/render  {seconds * 1e6 / reads:7.3f} us/read")  # noqa
+    for reads in [1, 10, 50, 200]:
+        seconds = bench_kernel_reads(reads, rounds)
+        print(f"{reads:>4} reads in a kernel: {seconds * 1e6:9.2f} us/pass  {seconds * 1e6 / reads:7.3f} us/read")  # noqa
+
+
+if __name__ == "__main__":
+    main()
@@ -50,7 +50,7 @@ def _scoped(page_session: playwright.sync_api.Page, solara_server, solara_app):
         kernel_ref = weakref.ref(ctx.kernel)
         shell = ctx.kernel.shell
         shell_ref = weakref.ref(shell)
-        last_cull_task = ctx._last_kernel_cull_task
+        last_cull_task = ctx._cull_entry.future if ctx._cull_entry is not None else None
         page_session.goto("about:blank")
         if last_cull_task is not None and not last_cull_task.done():
             event = threading.Event()
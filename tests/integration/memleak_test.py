@@ -49,7 +49,7 @@ def _scoped_test_memleak(
         assert krn is not None
         shell = weakref.ref(krn.shell)
         session = weakref.ref(krn.session)
-        last_cull_task = ctx._last_kernel_cull_task
+        last_cull_task = ctx._cull_entry.future if ctx._cull_entry is not None else None
         page_session.goto("about:blank")
         if last_cull_task is not None and not last_cull_task.done():
             event = threading.Event()
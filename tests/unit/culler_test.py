@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import pytest
+
+from solara.server import culler, settings
+
+
+@pytest.fixture
+async def fresh_culler():
+    culler.CullInfo._reset()
+    instance = culler.Culler(asyncio.get_running_loop())
+    try:
+        yield instance
+    finally:
+        instance.stop()
+        culler.CullInfo._reset()
+
+
+async def test_culler_runs_due_entries_at_a_bounded_rate(fresh_culler, monkeypatch):
+    monkeypatch.setattr(settings.kernel, "cull_rate", 3)
+    handled = []
+
+    def cull(i):
+        handled.append((i, time.monotonic()))
+        return i != 0
+
+    t0 = time.monotonic()
+    # the task starts once the test awaits, with all four due
+    entries = [fresh_culler.schedule(0, lambda i=i: cull(i)) for i in range(4)]
+    await asyncio.gather(*[asyncio.wrap_future(entry.future) for entry in entries])
+    # three in the first batch, and the last one a second later
+    assert [i for i, _ in handled] == [0, 1, 2, 3]
+    assert handled[2][1] - t0 < 0.5
+    assert handled[3][1] - t0 >= 0.99
+    info = culler.CullInfo.as_dict()
+    assert info["scheduled"] == 4 and info["culled"] == 3 and info["kept"] == 1
+    assert info["culls_last_minute"] == 3 and info["close_seconds"]["count"] == 3
+    assert info["lag_seconds"]["max"] >= 0.9
+
+
+async def test_culler_cancel(fresh_culler):
+    handled = []
+
+    def cull(i):
+        handled.append(i)
+        return True
+
+    entries = [fresh_culler.schedule(0.05, lambda i=i: cull(i)) for i in range(3)]
+    fresh_culler.cancel(entries[0])
+    assert entries[0].future.cancelled()
+    fresh_culler.cancel(entries[1])
+    # more than half of the heap was cancelled, so it was compacted
+    assert fresh_culler.pending == 1 and len(fresh_culler._heap) == 1
+    await asyncio.wrap_future(entries[2].future)
+    assert handled == [2]
+    fresh_culler.cancel(entries[2])  # too late, a no-op
+    assert culler.CullInfo.as_dict()["cancelled"] == 2
+    assert fresh_culler.pending == 0
+
+
+async def test_culler_wakes_up_for_an_earlier_deadline(fresh_culler):
+    late = fresh_culler.schedule(3600, lambda: True)
+    await asyncio.sleep(0.01)
+    early = fresh_culler.schedule(0.01, lambda: False)
+    await asyncio.wait_for(asyncio.wrap_future(early.future), 1)
+    assert not late.future.done()
+    fresh_culler.cancel(late)
@@ -0,0 +1,138 @@
+import copy
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+import ipyvuetify as v
+import numpy as np
+import pandas as pd
+import pytest
+
+import solara
+import solara.server.kernel as kernel
+from solara.server import settings
+
+orjson = pytest.importorskip("orjson")
+
+
+@pytest.fixture
+def serializer(monkeypatch):
+    def use(name):
+        monkeypatch.setattr(settings.kernel, "json_serializer", name)
+
+    return use
+
+
+class _Recorder:
+    def __init__(self):
+        self.frames = []
+
+    def send(self, data, coalesce_key=None):
+        self.frames.append(data)
+
+    def close(self):
+        pass
+
+
+def _record_traffic(kernel_context, monkeypatch):
+    """Render a small but realistic app and return the outgoing message dicts and wire frames."""
+    messages = []
+
+    def recording_serializer():
+        dumps, loads = kernel._stdlib_json_dumps, json.loads
+
+        def record(data):
+            messages.append(copy.deepcopy(data))
+            return dumps(data)
+
+        return record, loads
+
+    kernel.register_json_serializer("recording", recording_serializer)
+    monkeypatch.setattr(settings.kernel, "json_serializer", "recording")
+    recorder = _Recorder()
+    kernel_context.kernel.session.websockets.add(recorder)
+    df = pd.DataFrame({"a": np.arange(50), "b": np.linspace(0, 1, 50), "c": [f"row {i}" for i in range(50)]})
+
+    @solara.component
+    def App():
+        value = solara.use_reactive(1)
+        solara.SliderInt("x", value=value)
+        for i in range(20):
+            solara.Text(f"row {i} {value.value}")
+        solara.DataFrame(df)
+
+    try:
+        box, rc = solara.render(App(), handle_error=False)
+        slider = rc.find(v.Slider).widget
+        for i in range(2, 12):
+            slider.v_model = i
+        rc.close()
+    finally:
+        kernel_context.kernel.session.websockets.discard(recorder)
+        del kernel.json_serializers["recording"]
+        kernel._json_serializers_resolved.pop("recording", None)
+    # a few payloads the stdlib path needs its fallback for
+    messages.append(
+        {"content": {"data": {"state": {"value": np.float64(1.5), "count": np.int64(3), "when": datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)}}}}
+    )
+    return messages, [frame for frame in recorder.frames if isinstance(frame, str)]
+
+
+def test_json_serializer_default_is_stdlib(serializer):
+    assert kernel.get_json_serializer()[0] is kernel._stdlib_json_dumps
+    serializer("auto")
+    assert kernel.get_json_serializer() is kernel.get_json_serializer("orjson")
+
+
+def test_json_serializer_unknown_name(serializer):
+    serializer("simdjson")
+    with pytest.raises(ValueError, match="simdjson"):
+        kernel.json_dumps({})
+
+
+@pytest.mark.filterwarnings("ignore:Interpreting naive datetime")
+def test_orjson_matches_stdlib(serializer):
+    data: Dict[str, Any] = {
+        "int": np.int64(42),
+        "float": np.float32(0.5),
+        "bool": np.bool_(True),
+        "array": np.arange(6).reshape(2, 3),
+        "strided": np.arange(10)[::2],
+        "naive": datetime(2024, 1, 2, 3, 4, 5, 600),
+        "aware": datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        "bytes": b"\x00\x01binary",
+        "unicode": "é中",
+        "nested": [{1: "int key"}],
+    }
+    # the stdlib fallback handles np.number only, so give it plain Python for the rest
+    expected = {**data, "bool": True, "array": data["array"].tolist(), "strided": data["strided"].tolist()}
+    reference = json.loads(kernel._stdlib_json_dumps(expected))
+    serializer("orjson")
+    wire = kernel.json_dumps(data)
+    assert isinstance(wire, str)
+    assert json.loads(wire) == reference
+    assert kernel.json_loads(wire.encode("utf8")) == reference
+
+
+def test_orjson_falls_back_for_big_ints(serializer):
+    serializer("orjson")
+    assert json.loads(kernel.json_dumps({"big": 2**70})) == {"big": 2**70}
+
+
+def test_orjson_binary_message_roundtrip(serializer):
+    serializer("orjson")
+    msg = {"header": {"msg_type": "comm_msg"}, "content": {"value": np.int32(7)}, "buffers": [b"abc", memoryview(b"defg")]}
+    back = kernel.deserialize_binary_message(kernel.serialize_binary_message(msg))
+    assert back["content"] == {"value": 7}
+    assert [bytes(b) for b in back["buffers"]] == [b"abc", b"defg"]
+
+
+def test_wire_json_recorded_traffic(kernel_context, monkeypatch, serializer):
+    # every recorded message must serialize identically (timed in tests/benchmarks/kernel_json_bench.py)
+    messages, frames = _record_traffic(kernel_context, monkeypatch)
+    assert len(messages) > 20
+    serializer("orjson")
+    for message in messages:
+        assert json.loads(kernel.json_dumps(message)) == json.loads(kernel._stdlib_json_dumps(message))
+    for frame in frames:
+        assert kernel.json_loads(frame) == json.loads(frame)
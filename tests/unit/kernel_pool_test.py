@@ -0,0 +1,84 @@
+import json
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import solara.lifecycle
+from solara.server import esm_vue, kernel_context, kernel_pool, settings
+
+
+@pytest.fixture
+def pool(monkeypatch, no_kernel_context):
+    monkeypatch.setattr(settings.kernel, "pool_size", 2)
+    kernel_pool.KernelPoolInfo._reset()
+    modules = esm_vue._modules.copy()
+    esm_vue.define_module("kernel-pool-test-module", code="export default 1")
+    kernel_pool.start()
+    assert kernel_pool.pool is not None
+    try:
+        yield kernel_pool.pool
+    finally:
+        kernel_pool.stop()
+        esm_vue._modules.clear()
+        esm_vue._modules.update(modules)
+        for context in list(kernel_context.contexts.values()):
+            if context.id.startswith("kernel-pool-test"):
+                context.close()
+
+
+def _wait_ready(pool, count):
+    for _ in range(500):
+        if pool.ready >= count:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"only {pool.ready} kernels pre-warmed")
+
+
+def test_kernel_pool_handout_and_refill(pool):
+    started = []
+    cleanup = solara.lifecycle.on_kernel_start(lambda: started.append(kernel_context.get_current_context().id))
+    try:
+        _wait_ready(pool, 2)
+        # the callbacks wait for the handout, when the kernel has its id
+        assert started == []
+        ws = Mock()
+        context = kernel_context.initialize_virtual_kernel("kernel-pool-test-session", "kernel-pool-test-1", ws)
+        assert context.id == "kernel-pool-test-1" and context.session_id == "kernel-pool-test-session"
+        assert kernel_context.contexts["kernel-pool-test-1"] is context
+        assert started == ["kernel-pool-test-1"]
+        assert ws in context.kernel.session.websockets
+        _wait_ready(pool, 2)  # refilled in the background
+        info = kernel_pool.as_dict()
+        assert info["size"] == 2 and info["ready"] == 2
+        assert info["handouts"] == 1 and info["cold_starts"] == 0 and info["warmed"] == 3
+    finally:
+        cleanup()
+
+
+def test_kernel_pool_sends_module_widgets_on_app_load(pool):
+    _wait_ready(pool, 1)
+    ws = Mock()
+    context = kernel_context.initialize_virtual_kernel("kernel-pool-test-session", "kernel-pool-test-2", ws)
+    # the module widget exists, and is known under the new kernel id
+    module = esm_vue._modules_added_per_kernel["kernel-pool-test-2"]["kernel-pool-test-module"]
+    assert ws.send.call_count == 0
+    with context:
+        kernel_pool.send_prewarmed_frames(context)
+        assert esm_vue.create_modules()["kernel-pool-test-module"] is module
+    opened = [json.loads(call.args[0]) for call in ws.send.call_args_list]
+    assert [msg["content"]["comm_id"] for msg in opened if msg["msg_type"] == "comm_open"][-1] == module.model_id
+    assert context.prewarmed_frames is None
+    context.close()
+    assert "kernel-pool-test-2" not in esm_vue._modules_added_per_kernel
+
+
+def test_kernel_pool_cold_start_when_empty(monkeypatch, no_kernel_context):
+    kernel_pool.KernelPoolInfo._reset()
+    context = kernel_context.initialize_virtual_kernel("kernel-pool-test-session", "kernel-pool-test-3", Mock())
+    try:
+        assert context.prewarmed_frames is None
+        assert kernel_pool.as_dict()["cold_starts"] == 1
+        assert kernel_pool.as_dict()["handout_rate"] == 0
+    finally:
+        context.close()
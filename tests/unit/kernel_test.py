@@ -2,6 +2,7 @@ import json
 import logging
 import threading
 from datetime import datetime
+from typing import Any, Dict
 from unittest.mock import Mock
 
 import numpy as np
@@ -270,6 +271,39 @@ def test_page_connect_is_rejected_once_close_starts(no_kernel_context):
     assert not closer.is_alive()
 
 
+def test_contexts_indexes_follow_pages_and_close(no_kernel_context):
+    from solara.server import kernel as kernel_mod
+    from solara.server import kernel_context
+    from solara.server.kernel_context import PageStatus, VirtualKernelContext
+
+    contexts = kernel_context.contexts
+    first = VirtualKernelContext(id="index-1", kernel=kernel_mod.Kernel(), session_id="index-session")
+    second = VirtualKernelContext(id="index-2", kernel=kernel_mod.Kernel(), session_id="index-session")
+    contexts[first.id] = first
+    contexts[second.id] = second
+    try:
+        assert contexts.count_for_session("index-session") == 2
+        first.page_connect("a")
+        first.page_connect("b")
+        second.page_connect("c")
+        assert contexts.counts() == {"total": 2, "sessions": 1, "has_connected": 2, "has_disconnected": 0, "has_closed": 0}
+        first.page_disconnect("a")
+        second.page_disconnect("c")
+        assert contexts.counts()["has_connected"] == 1 and contexts.counts()["has_disconnected"] == 2
+        assert first._page_status.counts[PageStatus.CONNECTED] == 1
+        first.page_close("b")
+        assert contexts.counts()["has_connected"] == 0 and contexts.counts()["has_closed"] == 1
+        second.page_close("c")
+        # the last page closed the kernel, which leaves the indexes
+        assert second.closed_event.is_set()
+        assert contexts.counts() == {"total": 1, "sessions": 1, "has_connected": 0, "has_disconnected": 1, "has_closed": 1}
+        assert contexts.count_for_session("index-session") == 1
+    finally:
+        for context in list(contexts.values()):
+            context.close()
+    assert contexts.counts() == {"total": 0, "sessions": 0, "has_connected": 0, "has_disconnected": 0, "has_closed": 0}
+
+
 def test_restart_cleanup_failure_does_not_skip_cleanup_or_reinit(no_kernel_context, caplog):
     from solara.server import kernel as kernel_mod
     from solara.server.kernel_context import VirtualKernelContext
@@ -370,3 +404,242 @@ def test_comm_info_request_filters_on_target_name():
     finally:
         kernel.comm_manager.comms.clear()  # type: ignore
         kernel.close()
+
+
+def _batching_session(monkeypatch, **overrides):
+    from solara.server import kernel as kernel_mod, settings
+
+    monkeypatch.setattr(settings.kernel, "send_batching", True)
+    for name, value in overrides.items():
+        monkeypatch.setattr(settings.kernel, f"send_batch_{name}", value)
+    kernel_mod.SendBatchInfo._reset()
+
+    class Dummy:
+        pass
+
+    websocket = Mock()
+    stream = Dummy()
+    stream.channel = "iopub"  # type: ignore
+    session = SessionWebsocket()
+    session.websockets.add(websocket)
+    return session, stream, websocket
+
+
+def _unpack(frame):
+    from solara.server.kernel import BATCH_RECORD_SEPARATOR
+
+    if frame.startswith(BATCH_RECORD_SEPARATOR):
+        return [json.loads(part) for part in frame.split(BATCH_RECORD_SEPARATOR)[1:]]
+    return [json.loads(frame)]
+
+
+def test_send_batching_one_frame_per_handler(monkeypatch):
+    from solara.server.kernel import SendBatchInfo
+
+    session, stream, websocket = _batching_session(monkeypatch)
+    with session.batch():
+        with session.batch():  # nested blocks join the outer batch
+            for i in range(3):
+                session.send(stream, {"msg_type": "test", "content": {"i": i, "text": "a\x1eb\n"}})  # type: ignore
+        websocket.send.assert_not_called()
+    websocket.send.assert_called_once()
+    messages = _unpack(websocket.send.call_args[0][0])
+    assert [m["content"]["i"] for m in messages] == [0, 1, 2]
+    assert messages[0]["content"]["text"] == "a\x1eb\n"
+    info = SendBatchInfo.as_dict()
+    assert (info["frames"], info["messages"], info["batches"], info["batch_max_messages"]) == (1, 3, 1, 3)
+    # outside a batch block, a message is sent as a plain frame right away
+    session.send(stream, {"msg_type": "test", "content": {"i": 3}})  # type: ignore
+    assert websocket.send.call_args[0][0].startswith("{")
+
+
+def test_send_batching_keeps_order_around_binary_messages(monkeypatch):
+    session, stream, websocket = _batching_session(monkeypatch)
+    with session.batch():
+        session.send(stream, {"msg_type": "test", "content": {"i": 0}})  # type: ignore
+        session.send(stream, {"msg_type": "test", "content": {"i": 1}})  # type: ignore
+        session.send(stream, "test", content={"i": 2}, buffers=[b"data"])
+        session.send(stream, {"msg_type": "test", "content": {"i": 3}})  # type: ignore
+    frames = [call.args[0] for call in websocket.send.call_args_list]
+    # the pending batch goes out before the binary message, which is a frame of its own
+    assert len(frames) == 3
+    assert [m["content"]["i"] for m in _unpack(frames[0])] == [0, 1]
+    assert isinstance(frames[1], bytes)
+    assert [m["content"]["i"] for m in _unpack(frames[2])] == [3]
+
+
+def test_send_batching_flushes_at_max_messages(monkeypatch):
+    session, stream, websocket = _batching_session(monkeypatch, max_messages=2)
+    with session.batch():
+        for i in range(5):
+            session.send(stream, {"msg_type": "test", "content": {"i": i}})  # type: ignore
+        assert websocket.send.call_count == 2
+    assert [[m["content"]["i"] for m in _unpack(call.args[0])] for call in websocket.send.call_args_list] == [[0, 1], [2, 3], [4]]
+
+
+def test_send_batching_off_by_default():
+    class Dummy:
+        pass
+
+    websocket = Mock()
+    stream = Dummy()
+    stream.channel = "iopub"  # type: ignore
+    session = SessionWebsocket()
+    session.websockets.add(websocket)
+    with session.batch():
+        session.send(stream, {"msg_type": "test", "content": {}})  # type: ignore
+        websocket.send.assert_called_once()
+
+
+def test_binary_arrays_extract():
+    from solara.server.kernel import extract_array_buffers
+
+    big = np.arange(300, dtype=np.float64)
+    grid = np.arange(1600, dtype=">i4").reshape(40, 40)[:, ::2]  # big endian, not contiguous
+    state: Dict[str, Any] = {
+        "option": {"series": [{"data": big}, {"data": np.arange(3)}]},
+        "grid": grid,
+        "masked": np.ma.masked_array(np.arange(300), mask=True),
+    }
+    data, buffers = extract_array_buffers({"method": "update", "state": state, "buffer_paths": [["raw"]]}, [b"raw"])
+    assert data["buffer_paths"] == [["raw"], ["option", "series", 0, "data"], ["grid"]]
+    assert data["solara_buffer_arrays"] == [[1, "f8", [300]], [2, "i4", [40, 20]]]
+    assert np.frombuffer(buffers[1], dtype="<f8").tolist() == big.tolist()
+    assert np.frombuffer(buffers[2], dtype="<i4").reshape(40, 20).tolist() == grid.tolist()
+    # small arrays and array subclasses go out as lists, the rest of the state is left alone
+    assert data["state"]["option"]["series"] == [{}, {"data": [0, 1, 2]}]
+    assert "grid" not in data["state"]
+    assert data["state"]["masked"] == [None] * 300
+    # the widget's own values are not modified
+    assert state["option"]["series"][0]["data"] is big and state["grid"] is grid
+
+
+def test_binary_arrays_widget_state(kernel_context, monkeypatch):
+    from solara.components.echarts import EchartsWidget
+    from solara.server import kernel as kernel_mod, settings
+
+    monkeypatch.setattr(settings.kernel, "binary_arrays", True)
+    websocket = Mock()
+    kernel_context.kernel.session.websockets.add(websocket)
+    try:
+        values = np.linspace(0, 1, 1000)
+        widget = EchartsWidget(option={"series": [{"type": "line", "data": values}]})
+        msg = kernel_mod.deserialize_binary_message(websocket.send.call_args[0][0])
+        assert msg["msg_type"] == "comm_open"
+        data = msg["content"]["data"]
+        index, dtype, shape = data["solara_buffer_arrays"][0]
+        assert data["buffer_paths"][index] == ["option", "series", 0, "data"]
+        assert (dtype, shape) == ("f8", [1000])
+        assert np.frombuffer(msg["buffers"][index], dtype="<f8").tolist() == values.tolist()
+        assert data["state"]["option"]["series"] == [{"type": "line"}]
+
+        widget.option = {"series": [{"data": np.arange(2000, dtype=np.int32)}]}
+        msg = kernel_mod.deserialize_binary_message(websocket.send.call_args[0][0])
+        assert msg["content"]["data"]["method"] == "update"
+        assert msg["content"]["data"]["solara_buffer_arrays"] == [[0, "i4", [2000]]]
+        widget.close()
+    finally:
+        kernel_context.kernel.session.websockets.discard(websocket)
+
+
+def test_binary_arrays_off_by_default(kernel_context):
+    from solara.components.echarts import EchartsWidget
+
+    websocket = Mock()
+    kernel_context.kernel.session.websockets.add(websocket)
+    try:
+        widget = EchartsWidget(option={"series": [{"data": [1, 2, 3]}]})
+        frame = websocket.send.call_args[0][0]
+        assert isinstance(frame, str)
+        assert "solara_buffer_arrays" not in frame
+        widget.close()
+    finally:
+        kernel_context.kernel.session.websockets.discard(websocket)
+
+
+def _sent_messages(websocket):
+    return [json.loads(call.args[0]) for call in websocket.send.call_args_list]
+
+
+def _updates(messages):
+    return [
+        (m["content"]["comm_id"], m["content"]["data"]["state"])
+        for m in messages
+        if m["msg_type"] == "comm_msg" and m["content"]["data"].get("method") == "update"
+    ]
+
+
+def test_coalesce_updates_merges_by_trait(kernel_context, monkeypatch):
+    import ipywidgets
+
+    from solara.server import settings
+    from solara.server.kernel import UpdateCoalesceInfo
+
+    monkeypatch.setattr(settings.kernel, "coalesce_updates", True)
+    UpdateCoalesceInfo._reset()
+    session = kernel_context.kernel.session
+    slider = ipywidgets.IntSlider()
+    websocket = Mock()
+    session.websockets.add(websocket)
+    try:
+        with session.batch():
+            for i in range(1, 6):
+                slider.value = i
+            slider.max = 50
+            websocket.send.assert_not_called()
+        assert _updates(_sent_messages(websocket)) == [(slider.comm.comm_id, {"value": 5, "max": 50})]
+        assert UpdateCoalesceInfo.as_dict()["dropped"] == 5
+        assert UpdateCoalesceInfo.as_dict()["traits_overwritten"] == 4
+        # outside a batch block, updates go out right away
+        websocket.reset_mock()
+        slider.value = 6
+        slider.value = 7
+        assert [state for _, state in _updates(_sent_messages(websocket))] == [{"value": 6}, {"value": 7}]
+    finally:
+        session.websockets.discard(websocket)
+        slider.close()
+
+
+def test_coalesce_updates_keep_order_with_other_messages(kernel_context, monkeypatch):
+    import ipywidgets
+
+    from solara.server import settings
+
+    monkeypatch.setattr(settings.kernel, "coalesce_updates", True)
+    session = kernel_context.kernel.session
+    slider = ipywidgets.IntSlider()
+    websocket = Mock()
+    session.websockets.add(websocket)
+    try:
+        with session.batch():
+            slider.value = 1
+            box = ipywidgets.VBox()  # comm_open: the held update goes out first
+            slider.value = 2
+            slider.value = 3
+        messages = _sent_messages(websocket)
+        kinds = [(m["msg_type"], m["content"]["data"].get("state", {}).get("value")) for m in messages if m["msg_type"] in ("comm_open", "comm_msg")]
+        # the box (and its layout) opens between the first and the merged second update
+        assert kinds[0] == ("comm_msg", 1)
+        assert kinds[-1] == ("comm_msg", 3)
+        assert {kind for kind, _ in kinds[1:-1]} == {"comm_open"}
+        box.close()
+    finally:
+        session.websockets.discard(websocket)
+        slider.close()
+
+
+def test_coalesce_updates_off_by_default(kernel_context):
+    import ipywidgets
+
+    session = kernel_context.kernel.session
+    slider = ipywidgets.IntSlider()
+    websocket = Mock()
+    session.websockets.add(websocket)
+    try:
+        with session.batch():
+            slider.value = 1
+            slider.value = 2
+        assert [state for _, state in _updates(_sent_messages(websocket))] == [{"value": 1}, {"value": 2}]
+    finally:
+        session.websockets.discard(websocket)
+        slider.close()
@@ -1,6 +1,5 @@
 import asyncio
 import sys
-import threading
 import time
 from unittest.mock import Mock
 
@@ -119,38 +118,29 @@ async def test_kernel_lifecycle_close_single(close_first, short_cull_timeout):
 @pytest.mark.skipif(on_windows, reason="This test is flaky on Windows")
 @pytest.mark.parametrize("close_first", [True, False])
 async def test_kernel_lifecycle_close_while_disconnected(close_first, monkeypatch):
-    real_sleep = asyncio.sleep
-    cull_started = threading.Event()
-    release_cull = threading.Event()
-
-    async def controlled_cull_sleep(delay):
-        cull_started.set()
-        while not release_cull.is_set():
-            await real_sleep(0.01)
-
-    monkeypatch.setattr(asyncio, "sleep", controlled_cull_sleep)
+    cull_timeout = [3600.0]
+    monkeypatch.setattr(kernel_context.VirtualKernelContext, "_cull_timeout_seconds", lambda self: cull_timeout[0])
     # a reconnect should be possible within the reconnect window
     websocket = Mock()
     context = kernel_context.initialize_virtual_kernel(f"session-id-1-{close_first}", f"kernel-id-1-{close_first}", websocket)
     context.page_connect("page-id-1")
     cull_task_1 = context.page_disconnect("page-id-1")
-    assert cull_started.wait(timeout=5)
+    assert context._cull_entry is not None
     context.page_connect("page-id-2")
+    assert context._cull_entry is None
     with pytest.raises(asyncio.CancelledError):
         await cull_task_1
-    cull_started.clear()
+    cull_timeout[0] = 0.2
     if close_first:
         cull_task_2 = context.page_close("page-id-2")
-        assert cull_started.wait(timeout=5)
+        assert context._cull_entry is not None
         context.page_disconnect("page-id-2")
     else:
         context.page_disconnect("page-id-2")
-        assert cull_started.wait(timeout=5)
-        cull_started.clear()
+        assert context._cull_entry is not None
         cull_task_2 = context.page_close("page-id-2")
-        assert cull_started.wait(timeout=5)
+        assert context._cull_entry is not None
     assert cull_task_2 is not None
     assert not context.closed_event.is_set()
-    release_cull.set()
     await cull_task_2
     assert context.closed_event.is_set()
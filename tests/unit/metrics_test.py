@@ -0,0 +1,97 @@
+import time
+from unittest.mock import Mock
+
+import ipywidgets as widgets
+import pytest
+
+from solara.server import metrics, server, settings
+
+
+@pytest.fixture(autouse=True)
+def fresh_totals():
+    metrics._reset()
+    yield
+    metrics._reset()
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = metrics.Histogram()
+    for value in [0.0002] * 50 + [0.001] * 40 + [0.3] * 9 + [42.0]:
+        histogram.observe(value)
+    # a bound is inclusive, anything above the last bound goes in the extra bucket
+    assert histogram.counts[0] == 50 and histogram.counts[1] == 40 and histogram.counts[-1] == 1
+    assert histogram.quantile(0.5) == 0.0005
+    assert histogram.quantile(0.9) == 0.001
+    assert histogram.quantile(0.99) == 0.5
+    assert histogram.quantile(1.0) == 42.0
+    summary = histogram.as_dict()
+    assert summary["count"] == 100 and summary["max"] == 42.0
+    assert summary["sum"] == pytest.approx(0.0002 * 50 + 0.001 * 40 + 0.3 * 9 + 42)
+
+
+def test_message_type_labels():
+    def msg(msg_type, method=None):
+        content = {"comm_id": "x", "data": {"method": method}} if method else {}
+        return {"header": {"msg_type": msg_type}, "content": content}
+
+    assert metrics.message_type(msg("comm_msg", "update")) == "comm_msg/update"
+    assert metrics.message_type(msg("comm_msg", "custom")) == "comm_msg/custom"
+    assert metrics.message_type(msg("kernel_info_request")) == "kernel_info_request"
+    # the client picks these, so unknown values do not become new labels
+    assert metrics.message_type(msg("comm_msg", "x" * 100)) == "comm_msg/other"
+    assert metrics.message_type(msg("made_up_request")) == "other"
+    assert metrics.message_type({}) == "other"
+
+
+def test_record_message_per_kernel_and_totals(kernel_context):
+    ws = Mock()
+    session = kernel_context.kernel.session
+    session.websockets.add(ws)
+    msg = {"header": {"msg_type": "comm_msg"}, "content": {"data": {"method": "update"}}}
+    tally = metrics.tally
+    try:
+        send_before, opened_before, closed_before = tally.send_seconds, tally.widgets_opened, tally.widgets_closed
+        t0 = time.perf_counter()
+        button = widgets.Button()
+        button.close()
+        t3 = time.perf_counter()
+        server._record_message(kernel_context, msg, None, 0, send_before, opened_before, closed_before, t0 - 1, t0, t0, t0, t3)
+    finally:
+        session.websockets.discard(ws)
+    assert tally.send_seconds > send_before
+    data = kernel_context.message_metrics.as_dict()
+    assert data["messages"] == 1
+    # the button comes with a layout and a style widget
+    assert data["widgets_opened"] == 3 and data["widgets_closed"] == 1
+    assert list(data["phases"]) == list(metrics.PHASES)
+    assert data["phases"]["receive"]["p50"] == 1.0
+    assert data["phases"]["handler"]["sum"] + data["phases"]["send"]["sum"] == pytest.approx(t3 - t0, abs=1e-6)
+    assert set(data["by_type"]) == {"comm_msg/update"}
+    assert metrics.totals.as_dict(by_type=False)["messages"] == 1
+
+
+def test_prometheus_text():
+    metrics.record(None, "comm_msg/update", {"handler": 0.003, "send": 0.0001})
+    metrics.record(None, "comm_msg/update", {"handler": 20.0, "send": 0.0001}, renders=2)
+    text = metrics.prometheus_text()
+    assert "# TYPE solara_message_phase_seconds histogram" in text
+    assert 'solara_message_phase_seconds_bucket{phase="handler",msg_type="comm_msg/update",le="0.0025"} 0' in text
+    assert 'solara_message_phase_seconds_bucket{phase="handler",msg_type="comm_msg/update",le="0.005"} 1' in text
+    assert 'solara_message_phase_seconds_bucket{phase="handler",msg_type="comm_msg/update",le="10.0"} 1' in text
+    assert 'solara_message_phase_seconds_bucket{phase="handler",msg_type="comm_msg/update",le="+Inf"} 2' in text
+    assert 'solara_message_phase_seconds_count{phase="send",msg_type="comm_msg/update"} 2' in text
+    assert "solara_messages_total 2" in text
+    assert "solara_renders_total 2" in text
+
+
+def test_resourcez_message_metrics_redacts_kernel_ids(kernel_context, monkeypatch):
+    from solara.server.starlette import _message_metrics_info
+
+    kernel_context.message_metrics.record("comm_msg/update", {"handler": 0.01})
+    info = _message_metrics_info([kernel_context], full_detail=False, verbose=False)
+    assert info["enabled"] is settings.server.message_metrics
+    (kernel,) = info["kernels"].values()
+    assert kernel_context.id not in info["kernels"]
+    assert kernel["messages"] == 1 and "by_type" not in kernel
+    info = _message_metrics_info([kernel_context], full_detail=True, verbose=True)
+    assert info["kernels"][kernel_context.id]["by_type"]["comm_msg/update"]["handler"]["count"] == 1
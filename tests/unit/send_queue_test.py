@@ -0,0 +1,204 @@
+import asyncio
+import json
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from solara.server import websocket
+from solara.server.send_queue import SendQueue, SendQueueInfo, check_policy, coalesce_key
+
+
+class Client:
+    """A websocket whose writes can be paused, to play a slow client."""
+
+    def __init__(self):
+        self.frames = []
+        self.open = asyncio.Event()
+        self.open.set()
+        self.disconnected = False
+
+    async def send(self, data):
+        await self.open.wait()
+        if self.disconnected:
+            raise websocket.WebSocketDisconnect()
+        self.frames.append(data)
+
+
+def _queue(client, **kwargs):
+    kwargs.setdefault("max_messages", 100)
+    kwargs.setdefault("max_bytes", 1_000_000)
+    return SendQueue(client.send, asyncio.get_running_loop(), **kwargs)
+
+
+async def _in_thread(f, *args):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(f(*args)))
+    thread.start()
+    while thread.is_alive():
+        await asyncio.sleep(0.001)
+    return result
+
+
+async def _drained(queue, client, count):
+    for _ in range(1000):
+        if len(client.frames) >= count and queue.depth == 0:
+            return
+        await asyncio.sleep(0.001)
+    raise AssertionError(f"only {len(client.frames)} frames sent")
+
+
+def _update(comm_id, **state):
+    return {"msg_type": "comm_msg", "content": {"comm_id": comm_id, "data": {"method": "update", "state": state, "buffer_paths": []}}}
+
+
+def test_coalesce_key():
+    assert coalesce_key(_update("a", value=1)) == coalesce_key(_update("a", value=2)) == ("a", ("value",))
+    assert coalesce_key(_update("a", value=1, max=2)) == ("a", ("max", "value"))
+    echo = _update("a", value=1)
+    echo["content"]["data"]["method"] = "echo_update"
+    assert coalesce_key(echo) is None
+    binary = _update("a", value=None)
+    binary["content"]["data"]["buffer_paths"] = [["value"]]
+    assert coalesce_key(binary) is None
+    assert coalesce_key({"msg_type": "comm_open", "content": {"comm_id": "a", "data": {"state": {}}}}) is None
+    with pytest.raises(ValueError):
+        check_policy("drop")
+
+
+async def test_send_queue_in_order_from_threads():
+    client = Client()
+    queue = _queue(client)
+    task = asyncio.ensure_future(queue.run())
+    await _in_thread(lambda: [queue.put(f"m{i}") for i in range(50)])
+    queue.put(b"binary")
+    await _drained(queue, client, 51)
+    assert client.frames == [f"m{i}" for i in range(50)] + [b"binary"]
+    queue.close()
+    await asyncio.wait_for(task, 1)
+
+
+async def test_send_queue_coalesces_superseded_updates():
+    client = Client()
+    client.open.clear()
+    queue = _queue(client)
+    task = asyncio.ensure_future(queue.run())
+    queue.put("first")
+    await asyncio.sleep(0.01)  # "first" is being written, the rest queues up
+    queue.put("value=1", ("slider", ("value",)))
+    queue.put("open child")
+    queue.put("value=2", ("slider", ("value",)))
+    queue.put("max=10", ("slider", ("max",)))
+    queue.put("value=3", ("slider", ("value",)))
+    assert queue.coalesced == 2
+    client.open.set()
+    await _drained(queue, client, 4)
+    # the latest update goes out last, after everything it may refer to
+    assert client.frames == ["first", "open child", "max=10", "value=3"]
+    queue.close()
+    await asyncio.wait_for(task, 1)
+
+
+async def test_send_queue_block_policy_waits_for_the_client():
+    client = Client()
+    client.open.clear()
+    queue = _queue(client, max_messages=3, policy="block", block_timeout=5)
+    task = asyncio.ensure_future(queue.run())
+    producer_done = threading.Event()
+
+    def produce():
+        for i in range(6):
+            queue.put(f"m{i}")
+        producer_done.set()
+
+    thread = threading.Thread(target=produce)
+    thread.start()
+    await asyncio.sleep(0.05)
+    # the sender is held at the high-water mark while the client does not read
+    assert not producer_done.is_set()
+    assert queue.depth == 3
+    client.open.set()
+    while thread.is_alive():
+        await asyncio.sleep(0.001)
+    await _drained(queue, client, 6)
+    assert client.frames == [f"m{i}" for i in range(6)]
+    assert queue.blocked >= 1 and queue.blocked_seconds > 0.03
+    assert queue.max_depth <= 3
+    queue.close()
+    await asyncio.wait_for(task, 1)
+
+
+async def test_send_queue_block_timeout_disconnects():
+    SendQueueInfo._reset()
+    client = Client()
+    client.open.clear()
+    queue = _queue(client, max_messages=2, policy="block", block_timeout=0.05)
+    task = asyncio.ensure_future(queue.run())
+
+    def produce():
+        try:
+            for i in range(5):
+                queue.put(f"m{i}")
+        except websocket.WebSocketDisconnect:
+            return "disconnected"
+
+    assert await _in_thread(produce) == ["disconnected"]
+    assert queue.closed
+    with pytest.raises(websocket.WebSocketDisconnect):
+        queue.put("late")
+    # the write in progress ends when the server closes the connection
+    client.disconnected = True
+    client.open.set()
+    await asyncio.wait_for(task, 1)
+    assert SendQueueInfo.as_dict()["disconnects"] == 1
+
+
+async def test_send_queue_disconnect_and_drop_coalesce_policies():
+    client = Client()
+    client.open.clear()
+    queue = _queue(client, max_messages=2, policy="disconnect")
+    queue.put("m0")
+    queue.put("m1")
+    with pytest.raises(websocket.WebSocketDisconnect):
+        queue.put("m2")
+    assert queue.closed
+
+    queue = _queue(client, max_messages=2, policy="drop-coalesce")
+    start = time.monotonic()
+    for i in range(3):
+        queue.put(f"m{i}")
+    for i in range(10):
+        queue.put(f"value={i}", ("slider", ("value",)))  # superseded updates keep the depth down
+    assert queue.depth == 4
+    assert time.monotonic() - start < 0.5  # never waits
+    with pytest.raises(websocket.WebSocketDisconnect):
+        queue.put("m3")
+
+
+async def test_send_queue_stops_when_the_client_disconnects():
+    client = Client()
+    client.disconnected = True
+    queue = _queue(client)
+    task = asyncio.ensure_future(queue.run())
+    queue.put("m0")
+    await asyncio.wait_for(task, 1)
+    assert queue.closed
+    with pytest.raises(websocket.WebSocketDisconnect):
+        queue.put("m1")
+
+
+def test_session_passes_coalesce_key(kernel_context):
+    ws = Mock()
+    session = kernel_context.kernel.session
+    session.websockets.add(ws)
+    try:
+        msg = _update("comm-1", value=1)
+        session.send(kernel_context.kernel.iopub_socket, msg)
+        wire, key = ws.send.call_args[0]
+        assert json.loads(wire)["content"]["data"]["state"] == {"value": 1}
+        assert key == ("comm-1", ("value",))
+        session.send(kernel_context.kernel.iopub_socket, {"msg_type": "stream", "content": {"text": "hi"}})
+        assert len(ws.send.call_args[0]) == 1
+    finally:
+        session.websockets.discard(ws)
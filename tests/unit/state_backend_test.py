@@ -1,3 +1,4 @@
+import logging
 import os
 import threading
 
@@ -10,6 +11,7 @@ import redis
 import solara.server.settings
 import solara.state as state
 from solara.state import MemoryStateBackend
+from solara.state.sqlite import SQLiteStateBackend
 
 # session-HMACs and envelope contents are opaque bytes to the backend, so these tests use
 # plain byte literals rather than real signed envelopes.
@@ -18,25 +20,40 @@ SESSION_B = b"session-hmac-b"
 TTL = 60.0
 
 
-@pytest.fixture(params=["memory", "fakeredis", "redis"])
-def backend(request):
+@pytest.fixture(params=["memory", "sqlite", "fakeredis", "fakeredis-sharded", "redis"])
+def backend(request, tmp_path):
     """The shared four-verb contract, parametrized across every backend.
 
     - ``memory``: the in-process reference backend.
+    - ``sqlite``: the durable single-node backend on a WAL database file in ``tmp_path``.
     - ``fakeredis``: the real RedisStateBackend (Lua scripts and all) driven by an in-process
       fakeredis[lua] server, so the fenced Lua is exercised on every contract assertion.
+    - ``fakeredis-sharded``: the same over three fakeredis servers, kernels placed by the
+      consistent-hash ring (``SOLARA_STATE_REDIS_MODE=sharded``).
     - ``redis``: the same against a real server; opt-in via ``SOLARA_TEST_REDIS_URL`` (a throwaway
       db - the fixture ``flushdb()``s around each test), skipped otherwise so CI can enable it later.
     """
     if request.param == "memory":
         yield MemoryStateBackend()
         return
+    if request.param == "sqlite":
+        sqlite_backend = SQLiteStateBackend(str(tmp_path / "state.db"))
+        try:
+            yield sqlite_backend
+        finally:
+            sqlite_backend.close()
+        return
     if request.param == "fakeredis":
         from solara.state.redis import RedisStateBackend
 
         server = fakeredis.FakeServer()
         yield RedisStateBackend(client=fakeredis.FakeRedis(server=server))
         return
+    if request.param == "fakeredis-sharded":
+        from solara.state.redis import RedisStateBackend
+
+        yield RedisStateBackend(shards={f"node-{i}:6379/0": fakeredis.FakeRedis(server=fakeredis.FakeServer()) for i in range(3)})
+        return
     # real redis (opt-in): the same contract against a live server
     url = os.environ.get("SOLARA_TEST_REDIS_URL")
     if not url:
@@ -96,7 +113,7 @@ def test_claimed_key_refuses_foreign_session(backend):
 
 
 def test_claim_expires_with_ttl(backend):
-    if isinstance(backend, MemoryStateBackend):
+    if isinstance(backend, (MemoryStateBackend, SQLiteStateBackend)):
         now = [0.0]
         backend._clock = lambda: now[0]
         backend.takeover("k", SESSION_A, "v1")
@@ -109,7 +126,7 @@ def test_claim_expires_with_ttl(backend):
     else:
         # redis: the claim must have set an EXPIRE (abandoned claims may not live forever)
         backend.takeover("k", SESSION_A, "v1")
-        ttl = backend.client.ttl(backend._key("k"))
+        ttl = backend._shard("k").client.ttl(backend._key("k"))
         assert ttl > 0
 
 
@@ -214,6 +231,48 @@ def test_flush_refuses_to_resurrect_missing_key_at_stale_generation(backend):
     assert backend.takeover("k", SESSION_A, "v1").fields == {"reactive:x": b"fresh"}
 
 
+def test_flush_many_is_fenced_per_request(backend):
+    from solara.state import FlushRequest
+
+    backend.takeover("stale", SESSION_A, "v1")
+    backend.takeover("stale", SESSION_A, "v1")  # generation 2: a generation-1 write is stale
+    results = backend.flush_many(
+        [
+            FlushRequest("fresh", 1, {"reactive:x": b"e1"}, TTL, SESSION_A, "v1"),
+            FlushRequest("stale", 1, {"reactive:x": b"lost"}, TTL, SESSION_A, "v1"),
+            FlushRequest("zero", 0, {"reactive:x": b"never"}, TTL, SESSION_A, "v1"),
+        ]
+    )
+    assert results == [True, False, False]
+    assert backend.takeover("fresh", SESSION_A, "v1").fields == {"reactive:x": b"e1"}
+    assert backend.takeover("stale", SESSION_A, "v1").fields == {}
+    assert backend.peek_generation("zero") is None
+    assert backend.flush_many([]) == []
+
+
+async def test_async_verbs_follow_the_same_contract(backend):
+    # every backend can be awaited: the default *_async verbs run the blocking verb on an executor
+    from solara.state import FlushRequest
+
+    result = await backend.takeover_async("k", SESSION_A, "v1")
+    assert (result.reason, result.generation) == ("miss", 1)
+    assert await backend.flush_async("k", 1, {"reactive:x": b"e1"}, TTL, SESSION_A, "v1") is True
+    results = await backend.flush_many_async(
+        [
+            FlushRequest("k", 1, {"reactive:y": b"e2"}, TTL, SESSION_A, "v1"),
+            FlushRequest("k", 7, {"reactive:y": b"stale"}, TTL, SESSION_A, "v1"),
+        ]
+    )
+    assert results == [True, False]
+    result = await backend.takeover_async("k", [SESSION_A], "v1")
+    assert (result.reason, result.generation) == ("restored", 2)
+    assert result.fields == {"reactive:x": b"e1", "reactive:y": b"e2"}
+    assert await backend.peek_generation_async("k") == 2
+    assert await backend.delete_async("k", 1) is False
+    assert await backend.delete_async("k", 2) is True
+    assert await backend.peek_generation_async("k") is None
+
+
 def test_fenced_delete(backend):
     backend.flush("k", 1, {"reactive:x": b"e1"}, TTL, SESSION_A, "v1")
     assert backend.delete("k", 2) is False  # wrong generation
@@ -235,10 +294,10 @@ def test_unfenced_delete(backend):
 
 
 def test_ttl_expiry_via_monkeypatched_clock(backend):
-    if not isinstance(backend, MemoryStateBackend):
-        # redis has its own clock; clock injection is memory-only. Redis TTL (EXPIRE set on
-        # create, refreshed on flush and takeover) is covered in state_redis_test.py.
-        pytest.skip("clock injection is memory-only; redis TTL is covered in state_redis_test.py")
+    if not isinstance(backend, (MemoryStateBackend, SQLiteStateBackend)):
+        # redis has its own clock; clock injection is memory/sqlite-only. Redis TTL (EXPIRE set
+        # on create, refreshed on flush and takeover) is covered in state_redis_test.py.
+        pytest.skip("clock injection is memory/sqlite-only; redis TTL is covered in state_redis_test.py")
     now = [0.0]
     backend._clock = lambda: now[0]
     backend.flush("k", 1, {"reactive:x": b"e1"}, 10.0, SESSION_A, "v1")
@@ -346,3 +405,14 @@ def test_validate_state_settings_pickle_gate_needs_real_secret(monkeypatch):
     monkeypatch.setattr(solara.server.settings.state, "allow_pickle", True)
     with pytest.raises(ValueError):
         state.validate_state_settings()
+
+
+def test_validate_state_settings_flush_pacing(monkeypatch, caplog):
+    caplog.set_level(logging.WARNING, logger="solara.state")
+    monkeypatch.setattr(solara.server.settings.state, "flush_debounce", "10s")
+    # below the debounce: the worker raises it to the debounce, so this only warns
+    state.validate_state_settings()
+    assert "SOLARA_STATE_FLUSH_MAX_DELAY=5s" in caplog.text
+    monkeypatch.setattr(solara.server.settings.state, "flush_min_interval", "soon")
+    with pytest.raises(ValueError, match="FLUSH_MIN_INTERVAL"):
+        state.validate_state_settings()
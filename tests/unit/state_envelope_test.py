@@ -450,3 +450,164 @@ def test_untyped_dataclass_field_reconstructs_models_unlike_pydantic():
 
     result = roundtrip(Box(items=[User(name="a")]))
     assert type(result.items[0]) is User
+
+
+# --- the built-in binary codec ------------------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        None,
+        True,
+        0,
+        -1,
+        -33,
+        255,
+        -(2**63),
+        2**64 - 1,
+        2**80,
+        -(2**80),
+        -3.14,
+        "hello",
+        "x" * 300,
+        [1, 2, "three"],
+        list(range(70000)),
+        {"a": 1, "b": [2, 3]},
+        {f"k{i}": i for i in range(20)},
+        datetime.datetime(2020, 1, 2, 3, 4, 5, 678),
+        datetime.date(2021, 5, 6),
+        datetime.time(1, 2, 3),
+        Color.RED,
+        Size.LARGE,
+        uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        decimal.Decimal("1.500"),
+        {1, 2, 3},
+        frozenset([4, 5, 6]),
+        b"raw bytes \x00\x01" * 100,
+    ],
+)
+def test_binary_roundtrip(value):
+    result = roundtrip(value, codec="binary")
+    assert result == value
+    assert type(result) is type(value)
+
+
+def test_binary_matches_json_fidelity():
+    team = Team(lead=User(name="ada"), members=[User(name="bob", color=Color.BLUE)])
+    path = Path(label="route", points=[Point(1, 2), Point(3, 4)])
+    value = {"team": team, "path": path, "pair": (1, 2), "when": datetime.datetime(2020, 1, 1)}
+    assert roundtrip(value, codec="binary") == roundtrip(value, codec="json")
+    assert roundtrip(path, codec="binary").length == 2
+    with pytest.raises(SerializeError, match="dict keys must be str"):
+        state.encode({1: "a"}, codec="binary", kernel_id="k", field_name="f")
+    with pytest.raises(SerializeError, match="cannot serialize object of type"):
+        state.encode(object(), codec="binary", kernel_id="k", field_name="f")
+
+
+def test_binary_numpy_arrays_as_raw_buffers():
+    numpy = pytest.importorskip("numpy")
+    array = numpy.arange(12, dtype=numpy.float32).reshape(3, 4)[:, ::2]  # non-contiguous
+    result = roundtrip(array, codec="binary")
+    assert result.dtype == array.dtype and result.shape == array.shape
+    assert (result == array).all()
+    result[0, 0] = 42  # restored arrays are writable
+    blob = state.encode(numpy.zeros(1000), codec="binary", kernel_id="k", field_name="f")
+    assert len(blob) < 8100  # raw float64 buffer, no text
+    assert roundtrip(numpy.int64(7), codec="binary") == 7
+    with pytest.raises(SerializeError, match="object/structured dtype"):
+        state.encode(numpy.array([object()]), codec="binary", kernel_id="k", field_name="f")
+
+
+def test_binary_decode_enforces_allow_list_and_gates():
+    from solara.state.binary import _EXT_DATACLASS, _EXT_ENUM, _binary_dumps, _binary_loads, _write_ext
+    from solara.state.envelope import _allowed_decode_types, _class_tag
+
+    blob = _binary_dumps(Color.RED)
+    try:
+        state.allow_decode_types("some.other:Type")
+        with pytest.raises(CodecError, match="not in the state decode allow-list"):
+            _binary_loads(blob)
+        state.allow_decode_types(_class_tag(Color.RED))
+        assert _binary_loads(blob) is Color.RED
+    finally:
+        _allowed_decode_types.clear()
+    forged = bytearray()
+    _write_ext(forged, _EXT_ENUM, _binary_dumps(["os:system", "echo pwned"]))
+    with pytest.raises(CodecError, match="not an enum.Enum subclass"):
+        _binary_loads(bytes(forged))
+    forged = bytearray()
+    _write_ext(forged, _EXT_DATACLASS, _binary_dumps(["builtins:dict", {}]))
+    with pytest.raises(CodecError, match="not a dataclass"):
+        _binary_loads(bytes(forged))
+    with pytest.raises(CodecError):
+        _binary_loads(blob[:-1])
+
+
+def test_codec_stats_per_codec():
+    from solara.state import stats
+
+    stats()._reset()
+    roundtrip([i / 3 for i in range(100)], codec="json")
+    roundtrip([i / 3 for i in range(100)], codec="binary")
+    codecs = stats().as_dict()["codecs"]
+    assert codecs["json"]["encodes"] == 1 and codecs["json"]["decodes"] == 1
+    assert codecs["binary"]["encode_bytes"] < codecs["json"]["encode_bytes"]
+    assert codecs["binary"]["decode_bytes"] == codecs["binary"]["encode_bytes"]
+
+
+# --- envelope format v2: compression ------------------------------------------------------
+
+
+def test_compression_writes_v2_and_v1_keeps_decoding(monkeypatch):
+    from solara.state import stats
+
+    value = {"rows": ["the same row again"] * 1000}
+    v1 = state.encode(value, kernel_id="k", field_name="f")
+    assert v1[0] == 1
+    monkeypatch.setattr(solara.server.settings.state, "compression", "zlib")
+    monkeypatch.setattr(solara.server.settings.state, "compress_min_bytes", 1024)
+    stats()._reset()
+    v2 = state.encode(value, kernel_id="k", field_name="f")
+    assert v2[0] == 2
+    assert len(v2) < len(v1) / 10
+    assert state.decode(v2, kernel_id="k", field_name="f") == value
+    # version-1 envelopes still decode with compression on, and v2 with it off again
+    assert state.decode(v1, kernel_id="k", field_name="f") == value
+    block = stats().as_dict()
+    assert block["compression_envelopes"] == 1
+    assert block["compression_bytes_compressed"] < block["compression_bytes_uncompressed"]
+    # below the threshold: v2 with compression "none"
+    small = state.encode("tiny", kernel_id="k", field_name="f")
+    assert small[0] == 2 and b"none" in small
+    assert state.decode(small, kernel_id="k", field_name="f") == "tiny"
+    monkeypatch.setattr(solara.server.settings.state, "compression", "")
+    assert state.decode(v2, kernel_id="k", field_name="f") == value
+
+
+def test_compression_choice_is_signed(monkeypatch):
+    monkeypatch.setattr(solara.server.settings.state, "compression", "zlib")
+    monkeypatch.setattr(solara.server.settings.state, "compress_min_bytes", 0)
+    blob = state.encode("x" * 5000, kernel_id="k", field_name="f")
+    # claim the stored payload is uncompressed: the header is covered by the MAC
+    tampered = blob.replace(b"\x00\x00\x00\x04zlib", b"\x00\x00\x00\x04none", 1)
+    assert tampered != blob
+    with pytest.raises(HmacError):
+        state.decode(tampered, kernel_id="k", field_name="f")
+    with pytest.raises(EnvelopeError):
+        state.decode(bytes([3]) + blob[1:], kernel_id="k", field_name="f")
+
+
+def test_zstd_compression(monkeypatch):
+    pytest.importorskip("zstandard")
+    monkeypatch.setattr(solara.server.settings.state, "compression", "zstd")
+    blob = state.encode(list(range(10000)), kernel_id="k", field_name="f")
+    assert b"zstd" in blob[:64]
+    assert state.decode(blob, kernel_id="k", field_name="f") == list(range(10000))
+
+
+def test_check_compression():
+    state.check_compression("")
+    state.check_compression("zlib")
+    with pytest.raises(ValueError, match="Unknown SOLARA_STATE_COMPRESSION"):
+        state.check_compression("lz4")
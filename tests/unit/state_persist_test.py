@@ -15,7 +15,7 @@ import sys
 import textwrap
 import threading
 import unittest.mock
-from typing import Any
+from typing import Any, List
 
 import pytest
 
@@ -247,6 +247,88 @@ def test_bailout_all_or_nothing():
     assert backend.peek_generation(kernel_id) is None
 
 
+def test_restore_verifies_eagerly_decodes_lazily(caplog):
+    from solara.state import stats
+
+    stats()._reset()
+    key1 = "test.lazy.one"
+    key2 = "test.lazy.two"
+    r1 = solara.reactive(10, persist=True, key=key1)
+    r2 = solara.reactive(20, persist=True, key=key2)
+    kernel_id = "lazy-kernel"
+    field1 = persist.FIELD_PREFIX + key1
+    field2 = persist.FIELD_PREFIX + key2
+    envelopes = {
+        field1: encode(11, kernel_id=kernel_id, field_name=field1),
+        field2: encode(22, kernel_id=kernel_id, field_name=field2),
+    }
+    context = make_context(kernel_id)
+    with caplog.at_level("DEBUG", logger="solara.state"):
+        manager = fresh_manager(context, MemoryStateBackend(), envelopes=envelopes, generation=1)
+        assert manager.n_restored == 2
+        assert stats().as_dict()["restore_decodes"] == 0
+        assert "restore result=success kernel=lazy-kernel verify_ms=" in caplog.text
+        with context:
+            assert r1.value == 11
+        # only the key that was read got decoded
+        assert stats().as_dict()["restore_decodes"] == 1
+        assert set(manager.restored) == {key2}
+        assert "result=decoded" not in caplog.text
+        with context:
+            assert r2.value == 22
+    assert stats().as_dict()["restore_decodes"] == 2
+    assert manager.restored == {}
+    assert "restore result=decoded kernel=lazy-kernel decode_ms=" in caplog.text
+    assert manager.last_restore["status"] == "success"
+
+
+def test_restore_late_decode_failure_bails_out():
+    from solara.state import register_codec
+    from solara.state.envelope import _CODECS, CodecError
+
+    def broken_loads(blob: bytes):
+        raise CodecError("cannot decode")
+
+    register_codec("test-broken", lambda value: b"x", broken_loads)
+    try:
+        key1 = "test.late.one"
+        key2 = "test.late.two"
+        r1 = solara.reactive(10, persist=True, key=key1)
+        r2 = solara.reactive(20, persist=True, key=key2)
+        backend = MemoryStateBackend()
+        kernel_id = "late-kernel"
+        shmac = session_hmac(SESSION_ID)
+        field1 = persist.FIELD_PREFIX + key1
+        field2 = persist.FIELD_PREFIX + key2
+        fields = {
+            field1: encode(11, codec="test-broken", kernel_id=kernel_id, field_name=field1),
+            field2: encode(22, kernel_id=kernel_id, field_name=field2),
+        }
+        assert backend.flush(kernel_id, 1, fields, 60.0, shmac, SCHEMA_TAG)
+        result = backend.takeover(kernel_id, [shmac], SCHEMA_TAG)
+        context = make_context(kernel_id)
+        manager = fresh_manager(context, backend, envelopes=dict(result.fields), generation=result.generation)
+        # the envelopes verify, so the bail-out only happens when the key is decoded
+        assert not manager.recovery_failed
+        with context:
+            assert r1.value == 10
+            # every key not read yet falls back to its default as well
+            assert r2.value == 20
+        assert manager.recovery_failed
+        assert manager.failed_key == key1
+        assert manager.cause == "codec"
+        assert manager.disabled
+        assert manager.last_restore["status"] == "bailout"
+        # the poisoned hash is deleted off the init lock
+        for _ in range(100):
+            if backend.peek_generation(kernel_id) is None:
+                break
+            threading.Event().wait(0.01)
+        assert backend.peek_generation(kernel_id) is None
+    finally:
+        _CODECS.pop("test-broken", None)
+
+
 # --- dirty-tracking -----------------------------------------------------------------------
 
 
@@ -476,3 +558,194 @@ def test_none_default_pydantic_model_full_failover_loop():
         restored = r.value
     assert isinstance(restored, Profile)
     assert restored == Profile(name="ada", age=36)
+
+
+# --- delta (chunked) mode -----------------------------------------------------------------
+
+
+def _recording_flush(backend, written):
+    flush = backend.flush
+
+    def record(kernel_id, generation, fields, *args):
+        written.append(dict(fields))
+        return flush(kernel_id, generation, fields, *args)
+
+    return unittest.mock.patch.object(backend, "flush", side_effect=record)
+
+
+def test_delta_rewrites_only_changed_chunks_and_restores(monkeypatch):
+    monkeypatch.setattr(solara.server.settings.state, "delta_chunk_items", 4)
+    key = "test.delta.list"
+    r: solara.Reactive[Any] = solara.reactive([], persist=solara.PersistConfig(key=key, delta=True))
+    backend = MemoryStateBackend()
+    context_a = make_context("delta-kernel")
+    manager_a = fresh_manager(context_a, backend)
+    written: list = []
+    with _recording_flush(backend, written):
+        with context_a:
+            r.value = [{"row": i} for i in range(10)]
+        assert manager_a.flush_now() == FlushOutcome.OK
+        # manifest + 3 chunks
+        assert sorted(written[-1]) == [
+            f"reactive-chunk:{key}#0",
+            f"reactive-chunk:{key}#1",
+            f"reactive-chunk:{key}#2",
+            persist.FIELD_PREFIX + key,
+        ]
+        # an append only touches the last chunk (and the manifest)
+        with context_a:
+            r.value = [*r.value, {"row": 10}]
+        assert manager_a.flush_now() == FlushOutcome.OK
+        assert sorted(written[-1]) == [f"reactive-chunk:{key}#2", persist.FIELD_PREFIX + key]
+        # an equal-but-differently-typed element is a change (digests, not ==)
+        with context_a:
+            r.value = [{"row": True}, *r.value[1:]]
+        assert manager_a.flush_now() == FlushOutcome.OK
+        assert sorted(written[-1]) == [f"reactive-chunk:{key}#0", persist.FIELD_PREFIX + key]
+
+    context_b = make_context("delta-kernel")
+    manager_b = fresh_manager(context_b, backend)
+    assert not manager_b.recovery_failed
+    with context_b:
+        assert r.value == [{"row": True}] + [{"row": i} for i in range(1, 11)]
+        assert r.value[0]["row"] is True
+    # the restore seeded the digests: B's first flush is a delta too, and a shrink blanks chunks
+    written.clear()
+    with _recording_flush(backend, written):
+        with context_b:
+            r.value = r.value[:3]
+        assert manager_b.flush_now() == FlushOutcome.OK
+    assert written[-1][f"reactive-chunk:{key}#1"] == b""
+    assert written[-1][f"reactive-chunk:{key}#2"] == b""
+    assert f"reactive-chunk:{key}#0" in written[-1]
+
+    context_c = make_context("delta-kernel")
+    fresh_manager(context_c, backend)
+    with context_c:
+        assert r.value == [{"row": True}, {"row": 1}, {"row": 2}]
+
+
+def test_delta_dict_and_dataframe_roundtrip(monkeypatch):
+    pandas = pytest.importorskip("pandas")
+    monkeypatch.setattr(solara.server.settings.state, "allow_pickle", True)
+    monkeypatch.setattr(solara.server.settings.state, "delta_chunk_items", 2)
+    r_dict: solara.Reactive[Any] = solara.reactive({}, persist=solara.PersistConfig(key="test.delta.dict", delta=True))
+    r_df: solara.Reactive[Any] = solara.reactive(None, persist=solara.PersistConfig(key="test.delta.df", serializer="pickle", delta=True))
+    backend = MemoryStateBackend()
+    context_a = make_context("delta-kernel-2")
+    manager_a = fresh_manager(context_a, backend)
+    df = pandas.DataFrame({"x": range(5), "y": list("abcde")})
+    with context_a:
+        r_dict.value = {f"k{i}": i for i in range(5)}
+        r_df.value = df
+    assert manager_a.flush_now() == FlushOutcome.OK
+
+    context_b = make_context("delta-kernel-2")
+    assert not fresh_manager(context_b, backend).recovery_failed
+    with context_b:
+        assert list(r_dict.value.items()) == [(f"k{i}", i) for i in range(5)]
+        pandas.testing.assert_frame_equal(r_df.value, df)
+
+
+def test_delta_mixed_chunks_bail_out(monkeypatch):
+    monkeypatch.setattr(solara.server.settings.state, "delta_chunk_items", 2)
+    key = "test.delta.mixed"
+    r: solara.Reactive[Any] = solara.reactive([], persist=solara.PersistConfig(key=key, delta=True))
+    backend = MemoryStateBackend()
+    context_a = make_context("delta-kernel-3")
+    manager_a = fresh_manager(context_a, backend)
+    with context_a:
+        r.value = [1, 2, 3, 4]
+    assert manager_a.flush_now() == FlushOutcome.OK
+    old_chunk = backend.takeover(context_a.id, [session_hmac(SESSION_ID)], SCHEMA_TAG).fields[f"reactive-chunk:{key}#1"]
+    generation = backend.peek_generation(context_a.id)
+    assert generation is not None
+    manager_a.generation = generation
+    with context_a:
+        r.value = [1, 2, 3, 5]
+    assert manager_a.flush_now() == FlushOutcome.OK
+
+    # a validly signed chunk of an older write does not match the manifest digest
+    result = backend.takeover(context_a.id, [session_hmac(SESSION_ID)], SCHEMA_TAG)
+    envelopes = dict(result.fields)
+    envelopes[f"reactive-chunk:{key}#1"] = old_chunk
+    manager = fresh_manager(make_context("delta-kernel-3"), backend, envelopes=envelopes, generation=result.generation)
+    assert manager.recovery_failed
+    assert manager.failed_key == key
+    assert manager.cause == "codec"
+
+
+# --- flush snapshots ----------------------------------------------------------------------
+
+
+@dataclasses.dataclass(frozen=True)
+class FrozenPoint:
+    x: int
+    y: int
+
+
+class Bag:
+    def __init__(self, items):
+        self.items = items
+
+
+def test_snapshot_strategies(monkeypatch):
+    from solara.state import snapshot, stats
+
+    monkeypatch.setattr(solara.server.settings.state, "allow_pickle", True)
+    monkeypatch.setattr(snapshot, "_hooks", {})
+    hooked: List[Bag] = []
+
+    def snapshot_bag(bag: Bag) -> Bag:
+        hooked.append(bag)
+        return Bag(list(bag.items))
+
+    solara.state.register_snapshot(Bag, snapshot_bag)
+    r_frozen: solara.Reactive[Any] = solara.reactive(None, persist=True, key="test.snap.frozen")
+    r_shallow: solara.Reactive[Any] = solara.reactive([], persist=True, key="test.snap.shallow")
+    r_nested: solara.Reactive[Any] = solara.reactive([], persist=True, key="test.snap.nested")
+    r_hook: solara.Reactive[Any] = solara.reactive(None, persist=solara.PersistConfig(key="test.snap.hook", serializer="pickle"))
+    backend = MemoryStateBackend()
+    context = make_context("snapshot-kernel")
+    manager = fresh_manager(context, backend)
+    stats()._reset()
+    with context:
+        r_frozen.value = (FrozenPoint(1, 2), "a")
+        r_shallow.value = [1, "two", 3.0]
+        r_nested.value = [{"a": 1}]
+        r_hook.value = Bag([1, 2])
+    assert manager.flush_now() == FlushOutcome.OK
+    assert len(hooked) == 1
+    block = stats().as_dict()
+    assert block["snapshot_strategies"] == {"immutable": 1, "shallow": 1, "copy": 1, "hook": 1}
+    assert block["snapshot_count"] == 4
+    assert block["snapshot_lock_max_seconds"] >= 0
+
+    # serializing under the lock writes the same bytes as deep-copy-then-serialize
+    monkeypatch.setattr(solara.server.settings.state, "snapshot_mode", "encode")
+    with context:
+        r_nested.value = [{"a": 2}]
+    assert manager.flush_now() == FlushOutcome.OK
+    assert stats().as_dict()["snapshot_strategies"]["encode"] == 1
+    context_b = make_context("snapshot-kernel")
+    fresh_manager(context_b, backend)
+    with context_b:
+        assert r_nested.value == [{"a": 2}]
+        assert r_frozen.value == [FrozenPoint(1, 2), "a"]  # the json codec's tuple -> list
+        assert r_hook.value.items == [1, 2]
+
+
+def test_snapshot_cost_model():
+    from solara.state.snapshot import CostModel
+
+    costs = CostModel(reprobe=2)
+    assert not costs.encode_under_lock("k")
+    costs.record_copy("k", copy_seconds=0.5, encode_seconds=0.1)
+    assert costs.encode_under_lock("k")
+    costs.record_encode("k", 0.1)
+    assert costs.encode_under_lock("k")
+    costs.record_encode("k", 0.1)
+    # every reprobe-th flush re-measures the copy
+    assert not costs.encode_under_lock("k")
+    costs.record_copy("k", copy_seconds=0.1, encode_seconds=0.5)
+    assert not costs.encode_under_lock("k")
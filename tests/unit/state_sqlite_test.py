@@ -0,0 +1,94 @@
+"""SQLite-backend-specific tests.
+
+The shared four-verb contract runs against SQLiteStateBackend in state_backend_test.py's
+parametrized suite. This file adds what only makes sense for a file-backed backend: durability
+across a reopen, two instances (i.e. two server processes) fencing each other through one file,
+the bulk purge of expired kernels, and configuration via ``SOLARA_STATE_URL``.
+"""
+
+import sqlite3
+
+import pytest
+
+import solara.server.settings
+import solara.state as state
+from solara.state import FlushRequest
+from solara.state.sqlite import SQLiteStateBackend
+
+SESSION_A = b"session-hmac-a"
+TTL = 60.0
+
+
+def test_state_survives_reopen(tmp_path):
+    path = str(tmp_path / "state.db")
+    backend = SQLiteStateBackend(path)
+    assert backend.takeover("k", SESSION_A, "v1").reason == "miss"
+    assert backend.flush("k", 1, {"reactive:x": b"\x00e1\xff"}, TTL, SESSION_A, "v1") is True
+    backend.close()
+
+    # a restarted server opens the same file and restores byte-exact
+    reopened = SQLiteStateBackend(path)
+    try:
+        result = reopened.takeover("k", SESSION_A, "v1")
+        assert (result.reason, result.generation) == ("restored", 2)
+        assert result.fields == {"reactive:x": b"\x00e1\xff"}
+    finally:
+        reopened.close()
+
+
+def test_two_instances_fence_through_the_file(tmp_path):
+    path = str(tmp_path / "state.db")
+    a, b = SQLiteStateBackend(path), SQLiteStateBackend(path)
+    try:
+        assert a.takeover("k", SESSION_A, "v1").generation == 1
+        assert b.takeover("k", SESSION_A, "v1").generation == 2
+        assert a.peek_generation("k") == 2
+        # the superseded instance's late write is fenced out, the new owner's goes through
+        assert a.flush("k", 1, {"reactive:x": b"stale"}, TTL, SESSION_A, "v1") is False
+        assert b.flush("k", 2, {"reactive:x": b"fresh"}, TTL, SESSION_A, "v1") is True
+    finally:
+        a.close()
+        b.close()
+
+
+def test_flush_many_writes_the_batch_and_purges_expired(tmp_path):
+    now = [1000.0]
+    backend = SQLiteStateBackend(str(tmp_path / "state.db"), clock=lambda: now[0])
+    try:
+        backend.flush("old", 1, {"reactive:x": b"e"}, 10.0, SESSION_A, "v1")
+        now[0] += 3600.0
+        requests = [FlushRequest(f"k{i}", 1, {"reactive:x": b"e"}, TTL, SESSION_A, "v1") for i in range(100)]
+        assert backend.flush_many(requests) == [True] * 100
+        # the expired kernel and its fields are gone from the file, not just hidden
+        conn = sqlite3.connect(backend.path)
+        keys = {key for (key,) in conn.execute("SELECT key FROM solara_state_kernels")}
+        assert backend._key("old") not in keys
+        assert len(keys) == 100
+        assert conn.execute("SELECT COUNT(*) FROM solara_state_fields WHERE key = ?", (backend._key("old"),)).fetchone()[0] == 0
+        conn.close()
+    finally:
+        backend.close()
+
+
+def test_get_backend_from_url(monkeypatch, tmp_path):
+    path = tmp_path / "sub" / "state.db"
+    monkeypatch.setattr(solara.server.settings.state, "backend", "sqlite")
+    monkeypatch.setattr(solara.server.settings.state, "url", f"sqlite:///{path}")
+    state.reset_backend()
+    try:
+        backend = state.get_backend()
+        assert isinstance(backend, SQLiteStateBackend)
+        assert backend.path == str(path)
+        assert path.exists()
+        backend.close()
+    finally:
+        state.reset_backend()
+
+
+def test_missing_url_raises(monkeypatch):
+    monkeypatch.setattr(solara.server.settings.state, "url", "")
+    with pytest.raises(ValueError, match="SOLARA_STATE_URL"):
+        SQLiteStateBackend()
+    monkeypatch.setattr(solara.server.settings.state, "url", "sqlite://")
+    with pytest.raises(ValueError, match="has no path"):
+        SQLiteStateBackend()
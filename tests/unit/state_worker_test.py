@@ -18,7 +18,7 @@ import solara
 import solara.server.settings
 import solara.server.kernel_context as kernel_context
 from solara.server import kernel
-from solara.state import CircuitBreaker, FlushOutcome, KernelFlushWorker, MemoryStateBackend, decode, session_hmac, stats
+from solara.state import CircuitBreaker, FlushOutcome, FlushScheduler, KernelFlushWorker, MemoryStateBackend, decode, session_hmac, stats
 from solara.state import persist
 
 SCHEMA_TAG = "schema-1"
@@ -417,6 +417,200 @@ def test_close_flushes_pending_dirty_keys(worker_factory):
     assert context.state_persistence is None
 
 
+# --- flush pacing ---------------------------------------------------------------------------
+
+
+def test_pacing_min_interval_backoff_and_max_delay(worker_factory):
+    backend = MemoryStateBackend()
+    manager = attach_manager(make_context("pacing-kernel"), backend)
+    worker = worker_factory(manager, debounce=0.01, min_interval=1.0, max_delay=5.0)
+    # the first flush only waits for the debounce
+    assert worker._delay() == pytest.approx(0.01)
+    # right after a flush, the next one waits out min_interval
+    worker._last_flush = time.monotonic()
+    assert 0.9 < worker._delay() <= 1.0
+    # a slow backend stretches the interval (4x the smoothed latency)...
+    worker._observe_latency(0.5)
+    assert 1.9 < worker._delay() <= 2.0
+    assert stats().flush_backoffs == 1
+    # more marks before that flush do not count it again; the next delayed flush does
+    worker._delay()
+    assert stats().flush_backoffs == 1
+    worker._start_flush()
+    worker._delay()
+    assert stats().flush_backoffs == 2
+    # ...but never past max_delay, the latency guarantee
+    worker._observe_latency(100.0)
+    assert worker._delay() == pytest.approx(5.0)
+
+
+def test_per_key_rate_limit_defers_chatty_key():
+    chatty = solara.reactive(0, persist=True, key="test.worker.chatty")
+    quiet = solara.reactive(0, persist=True, key="test.worker.quiet")
+    backend = MemoryStateBackend()
+    context = make_context("rate-limit-kernel")
+    manager = attach_manager(context, backend)
+    manager.set_key_rate_limit(60.0, 60.0)
+    with context:
+        chatty.value = 1
+    assert manager.flush_now() == FlushOutcome.OK  # a first write is never held back
+    with context:
+        chatty.value = 2
+        quiet.value = 1
+    assert manager.flush_now() == FlushOutcome.OK
+    # the quiet key was written; the chatty one waits for its interval
+    assert manager.dirty_keys == {"test.worker.chatty"}
+    assert manager.next_key_due is not None and manager.next_key_due > time.monotonic() + 50
+    assert stats().flush_key_deferrals == 1
+    field = persist.FIELD_PREFIX + "test.worker.chatty"
+    assert decode(backend._store[context.id].fields[field], kernel_id=context.id, field_name=field) == 1
+    # max_delay caps the hold-back: a key dirty for that long is written regardless
+    manager.set_key_rate_limit(60.0, 0.0)
+    assert manager.flush_now() == FlushOutcome.OK
+    assert manager.dirty_keys == set()
+    assert decode(backend._store[context.id].fields[field], kernel_id=context.id, field_name=field) == 2
+
+
+def test_rate_limited_key_is_rearmed_and_written(worker_factory):
+    key = "test.worker.rearm"
+    r = solara.reactive(0, persist=True, key=key)
+    backend = MemoryStateBackend()
+    context = make_context("rearm-kernel")
+    manager = attach_manager(context, backend)
+    worker = worker_factory(manager, debounce=0.01, key_min_interval=0.1)
+    worker.start()
+    with context:
+        r.value = 1
+    assert worker.wait_for_flushes(1)
+    with context:
+        r.value = 2
+    # the deferred key has no new mark to arm the timer: the worker re-arms itself for it
+    field = persist.FIELD_PREFIX + key
+    assert wait_until(lambda: decode(backend._store[context.id].fields[field], kernel_id=context.id, field_name=field) == 2)
+    assert manager.dirty_keys == set()
+
+
+def test_coalesced_versus_actual_writes():
+    r = solara.reactive(0, persist=True, key="test.worker.coalesced")
+    backend = MemoryStateBackend()
+    context = make_context("coalesced-kernel")
+    manager = attach_manager(context, backend)
+    with context:
+        for i in range(5):
+            r.value = i + 1
+    assert manager.flush_now() == FlushOutcome.OK
+    # five changes, one write: four were absorbed into the pending write
+    d = stats().as_dict()
+    assert d["flush_coalesced"] == 4
+    assert d["sync_count"] == 1
+    assert d["flush_coalesced_ratio"] == 0.8
+
+
+def test_batched_scheduler_moves_deadline_earlier(scheduler):
+    worker = unittest.mock.Mock()
+    scheduler.schedule(worker, 60.0)
+    deadline = scheduler._armed[worker][1]
+    scheduler.schedule(worker, 120.0)  # a later deadline never postpones the armed one
+    assert scheduler._armed[worker][1] == deadline
+    scheduler.schedule(worker, 1.0)
+    assert scheduler._armed[worker][1] < deadline
+    scheduler.cancel(worker)
+
+
+# --- batched flush scheduler --------------------------------------------------------------
+
+
+@pytest.fixture
+def scheduler():
+    # a generous slack: kernels armed one after another in a test still share one batch
+    scheduler = FlushScheduler(batch_max=64, pool_size=2, slack=1.0)
+    yield scheduler
+    scheduler.close()
+
+
+def test_batched_scheduler_coalesces_kernels_into_one_backend_batch(worker_factory, scheduler):
+    key = "test.worker.batched"
+    r = solara.reactive(0, persist=True, key=key)
+    backend = MemoryStateBackend()
+    calls = []
+    flush_many = backend.flush_many
+
+    def spy(requests):
+        calls.append([request.kernel_id for request in requests])
+        return flush_many(requests)
+
+    backend.flush_many = spy  # type: ignore
+    contexts = [make_context(f"batched-kernel-{i}") for i in range(5)]
+    workers = []
+    for context in contexts:
+        worker = worker_factory(attach_manager(context, backend), debounce=0.05, scheduler=scheduler)
+        worker.start()
+        workers.append(worker)
+    for i, context in enumerate(contexts):
+        with context:
+            r.value = i + 1
+    assert all(worker.wait_for_flushes(1) for worker in workers)
+    # no per-kernel threads, and the five due kernels went out as one pipelined batch
+    assert all(worker._thread is None for worker in workers)
+    assert sorted(sum(calls, [])) == sorted(context.id for context in contexts)
+    assert len(calls) == 1
+    for i, context in enumerate(contexts):
+        field = persist.FIELD_PREFIX + key
+        assert decode(backend._store[context.id].fields[field], kernel_id=context.id, field_name=field) == i + 1
+    d = stats().as_dict()
+    assert d["flush_batches"] == 1
+    assert d["flush_batch_kernels"] == 5
+    assert d["flush_batch_max_kernels"] == 5
+    assert d["flush_batch_last_seconds"] is not None
+    assert stats().flush_ok == 5
+
+
+def test_batched_scheduler_routes_outcomes_per_kernel(worker_factory, scheduler):
+    key = "test.worker.batched_route"
+    r = solara.reactive(0, persist=True, key=key)
+    backend = MemoryStateBackend()
+    ok_context = make_context("batched-ok")
+    fenced_context = make_context("batched-fenced")
+    ok_manager = attach_manager(ok_context, backend)
+    fenced_manager = attach_manager(fenced_context, backend)
+    # another instance owns the fenced kernel now: its write must be rejected on its own
+    backend.takeover(fenced_context.id, [session_hmac(SESSION_ID)], SCHEMA_TAG)
+    superseded = []
+    ok_worker = worker_factory(ok_manager, debounce=0.02, scheduler=scheduler)
+    fenced_worker = worker_factory(
+        fenced_manager, debounce=0.02, scheduler=scheduler, has_connected_page=lambda: False, on_superseded=lambda: superseded.append(True)
+    )
+    ok_worker.start()
+    fenced_worker.start()
+    with ok_context:
+        r.value = 1
+    with fenced_context:
+        r.value = 2
+    assert ok_worker.wait_for_flushes(1)
+    assert fenced_worker.wait_for_flushes(1)
+    assert ok_manager.dirty_keys == set()
+    # the rejection went through the same protocol as the threaded worker: orphan -> superseded
+    assert fenced_manager.dirty_keys == {key}
+    assert superseded == [True]
+    assert stats().flush_ok == 1
+    assert stats().flush_rejected == 1
+
+
+def test_batched_scheduler_close_flushes_pending(worker_factory, scheduler):
+    key = "test.worker.batched_close"
+    r = solara.reactive(0, persist=True, key=key)
+    backend = MemoryStateBackend()
+    context = make_context("batched-close")
+    manager = attach_manager(context, backend)
+    worker = worker_factory(manager, debounce=30.0, scheduler=scheduler)
+    worker.start()
+    with context:
+        r.value = 7
+    worker.close(timeout=1.0)
+    field = persist.FIELD_PREFIX + key
+    assert decode(backend._store[context.id].fields[field], kernel_id=context.id, field_name=field) == 7
+
+
 # --- observability ------------------------------------------------------------------------
 
 
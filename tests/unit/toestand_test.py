@@ -1,3 +1,4 @@
+import contextlib
 import dataclasses
 import gc
 import logging
@@ -12,6 +13,7 @@ import pytest
 
 import ipyvuetify as v
 import react_ipywidgets as react
+import reacton.core
 from typing_extensions import TypedDict
 
 import solara
@@ -402,6 +404,48 @@ def test_auto_subscribe_cleanup_is_unlocked_and_failure_isolated(caplog):
     assert "unsubscribe failed" in caplog.text
 
 
+def test_auto_subscribe_only_resubscribes_the_difference(monkeypatch):
+    calls = []
+    subscribe_change = toestand.ValueBase.subscribe_change
+
+    def counting_subscribe_change(self, listener, scope=None):
+        calls.append(self)
+        return subscribe_change(self, listener, scope)
+
+    monkeypatch.setattr(toestand.ValueBase, "subscribe_change", counting_subscribe_change)
+    changes = []
+    manager = toestand.AutoSubscribeContextManager(lambda: changes.append(1))
+    a, b, c = Reactive(1), Reactive(2), Reactive(3)
+    with manager:
+        assert a.value + b.value == 3
+    assert len(calls) == 2
+    kept = manager.subscribed[b]
+    with manager:
+        assert b.value + c.value == 5
+    # b keeps its subscription, c is new, a is dropped
+    assert len(calls) == 3
+    assert manager.subscribed[b] is kept
+    assert set(manager.subscribed) == {b, c}
+    a.value = 10
+    assert changes == []
+    b.value = 20
+    assert changes == [1]
+    with manager:
+        assert b.value + c.value == 23
+    assert len(calls) == 3
+    with pytest.raises(ZeroDivisionError):
+        with manager:
+            assert a.value
+            1 / 0
+    # a failed run drops its new subscriptions only
+    assert set(manager.subscribed) == {b, c}
+    a.value = 11
+    assert changes == [1]
+    manager.unsubscribe_all()
+    c.value = 30
+    assert changes == [1]
+
+
 def test_listener_prune_is_atomic_with_subscribe(no_kernel_context, monkeypatch):
     from collections import defaultdict
 
@@ -1813,6 +1857,195 @@ def test_computed():
     assert calls == 4
 
 
+def test_computed_lazy_is_evaluated_on_read():
+    from solara.toestand import Computed
+
+    x = Reactive(1)
+    calls = []
+
+    def double():
+        calls.append(x.value)
+        return x.value * 2
+
+    z = Computed(double, lazy=True)
+    assert calls == []
+    assert z.value == 2
+    x.value = 2
+    x.value = 3
+    # nobody reads z, so the changes only invalidated it
+    assert calls == [1]
+    assert z.value == 6
+    assert z.value == 6
+    assert calls == [1, 3]
+
+
+def test_computed_lazy_diamond_is_glitch_free():
+    from solara.toestand import Computed
+
+    x = Reactive(1)
+    calls = []
+
+    def plus_one():
+        calls.append("a")
+        return x.value + 1
+
+    def times_two():
+        calls.append("b")
+        return x.value * 2
+
+    a = Computed(plus_one, lazy=True)
+    b = Computed(times_two, lazy=True)
+    seen = []
+
+    def total():
+        calls.append("c")
+        seen.append((x.peek(), a.value, b.value))
+        return a.value + b.value
+
+    c = Computed(total, lazy=True)
+    d = Computed(lambda: c.value * 10, lazy=True)
+    assert d.value == 40
+    assert (a._rank, b._rank, c._rank, d._rank) == (0, 0, 1, 2)
+    values: List[int] = []
+    unsubscribe = c.subscribe(values.append)
+    try:
+        calls.clear()
+        x.value = 2
+        # c is observed: evaluated once, pulling the new values of a and b
+        assert values == [3 + 4]
+        assert sorted(calls) == ["a", "b", "c"]
+        assert seen[-1] == (2, 3, 4)
+        # d is not observed, so it waits for a read
+        assert d.value == 70
+        assert sorted(calls) == ["a", "b", "c"]
+    finally:
+        unsubscribe()
+    assert all(a_value == x_value + 1 and b_value == x_value * 2 for x_value, a_value, b_value in seen)
+
+
+def test_computed_eager_reading_lazy():
+    from solara.toestand import Computed
+
+    x = Reactive(1)
+    lazy = Computed(lambda: x.value + 1, lazy=True)
+    calls = []
+
+    def eager_total():
+        calls.append(1)
+        return lazy.value * 10
+
+    eager = Computed(eager_total)
+    assert eager.value == 20
+    x.value = 5
+    # the eager computed keeps the lazy one up to date
+    assert len(calls) == 2
+    assert eager.peek() == 60
+
+
+def test_batch_notifies_once_with_final_values():
+    from solara.toestand import Computed
+
+    toestand.BatchInfo._reset()
+    x, y, z = Reactive(1), Reactive(2), Reactive(3)
+    changes = []
+    unsubscribe = x.subscribe_change(lambda new, old: changes.append((old, new)))
+    renders = []
+    manager = toestand.AutoSubscribeContextManager(lambda: renders.append(1))
+    with manager:
+        assert x.value + y.value + z.value == 6
+    calls = []
+
+    def total():
+        calls.append(1)
+        return x.value + y.value
+
+    summed = Computed(total)
+    assert summed.value == 3
+
+    x.value = 10
+    y.value = 20
+    # without a batch: every change notifies right away
+    assert changes == [(1, 10)] and len(renders) == 2 and len(calls) == 3
+    changes.clear()
+    renders.clear()
+    calls.clear()
+    with solara.batch():
+        x.value = 11
+        x.value = 12
+        y.value = 21
+        z.value = 4
+        z.value = 3  # back to the value before the batch
+        assert changes == [] and renders == [] and calls == []
+    assert changes == [(10, 12)]
+    assert len(renders) == 1 and len(calls) == 1
+    assert summed.value == 33
+    info = toestand.BatchInfo.as_dict()
+    # the computed set in the first round is deferred to a second one
+    assert info["batches"] == 1 and info["deferred"] == 6 and info["fired"] == 3
+    assert info["listener_calls_saved"] == 2
+    manager.unsubscribe_all()
+    unsubscribe()
+
+
+def test_batch_computed_read_sees_pending_changes():
+    from solara.toestand import Computed
+
+    x = Reactive(1)
+    double = Computed(lambda: x.value * 2)
+    lazy_double = Computed(lambda: x.value * 2, lazy=True)
+    assert double.value == 2 and lazy_double.value == 2
+    seen: List[int] = []
+    unsubscribe = double.subscribe(seen.append)
+    with solara.batch():
+        x.value = 5
+        with solara.batch():
+            x.value = 6
+        assert seen == []
+        assert double.value == 12
+        assert lazy_double.value == 12
+        assert seen == [12]
+        x.value = 7
+    assert seen == [12, 14]
+    unsubscribe()
+
+
+def test_batch_defers_changes_made_by_listeners():
+    x, y = Reactive(1), Reactive(1)
+    seen = []
+    unsubscribe = x.subscribe(lambda value: y.set(value * 10))
+    manager = toestand.AutoSubscribeContextManager(lambda: seen.append((x.peek(), y.peek())))
+    with manager:
+        assert x.value + y.value == 2
+    with solara.batch():
+        x.value = 2
+    # one call for x, and one in the next round for the y the x listener set
+    assert seen == [(2, 20), (2, 20)]
+    manager.unsubscribe_all()
+    unsubscribe()
+
+
+def test_batch_notifies_all_stores_when_a_listener_raises():
+    a, b = Reactive(0), Reactive(0)
+
+    def fail(value):
+        raise ValueError("listener failed")
+
+    seen: List[int] = []
+    unsubscribes = [a.subscribe(fail), b.subscribe(seen.append)]
+    with pytest.raises(ValueError, match="listener failed"):
+        with solara.batch():
+            a.value = 1
+            b.value = 2
+    # b's listeners still ran, and nothing is left pending for the next batch
+    assert seen == [2]
+    assert not toestand.thread_local.batch_pending
+    with solara.batch():
+        b.value = 3
+    assert seen == [2, 3]
+    for unsubscribe in unsubscribes:
+        unsubscribe()
+
+
 def test_computed_reload(no_kernel_context):
     import solara.server.reload
     from solara.server.app import AppScript
@@ -2321,3 +2554,72 @@ def test_init_lock_in_global_scope_uses_per_instance_lock(no_kernel_context):
     assert scope_id == "global"
     assert context is None  # no kernel context -> global scope, per-instance lock
     assert store.get() == "v"  # lazy init works through the global (per-instance) lock
+
+
+def test_kernel_store_read_follows_the_current_context(no_kernel_context, monkeypatch):
+    monkeypatch.setattr(toestand, "_using_solara_server", lambda: True)
+    x = Reactive(0)
+    context1 = kernel_context.VirtualKernelContext(id="reads-1", kernel=kernel.Kernel(), session_id="session-1")
+    context2 = kernel_context.VirtualKernelContext(id="reads-2", kernel=kernel.Kernel(), session_id="session-2")
+    assert kernel_context.get_current_context_or_none() is None
+    with context1:
+        x.value = 1
+        assert x.value == 1
+        # the cached lookup is dropped when another context is entered, and when it is left
+        with context2:
+            assert kernel_context.get_current_context_or_none() is context2
+            assert x.value == 0
+            x.value = 2
+        assert x.value == 1
+        assert kernel_context.get_current_context_or_none() is context1
+
+    def read_in_thread():
+        values.append(x.value)
+
+    values: List[int] = []
+    thread = threading.Thread(target=read_in_thread)
+    thread.current_context = context2  # type: ignore
+    thread.start()
+    thread.join()
+    assert values == [2]
+    assert x.value == 0
+    # tracked once per kernel, the first read
+    assert id(x._storage) in context1._generation_stores and id(x._storage) in context2._generation_stores
+    context1.close()
+    context2.close()
+
+
+def test_fire_groups_listeners_per_context_and_counts_them(no_kernel_context, monkeypatch):
+    monkeypatch.setattr(toestand, "_using_solara_server", lambda: True)
+    x = Reactive(0)
+    storage = cast(toestand.KernelStore, x._storage)
+    context = kernel_context.VirtualKernelContext(id="dispatch-1", kernel=kernel.Kernel(), session_id="session-1")
+    render_contexts = [contextlib.nullcontext(), contextlib.nullcontext()]
+    calls: List[tuple] = []
+    unsubscribes: List[Callable[[], None]] = []
+    with context:
+        for i, rc in enumerate(render_contexts):
+
+            def on_value(value, i=i):
+                calls.append((i, "value", value))
+
+            def on_change(new, old, i=i):
+                calls.append((i, "change", old, new))
+
+            with unittest.mock.patch.object(reacton.core, "get_render_context", lambda required=False, rc=rc: rc):
+                unsubscribes.append(x.subscribe(on_value))
+                unsubscribes.append(x.subscribe_change(on_change))
+                unsubscribes.append(x.subscribe(on_value))
+        assert storage.listener_counts() == {"dispatch-1": 6}
+        assert len(storage._dispatch["dispatch-1"]) == 2
+        stats = toestand.listener_stats()
+        assert {"key": storage.storage_key, "listeners": 6, "scopes": 1, "max_per_scope": 6} in stats["top"]
+        x.value = 1
+    # per context the listeners, then the change listeners
+    assert calls == [(0, "value", 1), (0, "value", 1), (0, "change", 0, 1), (1, "value", 1), (1, "value", 1), (1, "change", 0, 1)]
+    for unsubscribe in unsubscribes:
+        unsubscribe()
+    assert storage.listener_counts() == {}
+    assert storage._dispatch == {}
+    assert storage.storage_key not in [row["key"] for row in toestand.listener_stats()["top"]]
+    context.close()
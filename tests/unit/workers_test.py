@@ -0,0 +1,116 @@
+import asyncio
+import json
+import sys
+
+import pytest
+
+from solara.server import workers
+from solara.server.workers import Front, RequestHead, route, worker_index
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="workers listen on unix sockets")
+
+
+def _head(target="/", **headers):
+    lines = [f"GET {target} HTTP/1.1", "Host: localhost"] + [f"{name.replace('_', '-')}: {value}" for name, value in headers.items()]
+    return RequestHead("\r\n".join(lines).encode("latin-1"))
+
+
+def test_worker_index_is_stable_and_spread():
+    assert worker_index("session:abc", 4) == worker_index("session:abc", 4)
+    counts = [0] * 4
+    for i in range(4000):
+        counts[worker_index(f"session:{i}", 4)] += 1
+    assert min(counts) > 800
+
+
+def test_route():
+    def round_robin():
+        return 3
+
+    session = _head("/", Cookie="other=1; solara-session-id=s1")
+    assert route(session, 4, round_robin) == (worker_index("session:s1", 4), True)
+    # the websocket and close beacon of that browser go to the same worker
+    websocket = _head("/jupyter/api/kernels/k1/channels?session_id=p", Cookie="solara-session-id=s1", Upgrade="websocket", Connection="Upgrade")
+    assert route(websocket, 4, round_robin)[0] == worker_index("session:s1", 4)
+    # without a cookie: by kernel id, and the connection is not kept for other requests
+    close = _head("/_solara/api/close/k1?session_id=p")
+    assert route(close, 4, round_robin) == (worker_index("kernel:k1", 4), False)
+    assert route(_head("/static/main.js"), 4, round_robin) == (3, False)
+    assert b"Connection: close" in close.encode(connection_close=True)
+    assert close.encode() == b"GET /_solara/api/close/k1?session_id=p HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+
+def test_aggregate_and_label_metrics():
+    data = workers.aggregate_resourcez(
+        {0: {"kernels": {"total": 2, "limiter": {}}, "websockets": {"open": 1}}, 1: {"kernels": {"total": 3}}, 2: {"error": "x"}}
+    )
+    assert data["kernels"] == {"total": 5}
+    assert data["websockets"] == {"open": 1}
+    assert data["workers"]["2"] == {"error": "x"}
+    text = '# TYPE solara_messages_total counter\nsolara_messages_total 4\nsolara_x_bucket{le="+Inf"} 1\n'
+    assert workers.label_metrics(text, 1).splitlines() == [
+        "# TYPE solara_messages_total counter",
+        'solara_messages_total{worker="1"} 4',
+        'solara_x_bucket{worker="1",le="+Inf"} 1',
+    ]
+
+
+class FakeProcess:
+    def __init__(self):
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def terminate(self):
+        self.alive = False
+
+    def join(self, timeout=None):
+        pass
+
+
+async def test_front_routes_and_aggregates(tmp_path):
+    servers = []
+
+    def start_worker(index, path):
+        async def handle(reader, writer):
+            head = RequestHead((await reader.readuntil(b"\r\n\r\n"))[:-4])
+            if head.path == "/resourcez":
+                body = json.dumps({"kernels": {"total": index + 1}}).encode()
+            else:
+                body = f"worker {index} {head.header('connection')}".encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s" % (len(body), body))
+            await writer.drain()
+            writer.close()
+
+        servers.append(asyncio.ensure_future(asyncio.start_unix_server(handle, path)))
+        return FakeProcess()
+
+    front = Front("127.0.0.1", 0, 3, start_worker, socket_dir=str(tmp_path))
+    task = asyncio.ensure_future(front.serve())
+    while not front.started:
+        await asyncio.sleep(0.01)
+    assert front._server is not None
+    port = front._server.sockets[0].getsockname()[1]
+
+    async def get(target, cookie=None):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        lines = [f"GET {target} HTTP/1.1", "Host: localhost"] + ([f"Cookie: solara-session-id={cookie}"] if cookie else [])
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+        data = await reader.read()
+        writer.close()
+        return data.partition(b"\r\n\r\n")[2].decode()
+
+    try:
+        expected = worker_index("session:s1", 3)
+        assert await get("/", "s1") == f"worker {expected} None"
+        assert await get("/_solara/api/close/k9", "s1") == f"worker {expected} None"
+        assert await get("/_solara/api/close/k9") == f"worker {worker_index('kernel:k9', 3)} close"
+        data = json.loads(await get("/resourcez"))
+        assert data["kernels"] == {"total": 1 + 2 + 3}
+        assert data["front"] == {"workers": 3, "alive": 3, "restarts": {"0": 0, "1": 0, "2": 0}}
+    finally:
+        await front.stop()
+        task.cancel()
+        for server in servers:
+            (await server).close()